@@ -11,11 +11,16 @@ from .models import Empresa, Licenca, LicencaHistorico
 class EmpresaAdmin(admin.ModelAdmin):
     list_display = [
         'nome', 'razao_social', 'cnpj', 'email', 
-        'cidade', 'estado', 'ativa', 'created_at'
+        'cidade', 'estado', 'ativa', 'status_provisionamento', 'created_at'
     ]
-    list_filter = ['ativa', 'estado', 'created_at']
+    list_filter = ['ativa', 'status_provisionamento', 'status_migracao', 'estado', 'created_at']
     search_fields = ['nome', 'razao_social', 'cnpj', 'email']
-    readonly_fields = ['uuid', 'database_name', 'created_at', 'updated_at']
+    readonly_fields = [
+        'uuid', 'database_name', 'status_provisionamento', 'erro_provisionamento',
+        'provisionamento_atualizado_em', 'status_migracao', 'erro_migracao',
+        'migracao_atualizada_em', 'created_at', 'updated_at'
+    ]
+    actions = ['reprocessar_provisionamento']
     
     fieldsets = (
         ('Informações Básicas', {
@@ -27,6 +32,12 @@ class EmpresaAdmin(admin.ModelAdmin):
         ('Sistema', {
             'fields': ('uuid', 'database_name', 'ativa')
         }),
+        ('Provisionamento', {
+            'fields': ('status_provisionamento', 'erro_provisionamento', 'provisionamento_atualizado_em')
+        }),
+        ('Migrações', {
+            'fields': ('status_migracao', 'erro_migracao', 'migracao_atualizada_em')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -35,6 +46,20 @@ class EmpresaAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).using('master')
+    
+    @admin.action(description='Reprocessar provisionamento do banco')
+    def reprocessar_provisionamento(self, request, queryset):
+        """Agenda novamente o provisionamento das empresas pendentes ou com falha"""
+        from .provisionamento import agendar_provisionamento
+        
+        empresas = queryset.filter(status_provisionamento__in=[
+            Empresa.PROVISIONAMENTO_PENDENTE, Empresa.PROVISIONAMENTO_FALHOU
+        ])
+        total = 0
+        for empresa in empresas:
+            agendar_provisionamento(empresa.id)
+            total += 1
+        self.message_user(request, f'Provisionamento reagendado para {total} empresa(s).')
 
 
 class LicencaHistoricoInline(admin.TabularInline):
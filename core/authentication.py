@@ -5,15 +5,28 @@ from django.contrib.auth import authenticate, login as django_login, logout as d
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.db import connections
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+import copy
+from .cache import CacheProcesso
 from .models import Empresa, Licenca
 from .routers import create_empresa_database, get_empresa_database, set_db_for_request
 from .middleware import EmpresaSessionMiddleware
+from .licencas import obter_direitos_empresa, empresa_liberada, licenca_permite
 import logging
 from .routers import get_db_for_request
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Claim do token JWT com a empresa do usuário
+CLAIM_EMPRESA = 'empresa_id'
+
+# Usuários autenticados via JWT, mantidos por processo (chave: id do usuário)
+_cache_usuarios = CacheProcesso(ttl=getattr(settings, 'JWT_USUARIO_CACHE_TTL', 60))
+
 class MultiEmpresaAuthBackend(ModelBackend):
     """
     Backend de autenticação que suporta múltiplas empresas
@@ -26,19 +39,8 @@ class MultiEmpresaAuthBackend(ModelBackend):
         if username is None or password is None:
             return None
         
-        # Logs de debug do fluxo de autenticação
-        try:
-            logger.info("[AUTH] authenticate inicio | username=%s | has_password=%s | empresa_id=%s | db=%s | path=%s",
-                        username, bool(password), empresa_id, get_db_for_request(), getattr(request, 'path', None))
-            print("[AUTH] authenticate inicio:", {
-                "username": username,
-                "has_password": bool(password),
-                "empresa_id": empresa_id,
-                "db": get_db_for_request(),
-                "path": getattr(request, 'path', None)
-            })
-        except Exception as e:
-            print("[WARN] Falha ao coletar debug em authenticate:", str(e))
+        logger.debug("[AUTH] authenticate | username=%s | empresa_id=%s | db=%s",
+                     username, empresa_id, get_db_for_request())
         
         try:
             # Busca o usuário
@@ -48,27 +50,21 @@ class MultiEmpresaAuthBackend(ModelBackend):
             if user.check_password(password):
                 # Se empresa_id foi fornecida, verifica se o usuário pertence a ela
                 if empresa_id and user.empresa_id != empresa_id:
-                    print("[AUTH] empresa mismatch:", {"user_empresa": user.empresa_id, "empresa_id": empresa_id})
+                    logger.debug("[AUTH] empresa divergente | user_empresa=%s | empresa_id=%s", user.empresa_id, empresa_id)
                     return None
                 
                 # Verifica se a empresa está ativa e tem licença válida
                 if user.empresa_id:
                     if not self._verificar_empresa_ativa(user.empresa_id):
-                        print("[AUTH] empresa inativa ou sem licença:", {"empresa_id": user.empresa_id})
+                        logger.debug("[AUTH] empresa inativa ou sem licença | empresa_id=%s", user.empresa_id)
                         return None
                 
-                try:
-                    print("[AUTH] authenticate sucesso:", {"user_id": user.id, "username": user.username})
-                except Exception:
-                    pass
-                
                 return user
             else:
-                print("[AUTH] senha inválida para usuário:", username)
-                
+                logger.debug("[AUTH] senha inválida | username=%s", username)
                 return None
         except User.DoesNotExist:
-            print("[AUTH] usuário não encontrado:", username)
+            logger.debug("[AUTH] usuário não encontrado | username=%s", username)
             return None
         
         return None
@@ -77,21 +73,73 @@ class MultiEmpresaAuthBackend(ModelBackend):
         """
         Verifica se a empresa está ativa e tem licença válida
         """
+        # Usa o cache de licenças (consulta o master apenas com cache frio)
+        return empresa_liberada(empresa_id)
+
+
+class EmpresaJWTAuthentication(JWTAuthentication):
+    """
+    Autenticação JWT que direciona a requisição para o banco da empresa
+    a partir do claim `empresa_id` do token.
+
+    O DatabaseRoutingMiddleware roda antes da autenticação do DRF e vê um
+    usuário anônimo; aqui o banco é definido diretamente pelo claim e o
+    usuário vem de um cache por processo, sem consultas ao master nem ao
+    default no caminho quente. Tokens sem o claim seguem o fluxo antigo.
+    """
+
+    def get_user(self, validated_token):
         try:
-            # Busca no banco master
-            empresa = Empresa.objects.using('master').get(id=empresa_id)
-            if not empresa.ativa:
-                return False
-            
-            # Verifica se tem licença ativa
-            licenca_ativa = Licenca.objects.using('master').filter(
-                empresa=empresa,
-                status='ativa'
-            ).first()
-            
-            return licenca_ativa is not None and licenca_ativa.is_ativa()
-        except Empresa.DoesNotExist:
-            return False
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token não contém identificação do usuário')
+
+        if CLAIM_EMPRESA not in validated_token:
+            user = super().get_user(validated_token)
+            if user.empresa_id:
+                self._definir_banco_empresa(user.empresa_id)
+            return user
+
+        empresa_id = validated_token[CLAIM_EMPRESA]
+        user = _cache_usuarios.obter(user_id)
+        if user is None:
+            user = self._carregar_usuario(user_id)
+            _cache_usuarios.definir(user_id, user)
+
+        if user.empresa_id != empresa_id:
+            raise AuthenticationFailed('Empresa do token não confere com a do usuário', code='empresa_invalida')
+
+        if empresa_id:
+            if not empresa_liberada(empresa_id):
+                raise AuthenticationFailed('Empresa inativa ou sem licença válida', code='empresa_inativa')
+            self._definir_banco_empresa(empresa_id)
+
+        # Cópia rasa para que alterações na requisição não afetem o cache
+        return copy.copy(user)
+
+    def _carregar_usuario(self, user_id):
+        """Busca o usuário no banco default, onde o login é realizado"""
+        try:
+            user = self.user_model.objects.using('default').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed('Usuário não encontrado', code='user_not_found')
+
+        if not user.is_active:
+            raise AuthenticationFailed('Usuário inativo', code='user_inactive')
+
+        return user
+
+    def _definir_banco_empresa(self, empresa_id):
+        """Define o banco da empresa para o restante da requisição"""
+        db_alias = get_empresa_database(empresa_id)
+        if db_alias not in connections.databases:
+            create_empresa_database(empresa_id)
+        set_db_for_request(db_alias)
+
+
+def invalidar_usuario_cache(user_id):
+    """Remove o usuário do cache de autenticação JWT"""
+    _cache_usuarios.invalidar(user_id)
 
 
 def login_multiempresa(request, username, password, empresa_id=None):
@@ -147,41 +195,25 @@ def get_empresa_info(user):
     if not user.empresa_id:
         return None
     
-    try:
-        empresa = Empresa.objects.using('master').get(id=user.empresa_id)
-        licenca = Licenca.objects.using('master').filter(
-            empresa=empresa,
-            status='ativa'
-        ).first()
-        
-        return {
-            'empresa': empresa,
-            'licenca': licenca,
-            'database_alias': get_empresa_database(user.empresa_id)
-        }
-    except Empresa.DoesNotExist:
+    direitos = obter_direitos_empresa(user.empresa_id)
+    if not direitos:
         return None
+    
+    return {
+        'empresa': direitos['empresa'],
+        'licenca': direitos['licenca'],
+        'database_alias': get_empresa_database(user.empresa_id)
+    }
 
 
 def verificar_permissoes_empresa(user, acao):
     """
     Verifica se o usuário tem permissão para realizar uma ação baseado na licença
     """
-    empresa_info = get_empresa_info(user)
-    if not empresa_info or not empresa_info['licenca']:
+    if not user.empresa_id:
         return False
     
-    licenca = empresa_info['licenca']
-    
-    # Mapeamento de ações para permissões da licença
-    permissoes_map = {
-        'banco_horas': licenca.permite_banco_horas,
-        'ponto_eletronico': licenca.permite_ponto_eletronico,
-        'relatorios_avancados': licenca.permite_relatorios_avancados,
-        'integracao_api': licenca.permite_integracao_api,
-    }
-    
-    return permissoes_map.get(acao, False)
+    return licenca_permite(user.empresa_id, acao)
 
 
 def criar_usuario_empresa(username, email, password, first_name, last_name, empresa_id):
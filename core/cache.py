@@ -0,0 +1,63 @@
+"""
+Cache em memória por processo com expiração (TTL)
+Usado para dados do banco master consultados em toda requisição
+"""
+import threading
+import time
+
+_AUSENTE = object()
+
+
+class CacheProcesso:
+    """
+    Cache simples chave/valor com TTL, seguro para uso entre threads.
+    Cada processo (worker) mantém sua própria cópia; a invalidação
+    é feita por signals no processo que altera o dado e pelo TTL nos demais.
+    """
+
+    def __init__(self, ttl=300, max_itens=10000):
+        self.ttl = ttl
+        self.max_itens = max_itens
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave, default=None):
+        """Retorna o valor armazenado ou default se ausente/expirado"""
+        item = self._dados.get(chave, _AUSENTE)
+        if item is _AUSENTE:
+            return default
+
+        expira_em, valor = item
+        if expira_em < time.monotonic():
+            with self._lock:
+                self._dados.pop(chave, None)
+            return default
+
+        return valor
+
+    def definir(self, chave, valor, ttl=None):
+        """Armazena um valor no cache"""
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._dados) >= self.max_itens and chave not in self._dados:
+                # Descarta o item mais antigo para manter o cache limitado
+                self._dados.pop(next(iter(self._dados)), None)
+            self._dados[chave] = (expira_em, valor)
+
+    def obter_ou_calcular(self, chave, funcao, ttl=None):
+        """Retorna o valor do cache ou calcula, armazena e retorna"""
+        valor = self.obter(chave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = funcao()
+            self.definir(chave, valor, ttl)
+        return valor
+
+    def invalidar(self, chave):
+        """Remove uma chave do cache"""
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def limpar(self):
+        """Remove todas as chaves do cache"""
+        with self._lock:
+            self._dados.clear()
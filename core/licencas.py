@@ -0,0 +1,88 @@
+"""
+Cache dos direitos de licença das empresas
+Evita consultas ao banco master a cada requisição
+"""
+from django.conf import settings
+from .cache import CacheProcesso
+from .models import Empresa, Licenca
+
+# Mapeamento de recursos para os campos de permissão da licença
+RECURSOS_LICENCA = {
+    'banco_horas': 'permite_banco_horas',
+    'ponto_eletronico': 'permite_ponto_eletronico',
+    'relatorios_avancados': 'permite_relatorios_avancados',
+    'integracao_api': 'permite_integracao_api',
+}
+
+_cache_direitos = CacheProcesso(ttl=getattr(settings, 'LICENCA_CACHE_TTL', 300))
+
+
+def _carregar_direitos(empresa_id):
+    """Carrega empresa e licença ativa do banco master"""
+    try:
+        empresa = Empresa.objects.using('master').get(id=empresa_id)
+    except Empresa.DoesNotExist:
+        return None
+
+    licenca = Licenca.objects.using('master').filter(
+        empresa=empresa,
+        status='ativa'
+    ).first()
+
+    return {
+        'empresa': empresa,
+        'licenca': licenca,
+    }
+
+
+def obter_direitos_empresa(empresa_id):
+    """
+    Retorna {'empresa': Empresa, 'licenca': Licenca | None} da empresa,
+    ou None se a empresa não existir. Consulta o master apenas quando
+    o cache está frio ou expirado.
+    """
+    if not empresa_id:
+        return None
+    return _cache_direitos.obter_ou_calcular(empresa_id, lambda: _carregar_direitos(empresa_id))
+
+
+def invalidar_direitos_empresa(empresa_id):
+    """Remove os direitos da empresa do cache (chamado ao salvar Empresa/Licença)"""
+    _cache_direitos.invalidar(empresa_id)
+
+
+def empresa_pronta(empresa_id):
+    """Verifica se o banco da empresa já foi provisionado"""
+    direitos = obter_direitos_empresa(empresa_id)
+    if direitos and not direitos['empresa'].is_provisionada():
+        # O status muda em segundo plano, possivelmente em outro processo:
+        # enquanto não estiver pronto, não confia no cache
+        invalidar_direitos_empresa(empresa_id)
+        direitos = obter_direitos_empresa(empresa_id)
+    return bool(direitos) and direitos['empresa'].is_provisionada()
+
+
+def empresa_liberada(empresa_id):
+    """Verifica se a empresa está ativa, provisionada e possui licença válida"""
+    if not empresa_pronta(empresa_id):
+        return False
+
+    direitos = obter_direitos_empresa(empresa_id)
+    if not direitos or not direitos['empresa'].ativa:
+        return False
+
+    licenca = direitos['licenca']
+    return licenca is not None and licenca.is_ativa()
+
+
+def licenca_permite(empresa_id, recurso):
+    """Verifica se a licença da empresa permite o recurso informado"""
+    direitos = obter_direitos_empresa(empresa_id)
+    if not direitos or not direitos['licenca']:
+        return False
+
+    campo = RECURSOS_LICENCA.get(recurso)
+    if not campo:
+        return False
+
+    return bool(getattr(direitos['licenca'], campo, False))
@@ -2,12 +2,102 @@
 Comando para verificar status das licenças e limites das empresas
 """
 from django.core.management.base import BaseCommand, CommandError
-from django.db import connections
 from core.models import Empresa, Licenca
 from core.routers import get_empresa_database
+from core.tenants import MODO_PROCESSO, MODO_THREAD, banco_empresa_existe, executar_em_empresas, listar_empresas
+from escalator.models import Funcionario
+from usuarios.models import Usuario
 from datetime import datetime, timedelta
 import json
 
+
+def verificar_empresa(empresa_id, days_warning):
+    """Verifica licença e limites de uma empresa (executada no pool de empresas)"""
+    try:
+        # Busca empresa no banco master
+        empresa = Empresa.objects.using('master').get(id=empresa_id, ativa=True)
+    except Empresa.DoesNotExist:
+        return None
+
+    # Busca licença ativa no banco master
+    licenca = Licenca.objects.using('master').filter(
+        empresa=empresa,
+        status='ativa'
+    ).first()
+
+    if not licenca:
+        return {
+            'empresa_id': empresa.id,
+            'empresa_nome': empresa.nome,
+            'empresa_cnpj': empresa.cnpj,
+            'status': 'sem_licenca',
+            'mensagem': 'Nenhuma licença ativa encontrada'
+        }
+
+    # Verifica status da licença
+    hoje = datetime.now().date()
+    status_licenca = 'ativa'
+    mensagem = 'Licença ativa'
+
+    if licenca.data_fim and licenca.data_fim < hoje:
+        status_licenca = 'expirada'
+        mensagem = f'Licença expirada em {licenca.data_fim}'
+    elif licenca.data_fim and licenca.data_fim <= hoje + timedelta(days=days_warning):
+        status_licenca = 'vencendo'
+        dias_restantes = (licenca.data_fim - hoje).days
+        mensagem = f'Licença vence em {dias_restantes} dias ({licenca.data_fim})'
+
+    # Verifica limites de uso
+    limites = verificar_limites_uso(empresa_id, licenca)
+
+    return {
+        'empresa_id': empresa.id,
+        'empresa_nome': empresa.nome,
+        'empresa_cnpj': empresa.cnpj,
+        'licenca_tipo': licenca.tipo,
+        'status': status_licenca,
+        'mensagem': mensagem,
+        'data_inicio': licenca.data_inicio,
+        'data_fim': licenca.data_fim,
+        'valor_mensal': float(licenca.valor_mensal) if licenca.valor_mensal else None,
+        'limites': limites,
+        'data_verificacao': datetime.now()
+    }
+
+
+def _limite(atual, maximo):
+    return {
+        'atual': atual,
+        'limite': maximo,
+        'percentual_uso': (atual / maximo * 100) if maximo else 0,
+        'excedeu': atual > maximo if maximo else False
+    }
+
+
+def verificar_limites_uso(empresa_id, licenca):
+    """Verifica limites de uso da licença"""
+    if not banco_empresa_existe(empresa_id):
+        return {'erro': 'Banco da empresa não encontrado'}
+
+    limites = {}
+
+    # Funcionários ficam no banco da empresa
+    try:
+        funcionarios_ativos = Funcionario.objects.using(get_empresa_database(empresa_id)).filter(ativo=True).count()
+        limites['funcionarios'] = _limite(funcionarios_ativos, licenca.max_funcionarios)
+    except Exception as e:
+        limites['funcionarios'] = {'erro': f'Erro ao contar funcionários: {e}'}
+
+    # Usuários ficam no banco default (o login é feito antes do roteamento)
+    try:
+        usuarios_ativos = Usuario.objects.using('default').filter(empresa_id=empresa_id, is_active=True).count()
+        limites['usuarios'] = _limite(usuarios_ativos, licenca.max_usuarios)
+    except Exception as e:
+        limites['usuarios'] = {'erro': f'Erro ao contar usuários: {e}'}
+
+    return limites
+
+
 class Command(BaseCommand):
     help = 'Verifica status das licenças e limites das empresas'
     
@@ -33,152 +123,69 @@ class Command(BaseCommand):
             default=7,
             help='Dias de antecedência para aviso de vencimento (padrão: 7)',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Empresas verificadas em paralelo (padrão: 4)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Tempo limite por empresa em segundos (padrão: 60)',
+        )
+        parser.add_argument(
+            '--processos',
+            action='store_true',
+            help='Usa processos em vez de threads (interrompe as empresas que excedem o tempo limite)',
+        )
     
     def handle(self, *args, **options):
-        empresa_id = options['empresa_id']
         expired_only = options['expired_only']
         json_output = options['json_output']
-        days_warning = options['days_warning']
         
         try:
-            if empresa_id:
-                # Verifica apenas uma empresa específica
-                result = self.check_empresa_licenca(empresa_id, days_warning)
-                results = [result] if result else []
-            else:
-                # Verifica todas as empresas
-                results = self.check_all_empresas(days_warning)
-            
-            # Filtra apenas expiradas se solicitado
-            if expired_only:
-                results = [r for r in results if r['status'] in ['expirada', 'vencendo']]
-            
-            # Saída em JSON ou texto
-            if json_output:
-                self.stdout.write(json.dumps(results, default=str, indent=2))
-            else:
-                self.display_results(results)
-                
+            empresas = listar_empresas(options['empresa_id'])
+            execucoes = executar_em_empresas(
+                verificar_empresa,
+                empresas,
+                args=(options['days_warning'],),
+                max_workers=options['workers'],
+                timeout=options['timeout'],
+                modo=MODO_PROCESSO if options['processos'] else MODO_THREAD,
+                exigir_banco=False,
+                ao_concluir=self.exibir_progresso,
+            )
         except Exception as e:
             raise CommandError(f'Erro durante verificação: {e}')
-    
-    def check_all_empresas(self, days_warning):
-        """Verifica licenças de todas as empresas"""
-        empresas = Empresa.objects.using('master').filter(ativa=True)
+
         results = []
+        for execucao in execucoes:
+            if not execucao['sucesso']:
+                results.append({
+                    'empresa_id': execucao['empresa_id'],
+                    'empresa_nome': execucao['empresa_nome'],
+                    'status': 'erro',
+                    'mensagem': f"Erro ao verificar empresa: {execucao['erro']}",
+                })
+            elif execucao['resultado']:
+                results.append(execucao['resultado'])
         
-        for empresa in empresas:
-            try:
-                result = self.check_empresa_licenca(empresa.id, days_warning)
-                if result:
-                    results.append(result)
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Erro ao verificar empresa {empresa.nome}: {e}')
-                )
-                continue
+        # Filtra apenas expiradas se solicitado
+        if expired_only:
+            results = [r for r in results if r['status'] in ['expirada', 'vencendo', 'erro']]
         
-        return results
+        # Saída em JSON ou texto
+        if json_output:
+            self.stdout.write(json.dumps(results, default=str, indent=2))
+        else:
+            self.display_results(results)
     
-    def check_empresa_licenca(self, empresa_id, days_warning):
-        """Verifica licença de uma empresa específica"""
-        try:
-            # Busca empresa no banco master
-            empresa = Empresa.objects.using('master').get(id=empresa_id, ativa=True)
-            
-            # Busca licença ativa no banco master
-            licenca = Licenca.objects.using('master').filter(
-                empresa=empresa,
-                status='ativa'
-            ).first()
-            
-            if not licenca:
-                return {
-                    'empresa_id': empresa.id,
-                    'empresa_nome': empresa.nome,
-                    'status': 'sem_licenca',
-                    'mensagem': 'Nenhuma licença ativa encontrada'
-                }
-            
-            # Verifica status da licença
-            hoje = datetime.now().date()
-            status_licenca = 'ativa'
-            mensagem = 'Licença ativa'
-            
-            if licenca.data_fim and licenca.data_fim < hoje:
-                status_licenca = 'expirada'
-                mensagem = f'Licença expirada em {licenca.data_fim}'
-            elif licenca.data_fim and licenca.data_fim <= hoje + timedelta(days=days_warning):
-                status_licenca = 'vencendo'
-                dias_restantes = (licenca.data_fim - hoje).days
-                mensagem = f'Licença vence em {dias_restantes} dias ({licenca.data_fim})'
-            
-            # Verifica limites de uso
-            limites = self.check_usage_limits(empresa_id, licenca)
-            
-            return {
-                'empresa_id': empresa.id,
-                'empresa_nome': empresa.nome,
-                'empresa_cnpj': empresa.cnpj,
-                'licenca_tipo': licenca.tipo,
-                'status': status_licenca,
-                'mensagem': mensagem,
-                'data_inicio': licenca.data_inicio,
-                'data_fim': licenca.data_fim,
-                'valor_mensal': float(licenca.valor_mensal) if licenca.valor_mensal else None,
-                'limites': limites,
-                'data_verificacao': datetime.now()
-            }
-            
-        except Empresa.DoesNotExist:
-            return None
-    
-    def check_usage_limits(self, empresa_id, licenca):
-        """Verifica limites de uso da licença"""
-        try:
-            db_alias = get_empresa_database(empresa_id)
-            
-            # Verifica se o banco da empresa existe
-            if db_alias not in connections.databases:
-                return {
-                    'erro': 'Banco da empresa não encontrado'
-                }
-            
-            with connections[db_alias].cursor() as cursor:
-                limites = {}
-                
-                # Conta funcionários
-                try:
-                    cursor.execute("SELECT COUNT(*) FROM escalator_funcionario WHERE ativo = 1")
-                    funcionarios_ativos = cursor.fetchone()[0]
-                    limites['funcionarios'] = {
-                        'atual': funcionarios_ativos,
-                        'limite': licenca.max_funcionarios,
-                        'percentual_uso': (funcionarios_ativos / licenca.max_funcionarios * 100) if licenca.max_funcionarios else 0,
-                        'excedeu': funcionarios_ativos > licenca.max_funcionarios if licenca.max_funcionarios else False
-                    }
-                except:
-                    limites['funcionarios'] = {'erro': 'Tabela de funcionários não encontrada'}
-                
-                # Conta usuários
-                try:
-                    cursor.execute("SELECT COUNT(*) FROM usuarios_usuario WHERE is_active = 1")
-                    usuarios_ativos = cursor.fetchone()[0]
-                    limites['usuarios'] = {
-                        'atual': usuarios_ativos,
-                        'limite': licenca.max_usuarios,
-                        'percentual_uso': (usuarios_ativos / licenca.max_usuarios * 100) if licenca.max_usuarios else 0,
-                        'excedeu': usuarios_ativos > licenca.max_usuarios if licenca.max_usuarios else False
-                    }
-                except:
-                    limites['usuarios'] = {'erro': 'Tabela de usuários não encontrada'}
-                
-                return limites
-                
-        except Exception as e:
-            return {
-                'erro': f'Erro ao verificar limites: {str(e)}'
-            }
+    def exibir_progresso(self, execucao, concluidas, total):
+        """Progresso vai para stderr para não misturar com a saída JSON"""
+        situacao = 'ok' if execucao['sucesso'] else f"erro: {execucao['erro']}"
+        self.stderr.write(f"[{concluidas}/{total}] {execucao['empresa_nome']} ({situacao})", style_func=None)
     
     def display_results(self, results):
         """Exibe resultados em formato texto"""
@@ -193,7 +200,8 @@ class Command(BaseCommand):
         for result in results:
             # Cabeçalho da empresa
             self.stdout.write(f"Empresa: {result['empresa_nome']} (ID: {result['empresa_id']})")
-            self.stdout.write(f"CNPJ: {result['empresa_cnpj']}")
+            if result.get('empresa_cnpj'):
+                self.stdout.write(f"CNPJ: {result['empresa_cnpj']}")
             
             # Status da licença
             if result['status'] == 'ativa':
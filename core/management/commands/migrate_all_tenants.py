@@ -0,0 +1,120 @@
+"""
+Comando para aplicar as migrações em todos os bancos das empresas
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.models import Empresa
+from core.provisionamento import empresas_desatualizadas, migrar_banco_empresa
+from core.tenants import MODO_PROCESSO, executar_em_empresas
+
+
+class Command(BaseCommand):
+    help = 'Aplica as migrações pendentes nos bancos de todas as empresas, em paralelo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='ID da empresa específica (opcional)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Bancos migrados ao mesmo tempo, cada um em um processo (padrão: 4)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Tempo limite em segundos por empresa (padrão: sem limite)',
+        )
+        parser.add_argument(
+            '--apenas-falhas',
+            action='store_true',
+            help='Retoma apenas as empresas cuja última migração falhou',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Apenas lista as empresas com migrações pendentes',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers deve ser maior que zero')
+
+        # Empresas ainda não provisionadas recebem as migrações no provisionamento
+        empresas = Empresa.objects.using('master').filter(
+            status_provisionamento=Empresa.PROVISIONAMENTO_PRONTO
+        ).order_by('id')
+        if options['empresa_id']:
+            empresas = empresas.filter(id=options['empresa_id'])
+        if options['apenas_falhas']:
+            empresas = empresas.filter(status_migracao=Empresa.MIGRACAO_FALHOU)
+        empresas = list(empresas.values_list('id', 'nome'))
+
+        if not empresas:
+            self.stdout.write(self.style.WARNING('Nenhuma empresa encontrada'))
+            return
+
+        # Verificação em lote: empresas já atualizadas não sobem processo nem abrem conexão
+        pendentes = empresas_desatualizadas([empresa_id for empresa_id, _ in empresas])
+        atualizadas = [empresa_id for empresa_id, _ in empresas if empresa_id not in pendentes]
+        self.registrar_atualizadas(atualizadas)
+        empresas = [empresa for empresa in empresas if empresa[0] in pendentes]
+
+        self.stdout.write(f'{len(atualizadas)} empresas já atualizadas, {len(empresas)} com migrações pendentes')
+        if not empresas:
+            self.stdout.write(self.style.SUCCESS('Todos os bancos estão atualizados'))
+            return
+
+        if options['dry_run']:
+            for empresa_id, nome in empresas:
+                self.stdout.write(f'[DRY-RUN] {nome} (ID: {empresa_id}): {pendentes[empresa_id]} migrações pendentes')
+            return
+
+        execucoes = executar_em_empresas(
+            migrar_banco_empresa,
+            empresas,
+            max_workers=options['workers'],
+            timeout=options['timeout'],
+            modo=MODO_PROCESSO,
+            ao_concluir=self.registrar_resultado,
+        )
+
+        falhas = [execucao for execucao in execucoes if not execucao['sucesso']]
+        if falhas:
+            raise CommandError(
+                f'{len(falhas)} empresa(s) com falha na migração; '
+                'execute novamente (ou com --apenas-falhas) para retomar'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Migração concluída em todas as empresas!'))
+
+    def registrar_atualizadas(self, empresa_ids):
+        """Empresas que já estavam atualizadas deixam de constar como falha"""
+        if empresa_ids:
+            Empresa.objects.using('master').filter(id__in=empresa_ids).exclude(
+                status_migracao=Empresa.MIGRACAO_OK
+            ).update(
+                status_migracao=Empresa.MIGRACAO_OK,
+                erro_migracao='',
+                migracao_atualizada_em=timezone.now(),
+            )
+
+    def registrar_resultado(self, execucao, concluidas, total):
+        """Grava o resultado da empresa no master assim que ela termina e exibe o progresso"""
+        Empresa.objects.using('master').filter(id=execucao['empresa_id']).update(
+            status_migracao=Empresa.MIGRACAO_OK if execucao['sucesso'] else Empresa.MIGRACAO_FALHOU,
+            erro_migracao=execucao['erro'] or '',
+            migracao_atualizada_em=timezone.now(),
+        )
+
+        prefixo = f"[{concluidas}/{total}] {execucao['empresa_nome']}"
+        if execucao['sucesso']:
+            aplicadas = execucao['resultado']['migracoes_aplicadas']
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefixo}: {aplicadas} migrações aplicadas ({execucao['duracao']:.1f}s)"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f"{prefixo}: {execucao['erro']}"))
@@ -1,13 +1,51 @@
 """
 Comando para migrar dados existentes para o sistema multiempresa
+
+As tabelas são lidas dos models (db_table real) e copiadas em lotes: a origem
+é percorrida por chave (id > último copiado) com fetchmany, e cada lote é
+gravado no destino em uma transação junto com o progresso, de modo que uma
+migração interrompida pode ser retomada com --empresa-id sem recopiar nada.
+Para mover um banco inteiro, --banco-inteiro usa a API de backup do SQLite.
 """
+import sqlite3
+
+from django.apps import apps
+from django.core import serializers
 from django.core.management.base import BaseCommand, CommandError
 from django.db import connections, transaction
-from django.core.management import call_command
+from django.db.models import F
 from core.models import Empresa, Licenca
-from core.routers import create_empresa_database, get_empresa_database
+from core.routers import create_empresa_database, usando_banco
+from core.provisionamento import copiar_banco_sqlite, migrar_banco, provisionamento_sincrono
+from escalator.models import Escala, Ponto
+from escalator.services import ValidacaoEscalas
 from datetime import datetime, timedelta
 
+# Apps cujos dados vão para o banco da empresa
+APPS_MIGRADAS = ['usuarios', 'escalator']
+
+TABELA_PROGRESSO = 'migracao_empresa_progresso'
+
+
+def listar_models_migrados():
+    """
+    Models das apps migradas em ordem de dependência (referenciados antes),
+    incluindo as tabelas intermediárias de M2M cujos dois lados são copiados
+    """
+    configs = [apps.get_app_config(app) for app in APPS_MIGRADAS]
+    models = serializers.sort_dependencies([(config, None) for config in configs], allow_cycles=True)
+    copiados = set(models)
+
+    for config in configs:
+        for model in config.get_models(include_auto_created=True):
+            if not model._meta.auto_created:
+                continue
+            relacionados = {campo.related_model for campo in model._meta.concrete_fields if campo.is_relation}
+            if relacionados <= copiados:
+                models.append(model)
+    return models
+
+
 class Command(BaseCommand):
     help = 'Migra dados existentes para o sistema multiempresa'
     
@@ -15,21 +53,40 @@ class Command(BaseCommand):
         parser.add_argument(
             '--empresa-nome',
             type=str,
-            required=True,
             help='Nome da empresa para migração',
         )
         parser.add_argument(
             '--empresa-cnpj',
             type=str,
-            required=True,
             help='CNPJ da empresa (formato: XX.XXX.XXX/XXXX-XX)',
         )
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='Empresa já cadastrada: retoma (ou refaz) a migração no banco dela',
+        )
         parser.add_argument(
             '--from-database',
             type=str,
             default='default',
             help='Banco de origem dos dados (padrão: default)',
         )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Registros lidos e gravados por transação (padrão: 5000)',
+        )
+        parser.add_argument(
+            '--banco-inteiro',
+            action='store_true',
+            help='Copia o banco de origem inteiro com a API de backup do SQLite e aplica as migrações pendentes',
+        )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Ignora o progresso salvo e copia todas as tabelas novamente',
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -39,8 +96,17 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         empresa_nome = options['empresa_nome']
         empresa_cnpj = options['empresa_cnpj']
+        empresa_id = options['empresa_id']
         from_database = options['from_database']
         dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+
+        if not empresa_id and not (empresa_nome and empresa_cnpj):
+            raise CommandError('Informe --empresa-nome e --empresa-cnpj, ou --empresa-id de uma empresa existente')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser maior que zero')
+        if from_database not in connections:
+            raise CommandError(f'Banco de origem {from_database} não configurado')
         
         if dry_run:
             self.stdout.write(
@@ -48,20 +114,37 @@ class Command(BaseCommand):
             )
         
         try:
-            # Cria empresa no banco master
-            empresa = self.create_empresa_master(empresa_nome, empresa_cnpj, dry_run)
-            
-            if not dry_run and empresa:
+            if empresa_id:
+                empresa = Empresa.objects.using('master').filter(id=empresa_id).first()
+                if empresa is None:
+                    raise CommandError(f'Empresa com ID {empresa_id} não encontrada')
+                self.stdout.write(f'Empresa existente: {empresa.nome} (ID: {empresa.id})')
+            else:
+                # Cria empresa no banco master (o banco é provisionado no commit,
+                # antes de seguir para a cópia dos dados)
+                with provisionamento_sincrono():
+                    empresa = self.create_empresa_master(empresa_nome, empresa_cnpj, dry_run)
+
+            if dry_run:
+                self.show_plan(from_database, options['banco_inteiro'])
+            elif empresa:
                 # Cria banco da empresa
                 db_alias = create_empresa_database(empresa.id)
+                if db_alias == from_database:
+                    raise CommandError('O banco de origem é o próprio banco da empresa')
                 
                 # Migra dados do banco origem para o banco da empresa
-                self.migrate_data(from_database, db_alias, empresa.id)
+                if options['banco_inteiro']:
+                    self.copy_database(from_database, db_alias, empresa.id)
+                else:
+                    self.migrate_data(from_database, db_alias, empresa.id, options['lote'], options['reiniciar'])
                 
                 self.stdout.write(
-                    self.style.SUCCESS(f'Migração concluída para empresa {empresa_nome}!')
+                    self.style.SUCCESS(f'Migração concluída para empresa {empresa.nome}!')
                 )
             
+        except CommandError:
+            raise
         except Exception as e:
             raise CommandError(f'Erro durante migração: {e}')
     
@@ -108,96 +191,218 @@ class Command(BaseCommand):
         except Exception as e:
             raise CommandError(f'Erro ao criar empresa: {e}')
     
-    def migrate_data(self, from_db, to_db, empresa_id):
-        """Migra dados entre bancos"""
+    def show_plan(self, from_db, banco_inteiro):
+        """Mostra o que seria copiado no dry-run"""
+        if banco_inteiro:
+            self.stdout.write(f"[DRY-RUN] Copiaria o banco {connections[from_db].settings_dict['NAME']} inteiro")
+            return
+
+        with connections[from_db].cursor() as cursor:
+            for model in listar_models_migrados():
+                table = model._meta.db_table
+                if not self.table_columns(connections[from_db], table):
+                    self.stdout.write(f'[DRY-RUN] Tabela {table} não encontrada no banco origem')
+                    continue
+                cursor.execute(f'SELECT COUNT(*) FROM {connections[from_db].ops.quote_name(table)}')
+                self.stdout.write(f'[DRY-RUN] Copiaria {cursor.fetchone()[0]} registros da tabela {table}')
+
+    def copy_database(self, from_db, to_db, empresa_id):
+        """Substitui o banco da empresa por uma cópia do banco de origem (API de backup)"""
+        origem = connections[from_db].settings_dict['NAME']
+        destino = connections[to_db].settings_dict['NAME']
+        self.stdout.write(f'Copiando banco {origem} para {destino}...')
+
+        connections[to_db].close()
+        copiar_banco_sqlite(origem, destino)
+        connections[to_db].close()
+
+        aplicadas = migrar_banco(to_db)
+        if aplicadas:
+            self.stdout.write(f'{aplicadas} migrações aplicadas no banco copiado')
+
+        # Mesmo ajuste da cópia por tabela: usuários passam a apontar para a empresa
+        with transaction.atomic(using=to_db), connections[to_db].cursor() as cursor:
+            for model in listar_models_migrados():
+                if 'empresa_id' in self.table_columns(connections[to_db], model._meta.db_table):
+                    cursor.execute(
+                        f'UPDATE {connections[to_db].ops.quote_name(model._meta.db_table)} SET empresa_id = %s',
+                        [empresa_id],
+                    )
+
+        self.stdout.write(self.style.SUCCESS('Banco copiado com sucesso!'))
+
+    def migrate_data(self, from_db, to_db, empresa_id, lote=5000, reiniciar=False):
+        """Migra dados entre bancos, tabela a tabela, retomando do progresso salvo"""
         self.stdout.write(f'Migrando dados de {from_db} para {to_db}...')
         
-        # Lista de tabelas para migrar (excluindo tabelas do core)
-        tables_to_migrate = [
-            'escalator_funcionario',
-            'escalator_turno',
-            'escalator_escala',
-            'escalator_folga',
-            'escalator_escalapredefinida',
-            'escalator_contrato',
-            'escalator_ponto',
-            'escalator_bancohoras',
-            'escalator_configuracaosistema',
-            'usuarios_usuario',
-            'usuarios_perfil',
-            'usuarios_grupo',
-            'usuarios_permissao',
-        ]
-        
         from_conn = connections[from_db]
         to_conn = connections[to_db]
+        progresso = self.load_progress(to_conn, from_db, reiniciar)
         
         try:
-            with transaction.atomic(using=to_db):
-                for table in tables_to_migrate:
-                    self.migrate_table(from_conn, to_conn, table, empresa_id)
+            for model in listar_models_migrados():
+                self.migrate_table(from_conn, to_conn, model, empresa_id, lote, progresso)
+            self.preencher_atualizacao(from_conn, to_conn)
+            self.recalcular_previstos(from_conn, to_conn)
+            self.revalidar_escalas(from_conn, to_conn)
             
             self.stdout.write(
                 self.style.SUCCESS('Dados migrados com sucesso!')
             )
             
         except Exception as e:
-            raise CommandError(f'Erro ao migrar dados: {e}')
+            raise CommandError(
+                f'Erro ao migrar dados: {e}. Execute novamente com --empresa-id {empresa_id} para retomar'
+            )
+
+    def preencher_atualizacao(self, from_conn, to_conn):
+        """Tabelas vindas de um schema sem updated_at recebem a data de criação (o default do banco é UTC)"""
+        for model in (Escala, Ponto):
+            if 'updated_at' in self.table_columns(from_conn, model._meta.db_table):
+                continue
+            model.objects.using(to_conn.alias).update(updated_at=F('created_at'))
+    
+    def recalcular_previstos(self, from_conn, to_conn):
+        """Escalas vindas de um schema sem os campos previstos (duração, noturnos) são calculadas no destino"""
+        if 'duracao_minutos' in self.table_columns(from_conn, Escala._meta.db_table):
+            return
+        
+        escalas = Escala.objects.using(to_conn.alias).filter(
+            descanso=False, hora_inicio__isnull=False, hora_fim__isnull=False, fim_previsto__isnull=True
+        )
+        total = Escala.recalcular_previstos(escalas)
+        if total:
+            self.stdout.write(f'Previstos calculados em {total} escalas')
     
-    def migrate_table(self, from_conn, to_conn, table_name, empresa_id):
-        """Migra uma tabela específica"""
+    def revalidar_escalas(self, from_conn, to_conn):
+        """Escalas vindas de um schema sem a situação nas regras (valida) são revalidadas no destino"""
+        if 'valida' in self.table_columns(from_conn, Escala._meta.db_table):
+            return
+        
+        with usando_banco(to_conn.alias):
+            situacoes = ValidacaoEscalas().revalidar()
+        if situacoes:
+            self.stdout.write(f'Situação nas regras calculada em {len(situacoes)} escalas')
+    
+    def table_columns(self, conn, table_name):
+        """Colunas da tabela no banco (lista vazia se a tabela não existir)"""
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA table_info({conn.ops.quote_name(table_name)})')
+            return [col[1] for col in cursor.fetchall()]
+
+    def load_progress(self, to_conn, from_db, reiniciar):
+        """Cria a tabela de progresso no destino e retorna {tabela: (ultimo_id, linhas, concluida)}"""
+        with to_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {TABELA_PROGRESSO} (
+                    tabela TEXT PRIMARY KEY,
+                    origem TEXT NOT NULL,
+                    ultimo_id INTEGER NOT NULL,
+                    linhas INTEGER NOT NULL,
+                    concluida INTEGER NOT NULL,
+                    atualizado_em TEXT NOT NULL
+                )
+            """)
+            if reiniciar:
+                cursor.execute(f'DELETE FROM {TABELA_PROGRESSO}')
+                return {}
+
+            cursor.execute(f'SELECT tabela, origem, ultimo_id, linhas, concluida FROM {TABELA_PROGRESSO}')
+            linhas = cursor.fetchall()
+
+        outras_origens = {origem for _, origem, _, _, _ in linhas if origem != from_db}
+        if outras_origens:
+            raise CommandError(
+                f'Há uma migração de {", ".join(sorted(outras_origens))} em andamento neste banco; '
+                'use --reiniciar para descartá-la'
+            )
+        return {tabela: (ultimo_id, total, bool(concluida)) for tabela, _, ultimo_id, total, concluida in linhas}
+
+    def save_progress(self, cursor, table_name, from_db, ultimo_id, linhas, concluida):
+        cursor.execute(
+            f"""
+            INSERT INTO {TABELA_PROGRESSO} (tabela, origem, ultimo_id, linhas, concluida, atualizado_em)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT(tabela) DO UPDATE SET
+                ultimo_id = excluded.ultimo_id,
+                linhas = excluded.linhas,
+                concluida = excluded.concluida,
+                atualizado_em = excluded.atualizado_em
+            """,
+            [table_name, from_db, ultimo_id, linhas, int(concluida), datetime.now().isoformat()],
+        )
+    
+    def migrate_table(self, from_conn, to_conn, model, empresa_id, lote, progresso):
+        """
+        Migra uma tabela em lotes. A leitura é um único SELECT ordenado pela
+        chave, consumido com fetchmany; cada lote é gravado com o progresso
+        na mesma transação do destino. A memória usada depende só do lote.
+        """
+        table_name = model._meta.db_table
+        pk = model._meta.pk.column
+        ultimo_id, total, concluida = progresso.get(table_name, (None, 0, False))
+
+        if concluida:
+            self.stdout.write(f'Tabela {table_name} já migrada ({total} registros)')
+            return
+
+        # Verifica se a tabela existe no banco origem
+        origem_colunas = set(self.table_columns(from_conn, table_name))
+        if not origem_colunas:
+            self.stdout.write(f'Tabela {table_name} não encontrada no banco origem')
+            return
+
+        # Apenas colunas presentes nos dois lados (a origem pode estar em outra versão do schema)
+        columns = [col for col in self.table_columns(to_conn, table_name) if col in origem_colunas]
+        if pk not in columns:
+            self.stdout.write(self.style.WARNING(f'Tabela {table_name} sem a coluna {pk} na origem, ignorada'))
+            return
+
+        quote = from_conn.ops.quote_name
+        columns_str = ', '.join(quote(col) for col in columns)
+        placeholders = ', '.join(['%s'] * len(columns))
+        pk_index = columns.index(pk)
+        empresa_id_index = columns.index('empresa_id') if 'empresa_id' in columns else None
+
+        select = f'SELECT {columns_str} FROM {quote(table_name)}'
+        params = []
+        if ultimo_id is not None:
+            select += f' WHERE {quote(pk)} > ?'
+            params.append(ultimo_id)
+            self.stdout.write(f'Retomando tabela {table_name} após {pk} {ultimo_id} ({total} registros já migrados)')
+        select += f' ORDER BY {quote(pk)}'
+
+        insert = f'INSERT OR REPLACE INTO {quote(table_name)} ({columns_str}) VALUES ({placeholders})'
+
+        # Leitura direta no SQLite, sem os conversores de tipo do Django: os
+        # valores chegam como estão gravados e são regravados sem conversão
+        origem = sqlite3.connect(f"file:{from_conn.settings_dict['NAME']}?mode=ro", uri=True)
         try:
-            with from_conn.cursor() as from_cursor:
-                # Verifica se a tabela existe no banco origem
-                from_cursor.execute(f"""
-                    SELECT name FROM sqlite_master 
-                    WHERE type='table' AND name='{table_name}'
-                """)
-                
-                if not from_cursor.fetchone():
-                    self.stdout.write(f'Tabela {table_name} não encontrada no banco origem')
-                    return
-                
-                # Busca dados da tabela
-                from_cursor.execute(f"SELECT * FROM {table_name}")
-                rows = from_cursor.fetchall()
-                
+            from_cursor = origem.execute(select, params)
+            while True:
+                rows = from_cursor.fetchmany(lote)
                 if not rows:
-                    self.stdout.write(f'Tabela {table_name} está vazia')
-                    return
-                
-                # Busca estrutura da tabela
-                from_cursor.execute(f"PRAGMA table_info({table_name})")
-                columns_info = from_cursor.fetchall()
-                columns = [col[1] for col in columns_info]
-                
-            # Insere dados no banco destino
-            with to_conn.cursor() as to_cursor:
-                placeholders = ', '.join(['?' for _ in columns])
-                columns_str = ', '.join(columns)
-                
-                # Adiciona empresa_id se a tabela tiver esse campo
-                if 'empresa_id' in columns:
+                    break
+
+                if empresa_id_index is not None:
                     # Atualiza dados para incluir empresa_id
-                    updated_rows = []
-                    empresa_id_index = columns.index('empresa_id')
-                    
-                    for row in rows:
-                        row_list = list(row)
-                        row_list[empresa_id_index] = empresa_id
-                        updated_rows.append(tuple(row_list))
-                    
-                    rows = updated_rows
-                
-                # Insere dados
-                to_cursor.executemany(
-                    f"INSERT OR REPLACE INTO {table_name} ({columns_str}) VALUES ({placeholders})",
-                    rows
-                )
-                
-                self.stdout.write(f'Migrados {len(rows)} registros da tabela {table_name}')
-                
-        except Exception as e:
-            self.stdout.write(
-                self.style.WARNING(f'Erro ao migrar tabela {table_name}: {e}')
-            )
\ No newline at end of file
+                    rows = [
+                        row[:empresa_id_index] + (empresa_id,) + row[empresa_id_index + 1:]
+                        for row in rows
+                    ]
+
+                ultimo_id = rows[-1][pk_index]
+                total += len(rows)
+                with transaction.atomic(using=to_conn.alias), to_conn.cursor() as to_cursor:
+                    to_cursor.executemany(insert, rows)
+                    self.save_progress(to_cursor, table_name, from_conn.alias, ultimo_id, total, False)
+
+                if self.verbosity > 1:
+                    self.stdout.write(f'  {table_name}: {total} registros')
+        finally:
+            origem.close()
+
+        with transaction.atomic(using=to_conn.alias), to_conn.cursor() as to_cursor:
+            self.save_progress(to_cursor, table_name, from_conn.alias, ultimo_id or 0, total, True)
+
+        self.stdout.write(f'Migrados {total} registros da tabela {table_name}')
@@ -0,0 +1,50 @@
+"""
+Comando para preparar o banco modelo (template) usado no provisionamento de empresas
+"""
+from django.core.management.base import BaseCommand, CommandError
+from core.provisionamento import get_caminho_template, preparar_template, verificar_template
+
+
+class Command(BaseCommand):
+    help = 'Cria ou atualiza o banco modelo copiado para cada nova empresa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Apenas informa se o template está atualizado com as migrações',
+        )
+        parser.add_argument(
+            '--se-desatualizado',
+            action='store_true',
+            help='Recria o template somente se faltar alguma migração (útil no deploy)',
+        )
+
+    def handle(self, *args, **options):
+        caminho = get_caminho_template()
+        pendentes = verificar_template(caminho)
+
+        if options['verificar']:
+            if pendentes is None:
+                raise CommandError(f'Template inexistente em {caminho}')
+            if pendentes:
+                self.stdout.write(self.style.WARNING(f'Template desatualizado: {len(pendentes)} migrações pendentes'))
+                for app, migracao in pendentes:
+                    self.stdout.write(f'  {app}.{migracao}')
+                raise CommandError('Execute preparar_template_empresa para atualizar o template')
+            self.stdout.write(self.style.SUCCESS(f'Template atualizado em {caminho}'))
+            return
+
+        if options['se_desatualizado'] and pendentes == []:
+            self.stdout.write(self.style.SUCCESS(f'Template já está atualizado em {caminho}'))
+            return
+
+        self.stdout.write(f'Preparando template em {caminho}...')
+        try:
+            resultado = preparar_template(caminho)
+        except Exception as e:
+            raise CommandError(f'Erro ao preparar template: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Template preparado ({resultado['migracoes_aplicadas']} migrações aplicadas)"
+        ))
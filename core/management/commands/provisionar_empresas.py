@@ -0,0 +1,89 @@
+"""
+Comando para (re)processar o provisionamento dos bancos das empresas
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Empresa
+from core.provisionamento import executar_provisionamento
+from core.tenants import executar_em_empresas
+
+
+class Command(BaseCommand):
+    help = 'Provisiona empresas pendentes, com falha ou travadas no provisionamento'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='ID da empresa específica (opcional)',
+        )
+        parser.add_argument(
+            '--forcar',
+            action='store_true',
+            help='Reprocessa também empresas prontas (aplica migrações pendentes)',
+        )
+        parser.add_argument(
+            '--travado-minutos',
+            type=int,
+            default=30,
+            help='Retoma empresas em "provisionando" há mais de N minutos (padrão: 30; 0 desativa)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Empresas provisionadas em paralelo (padrão: 2)',
+        )
+
+    def handle(self, *args, **options):
+        estados = [Empresa.PROVISIONAMENTO_PENDENTE, Empresa.PROVISIONAMENTO_FALHOU]
+        if options['travado_minutos']:
+            estados.append(Empresa.PROVISIONAMENTO_EM_ANDAMENTO)
+        if options['forcar']:
+            estados.append(Empresa.PROVISIONAMENTO_PRONTO)
+
+        empresas = Empresa.objects.using('master').filter(status_provisionamento__in=estados).order_by('id')
+        if options['empresa_id']:
+            empresas = empresas.filter(id=options['empresa_id'])
+        empresas = list(empresas.values_list('id', 'nome'))
+
+        if not empresas:
+            self.stdout.write(self.style.SUCCESS('Nenhuma empresa aguardando provisionamento'))
+            return
+
+        self.stdout.write(f'Provisionando {len(empresas)} empresas...')
+        travado_apos = timedelta(minutes=options['travado_minutos']) if options['travado_minutos'] else None
+
+        execucoes = executar_em_empresas(
+            executar_provisionamento,
+            empresas,
+            kwargs={'forcar': options['forcar'], 'travado_apos': travado_apos},
+            max_workers=options['workers'],
+            exigir_banco=False,
+            ao_concluir=self.exibir_resultado,
+        )
+
+        falhas = [
+            execucao for execucao in execucoes
+            if not execucao['sucesso'] or execucao['resultado']['status'] == Empresa.PROVISIONAMENTO_FALHOU
+        ]
+        if falhas:
+            raise CommandError(f'{len(falhas)} empresa(s) com falha no provisionamento')
+
+        self.stdout.write(self.style.SUCCESS('Provisionamento concluído!'))
+
+    def exibir_resultado(self, execucao, concluidas, total):
+        prefixo = f"[{concluidas}/{total}] {execucao['empresa_nome']}"
+        if not execucao['sucesso']:
+            self.stdout.write(self.style.ERROR(f"{prefixo}: {execucao['erro']}"))
+            return
+
+        resultado = execucao['resultado']
+        if not resultado['executado']:
+            self.stdout.write(f"{prefixo}: ignorada (status {resultado['status']})")
+        elif resultado['status'] == Empresa.PROVISIONAMENTO_FALHOU:
+            self.stdout.write(self.style.ERROR(f"{prefixo}: falhou ({resultado['erro']})"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefixo}: pronta ({resultado['origem']}, {resultado['migracoes_aplicadas']} migrações aplicadas)"
+            ))
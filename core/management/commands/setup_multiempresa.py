@@ -5,7 +5,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import connections, transaction
 from django.core.management import call_command
 from core.models import Empresa, Licenca
-from core.routers import create_empresa_database
+from core.provisionamento import executar_provisionamento, provisionamento_sincrono
 from datetime import datetime, timedelta
 
 class Command(BaseCommand):
@@ -36,7 +36,8 @@ class Command(BaseCommand):
             self.create_empresa_database(options['empresa_id'])
         
         if options['create_sample']:
-            self.create_sample_data()
+            with provisionamento_sincrono():
+                self.create_sample_data()
         
         if not any([options['create_master'], options['empresa_id'], options['create_sample']]):
             self.stdout.write(
@@ -64,24 +65,15 @@ class Command(BaseCommand):
             # Verifica se a empresa existe no banco master
             empresa = Empresa.objects.using('master').get(id=empresa_id)
             
-            # Cria o banco da empresa
-            db_alias = create_empresa_database(empresa_id)
-            
-            # Executa migrações no banco da empresa (exceto core e algumas específicas)
-            try:
-                call_command('migrate', f'--database={db_alias}', 'contenttypes', verbosity=0)
-                call_command('migrate', f'--database={db_alias}', 'auth', verbosity=0)
-                call_command('migrate', f'--database={db_alias}', 'admin', verbosity=0)
-                call_command('migrate', f'--database={db_alias}', 'sessions', verbosity=0)
-                call_command('migrate', f'--database={db_alias}', 'usuarios', verbosity=0)
-                
-                # Para escalator, executa apenas as migrações básicas, pulando as que podem causar problemas
-                call_command('migrate', f'--database={db_alias}', 'escalator', '0002_escalapredefinida', verbosity=0)
-                
-            except Exception as migration_error:
-                self.stdout.write(
-                    self.style.WARNING(f'Aviso: Algumas migrações podem ter falhado: {migration_error}')
+            # Cria o banco da empresa (cópia do template) ou aplica as migrações
+            # pendentes em um banco existente, registrando o status no master
+            resultado = executar_provisionamento(empresa_id, forcar=True)
+            if not resultado['executado']:
+                raise CommandError(
+                    f"Provisionamento da empresa em andamento (status {resultado['status']})"
                 )
+            if resultado['status'] == Empresa.PROVISIONAMENTO_FALHOU:
+                raise CommandError(resultado['erro'])
             
             self.stdout.write(
                 self.style.SUCCESS(f'Banco da empresa {empresa.nome} criado com sucesso!')
@@ -89,6 +81,8 @@ class Command(BaseCommand):
             
         except Empresa.DoesNotExist:
             raise CommandError(f'Empresa com ID {empresa_id} não encontrada no banco master')
+        except CommandError:
+            raise
         except Exception as e:
             raise CommandError(f'Erro ao criar banco da empresa: {e}')
     
@@ -2,11 +2,172 @@
 Comando para sincronizar dados de licenças entre o banco master e os bancos das empresas
 """
 from django.core.management.base import BaseCommand, CommandError
-from django.db import connections, transaction
+from django.db import connections
 from core.models import Empresa, Licenca
 from core.routers import get_empresa_database
+from core.tenants import MODO_PROCESSO, MODO_THREAD, executar_em_empresas, listar_empresas
 import json
 
+
+def sincronizar_empresa(empresa_id, dry_run=False, force=False):
+    """
+    Sincroniza a licença de uma empresa (executada no pool de empresas).
+    Retorna {'status', 'mensagem'} e, no dry-run, os dados que seriam gravados.
+    """
+    # Busca empresa no banco master
+    empresa = Empresa.objects.using('master').get(id=empresa_id, ativa=True)
+
+    # Busca licença ativa no banco master
+    licenca_master = Licenca.objects.using('master').filter(
+        empresa=empresa,
+        status='ativa'
+    ).first()
+
+    if not licenca_master:
+        return {'status': 'sem_licenca', 'mensagem': f'Nenhuma licença ativa encontrada para {empresa.nome}'}
+
+    # Prepara dados da licença para sincronização
+    licenca_data = {
+        'empresa_id': empresa.id,
+        'empresa_nome': empresa.nome,
+        'empresa_cnpj': empresa.cnpj,
+        'tipo': licenca_master.tipo,
+        'status': licenca_master.status,
+        'max_funcionarios': licenca_master.max_funcionarios,
+        'max_usuarios': licenca_master.max_usuarios,
+        'permite_banco_horas': licenca_master.permite_banco_horas,
+        'permite_ponto_eletronico': licenca_master.permite_ponto_eletronico,
+        'permite_relatorios_avancados': licenca_master.permite_relatorios_avancados,
+        'permite_integracao_api': licenca_master.permite_integracao_api,
+        'data_inicio': licenca_master.data_inicio,
+        'data_fim': licenca_master.data_fim,
+        'valor_mensal': licenca_master.valor_mensal,
+        # Gravado como texto ISO para que a comparação com a cópia seja consistente
+        'data_atualizacao': licenca_master.updated_at.isoformat(),
+    }
+
+    if dry_run:
+        return {'status': 'dry_run', 'mensagem': f'[DRY-RUN] Sincronizaria licença para {empresa.nome}',
+                'dados': licenca_data}
+
+    # Executa sincronização no banco da empresa
+    if criar_ou_atualizar_copia_licenca(get_empresa_database(empresa_id), licenca_data, force):
+        return {'status': 'sincronizada', 'mensagem': f'Licença sincronizada para {empresa.nome}'}
+    return {'status': 'atualizada', 'mensagem': f'Licença de {empresa.nome} já estava atualizada'}
+
+
+def criar_ou_atualizar_copia_licenca(db_alias, licenca_data, force=False):
+    """Cria ou atualiza cópia da licença no banco da empresa; retorna False se já estava atualizada"""
+    # Usa conexão direta para criar/atualizar tabela de licença
+    with connections[db_alias].cursor() as cursor:
+        # Cria tabela se não existir
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS core_licenca_copy (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                empresa_id INTEGER NOT NULL,
+                empresa_nome VARCHAR(200) NOT NULL,
+                empresa_cnpj VARCHAR(18) NOT NULL,
+                tipo VARCHAR(20) NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                max_funcionarios INTEGER,
+                max_usuarios INTEGER,
+                permite_banco_horas BOOLEAN NOT NULL,
+                permite_ponto_eletronico BOOLEAN NOT NULL,
+                permite_relatorios_avancados BOOLEAN NOT NULL,
+                permite_integracao_api BOOLEAN NOT NULL,
+                data_inicio DATE NOT NULL,
+                data_fim DATE,
+                valor_mensal DECIMAL(10, 2),
+                data_atualizacao DATETIME NOT NULL,
+                data_sincronizacao DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Verifica se já existe registro
+        cursor.execute(
+            "SELECT data_atualizacao FROM core_licenca_copy WHERE empresa_id = %s",
+            [licenca_data['empresa_id']]
+        )
+        
+        existing = cursor.fetchone()
+        
+        if existing and not force:
+            # Compara datas de atualização
+            # A coluna DATETIME pode voltar convertida para datetime pelo driver
+            existing_date = existing[0]
+            if hasattr(existing_date, 'isoformat'):
+                existing_date = existing_date.isoformat()
+            
+            if existing_date >= licenca_data['data_atualizacao']:
+                return False  # Dados já estão atualizados
+        
+        # Insere ou atualiza dados
+        if existing:
+            cursor.execute("""
+                UPDATE core_licenca_copy SET
+                    empresa_nome = %s,
+                    empresa_cnpj = %s,
+                    tipo = %s,
+                    status = %s,
+                    max_funcionarios = %s,
+                    max_usuarios = %s,
+                    permite_banco_horas = %s,
+                    permite_ponto_eletronico = %s,
+                    permite_relatorios_avancados = %s,
+                    permite_integracao_api = %s,
+                    data_inicio = %s,
+                    data_fim = %s,
+                    valor_mensal = %s,
+                    data_atualizacao = %s,
+                    data_sincronizacao = CURRENT_TIMESTAMP
+                WHERE empresa_id = %s
+            """, [
+                licenca_data['empresa_nome'],
+                licenca_data['empresa_cnpj'],
+                licenca_data['tipo'],
+                licenca_data['status'],
+                licenca_data['max_funcionarios'],
+                licenca_data['max_usuarios'],
+                licenca_data['permite_banco_horas'],
+                licenca_data['permite_ponto_eletronico'],
+                licenca_data['permite_relatorios_avancados'],
+                licenca_data['permite_integracao_api'],
+                licenca_data['data_inicio'],
+                licenca_data['data_fim'],
+                licenca_data['valor_mensal'],
+                licenca_data['data_atualizacao'],
+                licenca_data['empresa_id']
+            ])
+        else:
+            cursor.execute("""
+                INSERT INTO core_licenca_copy (
+                    empresa_id, empresa_nome, empresa_cnpj, tipo, status,
+                    max_funcionarios, max_usuarios, permite_banco_horas,
+                    permite_ponto_eletronico, permite_relatorios_avancados,
+                    permite_integracao_api, data_inicio, data_fim,
+                    valor_mensal, data_atualizacao
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, [
+                licenca_data['empresa_id'],
+                licenca_data['empresa_nome'],
+                licenca_data['empresa_cnpj'],
+                licenca_data['tipo'],
+                licenca_data['status'],
+                licenca_data['max_funcionarios'],
+                licenca_data['max_usuarios'],
+                licenca_data['permite_banco_horas'],
+                licenca_data['permite_ponto_eletronico'],
+                licenca_data['permite_relatorios_avancados'],
+                licenca_data['permite_integracao_api'],
+                licenca_data['data_inicio'],
+                licenca_data['data_fim'],
+                licenca_data['valor_mensal'],
+                licenca_data['data_atualizacao']
+            ])
+
+    return True
+
+
 class Command(BaseCommand):
     help = 'Sincroniza dados de licenças entre banco master e bancos das empresas'
     
@@ -26,10 +187,26 @@ class Command(BaseCommand):
             action='store_true',
             help='Força a sincronização mesmo se os dados estiverem atualizados',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Empresas sincronizadas em paralelo (padrão: 4)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=60,
+            help='Tempo limite por empresa em segundos (padrão: 60)',
+        )
+        parser.add_argument(
+            '--processos',
+            action='store_true',
+            help='Usa processos em vez de threads (interrompe as empresas que excedem o tempo limite)',
+        )
     
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        force = options['force']
         empresa_id = options['empresa_id']
         
         if dry_run:
@@ -38,202 +215,49 @@ class Command(BaseCommand):
             )
         
         try:
-            if empresa_id:
-                # Sincroniza apenas uma empresa específica
-                self.sync_empresa_licenca(empresa_id, dry_run, force)
-            else:
-                # Sincroniza todas as empresas ativas
-                self.sync_all_empresas(dry_run, force)
-                
+            empresas = listar_empresas(empresa_id)
         except Exception as e:
             raise CommandError(f'Erro durante sincronização: {e}')
-    
-    def sync_all_empresas(self, dry_run=False, force=False):
-        """Sincroniza licenças de todas as empresas ativas"""
-        empresas = Empresa.objects.using('master').filter(ativa=True)
-        
-        self.stdout.write(f'Sincronizando {empresas.count()} empresas...')
+
+        if empresa_id and not empresas:
+            raise CommandError(f'Empresa com ID {empresa_id} não encontrada ou inativa')
         
-        for empresa in empresas:
-            try:
-                self.sync_empresa_licenca(empresa.id, dry_run, force)
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Erro ao sincronizar empresa {empresa.nome}: {e}')
-                )
-                continue
+        self.stdout.write(f'Sincronizando {len(empresas)} empresas...')
         
-        self.stdout.write(
-            self.style.SUCCESS('Sincronização de todas as empresas concluída!')
+        execucoes = executar_em_empresas(
+            sincronizar_empresa,
+            empresas,
+            args=(dry_run, options['force']),
+            max_workers=options['workers'],
+            timeout=options['timeout'],
+            modo=MODO_PROCESSO if options['processos'] else MODO_THREAD,
+            ao_concluir=self.exibir_resultado,
         )
-    
-    def sync_empresa_licenca(self, empresa_id, dry_run=False, force=False):
-        """Sincroniza licença de uma empresa específica"""
-        try:
-            # Busca empresa no banco master
-            empresa = Empresa.objects.using('master').get(id=empresa_id, ativa=True)
-            
-            # Busca licença ativa no banco master
-            licenca_master = Licenca.objects.using('master').filter(
-                empresa=empresa,
-                status='ativa'
-            ).first()
-            
-            if not licenca_master:
-                self.stdout.write(
-                    self.style.WARNING(f'Nenhuma licença ativa encontrada para {empresa.nome}')
-                )
-                return
-            
-            # Obtém alias do banco da empresa
-            db_alias = get_empresa_database(empresa_id)
-            
-            # Verifica se o banco da empresa existe
-            if db_alias not in connections.databases:
-                self.stdout.write(
-                    self.style.WARNING(f'Banco da empresa {empresa.nome} não encontrado')
-                )
-                return
-            
-            # Prepara dados da licença para sincronização
-            licenca_data = {
-                'empresa_id': empresa.id,
-                'empresa_nome': empresa.nome,
-                'empresa_cnpj': empresa.cnpj,
-                'tipo': licenca_master.tipo,
-                'status': licenca_master.status,
-                'max_funcionarios': licenca_master.max_funcionarios,
-                'max_usuarios': licenca_master.max_usuarios,
-                'permite_banco_horas': licenca_master.permite_banco_horas,
-                'permite_ponto_eletronico': licenca_master.permite_ponto_eletronico,
-                'permite_relatorios_avancados': licenca_master.permite_relatorios_avancados,
-                'permite_integracao_api': licenca_master.permite_integracao_api,
-                'data_inicio': licenca_master.data_inicio,
-                'data_fim': licenca_master.data_fim,
-                'valor_mensal': licenca_master.valor_mensal,
-                'data_atualizacao': licenca_master.data_atualizacao,
-            }
-            
-            if dry_run:
-                self.stdout.write(f'[DRY-RUN] Sincronizaria licença para {empresa.nome}')
-                self.stdout.write(f'Dados: {json.dumps(licenca_data, default=str, indent=2)}')
-                return
-            
-            # Executa sincronização no banco da empresa
-            self.create_or_update_licenca_copy(db_alias, licenca_data, force)
-            
+        
+        falhas = [execucao for execucao in execucoes if not execucao['sucesso']]
+        if falhas:
             self.stdout.write(
-                self.style.SUCCESS(f'Licença sincronizada para {empresa.nome}')
+                self.style.WARNING(f'Sincronização concluída com {len(falhas)} falha(s) em {len(execucoes)} empresas')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS('Sincronização de todas as empresas concluída!')
             )
-            
-        except Empresa.DoesNotExist:
-            raise CommandError(f'Empresa com ID {empresa_id} não encontrada ou inativa')
     
-    def create_or_update_licenca_copy(self, db_alias, licenca_data, force=False):
-        """Cria ou atualiza cópia da licença no banco da empresa"""
-        from django.db import connection
-        
-        # Usa conexão direta para criar/atualizar tabela de licença
-        with connections[db_alias].cursor() as cursor:
-            # Cria tabela se não existir
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS core_licenca_copy (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    empresa_id INTEGER NOT NULL,
-                    empresa_nome VARCHAR(200) NOT NULL,
-                    empresa_cnpj VARCHAR(18) NOT NULL,
-                    tipo VARCHAR(20) NOT NULL,
-                    status VARCHAR(20) NOT NULL,
-                    max_funcionarios INTEGER,
-                    max_usuarios INTEGER,
-                    permite_banco_horas BOOLEAN NOT NULL,
-                    permite_ponto_eletronico BOOLEAN NOT NULL,
-                    permite_relatorios_avancados BOOLEAN NOT NULL,
-                    permite_integracao_api BOOLEAN NOT NULL,
-                    data_inicio DATE NOT NULL,
-                    data_fim DATE,
-                    valor_mensal DECIMAL(10, 2),
-                    data_atualizacao DATETIME NOT NULL,
-                    data_sincronizacao DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Verifica se já existe registro
-            cursor.execute(
-                "SELECT data_atualizacao FROM core_licenca_copy WHERE empresa_id = ?",
-                [licenca_data['empresa_id']]
+    def exibir_resultado(self, execucao, concluidas, total):
+        """Exibe o resultado de cada empresa assim que ela termina"""
+        prefixo = f'[{concluidas}/{total}]'
+        if not execucao['sucesso']:
+            self.stdout.write(
+                self.style.ERROR(f"{prefixo} Erro ao sincronizar empresa {execucao['empresa_nome']}: {execucao['erro']}")
             )
-            
-            existing = cursor.fetchone()
-            
-            if existing and not force:
-                # Compara datas de atualização
-                existing_date = existing[0]
-                new_date = licenca_data['data_atualizacao'].isoformat()
-                
-                if existing_date >= new_date:
-                    return  # Dados já estão atualizados
-            
-            # Insere ou atualiza dados
-            if existing:
-                cursor.execute("""
-                    UPDATE core_licenca_copy SET
-                        empresa_nome = ?,
-                        empresa_cnpj = ?,
-                        tipo = ?,
-                        status = ?,
-                        max_funcionarios = ?,
-                        max_usuarios = ?,
-                        permite_banco_horas = ?,
-                        permite_ponto_eletronico = ?,
-                        permite_relatorios_avancados = ?,
-                        permite_integracao_api = ?,
-                        data_inicio = ?,
-                        data_fim = ?,
-                        valor_mensal = ?,
-                        data_atualizacao = ?,
-                        data_sincronizacao = CURRENT_TIMESTAMP
-                    WHERE empresa_id = ?
-                """, [
-                    licenca_data['empresa_nome'],
-                    licenca_data['empresa_cnpj'],
-                    licenca_data['tipo'],
-                    licenca_data['status'],
-                    licenca_data['max_funcionarios'],
-                    licenca_data['max_usuarios'],
-                    licenca_data['permite_banco_horas'],
-                    licenca_data['permite_ponto_eletronico'],
-                    licenca_data['permite_relatorios_avancados'],
-                    licenca_data['permite_integracao_api'],
-                    licenca_data['data_inicio'],
-                    licenca_data['data_fim'],
-                    licenca_data['valor_mensal'],
-                    licenca_data['data_atualizacao'],
-                    licenca_data['empresa_id']
-                ])
-            else:
-                cursor.execute("""
-                    INSERT INTO core_licenca_copy (
-                        empresa_id, empresa_nome, empresa_cnpj, tipo, status,
-                        max_funcionarios, max_usuarios, permite_banco_horas,
-                        permite_ponto_eletronico, permite_relatorios_avancados,
-                        permite_integracao_api, data_inicio, data_fim,
-                        valor_mensal, data_atualizacao
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, [
-                    licenca_data['empresa_id'],
-                    licenca_data['empresa_nome'],
-                    licenca_data['empresa_cnpj'],
-                    licenca_data['tipo'],
-                    licenca_data['status'],
-                    licenca_data['max_funcionarios'],
-                    licenca_data['max_usuarios'],
-                    licenca_data['permite_banco_horas'],
-                    licenca_data['permite_ponto_eletronico'],
-                    licenca_data['permite_relatorios_avancados'],
-                    licenca_data['permite_integracao_api'],
-                    licenca_data['data_inicio'],
-                    licenca_data['data_fim'],
-                    licenca_data['valor_mensal'],
-                    licenca_data['data_atualizacao']
-                ])
\ No newline at end of file
+            return
+        
+        resultado = execucao['resultado']
+        if resultado['status'] == 'sem_licenca':
+            self.stdout.write(self.style.WARNING(f"{prefixo} {resultado['mensagem']}"))
+        elif resultado['status'] == 'dry_run':
+            self.stdout.write(f"{prefixo} {resultado['mensagem']}")
+            self.stdout.write(f"Dados: {json.dumps(resultado['dados'], default=str, indent=2)}")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{prefixo} {resultado['mensagem']}"))
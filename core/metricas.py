@@ -0,0 +1,219 @@
+"""
+Instrumentação de requisições com métricas em memória
+Registra latência, queries por banco, empresa e endpoint em histogramas,
+exportados no formato texto do Prometheus, e gera logs estruturados amostrados
+"""
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Coletor de queries da requisição em andamento (por thread)
+_thread_local = threading.local()
+
+BUCKETS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_QUERIES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escapar_rotulo(valor):
+    """Escapa o valor de um rótulo conforme o formato texto do Prometheus"""
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histograma:
+    """Histograma com buckets fixos, uma série por combinação de rótulos"""
+
+    def __init__(self, nome, descricao, rotulos, buckets):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = buckets
+        # valores dos rótulos -> [contagem por bucket..., +Inf, soma, total]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            serie[indice] += 1
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def exportar(self):
+        linhas = [
+            f'# HELP {self.nome} {self.descricao}',
+            f'# TYPE {self.nome} histogram',
+        ]
+        with self._lock:
+            series = sorted((rotulos, list(serie)) for rotulos, serie in self._series.items())
+
+        for valores, serie in series:
+            base = ','.join(f'{r}="{_escapar_rotulo(v)}"' for r, v in zip(self.rotulos, valores))
+            separador = ',' if base else ''
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, serie):
+                acumulado += contagem
+                linhas.append(f'{self.nome}_bucket{{{base}{separador}le="{limite}"}} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{{{base}{separador}le="+Inf"}} {serie[-1]}')
+            linhas.append(f'{self.nome}_sum{{{base}}} {serie[-2]}')
+            linhas.append(f'{self.nome}_count{{{base}}} {serie[-1]}')
+
+        return linhas
+
+    def limpar(self):
+        with self._lock:
+            self._series.clear()
+
+
+class RegistroMetricas:
+    """Conjunto de histogramas do processo"""
+
+    def __init__(self):
+        self.duracao = Histograma(
+            'escalator_requisicao_duracao_segundos',
+            'Latência das requisições HTTP',
+            ('endpoint', 'metodo', 'status', 'empresa'),
+            BUCKETS_DURACAO
+        )
+        self.queries = Histograma(
+            'escalator_requisicao_queries',
+            'Queries executadas por requisição em cada banco',
+            ('endpoint', 'banco'),
+            BUCKETS_QUERIES
+        )
+        self.tempo_queries = Histograma(
+            'escalator_requisicao_queries_segundos',
+            'Tempo gasto em queries por requisição em cada banco',
+            ('endpoint', 'banco'),
+            BUCKETS_DURACAO
+        )
+
+    def histogramas(self):
+        return [self.duracao, self.queries, self.tempo_queries]
+
+    def exportar_prometheus(self):
+        linhas = []
+        for histograma in self.histogramas():
+            linhas.extend(histograma.exportar())
+        return '\n'.join(linhas) + '\n'
+
+    def limpar(self):
+        for histograma in self.histogramas():
+            histograma.limpar()
+
+
+registro = RegistroMetricas()
+
+
+class ColetorQueries:
+    """Acumula quantidade e tempo de queries por banco durante uma requisição"""
+
+    def __init__(self):
+        self.por_banco = {}
+        self.empresa = None
+
+    def registrar(self, alias, duracao):
+        # Bancos de empresa são agrupados para limitar a cardinalidade;
+        # a empresa fica no rótulo da métrica de latência
+        if alias.startswith('empresa_'):
+            self.empresa = alias[len('empresa_'):]
+            banco = 'empresa'
+        else:
+            banco = alias
+
+        total = self.por_banco.get(banco)
+        if total is None:
+            self.por_banco[banco] = [1, duracao]
+        else:
+            total[0] += 1
+            total[1] += duracao
+
+
+def _wrapper_queries(execute, sql, params, many, context):
+    """Execute wrapper que mede as queries quando há requisição instrumentada"""
+    coletor = getattr(_thread_local, 'coletor', None)
+    if coletor is None:
+        return execute(sql, params, many, context)
+
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        coletor.registrar(context['connection'].alias, time.perf_counter() - inicio)
+
+
+def instalar_wrapper_queries(sender, connection, **kwargs):
+    """Instala o wrapper de medição em cada conexão aberta (inclusive bancos de empresa criados dinamicamente)"""
+    if _wrapper_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrapper_queries)
+
+
+class MetricasMiddleware:
+    """
+    Middleware de instrumentação das requisições.
+
+    Desativado por padrão (METRICAS_HABILITADAS); nesse caso o Django o remove
+    da cadeia e não há custo algum. Deve ficar no início de MIDDLEWARE para
+    medir também o roteamento e a autenticação.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_HABILITADAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.taxa_log = getattr(settings, 'METRICAS_AMOSTRAGEM_LOG', 0.01)
+        connection_created.connect(instalar_wrapper_queries, dispatch_uid='core.metricas.wrapper_queries')
+        # Conexões já abertas antes da inicialização do middleware
+        for connection in connections.all(initialized_only=True):
+            instalar_wrapper_queries(None, connection)
+
+    def __call__(self, request):
+        coletor = ColetorQueries()
+        _thread_local.coletor = coletor
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _thread_local.coletor = None
+        duracao = time.perf_counter() - inicio
+
+        endpoint = self._get_endpoint(request)
+        empresa = coletor.empresa or '-'
+        registro.duracao.observar(duracao, endpoint, request.method, str(response.status_code), empresa)
+        for banco, (total, tempo) in coletor.por_banco.items():
+            registro.queries.observar(total, endpoint, banco)
+            registro.tempo_queries.observar(tempo, endpoint, banco)
+
+        if self.taxa_log and random.random() < self.taxa_log:
+            logger.info(json.dumps({
+                'evento': 'requisicao',
+                'endpoint': endpoint,
+                'metodo': request.method,
+                'status': response.status_code,
+                'empresa': coletor.empresa,
+                'duracao_ms': round(duracao * 1000, 2),
+                'queries': {
+                    banco: {'total': total, 'tempo_ms': round(tempo * 1000, 2)}
+                    for banco, (total, tempo) in coletor.por_banco.items()
+                },
+            }))
+
+        return response
+
+    def _get_endpoint(self, request):
+        """Usa o padrão da rota (ex.: api/escalas/<pk>/) para limitar a cardinalidade"""
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None:
+            return 'nao_encontrado'
+        return resolver_match.route or resolver_match.view_name
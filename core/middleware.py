@@ -20,12 +20,6 @@ class DatabaseRoutingMiddleware(MiddlewareMixin):
         """
         Processa a requisição e define o banco de dados apropriado
         """
-        # Log inicial da requisição para rastrear roteamento
-        try:
-            logger.info("[ROUTER] request path=%s | authenticated=%s | method=%s", getattr(request, 'path', None), getattr(getattr(request, 'user', None), 'is_authenticated', False), getattr(request, 'method', None))
-            print("[ROUTER] início:", {"path": getattr(request, 'path', None), "authenticated": getattr(getattr(request, 'user', None), 'is_authenticated', False), "method": getattr(request, 'method', None)})
-        except Exception:
-            pass
         # Se o usuário está autenticado
         if hasattr(request, 'user') and request.user.is_authenticated:
             try:
@@ -42,24 +36,19 @@ class DatabaseRoutingMiddleware(MiddlewareMixin):
                     
                     # Define o banco para a requisição
                     set_db_for_request(db_alias)
-                    print("[ROUTER] autenticado com empresa:", {"empresa_id": empresa_id, "db_alias": db_alias})
                 else:
                     # Se não tem empresa, usa o banco default
                     set_db_for_request('default')
-                    print("[ROUTER] autenticado sem empresa, usando default")
                     
             except Exception as e:
                 # Em caso de erro, usa o banco default
                 set_db_for_request('default')
-                print("[ROUTER] erro ao definir banco, fallback default:", str(e))
+                logger.warning("[ROUTER] erro ao definir banco, usando default: %s", e)
         else:
             # Usuário não autenticado, usa banco default
             set_db_for_request('default')
-            print("[ROUTER] não autenticado, usando default")
-        try:
-            print("[ROUTER] banco atual:", get_db_for_request())
-        except Exception:
-            pass
+        
+        logger.debug("[ROUTER] path=%s | method=%s | db=%s", request.path, request.method, get_db_for_request())
      
     def get_empresa_from_user(self, user):
         """
@@ -109,7 +98,7 @@ class EmpresaSessionMiddleware(MiddlewareMixin):
                     create_empresa_database(empresa_id)
                 
                 set_db_for_request(db_alias)
-                print("[ROUTER] sessão empresa ativa:", {"empresa_id": empresa_id, "db_alias": db_alias})
+                logger.debug("[ROUTER] sessão empresa ativa | empresa_id=%s | db=%s", empresa_id, db_alias)
     
     def set_empresa_session(self, request, empresa_id):
         """
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        # Empresas já cadastradas tiveram o banco criado de forma síncrona
+        migrations.AddField(
+            model_name='empresa',
+            name='status_provisionamento',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('provisionando', 'Provisionando'), ('pronto', 'Pronto'), ('falhou', 'Falhou')], default='pronto', max_length=20, verbose_name='Status do Provisionamento'),
+        ),
+        migrations.AlterField(
+            model_name='empresa',
+            name='status_provisionamento',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('provisionando', 'Provisionando'), ('pronto', 'Pronto'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Status do Provisionamento'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='erro_provisionamento',
+            field=models.TextField(blank=True, verbose_name='Erro do Provisionamento'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='provisionamento_atualizado_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Provisionamento Atualizado em'),
+        ),
+    ]
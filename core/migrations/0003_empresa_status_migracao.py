@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 08:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_empresa_status_provisionamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='erro_migracao',
+            field=models.TextField(blank=True, verbose_name='Erro da Migração'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='migracao_atualizada_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Migração Atualizada em'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='status_migracao',
+            field=models.CharField(blank=True, choices=[('ok', 'Atualizado'), ('falhou', 'Falhou')], max_length=20, verbose_name='Status da Migração'),
+        ),
+    ]
@@ -13,6 +13,26 @@ class Empresa(models.Model):
     Modelo para armazenar informações das empresas
     Fica no banco master
     """
+    PROVISIONAMENTO_PENDENTE = 'pendente'
+    PROVISIONAMENTO_EM_ANDAMENTO = 'provisionando'
+    PROVISIONAMENTO_PRONTO = 'pronto'
+    PROVISIONAMENTO_FALHOU = 'falhou'
+    
+    STATUS_PROVISIONAMENTO_CHOICES = [
+        (PROVISIONAMENTO_PENDENTE, _('Pendente')),
+        (PROVISIONAMENTO_EM_ANDAMENTO, _('Provisionando')),
+        (PROVISIONAMENTO_PRONTO, _('Pronto')),
+        (PROVISIONAMENTO_FALHOU, _('Falhou')),
+    ]
+    
+    MIGRACAO_OK = 'ok'
+    MIGRACAO_FALHOU = 'falhou'
+    
+    STATUS_MIGRACAO_CHOICES = [
+        (MIGRACAO_OK, _('Atualizado')),
+        (MIGRACAO_FALHOU, _('Falhou')),
+    ]
+    
     id = models.BigAutoField(primary_key=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     nome = models.CharField(_('Nome da Empresa'), max_length=200)
@@ -50,6 +70,34 @@ class Empresa(models.Model):
         help_text='Nome do banco de dados específico da empresa'
     )
     
+    # Provisionamento do banco (executado em segundo plano após o cadastro)
+    status_provisionamento = models.CharField(
+        _('Status do Provisionamento'),
+        max_length=20,
+        choices=STATUS_PROVISIONAMENTO_CHOICES,
+        default=PROVISIONAMENTO_PENDENTE
+    )
+    erro_provisionamento = models.TextField(_('Erro do Provisionamento'), blank=True)
+    provisionamento_atualizado_em = models.DateTimeField(
+        _('Provisionamento Atualizado em'),
+        null=True,
+        blank=True
+    )
+    
+    # Resultado da última execução de migrate_all_tenants no banco da empresa
+    status_migracao = models.CharField(
+        _('Status da Migração'),
+        max_length=20,
+        choices=STATUS_MIGRACAO_CHOICES,
+        blank=True
+    )
+    erro_migracao = models.TextField(_('Erro da Migração'), blank=True)
+    migracao_atualizada_em = models.DateTimeField(
+        _('Migração Atualizada em'),
+        null=True,
+        blank=True
+    )
+    
     # Timestamps
     created_at = models.DateTimeField(_('Criado em'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True)
@@ -72,6 +120,10 @@ class Empresa(models.Model):
     def get_database_alias(self):
         """Retorna o alias do banco de dados da empresa"""
         return f'empresa_{self.id}'
+    
+    def is_provisionada(self):
+        """Verifica se o banco da empresa está pronto para uso"""
+        return self.status_provisionamento == self.PROVISIONAMENTO_PRONTO
 
 
 class Licenca(models.Model):
@@ -216,9 +268,8 @@ class LicencaHistorico(models.Model):
 
 
 # Signals para criação automática de banco e configuração inicial
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.management import call_command
 from django.conf import settings
 import os
 import logging
@@ -229,53 +280,43 @@ logger = logging.getLogger(__name__)
 def criar_banco_empresa(sender, instance, created, **kwargs):
     """
     Signal que é executado após salvar uma Empresa.
-    Se for uma nova empresa (created=True), cria o banco e executa as configurações iniciais.
+    Se for uma nova empresa (created=True), agenda o provisionamento do banco
+    em segundo plano; o andamento fica em status_provisionamento.
     """
     if created:
-        try:
-            logger.info(f"Criando banco para nova empresa: {instance.nome}")
-            
-            # Atualizar o database_name se necessário
-            if not instance.database_name or instance.database_name == 'empresa_new':
-                instance.database_name = f'empresa_{instance.id}'
-                # Usar update para evitar recursão do signal
-                Empresa.objects.filter(id=instance.id).update(database_name=instance.database_name)
-            
-            # Importar a função de criação de banco
-            from .routers import create_empresa_database
-            
-            # Criar o banco de dados da empresa
-            create_empresa_database(instance.id)
-            logger.info(f"Banco criado para empresa {instance.nome}")
-            
-            # Executar migrações no banco da empresa
-            database_alias = f'empresa_{instance.id}'
-            
-            # Migrações essenciais
-            apps_to_migrate = [
-                'contenttypes',
-                'auth', 
-                'admin',
-                'sessions',
-                'usuarios',
-                'escalator'  # Executar todas as migrações do escalator
-            ]
-            
-            for app_config in apps_to_migrate:
-                call_command('migrate', app_config, database=database_alias, verbosity=0)
-                logger.info(f"Migração {app_config} executada para empresa {instance.nome}")
-            
-            # Executar comando de configuração inicial de dados usando o comando setup_initial_data
-            # Usar o parâmetro --database para especificar o banco da empresa
-            try:
-                call_command('setup_initial_data', database=database_alias, verbosity=0)
-                logger.info(f"Dados iniciais configurados para empresa {instance.nome}")
-            except Exception as e:
-                logger.warning(f"Erro ao configurar dados iniciais para empresa {instance.nome}: {str(e)}")
-                # Não falha a criação da empresa se houver erro nos dados iniciais
-            
-            logger.info(f"Configuração completa da empresa {instance.nome} finalizada com sucesso")
-            
-        except Exception as e:
-            logger.error(f"Erro ao criar banco para empresa {instance.nome}: {str(e)}")
-            # Não re-raise a exceção para não impedir a criação da empresa no master
\ No newline at end of file
+        # Atualizar o database_name se necessário
+        if not instance.database_name or instance.database_name == 'empresa_new':
+            instance.database_name = f'empresa_{instance.id}'
+            # Usar update para evitar recursão do signal
+            Empresa.objects.using(kwargs.get('using') or 'master').filter(id=instance.id).update(
+                database_name=instance.database_name
+            )
+        
+        from .provisionamento import agendar_provisionamento
+        
+        logger.info(f"Provisionamento agendado para nova empresa: {instance.nome}")
+        agendar_provisionamento(instance.id, using=kwargs.get('using') or 'master')
+
+
+@receiver(post_save, sender=Empresa)
+@receiver(post_delete, sender=Empresa)
+def invalidar_cache_empresa(sender, instance, **kwargs):
+    """Remove do cache de licenças os direitos da empresa alterada"""
+    from .licencas import invalidar_direitos_empresa
+    invalidar_direitos_empresa(instance.id)
+
+
+@receiver(post_save, sender=Licenca)
+@receiver(post_delete, sender=Licenca)
+def invalidar_cache_licenca(sender, instance, **kwargs):
+    """Remove do cache de licenças os direitos da empresa da licença alterada"""
+    from .licencas import invalidar_direitos_empresa
+    invalidar_direitos_empresa(instance.empresa_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidar_cache_usuario(sender, instance, **kwargs):
+    """Remove o usuário alterado do cache de autenticação JWT"""
+    from .authentication import invalidar_usuario_cache
+    invalidar_usuario_cache(instance.pk)
@@ -0,0 +1,36 @@
+"""
+Permissões DRF baseadas na licença da empresa
+"""
+from rest_framework import permissions
+from .licencas import empresa_liberada, licenca_permite
+
+
+class LicencaPermiteRecurso(permissions.BasePermission):
+    """
+    Bloqueia o acesso quando a licença da empresa do usuário não habilita o recurso.
+
+    O ViewSet declara o recurso exigido em `recurso_licenca`, que pode ser
+    uma string (vale para todas as ações) ou um dicionário {acao: recurso};
+    ações ausentes do dicionário não são restringidas pela licença.
+    Usuários sem empresa (banco default) não passam pela verificação.
+    Os direitos vêm do cache de licenças, sem consulta ao master no caminho quente.
+    """
+    message = 'A licença da empresa não permite acesso a este recurso.'
+
+    def has_permission(self, request, view):
+        recurso = self._get_recurso(view)
+        if not recurso:
+            return True
+
+        empresa_id = getattr(request.user, 'empresa_id', None)
+        if not empresa_id:
+            return True
+
+        return empresa_liberada(empresa_id) and licenca_permite(empresa_id, recurso)
+
+    def _get_recurso(self, view):
+        """Obtém o recurso de licença exigido pela ação atual"""
+        recurso = getattr(view, 'recurso_licenca', None)
+        if isinstance(recurso, dict):
+            return recurso.get(getattr(view, 'action', None))
+        return recurso
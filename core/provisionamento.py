@@ -0,0 +1,322 @@
+"""
+Provisionamento dos bancos das empresas a partir de um banco modelo (template)
+O template fica migrado e com os dados iniciais; cada nova empresa recebe uma
+cópia feita com a API de backup do SQLite e aplica apenas as migrações que
+faltarem no template. O provisionamento roda em segundo plano e o andamento
+fica em Empresa.status_provisionamento
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Empresa
+from .routers import create_empresa_database, get_empresa_database
+from .tenants import get_caminho_banco_empresa
+
+logger = logging.getLogger(__name__)
+
+# Quando ativo na thread, o provisionamento roda no próprio commit (comandos de management)
+_thread_local = threading.local()
+
+ALIAS_TEMPLATE = 'empresa_template'
+ALIAS_TEMPLATE_NOVO = 'empresa_template_novo'
+
+# Apps migradas nos bancos das empresas
+APPS_EMPRESA = [
+    'contenttypes',
+    'auth',
+    'admin',
+    'sessions',
+    'usuarios',
+    'escalator',
+]
+
+
+def get_caminho_template():
+    return str(getattr(settings, 'EMPRESA_TEMPLATE_DB', settings.BASE_DIR / 'databases' / 'template_empresa.sqlite3'))
+
+
+def _registrar_banco(alias, caminho):
+    """Registra (ou reaponta) um alias de banco SQLite com a configuração do default"""
+    config = settings.DATABASES['default'].copy()
+    config['NAME'] = str(caminho)
+    if alias in settings.DATABASES:
+        # A conexão guarda a configuração antiga: descarta para usar o novo caminho
+        connections[alias].close()
+        try:
+            del connections[alias]
+        except AttributeError:
+            pass
+    settings.DATABASES[alias] = config
+
+
+def copiar_banco_sqlite(origem, destino):
+    """
+    Copia um banco SQLite com a API de backup (cópia consistente mesmo com
+    o banco em uso). Grava em um arquivo temporário e renomeia ao final,
+    para que o destino nunca fique parcialmente copiado.
+    """
+    temporario = f'{destino}.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    conexao_origem = sqlite3.connect(origem)
+    conexao_destino = sqlite3.connect(temporario)
+    try:
+        with conexao_destino:
+            conexao_origem.backup(conexao_destino)
+    finally:
+        conexao_destino.close()
+        conexao_origem.close()
+
+    os.replace(temporario, destino)
+
+
+def migracoes_pendentes(alias, apps=None):
+    """Retorna [(app, migração)] ainda não aplicadas no banco, na ordem de execução"""
+    apps = apps or APPS_EMPRESA
+    executor = MigrationExecutor(connections[alias])
+    alvos = [no for no in executor.loader.graph.leaf_nodes() if no[0] in apps]
+    plano = executor.migration_plan(alvos)
+    return [(migracao.app_label, migracao.name) for migracao, reverter in plano if not reverter]
+
+
+def migrar_banco(alias, apps=None):
+    """Aplica as migrações pendentes das apps das empresas; retorna quantas foram aplicadas"""
+    pendentes = migracoes_pendentes(alias, apps)
+    for app in dict.fromkeys(app for app, _ in pendentes):
+        call_command('migrate', app, database=alias, verbosity=0)
+    return len(pendentes)
+
+
+def migracoes_alvo(apps=None):
+    """Migrações (app, nome) existentes no código para as apps das empresas"""
+    apps = apps or APPS_EMPRESA
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    return {no for no in loader.graph.nodes if no[0] in apps}
+
+
+def migracoes_aplicadas_arquivo(caminho, apps=None):
+    """
+    Lê django_migrations direto do arquivo SQLite, sem registrar alias nem
+    abrir conexão do Django. Retorna None se o arquivo não existir.
+    """
+    apps = apps or APPS_EMPRESA
+    if not os.path.exists(caminho):
+        return None
+
+    conexao = sqlite3.connect(f'file:{caminho}?mode=ro', uri=True)
+    try:
+        marcadores = ', '.join('?' * len(apps))
+        linhas = conexao.execute(
+            f'SELECT app, name FROM django_migrations WHERE app IN ({marcadores})', list(apps)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # Banco sem a tabela django_migrations: nada aplicado
+        linhas = []
+    finally:
+        conexao.close()
+    return set(linhas)
+
+
+def empresas_desatualizadas(empresa_ids, apps=None):
+    """
+    Verifica em lote quais empresas têm migrações pendentes, comparando o
+    django_migrations de cada banco com as migrações do código (carregadas
+    uma única vez). Retorna {empresa_id: quantidade pendente}; bancos
+    inexistentes aparecem com todas as migrações pendentes.
+    """
+    alvo = migracoes_alvo(apps)
+    pendentes = {}
+    for empresa_id in empresa_ids:
+        aplicadas = migracoes_aplicadas_arquivo(get_caminho_banco_empresa(empresa_id), apps) or set()
+        faltando = len(alvo - aplicadas)
+        if faltando:
+            pendentes[empresa_id] = faltando
+    return pendentes
+
+
+def migrar_banco_empresa(empresa_id):
+    """Aplica as migrações pendentes no banco de uma empresa (usada no pool de empresas)"""
+    return {'migracoes_aplicadas': migrar_banco(get_empresa_database(empresa_id))}
+
+
+def preparar_template(caminho=None):
+    """
+    (Re)cria o banco modelo: migra todas as apps das empresas e carrega os
+    dados iniciais. É montado em um arquivo temporário e só então substitui
+    o template atual, sem interferir em provisionamentos em andamento.
+    """
+    caminho = caminho or get_caminho_template()
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.novo'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    _registrar_banco(ALIAS_TEMPLATE_NOVO, temporario)
+    try:
+        aplicadas = migrar_banco(ALIAS_TEMPLATE_NOVO)
+        call_command('setup_initial_data', database=ALIAS_TEMPLATE_NOVO, verbosity=0)
+    finally:
+        connections[ALIAS_TEMPLATE_NOVO].close()
+
+    os.replace(temporario, caminho)
+    logger.info('Template de empresa preparado em %s (%s migrações)', caminho, aplicadas)
+    return {'caminho': caminho, 'migracoes_aplicadas': aplicadas}
+
+
+def verificar_template(caminho=None):
+    """Retorna as migrações que faltam no template (lista vazia se está atualizado)"""
+    caminho = caminho or get_caminho_template()
+    if not os.path.exists(caminho):
+        return None
+
+    _registrar_banco(ALIAS_TEMPLATE, caminho)
+    try:
+        return migracoes_pendentes(ALIAS_TEMPLATE)
+    finally:
+        connections[ALIAS_TEMPLATE].close()
+
+
+def provisionar_banco_empresa(empresa_id):
+    """
+    Cria o banco da empresa a partir do template.
+
+    Se o banco já existir, apenas aplica as migrações pendentes. Sem template,
+    ele é preparado na primeira chamada. Migrações criadas depois do template
+    são aplicadas na cópia (e um aviso sugere recriar o template).
+    """
+    db_alias = create_empresa_database(empresa_id)
+    destino = settings.DATABASES[db_alias]['NAME']
+    origem = 'existente'
+
+    if not os.path.exists(destino):
+        caminho_template = get_caminho_template()
+        if not os.path.exists(caminho_template):
+            logger.info('Template de empresa inexistente, preparando em %s', caminho_template)
+            preparar_template(caminho_template)
+
+        copiar_banco_sqlite(caminho_template, destino)
+        connections[db_alias].close()
+        origem = 'template'
+
+    aplicadas = migrar_banco(db_alias)
+    if aplicadas and origem == 'template':
+        logger.warning(
+            'Template de empresa desatualizado: %s migrações aplicadas em %s. '
+            'Execute preparar_template_empresa para atualizá-lo.', aplicadas, db_alias
+        )
+
+    connections[db_alias].close()
+    return {'alias': get_empresa_database(empresa_id), 'origem': origem, 'migracoes_aplicadas': aplicadas}
+
+
+# Execução e status
+
+@contextmanager
+def provisionamento_sincrono():
+    """
+    Faz com que empresas criadas dentro do bloco sejam provisionadas no commit,
+    na própria thread. Usado por comandos, que terminam antes de uma thread
+    em segundo plano concluir.
+    """
+    anterior = getattr(_thread_local, 'sincrono', False)
+    _thread_local.sincrono = True
+    try:
+        yield
+    finally:
+        _thread_local.sincrono = anterior
+
+
+def agendar_provisionamento(empresa_id, using='master'):
+    """Agenda o provisionamento para depois do commit da criação da empresa"""
+    if getattr(_thread_local, 'sincrono', False) or not getattr(settings, 'PROVISIONAMENTO_ASSINCRONO', True):
+        transaction.on_commit(lambda: executar_provisionamento(empresa_id), using=using)
+        return
+
+    def iniciar():
+        threading.Thread(
+            target=_provisionar_em_segundo_plano,
+            args=(empresa_id,),
+            name=f'provisionamento-empresa-{empresa_id}',
+            daemon=True,
+        ).start()
+
+    transaction.on_commit(iniciar, using=using)
+
+
+def _provisionar_em_segundo_plano(empresa_id):
+    try:
+        executar_provisionamento(empresa_id)
+    except Exception:
+        logger.exception('Erro inesperado no provisionamento da empresa %s', empresa_id)
+    finally:
+        connections.close_all()
+
+
+def _atualizar_status(empresa_id, status, erro=''):
+    Empresa.objects.using('master').filter(id=empresa_id).update(
+        status_provisionamento=status,
+        erro_provisionamento=erro,
+        provisionamento_atualizado_em=timezone.now(),
+    )
+    # update() não dispara signals: o cache de licenças guarda a empresa com o status
+    from .licencas import invalidar_direitos_empresa
+    invalidar_direitos_empresa(empresa_id)
+
+
+def executar_provisionamento(empresa_id, forcar=False, travado_apos=None):
+    """
+    Provisiona o banco da empresa e registra o status. Idempotente: a empresa
+    é reservada com um UPDATE condicional, então execuções concorrentes ou
+    repetidas não provisionam a mesma empresa duas vezes.
+
+    - forcar: reprocessa também empresas prontas (aplica migrações pendentes)
+    - travado_apos: timedelta; retoma empresas paradas em 'provisionando'
+      há mais tempo que isso (processo interrompido no meio)
+
+    Retorna {'status', 'executado', ...} com o resultado do provisionamento.
+    """
+    estados = [Empresa.PROVISIONAMENTO_PENDENTE, Empresa.PROVISIONAMENTO_FALHOU]
+    if forcar:
+        estados.append(Empresa.PROVISIONAMENTO_PRONTO)
+
+    filtro = Q(status_provisionamento__in=estados)
+    if travado_apos is not None:
+        filtro |= Q(
+            status_provisionamento=Empresa.PROVISIONAMENTO_EM_ANDAMENTO,
+            provisionamento_atualizado_em__lt=timezone.now() - travado_apos,
+        )
+
+    reservada = Empresa.objects.using('master').filter(filtro, id=empresa_id).update(
+        status_provisionamento=Empresa.PROVISIONAMENTO_EM_ANDAMENTO,
+        erro_provisionamento='',
+        provisionamento_atualizado_em=timezone.now(),
+    )
+    if not reservada:
+        status = Empresa.objects.using('master').filter(id=empresa_id).values_list(
+            'status_provisionamento', flat=True
+        ).first()
+        return {'status': status, 'executado': False}
+
+    try:
+        resultado = provisionar_banco_empresa(empresa_id)
+    except Exception as e:
+        logger.exception('Falha no provisionamento da empresa %s', empresa_id)
+        _atualizar_status(empresa_id, Empresa.PROVISIONAMENTO_FALHOU, f'{type(e).__name__}: {e}')
+        return {'status': Empresa.PROVISIONAMENTO_FALHOU, 'executado': True, 'erro': str(e)}
+
+    _atualizar_status(empresa_id, Empresa.PROVISIONAMENTO_PRONTO)
+    logger.info('Empresa %s provisionada (%s)', empresa_id, resultado['origem'])
+    return {'status': Empresa.PROVISIONAMENTO_PRONTO, 'executado': True, **resultado}
+
@@ -2,6 +2,7 @@
 Roteador de banco de dados para sistema multiempresa
 """
 import threading
+from contextlib import contextmanager
 from django.conf import settings
 from django.db import connections
 from django.core.exceptions import ImproperlyConfigured
@@ -92,6 +93,17 @@ def get_db_for_request():
     return getattr(_thread_local, 'db_alias', 'default')
 
 
+@contextmanager
+def usando_banco(db_alias):
+    """Direciona as queries da thread para o banco informado durante o bloco (ex.: signals com using)"""
+    anterior = getattr(_thread_local, 'db_alias', None)
+    _thread_local.db_alias = db_alias
+    try:
+        yield
+    finally:
+        _thread_local.db_alias = anterior
+
+
 def create_empresa_database(empresa_id):
     """
     Cria dinamicamente um banco de dados para uma empresa
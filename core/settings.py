@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',  # Instrumentação (inativa se METRICAS_HABILITADAS=False)
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -98,6 +99,34 @@ DATABASES = {
 # Configuração do roteador de banco de dados
 DATABASE_ROUTERS = ['core.routers.DatabaseRouter']
 
+# Métricas de requisições (/metrics) e fração das requisições registradas em log estruturado
+METRICAS_HABILITADAS = os.environ.get('ESCALATOR_METRICAS', '0') == '1'
+METRICAS_AMOSTRAGEM_LOG = float(os.environ.get('ESCALATOR_METRICAS_AMOSTRAGEM_LOG', '0.01'))
+# /metrics expõe endpoints, empresas e volumes de uso: publique-o apenas na rede interna.
+# Só responde ao token (Authorization: Bearer <token>) ou aos IPs listados; atrás de proxy
+# REMOTE_ADDR é o do proxy, então prefira o token para o coletor
+METRICAS_TOKEN = os.environ.get('ESCALATOR_METRICAS_TOKEN', '')
+METRICAS_IPS_PERMITIDOS = [
+    ip.strip() for ip in os.environ.get('ESCALATOR_METRICAS_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
+# Tempo (segundos) que os direitos de licença ficam em cache em cada processo
+LICENCA_CACHE_TTL = 300
+
+# Tempo (segundos) que as regras trabalhistas compiladas de cada empresa ficam em cache em cada processo
+REGRAS_CACHE_TTL = 300
+
+# Sincronização incremental (/api/sync/): margem (segundos) reenviada a cada token para
+# cobrir transações abertas no instante da consulta e retenção (dias) das exclusões
+SINCRONIZACAO_MARGEM_SEGUNDOS = 60
+SINCRONIZACAO_RETENCAO_DIAS = 90
+
+# Banco modelo já migrado e com dados iniciais, copiado para cada nova empresa
+EMPRESA_TEMPLATE_DB = str(BASE_DIR / 'databases' / 'template_empresa.sqlite3')
+
+# Provisiona o banco de novas empresas em segundo plano (False: no commit do cadastro)
+PROVISIONAMENTO_ASSINCRONO = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -144,7 +173,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.EmpresaJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -172,7 +201,11 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Tempo (segundos) que o usuário autenticado via JWT fica em cache em cada processo
+JWT_USUARIO_CACHE_TTL = 60
+
 # CORS Configuration
+from corsheaders.defaults import default_headers
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -184,6 +217,10 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Requisições condicionais (ETag / If-None-Match) das consultas por funcionário
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Escalator API',
     'VERSION': '1.0.0',
@@ -0,0 +1,250 @@
+"""
+Execução de tarefas em paralelo sobre os bancos das empresas
+Usado pelos comandos de manutenção que percorrem todas as empresas
+"""
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from multiprocessing.connection import wait as wait_conexoes
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Empresa
+from .routers import create_empresa_database, get_empresa_database
+
+logger = logging.getLogger(__name__)
+
+MODO_THREAD = 'thread'
+MODO_PROCESSO = 'processo'
+
+
+def listar_empresas(empresa_id=None, apenas_ativas=True):
+    """Retorna [(id, nome)] das empresas do master, em ordem de id"""
+    empresas = Empresa.objects.using('master').order_by('id')
+    if apenas_ativas:
+        empresas = empresas.filter(ativa=True)
+    if empresa_id:
+        empresas = empresas.filter(id=empresa_id)
+    return list(empresas.values_list('id', 'nome'))
+
+
+def get_caminho_banco_empresa(empresa_id):
+    """Caminho do arquivo do banco da empresa, mesmo que o alias ainda não esteja registrado"""
+    db_alias = get_empresa_database(empresa_id)
+    config = settings.DATABASES.get(db_alias)
+    if config is None:
+        return str(settings.BASE_DIR / 'databases' / f'{db_alias}.sqlite3')
+    return str(config['NAME'])
+
+
+def banco_empresa_existe(empresa_id):
+    """Verifica se o arquivo do banco da empresa já foi criado"""
+    return os.path.exists(get_caminho_banco_empresa(empresa_id))
+
+
+def _executar_empresa(funcao, empresa_id, exigir_banco, args, kwargs):
+    """
+    Executa a função para uma empresa isolando erros.
+    Roda na thread/processo do pool; as conexões abertas aqui são fechadas ao final.
+    """
+    inicio = time.monotonic()
+    try:
+        if exigir_banco and not banco_empresa_existe(empresa_id):
+            return {'sucesso': False, 'resultado': None, 'erro': 'Banco da empresa não encontrado',
+                    'duracao': time.monotonic() - inicio}
+
+        create_empresa_database(empresa_id)
+        resultado = funcao(empresa_id, *args, **kwargs)
+        return {'sucesso': True, 'resultado': resultado, 'erro': None, 'duracao': time.monotonic() - inicio}
+    except Exception as e:
+        logger.debug('Falha na empresa %s:\n%s', empresa_id, traceback.format_exc())
+        return {'sucesso': False, 'resultado': None, 'erro': f'{type(e).__name__}: {e}',
+                'duracao': time.monotonic() - inicio}
+    finally:
+        connections.close_all()
+
+
+def _executar_empresa_processo(emissor, funcao, empresa_id, exigir_banco, args, kwargs):
+    """Alvo do processo da empresa: envia o resultado de _executar_empresa pelo pipe"""
+    try:
+        emissor.send(_executar_empresa(funcao, empresa_id, exigir_banco, args, kwargs))
+    finally:
+        emissor.close()
+
+
+class _TarefaThread:
+    """Empresa em execução no pool de threads (não pode ser interrompida)"""
+
+    def __init__(self, executor, *argumentos):
+        self.futuro = executor.submit(_executar_empresa, *argumentos)
+        self.inicio = time.monotonic()
+
+    @staticmethod
+    def aguardar(tarefas, espera):
+        """Tarefas finalizadas em até `espera` segundos (None: até a primeira)"""
+        finalizados, _ = wait([tarefa.futuro for tarefa in tarefas], timeout=espera, return_when=FIRST_COMPLETED)
+        return [tarefa for tarefa in tarefas if tarefa.futuro in finalizados]
+
+    def ativa(self):
+        return not self.futuro.done()
+
+    def resultado(self):
+        return self.futuro.result()
+
+    def interromper(self):
+        # A thread segue até o fim da função; o pool só descarta o que ainda não começou
+        self.futuro.cancel()
+
+
+class _TarefaProcesso:
+    """Empresa em execução em um processo próprio, encerrado se exceder o tempo limite"""
+
+    def __init__(self, contexto, *argumentos):
+        self.receptor, emissor = contexto.Pipe(duplex=False)
+        # daemon: um processo que sobrar é encerrado junto com o comando, em vez de segurar a saída
+        self.processo = contexto.Process(target=_executar_empresa_processo, args=(emissor, *argumentos), daemon=True)
+        self.processo.start()
+        self.inicio = time.monotonic()
+        emissor.close()
+
+    @staticmethod
+    def aguardar(tarefas, espera):
+        """Tarefas finalizadas (resultado enviado ou processo encerrado) em até `espera` segundos"""
+        prontos = wait_conexoes([tarefa.receptor for tarefa in tarefas], timeout=espera)
+        return [tarefa for tarefa in tarefas if tarefa.receptor in prontos]
+
+    def ativa(self):
+        return self.processo.is_alive()
+
+    def resultado(self):
+        try:
+            resultado = self.receptor.recv()
+        except EOFError:
+            resultado = None
+        finally:
+            self.receptor.close()
+        self.processo.join()
+        if resultado is None:
+            raise RuntimeError(f'Processo da empresa encerrado (código {self.processo.exitcode})')
+        return resultado
+
+    def interromper(self):
+        self.processo.terminate()
+        self.processo.join()
+        self.receptor.close()
+
+
+def executar_em_empresas(funcao, empresas, args=(), kwargs=None, max_workers=4, timeout=None,
+                         modo=MODO_THREAD, exigir_banco=True, ao_concluir=None):
+    """
+    Executa funcao(empresa_id, *args, **kwargs) para cada empresa em um pool.
+
+    - empresas: lista de (id, nome), como retornada por listar_empresas
+    - max_workers: quantas empresas são processadas ao mesmo tempo
+    - timeout: segundos por empresa, contados a partir do início da execução
+      dela; a empresa que estoura é reportada como erro
+    - modo: 'thread' (padrão, bom para I/O de banco) ou 'processo'. Só o modo
+      processo interrompe de fato a empresa que estoura o tempo limite: cada
+      empresa roda em um processo próprio, encerrado nesse caso. No modo thread
+      a empresa é apenas abandonada: a thread segue até o fim da função e a vaga
+      dela só volta ao pool quando termina (o comando também espera por ela para
+      sair). No modo processo a função e os argumentos precisam ser
+      serializáveis (pickle), ou seja, funções de módulo e não métodos do comando
+    - exigir_banco: não chama a função se o arquivo do banco não existir
+    - ao_concluir: callback(resultado, concluidas, total) chamado na thread
+      principal a cada empresa finalizada, para exibir progresso
+
+    Uma falha em uma empresa nunca interrompe as demais. Retorna a lista de
+    resultados na ordem das empresas, cada um um dicionário com empresa_id,
+    empresa_nome, sucesso, resultado, erro e duracao.
+    """
+    kwargs = kwargs or {}
+    empresas = list(empresas)
+    total = len(empresas)
+    resultados = {}
+
+    if modo == MODO_PROCESSO:
+        executor = None
+        contexto = multiprocessing.get_context()
+        classe = _TarefaProcesso
+
+        def iniciar(empresa):
+            # Conexões abertas não podem ser herdadas pelos processos filhos
+            connections.close_all()
+            return _TarefaProcesso(contexto, funcao, empresa[0], exigir_banco, args, kwargs)
+    elif modo == MODO_THREAD:
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='empresa')
+        classe = _TarefaThread
+
+        def iniciar(empresa):
+            return _TarefaThread(executor, funcao, empresa[0], exigir_banco, args, kwargs)
+    else:
+        raise ValueError(f'Modo de execução inválido: {modo}')
+
+    fila = deque(empresas)
+    em_andamento = {}
+    # Threads abandonadas no tempo limite ainda ocupam uma vaga do pool
+    abandonadas = []
+
+    def preencher_vagas():
+        abandonadas[:] = [tarefa for tarefa in abandonadas if tarefa.ativa()]
+        # Só inicia com vaga livre: o tempo limite conta do início real da execução
+        while len(em_andamento) + len(abandonadas) < max_workers:
+            if not fila:
+                return
+            empresa = fila.popleft()
+            em_andamento[iniciar(empresa)] = empresa
+
+    def concluir(empresa, resultado):
+        resultado = {'empresa_id': empresa[0], 'empresa_nome': empresa[1], **resultado}
+        resultados[empresa[0]] = resultado
+        if ao_concluir:
+            ao_concluir(resultado, len(resultados), total)
+
+    try:
+        preencher_vagas()
+        # Sem empresas em execução, só resta esperar as vagas das abandonadas
+        while em_andamento or (fila and abandonadas):
+            espera = None
+            if timeout is not None and em_andamento:
+                mais_antiga = min(tarefa.inicio for tarefa in em_andamento)
+                espera = max(0, mais_antiga + timeout - time.monotonic())
+
+            # As abandonadas entram na espera para liberar a vaga assim que terminarem
+            for tarefa in classe.aguardar(list(em_andamento) + abandonadas, espera):
+                empresa = em_andamento.pop(tarefa, None)
+                if empresa is None:
+                    continue
+                try:
+                    concluir(empresa, tarefa.resultado())
+                except Exception as e:
+                    # Falha do próprio pool ou do processo (ex.: processo filho encerrado)
+                    concluir(empresa, {'sucesso': False, 'resultado': None,
+                                       'erro': f'{type(e).__name__}: {e}', 'duracao': None})
+
+            if timeout is not None:
+                agora = time.monotonic()
+                for tarefa, empresa in list(em_andamento.items()):
+                    if agora - tarefa.inicio >= timeout:
+                        em_andamento.pop(tarefa)
+                        tarefa.interromper()
+                        if tarefa.ativa():
+                            abandonadas.append(tarefa)
+                        logger.warning('Empresa %s excedeu o tempo limite de %ss', empresa[0], timeout)
+                        concluir(empresa, {'sucesso': False, 'resultado': None,
+                                           'erro': f'Tempo limite de {timeout}s excedido',
+                                           'duracao': agora - tarefa.inicio})
+
+            preencher_vagas()
+    finally:
+        for tarefa in em_andamento:
+            tarefa.interromper()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return [resultados[empresa[0]] for empresa in empresas if empresa[0] in resultados]
@@ -0,0 +1,33 @@
+"""
+Views do core (endpoints operacionais)
+"""
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from .metricas import registro
+
+
+def _acesso_metricas_permitido(request):
+    """Aceita o token de METRICAS_TOKEN (Authorization: Bearer) ou um IP de METRICAS_IPS_PERMITIDOS"""
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    if token:
+        esquema, _, enviado = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if esquema.lower() == 'bearer' and hmac.compare_digest(enviado.strip().encode(), token.encode()):
+            return True
+
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICAS_IPS_PERMITIDOS', ())
+
+
+def metricas(request):
+    """Exporta as métricas do processo no formato texto do Prometheus"""
+    if not getattr(settings, 'METRICAS_HABILITADAS', False):
+        raise Http404
+
+    if not _acesso_metricas_permitido(request):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        registro.exportar_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
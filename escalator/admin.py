@@ -1,4 +1,4 @@
-from .models import Funcionario, Turno, Escala, Folga, EscalaPredefinida
+from .models import Funcionario, Turno, Escala, Folga, EscalaPredefinida, EscalaRecorrente
 from django.contrib import admin
 
 @admin.register(Funcionario)
@@ -28,3 +28,10 @@ class FolgaAdmin(admin.ModelAdmin):
 class EscalaPredefinidaAdmin(admin.ModelAdmin):
     list_display = ("nome", "horas_trabalho", "horas_descanso", "descricao")
     search_fields = ("nome", "descricao")
+
+@admin.register(EscalaRecorrente)
+class EscalaRecorrenteAdmin(admin.ModelAdmin):
+    list_display = ("funcionario", "escala_predefinida", "vigencia_inicio", "vigencia_fim")
+    list_filter = ("escala_predefinida",)
+    search_fields = ("funcionario__nome",)
+    readonly_fields = ("dias_trabalho", "dias_ciclo")
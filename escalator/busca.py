@@ -0,0 +1,207 @@
+"""
+Busca textual pelos índices FTS5 de cada empresa: funcionários (nome, matrícula,
+cargo e e-mail do usuário) e observações dos pontos.
+
+Os índices são tabelas virtuais FTS5 cujo rowid é o id do registro indexado,
+mantidas por triggers. Recriar uma tabela no SQLite (AlterField) descarta os
+triggers dela: instalar_indices_busca roda após cada migrate, recria os ausentes
+e reconstrói o índice afetado. A tokenização unicode61 com remove_diacritics 2
+ignora acentos e maiúsculas ("conceicao" encontra "Conceição"); cada termo é
+buscado como prefixo, já que o FTS5 não tem radicalização para o português.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+TOKENIZADOR = 'unicode61 remove_diacritics 2'
+
+
+def _indices():
+    """Definição de cada índice: tabela indexada, colunas, carga completa e triggers"""
+    usuario = get_user_model()._meta.db_table
+    email = f"COALESCE((SELECT email FROM {usuario} WHERE id = NEW.usuario_id), '')"
+    return {
+        'funcionario_busca': {
+            'colunas': ['nome', 'matricula', 'cargo', 'email'],
+            'carga': f"""
+                INSERT INTO funcionario_busca (rowid, nome, matricula, cargo, email)
+                SELECT f.id, f.nome, f.matricula, f.cargo, COALESCE(u.email, '')
+                FROM funcionario f LEFT JOIN {usuario} u ON u.id = f.usuario_id
+            """,
+            'triggers': {
+                'funcionario_busca_ai': f"""
+                    AFTER INSERT ON funcionario BEGIN
+                        INSERT INTO funcionario_busca (rowid, nome, matricula, cargo, email)
+                        VALUES (NEW.id, NEW.nome, NEW.matricula, NEW.cargo, {email});
+                    END
+                """,
+                'funcionario_busca_au': f"""
+                    AFTER UPDATE OF nome, matricula, cargo, usuario_id ON funcionario BEGIN
+                        DELETE FROM funcionario_busca WHERE rowid = OLD.id;
+                        INSERT INTO funcionario_busca (rowid, nome, matricula, cargo, email)
+                        VALUES (NEW.id, NEW.nome, NEW.matricula, NEW.cargo, {email});
+                    END
+                """,
+                'funcionario_busca_ad': """
+                    AFTER DELETE ON funcionario BEGIN
+                        DELETE FROM funcionario_busca WHERE rowid = OLD.id;
+                    END
+                """,
+                # Usuários copiados depois dos funcionários (migrate_empresa) também preenchem o e-mail
+                'funcionario_busca_usuario_ai': f"""
+                    AFTER INSERT ON {usuario} BEGIN
+                        UPDATE funcionario_busca SET email = COALESCE(NEW.email, '')
+                        WHERE rowid IN (SELECT id FROM funcionario WHERE usuario_id = NEW.id);
+                    END
+                """,
+                'funcionario_busca_usuario_au': f"""
+                    AFTER UPDATE OF email ON {usuario} BEGIN
+                        UPDATE funcionario_busca SET email = COALESCE(NEW.email, '')
+                        WHERE rowid IN (SELECT id FROM funcionario WHERE usuario_id = NEW.id);
+                    END
+                """,
+            },
+        },
+        # Só os pontos com observação entram no índice
+        'ponto_busca': {
+            'colunas': ['observacoes'],
+            'carga': """
+                INSERT INTO ponto_busca (rowid, observacoes)
+                SELECT id, observacoes FROM ponto WHERE observacoes <> ''
+            """,
+            'triggers': {
+                'ponto_busca_ai': """
+                    AFTER INSERT ON ponto WHEN NEW.observacoes <> '' BEGIN
+                        INSERT INTO ponto_busca (rowid, observacoes) VALUES (NEW.id, NEW.observacoes);
+                    END
+                """,
+                'ponto_busca_au': """
+                    AFTER UPDATE OF observacoes ON ponto BEGIN
+                        DELETE FROM ponto_busca WHERE rowid = OLD.id;
+                        INSERT INTO ponto_busca (rowid, observacoes)
+                        SELECT NEW.id, NEW.observacoes WHERE NEW.observacoes <> '';
+                    END
+                """,
+                'ponto_busca_ad': """
+                    AFTER DELETE ON ponto BEGIN
+                        DELETE FROM ponto_busca WHERE rowid = OLD.id;
+                    END
+                """,
+            },
+        },
+    }
+
+
+def instalar_indices_busca(connection, criar=True):
+    """
+    Cria (se ausentes) os índices e seus triggers. Um índice criado agora ou com
+    algum trigger ausente é recarregado por completo, pois as gravações feitas
+    sem o trigger não chegaram a ele. Com criar=False (após cada migrate) só
+    repara os índices já existentes, criados pela migração.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    tabelas = set(connection.introspection.table_names())
+    if not {'funcionario', 'ponto', get_user_model()._meta.db_table} <= tabelas:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {linha[0] for linha in cursor.fetchall()}
+
+        for indice, definicao in _indices().items():
+            ausentes = {nome: sql for nome, sql in definicao['triggers'].items() if nome not in triggers}
+            if (indice in tabelas and not ausentes) or (indice not in tabelas and not criar):
+                continue
+
+            colunas = ', '.join(definicao['colunas'])
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {indice} USING fts5({colunas}, "
+                f"tokenize = '{TOKENIZADOR}', prefix = '2 3')"
+            )
+            cursor.execute(f'DELETE FROM {indice}')
+            cursor.execute(definicao['carga'])
+            for nome, sql in ausentes.items():
+                cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {nome} {sql}')
+
+
+def remover_indices_busca(connection):
+    """Remove os índices e seus triggers"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for indice, definicao in _indices().items():
+            for nome in definicao['triggers']:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {nome}')
+            cursor.execute(f'DROP TABLE IF EXISTS {indice}')
+
+
+def expressao_busca(termo, colunas=None):
+    """
+    Expressão MATCH do FTS5 para um termo digitado: buscado como prefixo (entre
+    aspas, sem interpretar operadores) e restrito às colunas, se informadas.
+    None se o termo não tiver letras ou dígitos.
+    """
+    if not re.search(r'\w', termo):
+        return None
+    expressao = '"{}"*'.format(termo.replace('"', '""'))
+    if colunas:
+        expressao = '{{{}}} : {}'.format(' '.join(colunas), expressao)
+    return expressao
+
+
+def ids_encontrados(indice, expressao):
+    """Subquery com os ids dos registros do índice que atendem à expressão"""
+    return RawSQL(f'SELECT rowid FROM {indice} WHERE {indice} MATCH %s', [expressao])
+
+
+class BuscaIndexadaFilter(SearchFilter):
+    """
+    SearchFilter que atende pelos índices FTS5 os campos de `search_fields`
+    declarados em `busca_indexada` da view: {campo: (campo do id, índice, coluna)}.
+    Os demais campos seguem com o icontains do SearchFilter; como nele, cada termo
+    precisa ser encontrado em ao menos um campo. Fora do SQLite, busca só pelo
+    SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        indexados = getattr(view, 'busca_indexada', None)
+        search_fields = self.get_search_fields(view, request)
+        termos = self.get_search_terms(request)
+        if not indexados or not search_fields or not termos or connections[queryset.db].vendor != 'sqlite':
+            return super().filter_queryset(request, queryset, view)
+
+        # Campos indexados agrupados por índice (e campo que guarda o id indexado)
+        grupos = {}
+        demais = []
+        for campo in search_fields:
+            if campo in indexados:
+                campo_id, indice, coluna = indexados[campo]
+                grupos.setdefault((campo_id, indice), {})[campo] = coluna
+            else:
+                demais.append(campo)
+
+        condicoes = Q()
+        for termo in termos:
+            condicao = Q()
+            for (campo_id, indice), colunas in grupos.items():
+                expressao = expressao_busca(termo, colunas.values())
+                if expressao:
+                    condicao |= Q(**{f'{campo_id}__in': ids_encontrados(indice, expressao)})
+                else:
+                    # Termo só de pontuação (ex.: "@"): não há tokens para o índice
+                    for campo in colunas:
+                        condicao |= Q(**{self.construct_search(str(campo)): termo})
+            for campo in demais:
+                condicao |= Q(**{self.construct_search(str(campo)): termo})
+            condicoes &= condicao
+        queryset = queryset.filter(condicoes)
+
+        campos_relacionados = demais + [campo for colunas in grupos.values() for campo in colunas]
+        if self.must_call_distinct(queryset, campos_relacionados):
+            queryset = queryset.distinct()
+        return queryset
@@ -0,0 +1,368 @@
+"""
+Comando Django de benchmark dos caminhos críticos de escalator.services.
+Mede latência (p50/p95), queries por chamada e pico de memória de cada caso
+contra uma empresa (normalmente gerada por gerar_dados_sinteticos), grava o
+resultado em JSON e compara com um baseline salvo anteriormente.
+
+Exemplo:
+    python manage.py benchmark_servicos --empresa-id 1 --saida resultado.json
+    python manage.py benchmark_servicos --empresa-id 1 --baseline baseline.json --estrito
+"""
+
+import json
+import math
+import platform
+import random
+import time as cronometro
+import tracemalloc
+from datetime import datetime, time, timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.routers import create_empresa_database, set_db_for_request
+from usuarios.models import Usuario
+from escalator.models import Escala, EscalaPredefinida, Ponto
+from escalator.services import CalculadoraJornada, GerenciadorBancoHoras, ProcessadorPontos, ConsultorEscalasBrasil
+from escalator.views import EscalaViewSet, BancoHorasViewSet, RelatoriosViewSet
+
+# Métricas comparadas com o baseline (em todas, valores maiores são piores)
+METRICAS_COMPARADAS = ('p50_ms', 'p95_ms', 'queries', 'memoria_pico_kb')
+
+
+class ContadorQueries:
+    """Execute wrapper que conta as queries (sem depender do log limitado de connection.queries)"""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def percentil(valores, fracao):
+    """Percentil pelo método do posto mais próximo"""
+    ordenados = sorted(valores)
+    posicao = max(1, math.ceil(fracao * len(ordenados)))
+    return ordenados[posicao - 1]
+
+
+class Command(BaseCommand):
+    help = 'Executa o benchmark dos serviços de escalas e compara com um baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Banco de dados medido (ignorado se --empresa-id for informado)'
+        )
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='Mede o banco da empresa informada'
+        )
+        parser.add_argument(
+            '--iteracoes',
+            type=int,
+            default=20,
+            help='Chamadas medidas por caso (padrão: 20)'
+        )
+        parser.add_argument(
+            '--aquecimento',
+            type=int,
+            default=2,
+            help='Chamadas descartadas antes da medição (padrão: 2)'
+        )
+        parser.add_argument(
+            '--dias-periodo',
+            type=int,
+            default=30,
+            help='Tamanho do período dos relatórios e validações (padrão: 30)'
+        )
+        parser.add_argument(
+            '--casos',
+            nargs='+',
+            help='Executa apenas os casos informados'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semente da escolha de funcionários e datas (padrão: 42)'
+        )
+        parser.add_argument(
+            '--saida',
+            help='Arquivo JSON onde o resultado é gravado'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Arquivo JSON de uma execução anterior para comparação'
+        )
+        parser.add_argument(
+            '--tolerancia',
+            type=float,
+            default=0.2,
+            help='Piora relativa aceita antes de apontar regressão (padrão: 0.2 = 20%%)'
+        )
+        parser.add_argument(
+            '--estrito',
+            action='store_true',
+            help='Termina com erro se houver regressão em relação ao baseline'
+        )
+
+    def handle(self, *args, **options):
+        if options['empresa_id']:
+            database = create_empresa_database(options['empresa_id'])
+        else:
+            database = options['database']
+
+        self.database = database
+        self.rng = random.Random(options['seed'])
+        self.dias_periodo = options['dias_periodo']
+        self.factory = APIRequestFactory()
+        # Usuário sem empresa: as views usam o banco já definido no roteador
+        self.usuario = Usuario(username='benchmark', is_active=True)
+
+        casos = self._get_casos()
+        if options['casos']:
+            desconhecidos = set(options['casos']) - set(casos)
+            if desconhecidos:
+                raise CommandError(f'Casos desconhecidos: {", ".join(sorted(desconhecidos))}')
+            casos = {nome: casos[nome] for nome in options['casos']}
+
+        baseline = self._carregar_baseline(options['baseline'])
+
+        set_db_for_request(database)
+        try:
+            self._carregar_amostras()
+            resultados = {}
+            for nome, (preparar, executar) in casos.items():
+                self.stdout.write(f'Medindo {nome}...')
+                resultados[nome] = self._medir(preparar, executar, options['iteracoes'], options['aquecimento'])
+        finally:
+            set_db_for_request(None)
+
+        relatorio = {
+            'meta': {
+                'executado_em': timezone.now().isoformat(),
+                'database': database,
+                'iteracoes': options['iteracoes'],
+                'dias_periodo': self.dias_periodo,
+                'seed': options['seed'],
+                'volume': self._volume,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'casos': resultados,
+        }
+
+        self._imprimir(resultados)
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {options["saida"]}'))
+
+        if baseline is not None:
+            regressoes = self._comparar(resultados, baseline, options['tolerancia'])
+            if regressoes and options['estrito']:
+                raise CommandError(f'{len(regressoes)} regressão(ões) em relação ao baseline')
+
+    # Casos
+
+    def _get_casos(self):
+        """Casos medidos: nome -> (preparar, executar); preparar não entra na medição"""
+        return {
+            'calcular_jornada_diaria': (self._preparar_escala, self._executar_jornada_diaria),
+            'relatorio_periodo': (self._preparar_periodo, self._executar_relatorio_periodo),
+            'validar_periodo': (self._preparar_periodo, self._executar_validar_periodo),
+            'saldos': (None, self._executar_saldos),
+            'processar_vencimentos': (None, self._executar_processar_vencimentos),
+            'aplicar_escala_predefinida': (self._preparar_aplicar_escala, self._executar_aplicar_escala),
+            'registrar_ponto': (self._preparar_registro_ponto, self._executar_registrar_ponto),
+        }
+
+    def _carregar_amostras(self):
+        """Sorteia (com a seed) escalas de dias trabalhados usadas como entrada dos casos"""
+        escalas = Escala.objects.filter(descanso=False, hora_inicio__isnull=False)
+        total = escalas.count()
+        if not total:
+            raise CommandError(f'O banco {self.database} não tem escalas; gere a massa com gerar_dados_sinteticos')
+
+        ids = escalas.order_by('id').values_list('id', flat=True)
+        sorteados = [ids[self.rng.randrange(total)] for _ in range(50)]
+        self._escalas = list(Escala.objects.filter(id__in=sorteados).select_related('funcionario').order_by('id'))
+        self._ultimo_dia = Escala.objects.order_by('-data').values_list('data', flat=True).first()
+        self._escala_predefinida = EscalaPredefinida.objects.order_by('id').first()
+        self._volume = {
+            'escalas': total,
+            'pontos': Ponto.objects.count(),
+        }
+
+    def _sortear_escala(self):
+        return self.rng.choice(self._escalas)
+
+    def _preparar_escala(self):
+        escala = self._sortear_escala()
+        return escala.funcionario, escala.data
+
+    def _preparar_periodo(self):
+        escala = self._sortear_escala()
+        return {
+            'funcionario': escala.funcionario_id,
+            'data_inicio': str(escala.data - timedelta(days=self.dias_periodo - 1)),
+            'data_fim': str(escala.data),
+        }
+
+    def _preparar_aplicar_escala(self):
+        if self._escala_predefinida is None:
+            raise CommandError('Nenhuma escala predefinida cadastrada')
+        # Período após o fim da massa, para não colidir com escalas existentes
+        escala = self._sortear_escala()
+        inicio = self._ultimo_dia + timedelta(days=1)
+        return escala.funcionario, self._escala_predefinida.id, inicio, inicio + timedelta(days=self.dias_periodo - 1)
+
+    def _preparar_registro_ponto(self):
+        # Entrada à noite no dia sorteado, para que a saída medida seja uma sequência válida
+        escala = self._sortear_escala()
+        entrada = timezone.make_aware(datetime.combine(escala.data, time(21, 0)))
+        Ponto.objects.create(funcionario=escala.funcionario, escala=escala, timestamp=entrada, tipo_registro='entrada')
+        return escala.funcionario, entrada + timedelta(minutes=30)
+
+    def _executar_jornada_diaria(self, funcionario, data):
+        return CalculadoraJornada().calcular_jornada_diaria(funcionario, data)
+
+    def _executar_relatorio_periodo(self, dados):
+        return self._chamar_view(RelatoriosViewSet, 'post', 'jornada_funcionario', dados)
+
+    def _executar_validar_periodo(self, dados):
+        return self._chamar_view(EscalaViewSet, 'post', 'validar_periodo', dados)
+
+    def _executar_saldos(self):
+        return self._chamar_view(BancoHorasViewSet, 'get', 'saldos')
+
+    def _executar_processar_vencimentos(self):
+        return GerenciadorBancoHoras().processar_vencimentos()
+
+    def _executar_aplicar_escala(self, funcionario, escala_id, data_inicio, data_fim):
+        return ConsultorEscalasBrasil().aplicar_escala_predefinida(funcionario, escala_id, data_inicio, data_fim)
+
+    def _executar_registrar_ponto(self, funcionario, timestamp):
+        return ProcessadorPontos().registrar_ponto(funcionario, 'saida', timestamp)
+
+    def _chamar_view(self, viewset, metodo, acao, dados=None):
+        """Chama a ação do ViewSet como uma requisição autenticada (sem HTTP)"""
+        if metodo == 'get':
+            request = self.factory.get('/', dados or {})
+        else:
+            request = self.factory.post('/', dados or {}, format='json')
+        force_authenticate(request, user=self.usuario)
+        response = viewset.as_view({metodo: acao})(request)
+        if response.status_code >= 400:
+            raise CommandError(f'{viewset.__name__}.{acao} retornou {response.status_code}: {response.data}')
+        return response
+
+    # Medição
+
+    def _chamar(self, preparar, executar, capturar=None):
+        """
+        Executa uma chamada dentro de uma transação desfeita ao final,
+        para que casos de escrita não alterem a massa entre iterações.
+        Retorna (duração em segundos, queries da chamada).
+        """
+        with transaction.atomic(using=self.database):
+            argumentos = preparar() if preparar else ()
+            if not isinstance(argumentos, tuple):
+                argumentos = (argumentos,)
+            contador = ContadorQueries()
+            with connections[self.database].execute_wrapper(contador):
+                inicio = cronometro.perf_counter()
+                if capturar:
+                    capturar()
+                executar(*argumentos)
+                duracao = cronometro.perf_counter() - inicio
+            transaction.set_rollback(True, using=self.database)
+        return duracao, contador.total
+
+    def _medir(self, preparar, executar, iteracoes, aquecimento):
+        for _ in range(aquecimento):
+            self._chamar(preparar, executar)
+
+        duracoes, queries = [], []
+        for _ in range(max(1, iteracoes)):
+            duracao, total_queries = self._chamar(preparar, executar)
+            duracoes.append(duracao * 1000)
+            queries.append(total_queries)
+
+        # Memória medida em uma chamada separada: o tracemalloc distorce a latência
+        tracemalloc.start()
+        try:
+            self._chamar(preparar, executar, capturar=tracemalloc.reset_peak)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'iteracoes': len(duracoes),
+            'p50_ms': round(percentil(duracoes, 0.5), 3),
+            'p95_ms': round(percentil(duracoes, 0.95), 3),
+            'media_ms': round(sum(duracoes) / len(duracoes), 3),
+            'queries': max(queries),
+            'memoria_pico_kb': round(pico / 1024, 1),
+        }
+
+    # Saída e comparação
+
+    def _imprimir(self, resultados):
+        self.stdout.write('')
+        self.stdout.write(f'{"caso":<28} {"p50 ms":>10} {"p95 ms":>10} {"queries":>8} {"memória kb":>11}')
+        for nome, resultado in resultados.items():
+            self.stdout.write(
+                f'{nome:<28} {resultado["p50_ms"]:>10.2f} {resultado["p95_ms"]:>10.2f} '
+                f'{resultado["queries"]:>8} {resultado["memoria_pico_kb"]:>11.1f}'
+            )
+
+    def _carregar_baseline(self, caminho):
+        if not caminho:
+            return None
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo).get('casos', {})
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Não foi possível ler o baseline {caminho}: {e}')
+
+    def _comparar(self, resultados, baseline, tolerancia):
+        """Compara com o baseline e lista as métricas que pioraram além da tolerância"""
+        self.stdout.write('')
+        self.stdout.write('Comparação com o baseline:')
+        regressoes = []
+        for nome, resultado in resultados.items():
+            anterior = baseline.get(nome)
+            if not anterior:
+                self.stdout.write(f'  {nome}: sem baseline')
+                continue
+
+            for metrica in METRICAS_COMPARADAS:
+                atual, referencia = resultado.get(metrica), anterior.get(metrica)
+                if atual is None or referencia is None:
+                    continue
+
+                # Queries são determinísticas: qualquer aumento é regressão
+                limite = referencia if metrica == 'queries' else referencia * (1 + tolerancia)
+                variacao = (atual - referencia) / referencia * 100 if referencia else 0.0
+                linha = f'  {nome}.{metrica}: {referencia} -> {atual} ({variacao:+.1f}%)'
+                if atual > limite:
+                    regressoes.append(linha)
+                    self.stdout.write(self.style.ERROR(linha + ' REGRESSÃO'))
+                elif atual < referencia:
+                    self.stdout.write(self.style.SUCCESS(linha))
+                else:
+                    self.stdout.write(linha)
+
+        if not regressoes:
+            self.stdout.write(self.style.SUCCESS('Nenhuma regressão em relação ao baseline'))
+        return regressoes
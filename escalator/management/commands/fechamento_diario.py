@@ -0,0 +1,144 @@
+"""
+Comando para o fechamento diário do banco de horas em todas as empresas
+Agendado para rodar de madrugada (ex.: cron às 02:00), fecha o dia anterior
+"""
+from datetime import datetime, timedelta
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.routers import get_empresa_database, set_db_for_request, usando_banco
+from core.tenants import MODO_PROCESSO, MODO_THREAD, executar_em_empresas, listar_empresas
+from escalator.services import FechamentoDiario, SincronizacaoIncremental
+
+
+def fechar_dia_empresa(empresa_id, data):
+    """Fecha o dia no banco de uma empresa (executada no pool de empresas)"""
+    set_db_for_request(get_empresa_database(empresa_id))
+    try:
+        return FechamentoDiario().fechar_dia(data)
+    finally:
+        set_db_for_request(None)
+
+
+def fechar_periodo_empresa(empresa_id, datas):
+    """Fecha cada dia da lista, em ordem, no banco da empresa e descarta as exclusões além da retenção da sincronização"""
+    resultados = [fechar_dia_empresa(empresa_id, data) for data in datas]
+    with usando_banco(get_empresa_database(empresa_id)):
+        SincronizacaoIncremental().purgar_excluidos()
+    return resultados
+
+
+class Command(BaseCommand):
+    help = 'Fecha o dia no banco de horas de todas as empresas (faltas e marcações incompletas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data',
+            type=str,
+            help='Dia a fechar, YYYY-MM-DD (padrão: ontem)',
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=1,
+            help='Quantidade de dias fechados, terminando em --data (padrão: 1)',
+        )
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='ID da empresa específica (opcional)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Empresas processadas em paralelo (padrão: 4)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=600,
+            help='Tempo limite por empresa em segundos (padrão: 600)',
+        )
+        parser.add_argument(
+            '--processos',
+            action='store_true',
+            help='Usa processos em vez de threads (interrompe as empresas que excedem o tempo limite)',
+        )
+        parser.add_argument(
+            '--json-output',
+            action='store_true',
+            help='Saída em formato JSON',
+        )
+
+    def handle(self, *args, **options):
+        if options['data']:
+            try:
+                data_fim = datetime.strptime(options['data'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Data inválida. Use o formato YYYY-MM-DD')
+        else:
+            data_fim = timezone.localdate() - timedelta(days=1)
+
+        if options['dias'] < 1:
+            raise CommandError('--dias deve ser maior que zero')
+        datas = [data_fim - timedelta(days=n) for n in range(options['dias'] - 1, -1, -1)]
+
+        empresas = listar_empresas(options['empresa_id'])
+        if not empresas:
+            raise CommandError('Nenhuma empresa ativa encontrada')
+
+        # Com --json-output o progresso vai para stderr, mantendo o stdout como JSON válido
+        self.saida_progresso = self.stderr if options['json_output'] else self.stdout
+
+        execucoes = executar_em_empresas(
+            fechar_periodo_empresa,
+            empresas,
+            args=(datas,),
+            max_workers=options['workers'],
+            timeout=options['timeout'],
+            modo=MODO_PROCESSO if options['processos'] else MODO_THREAD,
+            ao_concluir=self.exibir_resultado,
+        )
+
+        falhas = [execucao for execucao in execucoes if not execucao['sucesso']]
+
+        if options['json_output']:
+            self.stdout.write(json.dumps(execucoes, indent=2, default=str, ensure_ascii=False))
+        else:
+            self.exibir_resumo(execucoes)
+
+        if falhas:
+            raise CommandError(f'{len(falhas)} empresa(s) com falha no fechamento; execute novamente para refazê-las')
+
+    def exibir_resultado(self, execucao, concluidas, total):
+        prefixo = f"[{concluidas}/{total}] {execucao['empresa_nome']}"
+        if not execucao['sucesso']:
+            self.saida_progresso.write(self.style.ERROR(f"{prefixo}: {execucao['erro']}"))
+            return
+
+        dias = execucao['resultado']
+        self.saida_progresso.write(
+            f"{prefixo}: {sum(dia['registros'] for dia in dias)} registros, "
+            f"{sum(dia['faltas'] for dia in dias)} faltas, "
+            f"{sum(dia['marcacoes_incompletas'] for dia in dias)} marcações incompletas "
+            f"({execucao['duracao']:.2f}s)"
+        )
+
+    def exibir_resumo(self, execucoes):
+        sucesso = [execucao for execucao in execucoes if execucao['sucesso']]
+        self.stdout.write('\n' + '=' * 60)
+        self.stdout.write('RESUMO DO FECHAMENTO')
+        self.stdout.write('=' * 60)
+        self.stdout.write(f'Empresas processadas: {len(sucesso)}/{len(execucoes)}')
+        self.stdout.write(
+            f"Funcionários: {sum(dia['funcionarios'] for execucao in sucesso for dia in execucao['resultado'])}"
+        )
+        self.stdout.write(
+            f"Registros gravados: {sum(dia['registros'] for execucao in sucesso for dia in execucao['resultado'])}"
+        )
+        if sucesso:
+            mais_lenta = max(sucesso, key=lambda execucao: execucao['duracao'])
+            self.stdout.write(f"Empresa mais lenta: {mais_lenta['empresa_nome']} ({mais_lenta['duracao']:.2f}s)")
+
@@ -0,0 +1,326 @@
+"""
+Comando Django para gerar uma empresa sintética de grande volume.
+Cria funcionários, contratos (com troca de vigência), escalas 12x36/6x1/5x2,
+marcações de ponto realistas e histórico de banco de horas, para benchmarks.
+
+Exemplo:
+    python manage.py gerar_dados_sinteticos --empresa-id 1 --funcionarios 10000 --dias 365
+"""
+
+import random
+import time as cronometro
+from datetime import date, datetime, time, timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.routers import create_empresa_database
+from escalator.models import Funcionario, Contrato, Escala, Folga, Ponto, BancoHoras, ConfiguracaoSistema
+from escalator.regras import obter_regras
+from escalator.services import ValidacaoEscalas
+
+# Prefixo das matrículas geradas (permite limpar apenas a massa sintética)
+PREFIXO_MATRICULA = 'SIN'
+
+CARGOS = ['Operador', 'Auxiliar', 'Técnico', 'Enfermeiro', 'Vigilante', 'Atendente', 'Supervisor']
+
+# Modelos de escala: (nome, peso na distribuição)
+MODELOS_ESCALA = [('12x36', 0.3), ('6x1', 0.35), ('5x2', 0.35)]
+
+
+class Command(BaseCommand):
+    help = 'Gera uma empresa sintética com grande volume de dados para benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Banco de dados de destino (ignorado se --empresa-id for informado)'
+        )
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='Gera os dados no banco da empresa informada'
+        )
+        parser.add_argument(
+            '--funcionarios',
+            type=int,
+            default=100,
+            help='Quantidade de funcionários (padrão: 100)'
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=365,
+            help='Quantidade de dias de histórico (padrão: 365)'
+        )
+        parser.add_argument(
+            '--data-fim',
+            type=date.fromisoformat,
+            help='Último dia do histórico, AAAA-MM-DD (padrão: ontem)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semente do gerador aleatório, para massas reproduzíveis (padrão: 42)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Tamanho dos lotes de bulk_create (padrão: 5000)'
+        )
+        parser.add_argument(
+            '--funcionarios-por-transacao',
+            type=int,
+            default=200,
+            help='Funcionários gravados por transação (padrão: 200)'
+        )
+        parser.add_argument(
+            '--limpar',
+            action='store_true',
+            help='Remove a massa sintética existente antes de gerar'
+        )
+
+    def handle(self, *args, **options):
+        if options['funcionarios'] < 1 or options['dias'] < 1:
+            raise CommandError('--funcionarios e --dias devem ser maiores que zero')
+
+        if options['empresa_id']:
+            database = create_empresa_database(options['empresa_id'])
+        else:
+            database = options['database']
+
+        self.database = database
+        self.lote = options['lote']
+        self.rng = random.Random(options['seed'])
+        self.data_fim = options['data_fim'] or timezone.localdate() - timedelta(days=1)
+        self.data_inicio = self.data_fim - timedelta(days=options['dias'] - 1)
+        self.fuso = timezone.get_current_timezone()
+        self.periodo_noturno = ConfiguracaoSistema.get_periodo_noturno(using=database)
+        self.validacao = ValidacaoEscalas(obter_regras(database))
+
+        existentes = Funcionario.objects.using(database).filter(matricula__startswith=PREFIXO_MATRICULA)
+        if options['limpar']:
+            removidos, _ = existentes.delete()
+            self.stdout.write(f'Massa sintética anterior removida ({removidos} registros)')
+        elif existentes.exists():
+            raise CommandError('Já existe massa sintética neste banco; use --limpar para recriá-la')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Gerando {options["funcionarios"]} funcionários de {self.data_inicio} a {self.data_fim} '
+            f'no banco {database} (seed {options["seed"]})...'
+        ))
+
+        totais = {'funcionarios': 0, 'contratos': 0, 'escalas': 0, 'folgas': 0, 'pontos': 0, 'banco_horas': 0}
+        inicio = cronometro.perf_counter()
+        por_transacao = max(1, options['funcionarios_por_transacao'])
+
+        for primeiro in range(0, options['funcionarios'], por_transacao):
+            ultimo = min(primeiro + por_transacao, options['funcionarios'])
+            with transaction.atomic(using=database):
+                parcial = self._gerar_grupo(range(primeiro, ultimo))
+            for chave, valor in parcial.items():
+                totais[chave] += valor
+
+            decorrido = cronometro.perf_counter() - inicio
+            self.stdout.write(f'  {ultimo}/{options["funcionarios"]} funcionários ({decorrido:.1f}s)')
+
+        decorrido = cronometro.perf_counter() - inicio
+        resumo = ', '.join(f'{chave}: {valor}' for chave, valor in totais.items())
+        self.stdout.write(self.style.SUCCESS(f'Massa gerada em {decorrido:.1f}s ({resumo})'))
+
+    # Geração
+
+    def _gerar_grupo(self, indices):
+        """Gera e grava um grupo de funcionários com todo o histórico"""
+        funcionarios = Funcionario.objects.using(self.database).bulk_create([
+            Funcionario(
+                nome=f'Funcionário Sintético {indice + 1}',
+                matricula=f'{PREFIXO_MATRICULA}{indice + 1:07d}',
+                cargo=self.rng.choice(CARGOS),
+                ativo=self.rng.random() > 0.02,
+            )
+            for indice in indices
+        ], batch_size=self.lote)
+
+        # Relações por id: o roteador recusa atribuir instâncias de bancos de empresa dinâmicos
+        contratos, escalas, folgas, jornadas = [], [], [], []
+        for funcionario in funcionarios:
+            modelo = self._sortear_modelo()
+            vigencias = self._gerar_contratos(funcionario, modelo)
+            contratos.extend(vigencias)
+            self._gerar_escalas(funcionario, modelo, vigencias, escalas, folgas, jornadas)
+
+        Contrato.objects.using(self.database).bulk_create(contratos, batch_size=self.lote)
+        # bulk_create não chama save() nem os signals: previstos e situação nas regras são calculados aqui
+        for escala in escalas:
+            escala.calcular_previsto(self.periodo_noturno)
+        self.validacao.classificar(escalas, contratos)
+        Escala.objects.using(self.database).bulk_create(escalas, batch_size=self.lote)
+        Folga.objects.using(self.database).bulk_create(folgas, batch_size=self.lote)
+
+        # As marcações dependem do id das escalas, obtido no bulk_create acima
+        pontos, bancos = [], []
+        for escala, contrato in jornadas:
+            self._gerar_marcacoes(escala, contrato, pontos, bancos)
+
+        Ponto.objects.using(self.database).bulk_create(pontos, batch_size=self.lote)
+        BancoHoras.objects.using(self.database).bulk_create(bancos, batch_size=self.lote)
+
+        return {
+            'funcionarios': len(funcionarios),
+            'contratos': len(contratos),
+            'escalas': len(escalas),
+            'folgas': len(folgas),
+            'pontos': len(pontos),
+            'banco_horas': len(bancos),
+        }
+
+    def _sortear_modelo(self):
+        nomes, pesos = zip(*MODELOS_ESCALA)
+        return self.rng.choices(nomes, weights=pesos)[0]
+
+    def _gerar_contratos(self, funcionario, modelo):
+        """Gera o contrato inicial e, para parte dos funcionários, uma troca de vigência no período"""
+        admissao = self.data_inicio - timedelta(days=self.rng.randint(0, 1500))
+        carga_diaria = 720 if modelo == '12x36' else 480
+        contrato = Contrato(
+            funcionario_id=funcionario.id,
+            carga_diaria_max=carga_diaria,
+            carga_semanal_max=2640,
+            extra_diaria_cap=120,
+            banco_horas_prazo_meses=self.rng.choice([6, 12]),
+            permite_12x36=modelo == '12x36',
+            vigencia_inicio=admissao,
+        )
+        contratos = [contrato]
+
+        total_dias = (self.data_fim - self.data_inicio).days
+        if total_dias > 30 and self.rng.random() < 0.3:
+            troca = self.data_inicio + timedelta(days=self.rng.randint(15, total_dias - 15))
+            contrato.vigencia_fim = troca - timedelta(days=1)
+            contratos.append(Contrato(
+                funcionario_id=funcionario.id,
+                carga_diaria_max=carga_diaria,
+                carga_semanal_max=2640,
+                extra_diaria_cap=self.rng.choice([60, 120]),
+                banco_horas_prazo_meses=self.rng.choice([6, 12]),
+                permite_12x36=modelo == '12x36',
+                vigencia_inicio=troca,
+            ))
+
+        return contratos
+
+    def _contrato_vigente(self, vigencias, data):
+        for contrato in reversed(vigencias):
+            if contrato.vigencia_inicio <= data:
+                return contrato
+        return vigencias[0]
+
+    def _gerar_escalas(self, funcionario, modelo, vigencias, escalas, folgas, jornadas):
+        """Gera as escalas do período conforme o modelo, com DSR e folgas"""
+        noturno = modelo == '12x36' and self.rng.random() < 0.4
+        defasagem = self.rng.randint(0, 6)
+        data = self.data_inicio
+        while data <= self.data_fim:
+            dia = (data - self.data_inicio).days + defasagem
+            if modelo == '12x36':
+                trabalha = dia % 2 == 0
+            elif modelo == '6x1':
+                trabalha = dia % 7 != 6
+            else:
+                trabalha = data.weekday() < 5
+
+            # Ausências eventuais (atestados, folgas concedidas)
+            if trabalha and self.rng.random() < 0.01:
+                folgas.append(Folga(funcionario_id=funcionario.id, data=data, motivo='Folga concedida'))
+                trabalha = False
+            elif not trabalha and (modelo == '6x1' or data.weekday() == 6):
+                folgas.append(Folga(funcionario_id=funcionario.id, data=data, motivo='DSR'))
+
+            if not trabalha:
+                escalas.append(Escala(funcionario_id=funcionario.id, data=data, descanso=True, pausa_minutos=0))
+            elif modelo == '12x36':
+                escala = Escala(
+                    funcionario_id=funcionario.id, data=data,
+                    hora_inicio=time(19, 0) if noturno else time(7, 0),
+                    hora_fim=time(7, 0) if noturno else time(19, 0),
+                    pausa_minutos=60,
+                    tipo_escala='noturna' if noturno else '12x36',
+                )
+                escalas.append(escala)
+                jornadas.append((escala, self._contrato_vigente(vigencias, data)))
+            else:
+                escala = Escala(
+                    funcionario_id=funcionario.id, data=data,
+                    hora_inicio=time(8, 0), hora_fim=time(17, 0),
+                    pausa_minutos=60, tipo_escala='normal',
+                )
+                escalas.append(escala)
+                jornadas.append((escala, self._contrato_vigente(vigencias, data)))
+
+            data += timedelta(days=1)
+
+    def _gerar_marcacoes(self, escala, contrato, pontos, bancos):
+        """Gera as marcações do dia (atrasos, saídas ausentes, virada de dia) e o lançamento de banco de horas"""
+        rng = self.rng
+        if rng.random() < 0.005:
+            return  # falta sem marcação
+
+        inicio = datetime.combine(escala.data, escala.hora_inicio)
+        fim = datetime.combine(escala.data, escala.hora_fim)
+        if fim <= inicio:
+            fim += timedelta(days=1)
+
+        # Atraso ocasional; no restante, chegada próxima do horário
+        if rng.random() < 0.08:
+            entrada = inicio + timedelta(minutes=rng.randint(10, 45))
+        else:
+            entrada = inicio + timedelta(minutes=rng.randint(-10, 5))
+
+        meio = inicio + (fim - inicio) / 2
+        pausa_inicio = meio + timedelta(minutes=rng.randint(-30, 30))
+        pausa_fim = pausa_inicio + timedelta(minutes=escala.pausa_minutos + rng.randint(-5, 10))
+        saida = fim + timedelta(minutes=rng.choice([rng.randint(-5, 10), rng.randint(20, 90)]))
+        esqueceu_saida = rng.random() < 0.02
+
+        marcacoes = [('entrada', entrada), ('pausa_inicio', pausa_inicio), ('pausa_fim', pausa_fim)]
+        if not esqueceu_saida:
+            marcacoes.append(('saida', saida))
+
+        for tipo, momento in marcacoes:
+            pontos.append(Ponto(
+                funcionario_id=escala.funcionario_id,
+                escala_id=escala.id,
+                timestamp=timezone.make_aware(momento, self.fuso),
+                tipo_registro=tipo,
+                validado=rng.random() > 0.05,
+                observacoes='' if tipo != 'entrada' or entrada - inicio < timedelta(minutes=10) else 'Atraso',
+            ))
+
+        if esqueceu_saida:
+            return
+
+        previsto = (fim - inicio).total_seconds() // 60 - escala.pausa_minutos
+        trabalhado = ((saida - entrada) - (pausa_fim - pausa_inicio)).total_seconds() // 60
+        diferenca = int(trabalhado - previsto)
+        if abs(diferenca) < 10:
+            return
+
+        # bulk_create não chama BancoHoras.save: saldo e vencimento são calculados aqui
+        credito = max(diferenca, 0)
+        debito = max(-diferenca, 0)
+        vencimento = escala.data + relativedelta(months=contrato.banco_horas_prazo_meses)
+        bancos.append(BancoHoras(
+            funcionario_id=escala.funcionario_id,
+            data_referencia=escala.data,
+            credito_minutos=credito,
+            debito_minutos=debito,
+            saldo_minutos=credito - debito,
+            data_vencimento=vencimento,
+            compensado=vencimento < self.data_fim and rng.random() < 0.7,
+        ))
@@ -0,0 +1,104 @@
+"""
+Comando para recalcular a situação (valida, codigos_violacao) das escalas gravadas
+Necessário após alterar regras com efeito retroativo; no dia a dia a situação é
+mantida pelos signals de escala, contrato, recorrência e configuração, e a carga
+inicial roda ao aplicar a migração que criou os campos (revalidar_escalas_apos_migrate)
+"""
+from datetime import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from core.routers import get_empresa_database, usando_banco
+from core.tenants import MODO_PROCESSO, MODO_THREAD, executar_em_empresas, listar_empresas
+from escalator.services import ValidacaoEscalas
+
+
+def revalidar_empresa(empresa_id, data_inicio):
+    """Revalida as escalas no banco de uma empresa (executada no pool de empresas)"""
+    with usando_banco(get_empresa_database(empresa_id)):
+        situacoes = ValidacaoEscalas().revalidar(data_inicio=data_inicio)
+    return {
+        'escalas': len(situacoes),
+        'invalidas': sum(1 for valida, _ in situacoes.values() if not valida),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a situação das escalas gravadas nas regras trabalhistas de cada empresa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            type=str,
+            help='Revalida só as escalas a partir desta data, YYYY-MM-DD (padrão: todo o histórico)',
+        )
+        parser.add_argument(
+            '--empresa-id',
+            type=int,
+            help='ID da empresa específica (opcional)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Empresas processadas em paralelo (padrão: 4)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=1800,
+            help='Tempo limite por empresa em segundos (padrão: 1800)',
+        )
+        parser.add_argument(
+            '--processos',
+            action='store_true',
+            help='Usa processos em vez de threads (interrompe as empresas que excedem o tempo limite)',
+        )
+        parser.add_argument(
+            '--json-output',
+            action='store_true',
+            help='Saída em formato JSON',
+        )
+
+    def handle(self, *args, **options):
+        data_inicio = None
+        if options['desde']:
+            try:
+                data_inicio = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Data inválida. Use o formato YYYY-MM-DD')
+
+        empresas = listar_empresas(options['empresa_id'])
+        if not empresas:
+            raise CommandError('Nenhuma empresa ativa encontrada')
+
+        self.saida_progresso = self.stderr if options['json_output'] else self.stdout
+
+        execucoes = executar_em_empresas(
+            revalidar_empresa,
+            empresas,
+            args=(data_inicio,),
+            max_workers=options['workers'],
+            timeout=options['timeout'],
+            modo=MODO_PROCESSO if options['processos'] else MODO_THREAD,
+            ao_concluir=self.exibir_resultado,
+        )
+
+        if options['json_output']:
+            self.stdout.write(json.dumps(execucoes, indent=2, default=str, ensure_ascii=False))
+
+        falhas = [execucao for execucao in execucoes if not execucao['sucesso']]
+        if falhas:
+            raise CommandError(f'{len(falhas)} empresa(s) com falha; execute novamente para refazê-las')
+
+    def exibir_resultado(self, execucao, concluidas, total):
+        prefixo = f"[{concluidas}/{total}] {execucao['empresa_nome']}"
+        if not execucao['sucesso']:
+            self.saida_progresso.write(self.style.ERROR(f"{prefixo}: {execucao['erro']}"))
+            return
+
+        resultado = execucao['resultado']
+        self.saida_progresso.write(
+            f"{prefixo}: {resultado['escalas']} escalas, {resultado['invalidas']} fora das regras "
+            f"({execucao['duracao']:.2f}s)"
+        )
@@ -2,6 +2,7 @@ from django.db import migrations
 
 def criar_escalas_predefinidas(apps, schema_editor):
     EscalaPredefinida = apps.get_model('escalator', 'EscalaPredefinida')
+    db_alias = schema_editor.connection.alias
     exemplos = [
         {"nome": "12x36", "descricao": "12h trabalho, 36h descanso", "horas_trabalho": 12, "horas_descanso": 36},
         {"nome": "24x48", "descricao": "24h trabalho, 48h descanso", "horas_trabalho": 24, "horas_descanso": 48},
@@ -11,7 +12,7 @@ def criar_escalas_predefinidas(apps, schema_editor):
         {"nome": "6x2", "descricao": "6 dias trabalho, 2 dias descanso", "horas_trabalho": 8, "horas_descanso": 16},
     ]
     for ex in exemplos:
-        EscalaPredefinida.objects.get_or_create(**ex)
+        EscalaPredefinida.objects.using(db_alias).get_or_create(**ex)
 
 class Migration(migrations.Migration):
     dependencies = [
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0007_alter_folga_options_alter_funcionario_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscalaRecorrente',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('data_ancora', models.DateField(verbose_name='Início do ciclo')),
+                ('dias_trabalho', models.PositiveIntegerField(verbose_name='Dias de trabalho no ciclo')),
+                ('dias_ciclo', models.PositiveIntegerField(verbose_name='Dias do ciclo')),
+                ('hora_inicio', models.TimeField(verbose_name='Hora de início')),
+                ('hora_fim', models.TimeField(verbose_name='Hora de término')),
+                ('pausa_minutos', models.PositiveIntegerField(default=60, verbose_name='Pausa em minutos')),
+                ('tipo_escala', models.CharField(choices=[('normal', 'Normal'), ('12x36', '12x36'), ('noturna', 'Noturna'), ('extra', 'Hora Extra')], default='normal', max_length=20, verbose_name='Tipo de escala')),
+                ('vigencia_inicio', models.DateField(verbose_name='Vigência início')),
+                ('vigencia_fim', models.DateField(blank=True, null=True, verbose_name='Vigência fim')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('escala_predefinida', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='escalator.escalapredefinida', verbose_name='Escala predefinida')),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='escalator.funcionario', verbose_name='Funcionário')),
+            ],
+            options={
+                'verbose_name': 'Escala Recorrente',
+                'verbose_name_plural': 'Escalas Recorrentes',
+                'db_table': 'escala_recorrente',
+                'ordering': ['-vigencia_inicio'],
+            },
+        ),
+    ]
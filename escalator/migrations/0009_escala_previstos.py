@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:02
+
+from datetime import time
+
+from django.db import migrations, models
+
+from escalator.models import calcular_horario_previsto
+
+LOTE = 2000
+
+
+def preencher_previstos(apps, schema_editor):
+    """Calcula duração, minutos noturnos e término previstos das escalas existentes"""
+    Escala = apps.get_model('escalator', 'Escala')
+    ConfiguracaoSistema = apps.get_model('escalator', 'ConfiguracaoSistema')
+    db_alias = schema_editor.connection.alias
+
+    configuracoes = dict(ConfiguracaoSistema.objects.using(db_alias).filter(
+        chave__in=['periodo_noturno_inicio', 'periodo_noturno_fim']
+    ).values_list('chave', 'valor'))
+    try:
+        periodo_noturno = (
+            time.fromisoformat(configuracoes.get('periodo_noturno_inicio') or '22:00'),
+            time.fromisoformat(configuracoes.get('periodo_noturno_fim') or '05:00'),
+        )
+    except ValueError:
+        periodo_noturno = (time(22, 0), time(5, 0))
+
+    escalas = Escala.objects.using(db_alias).filter(
+        descanso=False, hora_inicio__isnull=False, hora_fim__isnull=False
+    ).only('id', 'data', 'hora_inicio', 'hora_fim', 'pausa_minutos', 'descanso').order_by('id')
+
+    pendentes = []
+    for escala in escalas.iterator(chunk_size=LOTE):
+        escala.duracao_minutos, escala.minutos_noturnos, escala.fim_previsto = calcular_horario_previsto(
+            escala.data, escala.hora_inicio, escala.hora_fim, escala.pausa_minutos, False, periodo_noturno
+        )
+        pendentes.append(escala)
+        if len(pendentes) >= LOTE:
+            Escala.objects.using(db_alias).bulk_update(pendentes, ['duracao_minutos', 'minutos_noturnos', 'fim_previsto'])
+            pendentes = []
+    if pendentes:
+        Escala.objects.using(db_alias).bulk_update(pendentes, ['duracao_minutos', 'minutos_noturnos', 'fim_previsto'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0008_escalarecorrente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='escala',
+            name='duracao_minutos',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Duração prevista (minutos)'),
+        ),
+        migrations.AddField(
+            model_name='escala',
+            name='fim_previsto',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Término previsto'),
+        ),
+        migrations.AddField(
+            model_name='escala',
+            name='minutos_noturnos',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Minutos noturnos previstos'),
+        ),
+        migrations.RunPython(preencher_previstos, migrations.RunPython.noop),
+    ]
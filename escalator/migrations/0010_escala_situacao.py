@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0009_escala_previstos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='escala',
+            name='codigos_violacao',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=200, verbose_name='Regras violadas'),
+        ),
+        migrations.AddField(
+            model_name='escala',
+            name='valida',
+            field=models.BooleanField(db_default=True, default=True, editable=False, verbose_name='Conforme as regras'),
+        ),
+        migrations.AddIndex(
+            model_name='escala',
+            index=models.Index(fields=['valida', 'data'], name='escala_valida_data_idx'),
+        ),
+    ]
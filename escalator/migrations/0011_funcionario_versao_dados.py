@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0010_escala_situacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='funcionario',
+            name='versao_dados',
+            field=models.PositiveBigIntegerField(db_default=0, default=0, editable=False, verbose_name='Versão dos dados'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:23
+
+import django.db.models.functions.datetime
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_atualizacao(apps, schema_editor):
+    """Registros existentes: updated_at = created_at (Now() no SQLite é UTC e os bancos gravam no horário local)"""
+    db_alias = schema_editor.connection.alias
+    for modelo in ('Escala', 'Ponto'):
+        apps.get_model('escalator', modelo).objects.using(db_alias).update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0011_funcionario_versao_dados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroExcluido',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tabela', models.CharField(max_length=50, verbose_name='Tabela')),
+                ('objeto_id', models.BigIntegerField(verbose_name='ID do registro')),
+                ('funcionario_id', models.BigIntegerField(blank=True, null=True, verbose_name='Funcionário')),
+                ('excluido_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Excluído em')),
+            ],
+            options={
+                'verbose_name': 'Registro Excluído',
+                'verbose_name_plural': 'Registros Excluídos',
+                'db_table': 'registro_excluido',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='escala',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='ponto',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='Atualizado em'),
+        ),
+        migrations.AddIndex(
+            model_name='bancohoras',
+            index=models.Index(fields=['updated_at'], name='banco_horas_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='configuracaosistema',
+            index=models.Index(fields=['updated_at'], name='configuracao_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='escala',
+            index=models.Index(fields=['updated_at'], name='escala_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='escalarecorrente',
+            index=models.Index(fields=['updated_at'], name='escala_rec_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ponto',
+            index=models.Index(fields=['updated_at'], name='ponto_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroexcluido',
+            index=models.Index(fields=['excluido_em'], name='registro_excluido_em_idx'),
+        ),
+        migrations.RunPython(preencher_atualizacao, migrations.RunPython.noop),
+    ]
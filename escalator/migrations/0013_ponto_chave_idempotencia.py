@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0012_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ponto',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Chave de idempotência'),
+        ),
+    ]
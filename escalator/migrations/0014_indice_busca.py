@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:02
+
+from django.conf import settings
+from django.db import migrations
+
+
+def criar_indices(apps, schema_editor):
+    """Índices FTS5 de busca, carregados com os registros existentes"""
+    from escalator.busca import instalar_indices_busca
+    instalar_indices_busca(schema_editor.connection)
+
+
+def remover_indices(apps, schema_editor):
+    from escalator.busca import remover_indices_busca
+    remover_indices_busca(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('escalator', '0013_ponto_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('escalator', '0014_indice_busca'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='escala',
+            name='duracao_minutos',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Duração prevista (minutos)'),
+        ),
+        migrations.AlterField(
+            model_name='escala',
+            name='minutos_noturnos',
+            field=models.IntegerField(db_default=0, default=0, editable=False, verbose_name='Minutos noturnos previstos'),
+        ),
+    ]
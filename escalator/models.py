@@ -1,12 +1,65 @@
 from django.db import models
+from django.db.models.functions import Now
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import datetime, timedelta, time
+import re
 from dateutil.relativedelta import relativedelta
 
 User = get_user_model()
 
+
+def contar_minutos_noturnos(inicio, fim, periodo_inicio, periodo_fim):
+    """
+    Minutos iniciados entre inicio e fim (datetimes sem fuso) que caem no período
+    noturno, por interseção com cada janela noturna, sem percorrer minuto a minuto
+    """
+    minuto = timedelta(minutes=1)
+    total_minutos = -((inicio - fim) // minuto)  # minutos iniciados no período
+    
+    def minutos_ate(momento):
+        """Quantos minutos do período começam antes do momento"""
+        if momento <= inicio:
+            return 0
+        return min(total_minutos, -((inicio - momento) // minuto))
+    
+    # Janela noturna que começa em cada dia (ex.: 22:00 de um dia às 05:00 do seguinte)
+    minutos_noturnos = 0
+    dia = inicio.date() - timedelta(days=1)
+    while dia <= fim.date():
+        janela_inicio = datetime.combine(dia, periodo_inicio)
+        janela_fim = datetime.combine(dia, periodo_fim)
+        if periodo_fim <= periodo_inicio:
+            janela_fim += timedelta(days=1)
+        
+        minutos_noturnos += max(0, minutos_ate(janela_fim) - minutos_ate(janela_inicio))
+        dia += timedelta(days=1)
+    
+    return minutos_noturnos
+
+
+def calcular_horario_previsto(data, hora_inicio, hora_fim, pausa_minutos, descanso, periodo_noturno):
+    """
+    Duração (pausa descontada), minutos noturnos e término previstos de uma escala.
+    Término igual ou anterior ao início passa da meia-noite. Usado também na migração
+    que preenche as escalas existentes.
+    """
+    if descanso or not hora_inicio or not hora_fim:
+        return 0, 0, None
+    
+    inicio = datetime.combine(data, hora_inicio)
+    fim = datetime.combine(data, hora_fim)
+    if fim <= inicio:
+        fim += timedelta(days=1)
+    
+    duracao = int((fim - inicio).total_seconds() // 60) - pausa_minutos
+    noturnos = contar_minutos_noturnos(inicio, fim, *periodo_noturno)
+    return duracao, noturnos, timezone.make_aware(fim)
+
+
 class Funcionario(models.Model):
     id = models.BigAutoField(primary_key=True)  
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name=_('Usuário'), null=True, blank=True)
@@ -15,6 +68,9 @@ class Funcionario(models.Model):
     cargo = models.CharField(_('Cargo'), max_length=50)
     ativo = models.BooleanField(_('Ativo'), default=True)
     created_at = models.DateTimeField(_('Criado em'), auto_now_add=True)
+    # Incrementada a cada gravação nos dados do funcionário (escalas, pontos, banco de horas,
+    # contratos); base do ETag das consultas por funcionário
+    versao_dados = models.PositiveBigIntegerField(_('Versão dos dados'), default=0, db_default=0, editable=False)
 
     class Meta:
         verbose_name = _('Funcionário')
@@ -26,6 +82,32 @@ class Funcionario(models.Model):
     def __str__(self):
         return f"{self.nome} ({self.matricula})"
 
+    def save(self, *args, **kwargs):
+        # versao_dados só muda por incrementar_versao (UPDATE com F()): o valor em memória
+        # pode estar defasado e regravá-lo desfaria incrementos feitos depois da leitura
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferidos = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.attname for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.attname != 'versao_dados' and campo.attname not in deferidos
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def incrementar_versao(cls, funcionarios=None, using=None):
+        """
+        Incrementa a versão dos dados dos funcionários informados (padrão: todos)
+        com um único UPDATE. Caminhos em lote (bulk_create, bulk_update, exclusões)
+        devem chamar após gravar, pois não disparam os signals.
+        """
+        queryset = cls.objects.using(using) if using else cls.objects.all()
+        if funcionarios is not None:
+            funcionarios = list(funcionarios)
+            if not funcionarios:
+                return 0
+            queryset = queryset.filter(pk__in=funcionarios)
+        return queryset.update(versao_dados=models.F('versao_dados') + 1)
+
 class Turno(models.Model):
     id = models.BigAutoField(primary_key=True)
     nome = models.CharField(_('Nome do turno'), max_length=50)
@@ -52,35 +134,90 @@ class Escala(models.Model):
     pausa_minutos = models.PositiveIntegerField(_('Pausa em minutos'), default=60)
     tipo_escala = models.CharField(_('Tipo de escala'), max_length=20, choices=TIPO_ESCALA_CHOICES, default='normal')
     descanso = models.BooleanField(_('Dia de descanso (DSR)'), default=False)
+    # Calculados a partir dos horários em save() / calcular_previsto()
+    duracao_minutos = models.IntegerField(_('Duração prevista (minutos)'), default=0, db_default=0, editable=False)
+    minutos_noturnos = models.IntegerField(_('Minutos noturnos previstos'), default=0, db_default=0, editable=False)
+    fim_previsto = models.DateTimeField(_('Término previsto'), null=True, blank=True, editable=False)
+    # Situação nas regras trabalhistas, mantida por ValidacaoEscalas a cada alteração
+    # (db_default: cópias de bancos de versões anteriores gravam sem estas colunas)
+    valida = models.BooleanField(_('Conforme as regras'), default=True, db_default=True, editable=False)
+    codigos_violacao = models.CharField(
+        _('Regras violadas'), max_length=200, blank=True, default='', db_default='', editable=False
+    )
     created_at = models.DateTimeField(_('Criado em'), auto_now_add=True)
+    # Base da sincronização incremental; caminhos com bulk_update devem preencher
+    updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True, db_default=Now())
 
     class Meta:
         unique_together = ('funcionario', 'data')
+        indexes = [
+            models.Index(fields=['valida', 'data'], name='escala_valida_data_idx'),
+            models.Index(fields=['updated_at'], name='escala_updated_at_idx'),
+        ]
         verbose_name = _('Escala')
         verbose_name_plural = _('Escalas')
         ordering = ['-data']
         db_table = 'escala'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        escala = super().from_db(db, field_names, values)
+        # Dia de origem: se a escala mudar de dia, a vizinhança antiga também é revalidada
+        escala._dia_carregado = (escala.__dict__.get('funcionario_id'), escala.__dict__.get('data'))
+        return escala
+
     def __str__(self):
         if self.descanso:
             return f"{self.funcionario} - DSR em {self.data.strftime('%d/%m/%Y')}"
         return f"{self.funcionario} - {self.tipo_escala} em {self.data.strftime('%d/%m/%Y')}"
 
+    def save(self, *args, **kwargs):
+        self.calcular_previsto()
+        super().save(*args, **kwargs)
+
     @property
-    def duracao_minutos(self):
-        """Calcula a duração da jornada em minutos"""
-        if self.descanso or not self.hora_inicio or not self.hora_fim:
-            return 0
+    def violacoes(self):
+        """Códigos das regras violadas (lista)"""
+        return self.codigos_violacao.split(',') if self.codigos_violacao else []
+
+    def calcular_previsto(self, periodo_noturno=None):
+        """
+        Preenche duração, minutos noturnos e término previstos a partir dos horários.
+        Caminhos em lote (bulk_create) devem chamar antes de gravar, informando o
+        período noturno para não consultar a configuração a cada escala.
+        """
+        if periodo_noturno is None and not self.descanso and self.hora_inicio and self.hora_fim:
+            periodo_noturno = ConfiguracaoSistema.get_periodo_noturno()
         
-        inicio = datetime.combine(self.data, self.hora_inicio)
-        fim = datetime.combine(self.data, self.hora_fim)
-        
-        # Se hora fim é menor que início, passou da meia-noite
-        if self.hora_fim < self.hora_inicio:
-            fim += timedelta(days=1)
+        self.duracao_minutos, self.minutos_noturnos, self.fim_previsto = calcular_horario_previsto(
+            self.data, self.hora_inicio, self.hora_fim, self.pausa_minutos, self.descanso, periodo_noturno
+        )
+        return self
+
+    @classmethod
+    def recalcular_previstos(cls, escalas=None, lote=2000):
+        """
+        Recalcula e grava os previstos das escalas (padrão: todas), em lotes.
+        Necessário após alterar o período noturno ou copiar dados de um schema antigo.
+        """
+        if escalas is None:
+            escalas = cls.objects.all()
+        periodo_noturno = ConfiguracaoSistema.get_periodo_noturno(using=escalas.db)
         
-        duracao = fim - inicio
-        return int(duracao.total_seconds() / 60) - self.pausa_minutos
+        # bulk_update não preenche o auto_now (sincronização incremental)
+        campos = ['duracao_minutos', 'minutos_noturnos', 'fim_previsto', 'updated_at']
+        agora = timezone.now()
+        total = 0
+        pendentes = []
+        for escala in escalas.order_by('pk').iterator(chunk_size=lote):
+            escala.calcular_previsto(periodo_noturno).updated_at = agora
+            pendentes.append(escala)
+            if len(pendentes) >= lote:
+                total += escalas.model.objects.using(escalas.db).bulk_update(pendentes, campos)
+                pendentes = []
+        if pendentes:
+            total += escalas.model.objects.using(escalas.db).bulk_update(pendentes, campos)
+        return total
 
 class Folga(models.Model):
     funcionario = models.ForeignKey(Funcionario, on_delete=models.CASCADE, verbose_name=_('Funcionário'))
@@ -111,6 +248,106 @@ class EscalaPredefinida(models.Model):
     def __str__(self):
         return f"{self.nome} ({self.horas_trabalho}x{self.horas_descanso})"
 
+    def ciclo(self):
+        """
+        Retorna (dias de trabalho, dias do ciclo) a partir do padrão no nome:
+        '6x1', '4x2' em dias; '12x36', '24x48' em horas (um dia de trabalho por ciclo)
+        """
+        padrao = re.search(r'(\d+)\s*x\s*(\d+)', self.nome)
+        if not padrao:
+            return None
+        
+        trabalho, descanso = int(padrao.group(1)), int(padrao.group(2))
+        if not trabalho:
+            return None
+        if trabalho + descanso >= 24:
+            return 1, max(1, (trabalho + descanso) // 24)
+        return trabalho, trabalho + descanso
+
+class EscalaRecorrente(models.Model):
+    """
+    Escala predefinida aplicada a um funcionário sem gravar uma linha por dia.
+    Os dias são gerados na leitura a partir da data âncora do ciclo; uma Escala
+    gravada para o mesmo funcionário e data substitui o dia gerado (exceção).
+    """
+    id = models.BigAutoField(primary_key=True)
+    funcionario = models.ForeignKey(Funcionario, on_delete=models.CASCADE, verbose_name=_('Funcionário'))
+    escala_predefinida = models.ForeignKey(EscalaPredefinida, on_delete=models.PROTECT, verbose_name=_('Escala predefinida'))
+    data_ancora = models.DateField(_('Início do ciclo'))
+    dias_trabalho = models.PositiveIntegerField(_('Dias de trabalho no ciclo'))
+    dias_ciclo = models.PositiveIntegerField(_('Dias do ciclo'))
+    hora_inicio = models.TimeField(_('Hora de início'))
+    hora_fim = models.TimeField(_('Hora de término'))
+    pausa_minutos = models.PositiveIntegerField(_('Pausa em minutos'), default=60)
+    tipo_escala = models.CharField(_('Tipo de escala'), max_length=20, choices=Escala.TIPO_ESCALA_CHOICES, default='normal')
+    vigencia_inicio = models.DateField(_('Vigência início'))
+    vigencia_fim = models.DateField(_('Vigência fim'), null=True, blank=True)
+    created_at = models.DateTimeField(_('Criado em'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='escala_rec_updated_at_idx')]
+        verbose_name = _('Escala Recorrente')
+        verbose_name_plural = _('Escalas Recorrentes')
+        ordering = ['-vigencia_inicio']
+        db_table = 'escala_recorrente'
+
+    def __str__(self):
+        return f"{self.funcionario} - {self.escala_predefinida.nome} desde {self.vigencia_inicio.strftime('%d/%m/%Y')}"
+
+    def clean(self):
+        if self.escala_predefinida_id and not self.escala_predefinida.ciclo():
+            raise ValidationError({'escala_predefinida': _('Padrão da escala predefinida não reconhecido')})
+        if self.vigencia_fim and self.vigencia_fim < self.vigencia_inicio:
+            raise ValidationError(_('Vigência fim deve ser posterior à vigência início'))
+
+    def save(self, *args, **kwargs):
+        # O ciclo é copiado da escala predefinida, para não depender do nome dela depois
+        if not self.dias_ciclo:
+            self.dias_trabalho, self.dias_ciclo = self.escala_predefinida.ciclo()
+        super().save(*args, **kwargs)
+
+    def is_vigente(self, data):
+        """Verifica se a recorrência vale na data especificada"""
+        if data < self.vigencia_inicio:
+            return False
+        return not self.vigencia_fim or data <= self.vigencia_fim
+
+    def trabalha_em(self, data):
+        """Indica se a data é dia de trabalho no ciclo"""
+        return (data - self.data_ancora).days % self.dias_ciclo < self.dias_trabalho
+
+    def gerar_escala(self, data, periodo_noturno=None):
+        """Escala do dia gerada pelo ciclo (não gravada; datas de gravação da recorrência)"""
+        if not self.trabalha_em(data):
+            return Escala(
+                funcionario=self.funcionario, data=data, descanso=True, tipo_escala=self.tipo_escala,
+                created_at=self.created_at, updated_at=self.updated_at
+            )
+        
+        return Escala(
+            funcionario=self.funcionario,
+            data=data,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+            hora_inicio=self.hora_inicio,
+            hora_fim=self.hora_fim,
+            pausa_minutos=self.pausa_minutos,
+            tipo_escala=self.tipo_escala,
+            descanso=False
+        ).calcular_previsto(periodo_noturno)
+
+    def expandir(self, data_inicio, data_fim, periodo_noturno=None):
+        """Escalas geradas para os dias do período dentro da vigência"""
+        inicio = max(data_inicio, self.vigencia_inicio)
+        fim = min(data_fim, self.vigencia_fim) if self.vigencia_fim else data_fim
+        if periodo_noturno is None:
+            periodo_noturno = ConfiguracaoSistema.get_periodo_noturno()
+        return [
+            self.gerar_escala(inicio + timedelta(days=dia), periodo_noturno)
+            for dia in range((fim - inicio).days + 1)
+        ]
+
 class Contrato(models.Model):
     id = models.BigAutoField(primary_key=True)
     funcionario = models.ForeignKey(Funcionario, on_delete=models.CASCADE, verbose_name=_('Funcionário'))
@@ -146,6 +383,33 @@ class Contrato(models.Model):
         
         return True
 
+    @classmethod
+    def vigentes_em(cls, data=None):
+        """Contratos vigentes na data (padrão: hoje), do início mais recente para o mais antigo"""
+        if data is None:
+            data = datetime.now().date()
+        return cls.objects.filter(
+            vigencia_inicio__lte=data
+        ).filter(
+            models.Q(vigencia_fim__isnull=True) | models.Q(vigencia_fim__gte=data)
+        ).order_by('-vigencia_inicio')
+
+    @classmethod
+    def prefetch_vigentes(cls, data=None, to_attr='contratos_vigentes'):
+        """
+        Prefetch dos contratos vigentes na data para um queryset de funcionários:
+        uma query para todos, em funcionario.<to_attr> (o primeiro é o vigente)
+        """
+        return models.Prefetch('contrato_set', queryset=cls.vigentes_em(data), to_attr=to_attr)
+
+    @classmethod
+    def vigente_hoje(cls, funcionario):
+        """Contrato vigente hoje do funcionário, do prefetch_vigentes() quando carregado"""
+        contratos = getattr(funcionario, 'contratos_vigentes', None)
+        if contratos is not None:
+            return contratos[0] if contratos else None
+        return cls.vigentes_em().filter(funcionario=funcionario).first()
+
 class Ponto(models.Model):
     TIPO_REGISTRO_CHOICES = [
         ('entrada', _('Entrada')),
@@ -163,9 +427,15 @@ class Ponto(models.Model):
     localizacao_lng = models.FloatField(_('Longitude'), null=True, blank=True)
     validado = models.BooleanField(_('Validado'), default=False)
     observacoes = models.TextField(_('Observações'), blank=True)
+    # Gerada pelo app a cada marcação: repetições do envio devolvem o ponto já gravado
+    chave_idempotencia = models.CharField(
+        _('Chave de idempotência'), max_length=64, null=True, blank=True, unique=True, editable=False
+    )
     created_at = models.DateTimeField(_('Criado em'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True, db_default=Now())
 
     class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='ponto_updated_at_idx')]
         verbose_name = _('Ponto')
         verbose_name_plural = _('Pontos')
         ordering = ['-timestamp']
@@ -188,6 +458,7 @@ class BancoHoras(models.Model):
     updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True)
 
     class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='banco_horas_updated_at_idx')]
         verbose_name = _('Banco de Horas')
         verbose_name_plural = _('Banco de Horas')
         unique_together = ('funcionario', 'data_referencia')
@@ -225,6 +496,7 @@ class ConfiguracaoSistema(models.Model):
     updated_at = models.DateTimeField(_('Atualizado em'), auto_now=True)
 
     class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='configuracao_updated_at_idx')]
         verbose_name = _('Configuração do Sistema')
         verbose_name_plural = _('Configurações do Sistema')
         db_table = 'configuracao_sistema'
@@ -233,20 +505,25 @@ class ConfiguracaoSistema(models.Model):
         return f"{self.chave}: {self.valor}"
 
     @classmethod
-    def get_valor(cls, chave, default=None):
+    def get_valor(cls, chave, default=None, using=None):
         """Método utilitário para obter valor de configuração"""
         try:
-            config = cls.objects.get(chave=chave)
+            config = cls.objects.using(using).get(chave=chave)
             return config.valor if config.valor else default
         except cls.DoesNotExist:
             return default
 
     @classmethod
-    def get_periodo_noturno(cls):
+    def get_valores(cls, chaves, using=None):
+        """Valores configurados das chaves informadas (as ausentes ficam de fora), em uma query"""
+        return dict(cls.objects.using(using).filter(chave__in=list(chaves)).values_list('chave', 'valor'))
+
+    @classmethod
+    def get_periodo_noturno(cls, using=None):
         """Retorna o período noturno configurado"""
         try:
-            inicio = cls.get_valor('periodo_noturno_inicio', '22:00')
-            fim = cls.get_valor('periodo_noturno_fim', '05:00')
+            inicio = cls.get_valor('periodo_noturno_inicio', '22:00', using=using)
+            fim = cls.get_valor('periodo_noturno_fim', '05:00', using=using)
             
             # Garante que os valores são strings antes de usar fromisoformat
             if isinstance(inicio, str) and inicio:
@@ -268,3 +545,177 @@ class ConfiguracaoSistema(models.Model):
     def get_interjornada_minima(cls):
         """Retorna o intervalo mínimo entre jornadas em minutos"""
         return int(cls.get_valor('interjornada_minima_minutos', '660'))
+
+
+class RegistroExcluido(models.Model):
+    """
+    Exclusão (tombstone) de um registro sincronizado com o app móvel.
+    Gravado por triggers do banco, para valer também nas exclusões em cascata e
+    em lote, que não disparam signals (ver instalar_triggers_exclusao).
+    """
+    # Tabelas cujas exclusões são registradas: tabela -> tem coluna funcionario_id
+    TABELAS = {
+        'escala': True,
+        'escala_recorrente': True,
+        'ponto': True,
+        'banco_horas': True,
+        'configuracao_sistema': False,
+    }
+    
+    id = models.BigAutoField(primary_key=True)
+    tabela = models.CharField(_('Tabela'), max_length=50)
+    objeto_id = models.BigIntegerField(_('ID do registro'))
+    # Sem chave estrangeira: o funcionário pode ter sido excluído junto
+    funcionario_id = models.BigIntegerField(_('Funcionário'), null=True, blank=True)
+    excluido_em = models.DateTimeField(_('Excluído em'), default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['excluido_em'], name='registro_excluido_em_idx')]
+        verbose_name = _('Registro Excluído')
+        verbose_name_plural = _('Registros Excluídos')
+        ordering = ['id']
+        db_table = 'registro_excluido'
+
+    def __str__(self):
+        return f"{self.tabela} #{self.objeto_id} excluído em {self.excluido_em}"
+
+
+def instalar_triggers_exclusao(connection):
+    """
+    Cria (se ausentes) os triggers que gravam RegistroExcluido a cada exclusão.
+    Chamada após cada migrate: recriar uma tabela no SQLite (AlterField) descarta
+    os triggers dela. Com TIME_ZONE no banco as datas são gravadas no horário
+    local, que o Django define como fuso do processo.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    tabelas = connection.introspection.table_names()
+    if RegistroExcluido._meta.db_table not in tabelas:
+        return
+    
+    agora = "strftime('%Y-%m-%d %H:%M:%f', 'now'{})".format(
+        ", 'localtime'" if connection.settings_dict.get('TIME_ZONE') else ''
+    )
+    with connection.cursor() as cursor:
+        for tabela, por_funcionario in RegistroExcluido.TABELAS.items():
+            if tabela not in tabelas:
+                continue
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {tabela}_registro_excluido
+                AFTER DELETE ON {tabela}
+                BEGIN
+                    INSERT INTO {RegistroExcluido._meta.db_table} (tabela, objeto_id, funcionario_id, excluido_em)
+                    VALUES ('{tabela}', OLD.id, {'OLD.funcionario_id' if por_funcionario else 'NULL'}, {agora});
+                END
+            """)
+
+
+from django.db import connections
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from core.routers import usando_banco
+from .busca import instalar_indices_busca
+
+
+@receiver(post_migrate)
+def instalar_triggers_apos_migrate(sender, using, **kwargs):
+    """Garante os triggers de exclusão e dos índices de busca no banco migrado (uma vez, ao migrar o escalator)"""
+    if sender.name == 'escalator':
+        instalar_triggers_exclusao(connections[using])
+        instalar_indices_busca(connections[using], criar=False)
+
+
+# Migração que criou a situação das escalas (valida), gravada como válida em todas as existentes
+MIGRACAO_SITUACAO = ('escalator', '0010_escala_situacao')
+
+
+@receiver(post_migrate)
+def revalidar_escalas_apos_migrate(sender, using, plan=None, **kwargs):
+    """
+    Aplicada MIGRACAO_SITUACAO, calcula a situação das escalas existentes nas regras
+    da empresa. Roda após o migrate (schema completo, sem os models históricos),
+    em todo caminho que migra bancos: migrate, migrate_all_tenants e provisionamento
+    """
+    if sender.name != 'escalator' or not plan:
+        return
+    if not any((migracao.app_label, migracao.name) == MIGRACAO_SITUACAO and not reverter
+               for migracao, reverter in plan):
+        return
+    # Bancos em que o roteador não cria as tabelas do escalator (master) também recebem o plano
+    if Escala._meta.db_table not in connections[using].introspection.table_names():
+        return
+    if not Escala.objects.using(using).exists():
+        return
+    from .services import ValidacaoEscalas
+    with usando_banco(using):
+        ValidacaoEscalas().revalidar()
+
+
+@receiver(post_save, sender=ConfiguracaoSistema)
+@receiver(post_delete, sender=ConfiguracaoSistema)
+def recompilar_regras_empresa(sender, instance, using, **kwargs):
+    """
+    Recompila as regras trabalhistas do banco cuja configuração mudou e
+    revalida as escalas a partir da semana atual (as anteriores mantêm a
+    situação apurada com as regras da época)
+    """
+    from .regras import recompilar_regras
+    from .services import ValidacaoEscalas
+    recompilar_regras(using)
+    if kwargs.get('raw'):
+        return
+    hoje = timezone.localdate()
+    with usando_banco(using):
+        ValidacaoEscalas().revalidar(data_inicio=hoje - timedelta(days=hoje.weekday()))
+    # Regras, tolerância e período noturno mudam as consultas de todos os funcionários
+    Funcionario.incrementar_versao(using=using)
+
+
+# Exclusões são revalidadas (e a versão dos dados incrementada) nos ViewSets
+# (perform_destroy): um receiver de post_delete impediria a exclusão em lote
+# das escalas, contratos e pontos em cascata
+
+@receiver(post_save, sender=Escala)
+def revalidar_vizinhanca_escala(sender, instance, using, **kwargs):
+    """Revalida a escala gravada e os dias cujas regras dependem dela (vizinhos, semana, DSR)"""
+    if kwargs.get('raw'):
+        return
+    from .services import ValidacaoEscalas
+    with usando_banco(using):
+        validacao = ValidacaoEscalas()
+        situacoes = validacao.revalidar_alteracao(instance.funcionario_id, instance.data)
+        origem = getattr(instance, '_dia_carregado', None)
+        if origem and origem != (instance.funcionario_id, instance.data):
+            validacao.revalidar_alteracao(*origem)
+    
+    if instance.pk in situacoes:
+        instance.valida, instance.codigos_violacao = situacoes[instance.pk]
+    instance._dia_carregado = (instance.funcionario_id, instance.data)
+
+
+@receiver(post_save, sender=Contrato)
+@receiver(post_save, sender=EscalaRecorrente)
+def revalidar_escalas_funcionario(sender, instance, using, **kwargs):
+    """Contrato ou recorrência gravados: revalida as escalas do funcionário"""
+    if kwargs.get('raw'):
+        return
+    from .services import ValidacaoEscalas
+    with usando_banco(using):
+        ValidacaoEscalas().revalidar([instance.funcionario_id])
+
+
+@receiver(post_save, sender=Escala)
+@receiver(post_save, sender=EscalaRecorrente)
+@receiver(post_save, sender=Ponto)
+@receiver(post_save, sender=BancoHoras)
+@receiver(post_save, sender=Contrato)
+def incrementar_versao_funcionario(sender, instance, using, **kwargs):
+    """Dados do funcionário gravados: invalida os ETags das consultas dele"""
+    Funcionario.incrementar_versao([instance.funcionario_id], using=using)
+
+
+@receiver(post_save, sender=Funcionario)
+def incrementar_versao_cadastro(sender, instance, created, using, **kwargs):
+    """Cadastro alterado (nome, situação): as consultas do funcionário também mudam"""
+    if not created:
+        Funcionario.incrementar_versao([instance.pk], using=using)
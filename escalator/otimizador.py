@@ -0,0 +1,573 @@
+"""
+Otimizador automático de escalas.
+
+Monta as escalas de uma equipe para um período a partir da demanda de
+cobertura por dia e hora, respeitando as regras verificadas em
+ValidadorRegrasTrabalho: carga diária e semanal do contrato e, com os limites
+das regras compiladas da empresa (escalator.regras), interjornada mínima,
+dias seguidos antes do DSR, autorização para 12x36 (com folga no dia
+seguinte) e pausa intrajornada.
+
+A heurística é gulosa (dia a dia, o turno que cobre mais horas em falta vai
+para o funcionário elegível com menos horas na semana) seguida de uma busca
+local com tempo limitado (troca de turno, mudança de dia e remoção de turnos
+que só geram excesso). No modo prévia nada é gravado.
+"""
+
+import time as relogio
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import ConfiguracaoSistema, Contrato, Escala, Folga, Funcionario, Turno
+from .regras import obter_regras
+from .services import CalendarioEscalas, ValidacaoEscalas
+
+# Turnos usados quando não há turnos cadastrados nem informados: (início, fim, tipo)
+TURNOS_PADRAO = [
+    ('06:00', '14:00', 'normal'),
+    ('08:00', '17:00', 'normal'),
+    ('14:00', '22:00', 'normal'),
+    ('22:00', '06:00', 'noturna'),
+    ('07:00', '19:00', '12x36'),
+    ('19:00', '07:00', '12x36'),
+]
+
+DIAS_HISTORICO = 7  # dias mínimos antes e depois do período considerados nas regras (DSR, semana, interjornada)
+MINUTOS_DIA = 1440
+
+
+def _ler_hora(valor) -> time:
+    if isinstance(valor, time):
+        return valor
+    return time.fromisoformat(str(valor))
+
+
+class TurnoCandidato:
+    """Turno que pode ser atribuído a um funcionário em um dia"""
+
+    __slots__ = ('hora_inicio', 'hora_fim', 'tipo_escala', 'pausa_minutos', 'duracao',
+                 'inicio', 'fim', 'horas', 'sem_horario')
+
+    def __init__(self, hora_inicio: Optional[time], hora_fim: Optional[time],
+                 tipo_escala: str = 'normal', pausa_minutos: Optional[int] = None):
+        self.hora_inicio = hora_inicio
+        self.hora_fim = hora_fim
+        self.tipo_escala = tipo_escala
+        self.sem_horario = hora_inicio is None or hora_fim is None
+
+        if self.sem_horario:
+            self.inicio = self.fim = 0
+            self.pausa_minutos = pausa_minutos or 0
+            self.duracao = 0
+            self.horas = ()
+            return
+
+        # Minutos desde a meia-noite do dia da escala (fim pode passar de 1440)
+        self.inicio = hora_inicio.hour * 60 + hora_inicio.minute
+        self.fim = hora_fim.hour * 60 + hora_fim.minute
+        if self.fim <= self.inicio:
+            self.fim += MINUTOS_DIA
+
+        duracao_bruta = self.fim - self.inicio
+        self.pausa_minutos = obter_regras().pausa_minima(duracao_bruta) if pausa_minutos is None else pausa_minutos
+        self.duracao = duracao_bruta - self.pausa_minutos
+        # Horas (a partir da meia-noite do dia) em que o turno conta na cobertura
+        self.horas = tuple(range(self.inicio // 60, -(-self.fim // 60)))
+
+    @classmethod
+    def da_escala(cls, escala: Escala) -> 'TurnoCandidato':
+        return cls(escala.hora_inicio, escala.hora_fim, escala.tipo_escala, escala.pausa_minutos)
+
+    def __repr__(self):
+        return f'{self.hora_inicio}-{self.hora_fim} ({self.tipo_escala})'
+
+
+class OtimizadorEscalas:
+    """
+    Gera escalas para uma equipe e um período atendendo a demanda de cobertura.
+
+    demanda: lista de faixas {'hora_inicio', 'hora_fim', 'quantidade'} com
+    'data' (um dia) ou 'dias_semana' (0 = segunda ... 6 = domingo; sem os dois,
+    vale para todos os dias). Faixas que passam da meia-noite seguem no dia seguinte.
+
+    Dias que já têm escala (ou folga) são mantidos como estão e entram nas regras.
+    """
+
+    PESO_DEFICIT = 1000  # uma hora descoberta pesa mais que qualquer excesso
+
+    def __init__(self, data_inicio: date, data_fim: date, demanda: List[Dict],
+                 funcionarios: Optional[List[int]] = None, turnos: Optional[List[Dict]] = None,
+                 limite_segundos: float = 50):
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.dias = (data_fim - data_inicio).days + 1
+        self.demanda_informada = demanda
+        self.funcionarios_informados = funcionarios
+        self.turnos_informados = turnos
+        self.limite_segundos = limite_segundos
+
+    # Entrada
+
+    def _carregar_turnos(self) -> List[TurnoCandidato]:
+        if self.turnos_informados:
+            turnos = [
+                (_ler_hora(turno['hora_inicio']), _ler_hora(turno['hora_fim']), turno.get('tipo_escala', 'normal'))
+                for turno in self.turnos_informados
+            ]
+        else:
+            turnos = [(turno.hora_inicio, turno.hora_fim, 'normal') for turno in Turno.objects.all()]
+            if not turnos:
+                turnos = [(_ler_hora(inicio), _ler_hora(fim), tipo) for inicio, fim, tipo in TURNOS_PADRAO]
+        return [TurnoCandidato(inicio, fim, tipo) for inicio, fim, tipo in turnos]
+
+    def _montar_demanda(self) -> List[int]:
+        """Demanda por hora do período (um dia a mais para turnos que passam da meia-noite)"""
+        demanda = [0] * ((self.dias + 1) * 24)
+        for faixa in self.demanda_informada:
+            inicio = _ler_hora(faixa['hora_inicio'])
+            fim = _ler_hora(faixa['hora_fim'])
+            quantidade = int(faixa['quantidade'])
+            hora_inicio = inicio.hour
+            hora_fim = -(-(fim.hour * 60 + fim.minute) // 60)
+            if hora_fim <= hora_inicio:
+                hora_fim += 24
+
+            data_faixa = faixa.get('data')
+            if data_faixa and not isinstance(data_faixa, date):
+                data_faixa = datetime.strptime(str(data_faixa), '%Y-%m-%d').date()
+            dias_semana = faixa.get('dias_semana')
+
+            for dia in range(self.dias):
+                data_dia = self.data_inicio + timedelta(days=dia)
+                if data_faixa and data_dia != data_faixa:
+                    continue
+                if dias_semana is not None and data_dia.weekday() not in dias_semana:
+                    continue
+                for hora in range(hora_inicio, hora_fim):
+                    demanda[dia * 24 + hora] += quantidade
+        return demanda
+
+    def _carregar_equipe(self):
+        """Monta, por funcionário e dia (com o contexto antes e depois), disponibilidade, limites e escalas existentes"""
+        funcionarios = Funcionario.objects.filter(ativo=True)
+        if self.funcionarios_informados:
+            funcionarios = funcionarios.filter(id__in=self.funcionarios_informados)
+        self.funcionarios = list(funcionarios.order_by('id').values_list('id', flat=True))
+
+        total_dias = self.historico + self.dias + self.historico
+        primeiro_dia = self.data_inicio - timedelta(days=self.historico)
+        ultimo_dia = self.data_fim + timedelta(days=self.historico)
+
+        contratos = {}
+        for contrato in Contrato.objects.filter(
+            funcionario_id__in=self.funcionarios,
+            vigencia_inicio__lte=ultimo_dia
+        ).filter(
+            Q(vigencia_fim__isnull=True) | Q(vigencia_fim__gte=primeiro_dia)
+        ).order_by('vigencia_inicio'):
+            contratos.setdefault(contrato.funcionario_id, []).append(contrato)
+
+        folgas = set(Folga.objects.filter(
+            funcionario_id__in=self.funcionarios,
+            data__range=[self.data_inicio, self.data_fim]
+        ).values_list('funcionario_id', 'data'))
+
+        existentes = {}
+        for escala in CalendarioEscalas().escalas(primeiro_dia, ultimo_dia, self.funcionarios):
+            existentes[(escala.funcionario_id, escala.data)] = escala
+
+        self.alocacao = {}
+        self.fixo = {}
+        self.disponivel = {}
+        self.carga_diaria = {}
+        self.carga_semanal = {}
+        self.permite_12x36 = {}
+
+        for funcionario_id in self.funcionarios:
+            alocacao = [None] * total_dias
+            fixo = [True] * total_dias
+            disponivel = [False] * total_dias
+            carga_diaria = [0] * total_dias
+            carga_semanal = [0] * total_dias
+            permite_12x36 = [False] * total_dias
+            contratos_funcionario = contratos.get(funcionario_id, [])
+
+            for indice in range(total_dias):
+                data_dia = primeiro_dia + timedelta(days=indice)
+                escala = existentes.get((funcionario_id, data_dia))
+                if escala is not None and not escala.descanso:
+                    alocacao[indice] = TurnoCandidato.da_escala(escala)
+
+                vigente = None
+                for contrato in contratos_funcionario:
+                    if contrato.vigencia_inicio <= data_dia and (
+                        contrato.vigencia_fim is None or contrato.vigencia_fim >= data_dia
+                    ):
+                        vigente = contrato  # o de início mais recente prevalece
+                if vigente:
+                    carga_diaria[indice] = vigente.carga_diaria_max
+                    carga_semanal[indice] = vigente.carga_semanal_max
+                    permite_12x36[indice] = vigente.permite_12x36
+
+                no_periodo = self.historico <= indice < self.historico + self.dias
+                if no_periodo and escala is None:
+                    fixo[indice] = False
+                    disponivel[indice] = vigente is not None and (funcionario_id, data_dia) not in folgas
+
+            self.alocacao[funcionario_id] = alocacao
+            self.fixo[funcionario_id] = fixo
+            self.disponivel[funcionario_id] = disponivel
+            self.carga_diaria[funcionario_id] = carga_diaria
+            self.carga_semanal[funcionario_id] = carga_semanal
+            self.permite_12x36[funcionario_id] = permite_12x36
+
+    # Regras
+
+    def _viavel(self, funcionario_id: int, indice: int, turno: TurnoCandidato) -> bool:
+        """Verifica se o funcionário pode receber o turno no dia (índice com histórico)"""
+        if not self.disponivel[funcionario_id][indice]:
+            return False
+        alocacao = self.alocacao[funcionario_id]
+
+        # Carga diária do contrato (pausa já descontada)
+        if turno.duracao > self.carga_diaria[funcionario_id][indice]:
+            return False
+
+        anterior = alocacao[indice - 1]
+        seguinte = alocacao[indice + 1] if indice + 1 < len(alocacao) else None
+
+        # 12x36: autorização no contrato e folga no dia seguinte; após um 12x36 o dia é de folga
+        if turno.tipo_escala == '12x36':
+            if not self.permite_12x36[funcionario_id][indice] or seguinte is not None:
+                return False
+            if indice + 1 >= self.historico + self.dias:
+                return False  # a folga seguinte ficaria fora do período
+        if anterior is not None and anterior.tipo_escala == '12x36':
+            return False
+
+        # Interjornada com os dias vizinhos
+        if anterior is not None and not anterior.sem_horario:
+            if MINUTOS_DIA + turno.inicio - anterior.fim < self.interjornada_minima:
+                return False
+        if seguinte is not None and not seguinte.sem_horario:
+            if MINUTOS_DIA + seguinte.inicio - turno.fim < self.interjornada_minima:
+                return False
+
+        # DSR: no máximo max_dias_consecutivos dias seguidos de trabalho
+        consecutivos = 1
+        posicao = indice - 1
+        while posicao >= 0 and alocacao[posicao] is not None:
+            consecutivos += 1
+            posicao -= 1
+        posicao = indice + 1
+        while posicao < len(alocacao) and alocacao[posicao] is not None:
+            consecutivos += 1
+            posicao += 1
+        if self.max_dias_consecutivos is not None and consecutivos > self.max_dias_consecutivos:
+            return False
+
+        # Carga semanal em toda janela de 7 dias que contém o dia
+        carga_semanal = self.carga_semanal[funcionario_id][indice]
+        for inicio_janela in range(max(0, indice - 6), min(indice, len(alocacao) - 7) + 1):
+            total = turno.duracao
+            for posicao in range(inicio_janela, inicio_janela + 7):
+                if posicao != indice and alocacao[posicao] is not None:
+                    total += alocacao[posicao].duracao
+            if total > carga_semanal:
+                return False
+
+        return True
+
+    # Cobertura
+
+    def _aplicar_cobertura(self, dia: int, turno: TurnoCandidato, sinal: int):
+        base = dia * 24
+        for hora in turno.horas:
+            posicao = base + hora
+            if posicao < len(self.cobertura):
+                self.cobertura[posicao] += sinal
+
+    def _ganho(self, dia: int, turno: TurnoCandidato) -> int:
+        """Horas em falta que o turno cobriria no dia"""
+        base = dia * 24
+        ganho = 0
+        for hora in turno.horas:
+            posicao = base + hora
+            if posicao < len(self.cobertura) and self.cobertura[posicao] < self.demanda[posicao]:
+                ganho += 1
+        return ganho
+
+    def _perda(self, dia: int, turno: TurnoCandidato) -> int:
+        """Horas que ficariam em falta se o turno fosse removido do dia"""
+        base = dia * 24
+        perda = 0
+        for hora in turno.horas:
+            posicao = base + hora
+            if posicao < len(self.cobertura) and self.cobertura[posicao] <= self.demanda[posicao]:
+                perda += 1
+        return perda
+
+    def _atribuir(self, funcionario_id: int, dia: int, turno: Optional[TurnoCandidato]):
+        indice = dia + self.historico
+        atual = self.alocacao[funcionario_id][indice]
+        if atual is not None:
+            self._aplicar_cobertura(dia, atual, -1)
+        self.alocacao[funcionario_id][indice] = turno
+        if turno is not None:
+            self._aplicar_cobertura(dia, turno, 1)
+
+    def _carga_semana(self, funcionario_id: int, indice: int) -> int:
+        alocacao = self.alocacao[funcionario_id]
+        return sum(turno.duracao for turno in alocacao[max(0, indice - 6):indice] if turno is not None)
+
+    # Heurística
+
+    def _gulosa(self):
+        for dia in range(self.dias):
+            indice = dia + self.historico
+            livres = [f for f in self.funcionarios if self.disponivel[f][indice]]
+            # Menos horas nos últimos 6 dias primeiro (distribui a carga e ajuda o DSR)
+            livres.sort(key=lambda f: self._carga_semana(f, indice))
+            esgotados = set()
+
+            while livres:
+                candidatos = [
+                    (self._ganho(dia, turno), -turno.duracao, posicao)
+                    for posicao, turno in enumerate(self.turnos) if posicao not in esgotados
+                ]
+                if not candidatos:
+                    break
+                ganho, _, posicao = max(candidatos)
+                if ganho <= 0:
+                    break
+
+                turno = self.turnos[posicao]
+                escolhido = next((f for f in livres if self._viavel(f, indice, turno)), None)
+                if escolhido is None:
+                    esgotados.add(posicao)
+                    continue
+
+                self._atribuir(escolhido, dia, turno)
+                livres.remove(escolhido)
+
+    def _busca_local(self, prazo: float) -> int:
+        """Melhora a solução gulosa até não haver melhoria ou acabar o tempo; retorna os movimentos aceitos"""
+        movimentos = 0
+        melhorou = True
+        while melhorou and relogio.monotonic() < prazo:
+            melhorou = False
+            for dia in range(self.dias):
+                if relogio.monotonic() >= prazo:
+                    break
+                indice = dia + self.historico
+                base = dia * 24
+                falta = any(
+                    self.cobertura[posicao] < self.demanda[posicao] for posicao in range(base, base + 24)
+                )
+
+                for funcionario_id in self.funcionarios:
+                    if self.fixo[funcionario_id][indice]:
+                        continue
+                    atual = self.alocacao[funcionario_id][indice]
+
+                    if atual is not None:
+                        # Remove turnos que só geram excesso
+                        if self._perda(dia, atual) == 0:
+                            self._atribuir(funcionario_id, dia, None)
+                            movimentos += 1
+                            melhorou = True
+                            continue
+                        if not falta:
+                            continue
+                        # Troca de turno no mesmo dia se cobrir mais horas em falta
+                        saldo_atual = self._ganho_liquido(dia, atual, removendo=True)
+                        self._atribuir(funcionario_id, dia, None)
+                        melhor = (saldo_atual, atual)
+                        for turno in self.turnos:
+                            if turno is atual or not self._viavel(funcionario_id, indice, turno):
+                                continue
+                            saldo = self._ganho_liquido(dia, turno)
+                            if saldo > melhor[0]:
+                                melhor = (saldo, turno)
+                        self._atribuir(funcionario_id, dia, melhor[1])
+                        if melhor[1] is not atual:
+                            movimentos += 1
+                            melhorou = True
+                    elif falta and self.disponivel[funcionario_id][indice]:
+                        if self._mover_para(funcionario_id, dia):
+                            movimentos += 1
+                            melhorou = True
+        return movimentos
+
+    def _ganho_liquido(self, dia: int, turno: TurnoCandidato, removendo: bool = False) -> int:
+        """Valor do turno no dia: horas em falta cobertas (peso alto) menos horas de excesso"""
+        base = dia * 24
+        valor = 0
+        ajuste = 1 if removendo else 0  # o turno já está na cobertura
+        for hora in turno.horas:
+            posicao = base + hora
+            if posicao >= len(self.cobertura):
+                valor -= 1
+            elif self.cobertura[posicao] - ajuste < self.demanda[posicao]:
+                valor += self.PESO_DEFICIT
+            else:
+                valor -= 1
+        return valor
+
+    def _mover_para(self, funcionario_id: int, dia: int) -> bool:
+        """
+        Tenta levar para o dia (com falta) um turno do funcionário em outro dia
+        do período cuja remoção não deixa nenhuma hora descoberta.
+        """
+        indice = dia + self.historico
+        for outro_dia in range(self.dias):
+            outro_indice = outro_dia + self.historico
+            if outro_dia == dia or self.fixo[funcionario_id][outro_indice]:
+                continue
+            turno_origem = self.alocacao[funcionario_id][outro_indice]
+            if turno_origem is None or self._perda(outro_dia, turno_origem) > 0:
+                continue
+
+            self._atribuir(funcionario_id, outro_dia, None)
+            melhor = None
+            for turno in self.turnos:
+                ganho = self._ganho(dia, turno)
+                if ganho > 0 and (melhor is None or ganho > melhor[0]) and self._viavel(funcionario_id, indice, turno):
+                    melhor = (ganho, turno)
+            if melhor is not None:
+                self._atribuir(funcionario_id, dia, melhor[1])
+                return True
+            self._atribuir(funcionario_id, outro_dia, turno_origem)
+        return False
+
+    # Saída
+
+    def otimizar(self) -> Dict:
+        """Calcula as escalas sem gravar; retorna as escalas propostas e o resumo da cobertura"""
+        inicio = relogio.monotonic()
+        prazo = inicio + self.limite_segundos
+
+        regras = obter_regras()
+        self.interjornada_minima = regras.interjornada_minima
+        self.max_dias_consecutivos = regras.max_dias_consecutivos
+        # Dias antes e depois do período que entram nas regras: a sequência sem DSR
+        # pode vir de mais longe que a semana quando a empresa permite mais dias seguidos
+        self.historico = max(DIAS_HISTORICO, self.max_dias_consecutivos or 0)
+        self.turnos = self._carregar_turnos()
+        self.demanda = self._montar_demanda()
+        self.cobertura = [0] * len(self.demanda)
+        self._carregar_equipe()
+
+        # Escalas existentes no período já contam na cobertura
+        for funcionario_id in self.funcionarios:
+            for dia in range(self.dias):
+                indice = dia + self.historico
+                turno = self.alocacao[funcionario_id][indice]
+                if turno is not None:
+                    self._aplicar_cobertura(dia, turno, 1)
+
+        self._gulosa()
+        tempo_gulosa = relogio.monotonic() - inicio
+        movimentos = self._busca_local(prazo)
+
+        escalas = self._montar_escalas()
+        horas_demanda = sum(self.demanda)
+        horas_descobertas = sum(max(0, d - c) for d, c in zip(self.demanda, self.cobertura))
+        horas_excedentes = sum(max(0, c - d) for d, c in zip(self.demanda, self.cobertura))
+
+        dias_descobertos = []
+        for dia in range(self.dias):
+            base = dia * 24
+            faltando = sum(max(0, self.demanda[p] - self.cobertura[p]) for p in range(base, base + 24))
+            if faltando:
+                dias_descobertos.append({'data': self.data_inicio + timedelta(days=dia), 'horas_descobertas': faltando})
+
+        return {
+            'periodo': f'{self.data_inicio} a {self.data_fim}',
+            'funcionarios': len(self.funcionarios),
+            'escalas': escalas,
+            'resumo': {
+                'turnos_trabalho': sum(1 for escala in escalas if not escala['descanso']),
+                'dias_descanso': sum(1 for escala in escalas if escala['descanso']),
+                'horas_demanda': horas_demanda,
+                'horas_cobertas': horas_demanda - horas_descobertas,
+                'horas_descobertas': horas_descobertas,
+                'horas_excedentes': horas_excedentes,
+                'percentual_cobertura': round(100 * (horas_demanda - horas_descobertas) / horas_demanda, 2)
+                if horas_demanda else 100.0,
+                'movimentos_busca_local': movimentos,
+                'tempo_gulosa_segundos': round(tempo_gulosa, 3),
+                'tempo_total_segundos': round(relogio.monotonic() - inicio, 3),
+            },
+            'dias_descobertos': dias_descobertos,
+        }
+
+    def _montar_escalas(self) -> List[Dict]:
+        """Escalas novas: turnos atribuídos e, para quem trabalha no período, DSR nos demais dias livres"""
+        escalas = []
+        for funcionario_id in self.funcionarios:
+            alocacao = self.alocacao[funcionario_id]
+            fixo = self.fixo[funcionario_id]
+            novos = [
+                dia for dia in range(self.dias)
+                if not fixo[dia + self.historico]
+            ]
+            if not any(alocacao[dia + self.historico] is not None for dia in novos):
+                continue
+
+            for dia in novos:
+                turno = alocacao[dia + self.historico]
+                data_dia = self.data_inicio + timedelta(days=dia)
+                if turno is None:
+                    escalas.append({
+                        'funcionario': funcionario_id,
+                        'data': data_dia,
+                        'hora_inicio': None,
+                        'hora_fim': None,
+                        'pausa_minutos': 0,
+                        'tipo_escala': 'normal',
+                        'descanso': True,
+                    })
+                else:
+                    escalas.append({
+                        'funcionario': funcionario_id,
+                        'data': data_dia,
+                        'hora_inicio': turno.hora_inicio,
+                        'hora_fim': turno.hora_fim,
+                        'pausa_minutos': turno.pausa_minutos,
+                        'tipo_escala': turno.tipo_escala,
+                        'descanso': False,
+                        'duracao_minutos': turno.duracao,
+                    })
+        return escalas
+
+    def aplicar(self, resultado: Dict) -> int:
+        """Grava as escalas calculadas por otimizar(); retorna quantas foram criadas"""
+        periodo_noturno = ConfiguracaoSistema.get_periodo_noturno()
+        escalas = [
+            Escala(
+                funcionario_id=escala['funcionario'],
+                data=escala['data'],
+                hora_inicio=escala['hora_inicio'],
+                hora_fim=escala['hora_fim'],
+                pausa_minutos=escala['pausa_minutos'],
+                tipo_escala=escala['tipo_escala'],
+                descanso=escala['descanso'],
+            ).calcular_previsto(periodo_noturno)
+            for escala in resultado['escalas']
+        ]
+        with transaction.atomic():
+            Escala.objects.bulk_create(escalas, batch_size=1000)
+            # bulk_create não dispara os signals: situação das novas escalas e das vizinhas
+            if escalas:
+                validacao = ValidacaoEscalas()
+                inicio, fim = validacao.janela(
+                    min(escala.data for escala in escalas), max(escala.data for escala in escalas)
+                )
+                funcionarios = sorted({escala.funcionario_id for escala in escalas})
+                validacao.revalidar(funcionarios, inicio, fim)
+                Funcionario.incrementar_versao(funcionarios)
+        return len(escalas)
@@ -0,0 +1,541 @@
+"""
+Motor de regras trabalhistas.
+
+As regras (jornada, pausa, interjornada, DSR, 12x36, carga semanal e limites
+do contrato) são declaradas uma única vez neste módulo. Os limites vêm de
+ConfiguracaoSistema (chaves em PARAMETROS, com o padrão da CLT), de modo que
+cada empresa pode ajustá-los à sua convenção coletiva ou desativar regras
+(regras_desativadas).
+
+obter_regras() compila a configuração da empresa em uma lista de funções de
+verificação sobre dados simples (os dias de um funcionário em arrays, ver
+LinhaEscalas) e mantém o resultado em cache por banco até a configuração
+mudar (signals de ConfiguracaoSistema em models.py) ou expirar o TTL.
+ValidadorRegrasTrabalho, os serializers de Escala e Contrato, o otimizador
+e o SimuladorEscalas validam por aqui.
+
+O SimuladorEscalas avalia propostas de escala sem gravar nada: as escalas
+gravadas (e geradas pelas recorrentes) dos funcionários afetados e os
+contratos são carregados uma vez, as propostas são sobrepostas e as regras
+são avaliadas em memória, sem nenhuma query por regra ou por dia.
+"""
+
+import logging
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from core.cache import CacheProcesso
+from core.routers import get_db_for_request
+from .models import ConfiguracaoSistema, Contrato, Escala
+
+logger = logging.getLogger(__name__)
+
+JANELA_DIAS = 7  # dias mínimos de contexto em volta de uma alteração (regras da semana e DSR)
+
+_cache_regras = CacheProcesso(ttl=getattr(settings, 'REGRAS_CACHE_TTL', 300))
+
+
+# Parâmetros
+
+def _inteiro(valor: str) -> int:
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError('Informe um número inteiro')
+    if numero < 0:
+        raise ValueError('Valor não pode ser negativo')
+    return numero
+
+
+def _faixas_pausa(valor: str) -> Tuple[Tuple[int, int], ...]:
+    """'360:60,240:15' -> ((360, 60), (240, 15)): pausa mínima a partir de cada duração de turno"""
+    faixas = []
+    for faixa in valor.split(','):
+        if not faixa.strip():
+            continue
+        try:
+            duracao, pausa = faixa.split(':')
+        except ValueError:
+            raise ValueError('Use duracao:pausa separados por vírgula (ex.: 360:60,240:15)')
+        faixas.append((_inteiro(duracao), _inteiro(pausa)))
+    return tuple(sorted(faixas, reverse=True))
+
+
+def _nomes_regras(valor: str) -> frozenset:
+    nomes = frozenset(nome.strip() for nome in valor.split(',') if nome.strip())
+    desconhecidas = nomes - set(REGRAS)
+    if desconhecidas:
+        raise ValueError(f'Regras desconhecidas: {", ".join(sorted(desconhecidas))}')
+    return nomes
+
+
+# Chave em ConfiguracaoSistema -> (leitura do valor, padrão da CLT, descrição)
+PARAMETROS = {
+    'jornada_maxima_minutos': (
+        _inteiro, '720', 'Duração máxima do turno e da carga diária do contrato (minutos)'),
+    'carga_semanal_maxima_minutos': (
+        _inteiro, '2640', 'Carga semanal máxima do contrato (minutos)'),
+    'extra_diaria_maxima_minutos': (
+        _inteiro, '120', 'Horas extras diárias máximas do contrato (minutos)'),
+    'banco_horas_prazo_maximo_meses': (
+        _inteiro, '12', 'Prazo máximo de compensação do banco de horas (meses)'),
+    'interjornada_minima_minutos': (
+        _inteiro, '660', 'Intervalo mínimo entre jornadas (minutos)'),
+    'max_dias_consecutivos': (
+        _inteiro, '6', 'Dias de trabalho seguidos permitidos antes do DSR'),
+    'pausas_intrajornada': (
+        _faixas_pausa, '360:60,240:15', 'Pausa mínima por duração do turno (duracao:pausa, separados por vírgula)'),
+    'tolerancia_ponto_minutos': (
+        _inteiro, '15', 'Diferença tolerada entre o ponto e o horário da escala (minutos)'),
+    'regras_desativadas': (
+        _nomes_regras, '', 'Regras não aplicadas, separadas por vírgula'),
+}
+
+# Limites do cadastro de contrato: campo -> (parâmetro, mensagem)
+LIMITES_CONTRATO = {
+    'carga_diaria_max': ('jornada_maxima_minutos', 'Carga diária não pode exceder {horas} ({limite} minutos)'),
+    'carga_semanal_max': ('carga_semanal_maxima_minutos', 'Carga semanal não pode exceder {horas} ({limite} minutos)'),
+    'extra_diaria_cap': ('extra_diaria_maxima_minutos',
+                         'Horas extras diárias não podem exceder {horas} ({limite} minutos)'),
+    'banco_horas_prazo_meses': ('banco_horas_prazo_maximo_meses',
+                                'Prazo do banco de horas não pode exceder {limite} meses'),
+}
+
+
+def ler_parametro(chave: str, valor: str):
+    """Converte o valor configurado do parâmetro; ValueError se inválido"""
+    return PARAMETROS[chave][0](valor)
+
+
+def _em_horas(minutos: int) -> str:
+    horas, resto = divmod(minutos, 60)
+    return f'{horas} horas' if not resto else f'{horas}h{resto:02d}'
+
+
+def _pausa_minima(faixas: Tuple[Tuple[int, int], ...], duracao_bruta: int) -> int:
+    for duracao, pausa in faixas:
+        if duracao_bruta >= duracao:
+            return pausa
+    return 0
+
+
+# Dados das regras
+
+class DiaEscala:
+    """Escala de um dia em dados simples (início e fim como datetime sem fuso)"""
+
+    __slots__ = ('data', 'inicio', 'fim', 'pausa_minutos', 'duracao', 'tipo_escala', 'descanso', 'proposta')
+
+    def __init__(self, data: date, hora_inicio: Optional[time], hora_fim: Optional[time],
+                 pausa_minutos: int = 0, tipo_escala: str = 'normal', descanso: bool = False,
+                 proposta: bool = False):
+        self.data = data
+        self.tipo_escala = tipo_escala
+        self.proposta = proposta
+        self.descanso = descanso or hora_inicio is None or hora_fim is None
+
+        if self.descanso:
+            self.inicio = self.fim = None
+            self.pausa_minutos = self.duracao = 0
+            return
+
+        self.inicio = datetime.combine(data, hora_inicio)
+        self.fim = datetime.combine(data, hora_fim)
+        if self.fim <= self.inicio:
+            self.fim += timedelta(days=1)
+        self.pausa_minutos = pausa_minutos
+        self.duracao = int((self.fim - self.inicio).total_seconds() // 60) - pausa_minutos
+
+    @classmethod
+    def da_escala(cls, escala: Escala) -> 'DiaEscala':
+        return cls(escala.data, escala.hora_inicio, escala.hora_fim,
+                   escala.pausa_minutos, escala.tipo_escala, escala.descanso)
+
+    @property
+    def trabalho(self) -> bool:
+        return not self.descanso
+
+
+def contrato_vigente(contratos: List[Contrato], data: date) -> Optional[Contrato]:
+    """Contrato vigente na data (o de início mais recente prevalece)"""
+    vigente = None
+    for contrato in contratos:
+        if contrato.vigencia_inicio <= data and (contrato.vigencia_fim is None or contrato.vigencia_fim >= data):
+            if vigente is None or contrato.vigencia_inicio >= vigente.vigencia_inicio:
+                vigente = contrato
+    return vigente
+
+
+class LinhaEscalas:
+    """
+    Dias seguidos de um funcionário em arrays: dias[i] (DiaEscala ou None) e
+    contratos[i] (contrato vigente) referem-se a inicio + i. Índices fora da
+    linha contam como dia sem escala e sem contrato.
+    """
+
+    __slots__ = ('inicio', 'dias', 'contratos')
+
+    def __init__(self, inicio: date, dias: List[Optional[DiaEscala]], contratos: List[Optional[Contrato]]):
+        self.inicio = inicio
+        self.dias = dias
+        self.contratos = contratos
+
+    @classmethod
+    def montar(cls, inicio: date, fim: date, dias: Dict[date, DiaEscala],
+               contratos: List[Contrato]) -> 'LinhaEscalas':
+        datas = [inicio + timedelta(days=indice) for indice in range((fim - inicio).days + 1)]
+        return cls(inicio, [dias.get(data) for data in datas], [contrato_vigente(contratos, data) for data in datas])
+
+    def indice(self, data: date) -> int:
+        return (data - self.inicio).days
+
+    def data(self, indice: int) -> date:
+        return self.inicio + timedelta(days=indice)
+
+    def dia(self, indice: int) -> Optional[DiaEscala]:
+        return self.dias[indice] if 0 <= indice < len(self.dias) else None
+
+    def contrato(self, indice: int) -> Optional[Contrato]:
+        return self.contratos[indice] if 0 <= indice < len(self.contratos) else None
+
+    def trabalha(self, indice: int) -> bool:
+        dia = self.dia(indice)
+        return dia is not None and dia.trabalho
+
+    def intervalo(self, indice: int) -> Optional[int]:
+        """Minutos entre o fim da jornada do dia anterior e o início da do dia (None sem as duas)"""
+        if not (self.trabalha(indice - 1) and self.trabalha(indice)):
+            return None
+        return int((self.dias[indice].inicio - self.dias[indice - 1].fim).total_seconds() // 60)
+
+
+# Regras
+#
+# Cada regra é registrada com uma função que recebe os parâmetros da empresa
+# e retorna a verificação compilada: verificar(linha, indice) devolve
+# (índice de referência, mensagem) quando o dia viola a regra, ou None.
+# alcance: deslocamentos avaliados em volta de um dia alterado (a
+# interjornada do dia seguinte, por exemplo, depende do dia alterado).
+
+REGRAS: Dict[str, Tuple[Callable, Tuple[int, ...]]] = {}
+
+
+def regra(nome: str, alcance: Tuple[int, ...] = (0,)):
+    def registrar(compilar):
+        REGRAS[nome] = (compilar, alcance)
+        return compilar
+    return registrar
+
+
+@regra('contrato')
+def _regra_contrato(parametros):
+    def verificar(linha, indice):
+        if linha.trabalha(indice) and linha.contrato(indice) is None:
+            return indice, 'Contrato não encontrado'
+    return verificar
+
+
+@regra('jornada_diaria')
+def _regra_jornada_diaria(parametros):
+    def verificar(linha, indice):
+        dia, contrato = linha.dia(indice), linha.contrato(indice)
+        if dia is None or dia.descanso or contrato is None:
+            return None
+        if dia.duracao > contrato.carga_diaria_max:
+            return indice, f'Jornada de {dia.duracao}min excede limite diário de {contrato.carga_diaria_max}min'
+    return verificar
+
+
+@regra('duracao_maxima')
+def _regra_duracao_maxima(parametros):
+    limite = parametros['jornada_maxima_minutos']
+    mensagem = f'Jornada não pode exceder {_em_horas(limite)} ({limite} minutos)'
+
+    def verificar(linha, indice):
+        dia = linha.dia(indice)
+        if dia is not None and dia.trabalho and dia.duracao + dia.pausa_minutos > limite:
+            return indice, mensagem
+    return verificar
+
+
+@regra('pausa_intrajornada')
+def _regra_pausa_intrajornada(parametros):
+    faixas = parametros['pausas_intrajornada']
+
+    def verificar(linha, indice):
+        dia = linha.dia(indice)
+        if dia is None or dia.descanso:
+            return None
+        pausa_necessaria = _pausa_minima(faixas, dia.duracao + dia.pausa_minutos)
+        if dia.pausa_minutos < pausa_necessaria:
+            return indice, f'Pausa de {dia.pausa_minutos}min insuficiente. Necessário: {pausa_necessaria}min'
+    return verificar
+
+
+@regra('escala_12x36')
+def _regra_escala_12x36(parametros):
+    def verificar(linha, indice):
+        dia = linha.dia(indice)
+        if dia is None or dia.descanso or dia.tipo_escala != '12x36':
+            return None
+        contrato = linha.contrato(indice)
+        if contrato is None or not contrato.permite_12x36:
+            return indice, 'Contrato não permite escala 12x36'
+    return verificar
+
+
+@regra('folga_12x36', alcance=(-1, 0))
+def _regra_folga_12x36(parametros):
+    def verificar(linha, indice):
+        dia = linha.dia(indice)
+        if dia is not None and dia.trabalho and dia.tipo_escala == '12x36' and linha.trabalha(indice + 1):
+            return indice, 'Escala 12x36 deve ter folga embutida no dia seguinte'
+    return verificar
+
+
+@regra('interjornada', alcance=(0, 1))
+def _regra_interjornada(parametros):
+    minimo = parametros['interjornada_minima_minutos']
+
+    def verificar(linha, indice):
+        intervalo = linha.intervalo(indice)
+        if intervalo is not None and intervalo < minimo:
+            return indice, f'Interjornada de {intervalo}min menor que mínimo de {minimo}min'
+    return verificar
+
+
+@regra('jornada_semanal')
+def _regra_jornada_semanal(parametros):
+    def verificar(linha, indice):
+        # Semana de segunda a domingo que contém o dia
+        segunda = indice - linha.data(indice).weekday()
+        contrato = linha.contrato(segunda) or linha.contrato(segunda + 6)
+        if contrato is None:
+            return None
+        total_minutos = sum(linha.dias[posicao].duracao for posicao in range(segunda, segunda + 7)
+                            if linha.trabalha(posicao))
+        if total_minutos > contrato.carga_semanal_max:
+            return segunda, f'Jornada semanal de {total_minutos}min excede limite de {contrato.carga_semanal_max}min'
+    return verificar
+
+
+@regra('dsr')
+def _regra_dsr(parametros):
+    maximo = parametros['max_dias_consecutivos']
+
+    def verificar(linha, indice):
+        if not linha.trabalha(indice):
+            return None
+        primeiro = ultimo = indice
+        while linha.trabalha(primeiro - 1):
+            primeiro -= 1
+        while linha.trabalha(ultimo + 1):
+            ultimo += 1
+        consecutivos = ultimo - primeiro + 1
+        if consecutivos > maximo:
+            return primeiro, f'{consecutivos} dias consecutivos de trabalho sem DSR (máximo {maximo})'
+    return verificar
+
+
+class RegrasTrabalhistas:
+    """
+    Regras de uma empresa compiladas a partir da configuração.
+    Não acessa o banco: obtenha com obter_regras().
+    """
+
+    def __init__(self, configuracoes: Dict[str, str]):
+        self.parametros = {}
+        self.valores = {}  # valor em vigor de cada parâmetro, como configurado
+        for chave, (leitura, padrao, _) in PARAMETROS.items():
+            valor = configuracoes.get(chave) or padrao
+            try:
+                self.parametros[chave] = leitura(valor)
+            except ValueError:
+                logger.warning(f'Configuração inválida {chave}={valor!r}; usando o padrão {padrao!r}')
+                valor = padrao
+                self.parametros[chave] = leitura(valor)
+            self.valores[chave] = valor
+
+        self.desativadas = self.parametros['regras_desativadas']
+        self.verificacoes = [
+            (nome, alcance, compilar(self.parametros))
+            for nome, (compilar, alcance) in REGRAS.items()
+            if nome not in self.desativadas
+        ]
+        self._por_nome = {nome: verificar for nome, _, verificar in self.verificacoes}
+
+        self._faixas_pausa = self.parametros['pausas_intrajornada'] if self.ativa('pausa_intrajornada') else ()
+        self.interjornada_minima = self.parametros['interjornada_minima_minutos'] if self.ativa('interjornada') else 0
+        self.max_dias_consecutivos = self.parametros['max_dias_consecutivos'] if self.ativa('dsr') else None
+        self.tolerancia_ponto = self.parametros['tolerancia_ponto_minutos']
+        self._limites_contrato = [
+            (campo, self.parametros[parametro], mensagem.format(
+                horas=_em_horas(self.parametros[parametro]), limite=self.parametros[parametro]))
+            for campo, (parametro, mensagem) in LIMITES_CONTRATO.items()
+        ]
+
+    def ativa(self, nome: str) -> bool:
+        return nome not in self.desativadas
+
+    def pausa_minima(self, duracao_bruta: int) -> int:
+        """Pausa intrajornada mínima para a duração do turno (pausa incluída)"""
+        return _pausa_minima(self._faixas_pausa, duracao_bruta)
+
+    def verificar(self, nome: str, linha: LinhaEscalas, indice: int) -> Optional[str]:
+        """Mensagem de violação da regra no dia, ou None (também para regra desativada)"""
+        verificar = self._por_nome.get(nome)
+        resultado = verificar(linha, indice) if verificar else None
+        return resultado[1] if resultado else None
+
+    def avaliar(self, linha: LinhaEscalas, indices, regras=None) -> List[Tuple[str, int, str]]:
+        """
+        Violações (regra, índice de referência, mensagem) das regras ativas
+        que envolvem os dias indicados; regras limita a avaliação a alguns nomes.
+        """
+        violacoes = []
+        vistas = set()
+        for nome, alcance, verificar in self.verificacoes:
+            if regras is not None and nome not in regras:
+                continue
+            for indice in sorted({indice + deslocamento for indice in indices for deslocamento in alcance}):
+                resultado = verificar(linha, indice)
+                if resultado is None or (nome, resultado[0]) in vistas:
+                    continue
+                vistas.add((nome, resultado[0]))
+                violacoes.append((nome, resultado[0], resultado[1]))
+        return violacoes
+
+    def violacoes_do_dia(self, linha: LinhaEscalas, indice: int) -> List[str]:
+        """
+        Regras violadas que envolvem o dia de trabalho (inclusive as apuradas
+        em dias vizinhos, como a interjornada do dia seguinte); vazio para folga
+        """
+        if not linha.trabalha(indice):
+            return []
+        return [
+            nome for nome, alcance, verificar in self.verificacoes
+            if any(verificar(linha, indice + deslocamento) for deslocamento in alcance)
+        ]
+
+    def validar_turno(self, hora_inicio: time, hora_fim: time, pausa_minutos: int) -> List[Tuple[str, str]]:
+        """Violações (regra, mensagem) de duração e pausa de um turno, sem funcionário"""
+        hoje = date.today()
+        linha = LinhaEscalas(hoje, [DiaEscala(hoje, hora_inicio, hora_fim, pausa_minutos)], [None])
+        return [(nome, mensagem) for nome, _, mensagem in
+                self.avaliar(linha, [0], regras=('duracao_maxima', 'pausa_intrajornada'))]
+
+    def validar_contrato(self, dados: Dict) -> Dict[str, str]:
+        """Campos do contrato acima dos limites da empresa -> mensagem"""
+        return {
+            campo: mensagem
+            for campo, limite, mensagem in self._limites_contrato
+            if dados.get(campo) is not None and dados[campo] > limite
+        }
+
+
+def _banco(using: Optional[str]) -> str:
+    return using or get_db_for_request() or 'default'
+
+
+def compilar_regras(using: Optional[str] = None) -> RegrasTrabalhistas:
+    """Lê a configuração da empresa (uma query) e compila as regras"""
+    using = _banco(using)
+    return RegrasTrabalhistas(ConfiguracaoSistema.get_valores(PARAMETROS, using=using))
+
+
+def obter_regras(using: Optional[str] = None) -> RegrasTrabalhistas:
+    """Regras compiladas da empresa da requisição (ou do banco informado), em cache"""
+    using = _banco(using)
+    return _cache_regras.obter_ou_calcular(using, lambda: compilar_regras(using))
+
+
+def recompilar_regras(using: Optional[str] = None):
+    """Recompila as regras do banco após mudança na configuração"""
+    using = _banco(using)
+    _cache_regras.definir(using, compilar_regras(using))
+
+
+class SimuladorEscalas:
+    """
+    Valida um lote de escalas propostas sobre a escala atual, sem gravar.
+
+    Cada proposta é um dict com funcionario (id), data e, para dia de trabalho,
+    hora_inicio, hora_fim, pausa_minutos e tipo_escala; descanso=True propõe
+    folga e remover=True retira a escala do dia. Propostas repetidas para o
+    mesmo funcionário e dia: vale a última.
+
+    Só são retornadas as violações que envolvem algum dia proposto: a jornada
+    e a pausa do próprio dia, a interjornada com o dia anterior e o seguinte,
+    a carga da semana (segunda a domingo) e a sequência de dias sem DSR que o
+    contêm, e a folga obrigatória após um dia de 12x36.
+    """
+
+    def __init__(self):
+        self.regras = obter_regras()
+
+    def simular(self, propostas: List[Dict]) -> Dict:
+        """Retorna as violações das regras nos dias afetados pelas propostas"""
+        # services importa este módulo
+        from .services import CalendarioEscalas
+
+        if not propostas:
+            return {'valido': True, 'violacoes': [], 'resumo_violacoes': {}, 'total_violacoes': 0}
+
+        # Contexto para a semana e para a sequência de dias sem DSR, como em ValidacaoEscalas
+        contexto = max(JANELA_DIAS, self.regras.parametros['max_dias_consecutivos'])
+        datas = [proposta['data'] for proposta in propostas]
+        inicio = min(datas) - timedelta(days=contexto)
+        fim = max(datas) + timedelta(days=contexto)
+        funcionarios = sorted({proposta['funcionario'] for proposta in propostas})
+
+        # Escala atual (gravada ou gerada) e contratos: uma carga para todos os funcionários
+        dias = {funcionario_id: {} for funcionario_id in funcionarios}
+        for escala in CalendarioEscalas().escalas(inicio, fim, funcionarios):
+            dias[escala.funcionario_id][escala.data] = DiaEscala.da_escala(escala)
+
+        contratos = {funcionario_id: [] for funcionario_id in funcionarios}
+        for contrato in Contrato.objects.filter(
+            funcionario_id__in=funcionarios, vigencia_inicio__lte=fim
+        ).order_by('vigencia_inicio'):
+            contratos[contrato.funcionario_id].append(contrato)
+
+        propostos = {funcionario_id: set() for funcionario_id in funcionarios}
+        for proposta in propostas:
+            funcionario_id, data = proposta['funcionario'], proposta['data']
+            propostos[funcionario_id].add(data)
+            if proposta.get('remover'):
+                dias[funcionario_id].pop(data, None)
+                continue
+            dias[funcionario_id][data] = DiaEscala(
+                data,
+                proposta.get('hora_inicio'),
+                proposta.get('hora_fim'),
+                proposta.get('pausa_minutos', 60),
+                proposta.get('tipo_escala', 'normal'),
+                proposta.get('descanso', False),
+                proposta=True,
+            )
+
+        violacoes = []
+        for funcionario_id in funcionarios:
+            linha = LinhaEscalas.montar(inicio, fim, dias[funcionario_id], contratos[funcionario_id])
+            indices = [linha.indice(data) for data in propostos[funcionario_id]]
+            for nome, indice, mensagem in self.regras.avaliar(linha, indices):
+                violacoes.append({
+                    'funcionario': funcionario_id,
+                    'data': linha.data(indice),
+                    'regra': nome,
+                    'mensagem': mensagem,
+                })
+        violacoes.sort(key=lambda violacao: (violacao['funcionario'], violacao['data'], violacao['regra']))
+
+        resumo = Counter(violacao['regra'] for violacao in violacoes)
+        return {
+            'valido': not violacoes,
+            'violacoes': violacoes,
+            'resumo_violacoes': dict(resumo),
+            'total_violacoes': len(violacoes),
+        }
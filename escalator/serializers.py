@@ -3,21 +3,27 @@ Serializers Django REST Framework para o sistema de gerenciamento de escalas.
 Implementa validações das regras trabalhistas brasileiras.
 """
 
-from rest_framework import serializers
+from rest_framework import permissions, serializers
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.manager import BaseManager
 from django.utils import timezone
 from datetime import date, time, datetime, timedelta
 from typing import Dict, Any
 
 from .models import (
     Funcionario, Escala, Ponto, BancoHoras, Contrato, 
-    ConfiguracaoSistema, EscalaPredefinida, Folga
+    ConfiguracaoSistema, EscalaPredefinida, EscalaRecorrente, Folga
 )
 from .services import (
     ValidadorRegrasTrabalho, CalculadoraJornada, 
-    GerenciadorBancoHoras, ProcessadorPontos
+    GerenciadorBancoHoras, ProcessadorPontos, CalendarioEscalas, SincronizacaoIncremental
 )
+from .regras import PARAMETROS, ler_parametro, obter_regras
+from core.licencas import empresa_pronta
 
 User = get_user_model()
 
@@ -25,9 +31,25 @@ User = get_user_model()
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """Serializer customizado para incluir dados do usuário na resposta do token"""
     
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        
+        # Empresa no token para o roteamento direto ao banco da empresa
+        token['empresa_id'] = user.empresa_id
+        
+        return token
+    
     def validate(self, attrs):
         data = super().validate(attrs)
         
+        # O login aguarda o banco da empresa ficar pronto
+        if self.user.empresa_id and not empresa_pronta(self.user.empresa_id):
+            raise AuthenticationFailed(
+                'O ambiente da empresa ainda está sendo preparado. Tente novamente em instantes.',
+                'empresa_em_provisionamento',
+            )
+        
         # Adiciona dados do usuário à resposta
         data['user'] = {
             'id': str(self.user.id),
@@ -40,9 +62,104 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
-class FuncionarioSerializer(serializers.ModelSerializer):
+def ler_lista_campos(valor):
+    """Nomes de campos separados por vírgula"""
+    return [nome.strip() for nome in (valor or '').split(',') if nome.strip()]
+
+
+class CamposEsparsosMixin:
+    """
+    Campos da resposta escolhidos pelo cliente nas leituras: ?fields=id,data
+    mantém só os campos informados e ?omit=validacoes remove campos (nomes
+    desconhecidos são ignorados). Vale só para a serialização raiz da requisição.
+    
+    campos_queryset traduz a seleção em colunas para only() e relações para
+    select_related; `dependencias_campos` informa as colunas lidas por campos
+    calculados (os não declarados exigem o registro inteiro).
+    """
+    
+    dependencias_campos = {}
+    
+    @staticmethod
+    def nomes_selecionados(nomes, parametros):
+        """Nomes mantidos pelos parâmetros fields/omit, na ordem original; None sem seleção"""
+        incluir = ler_lista_campos(parametros.get('fields'))
+        omitir = set(ler_lista_campos(parametros.get('omit')))
+        if not incluir and not omitir:
+            return None
+        return [nome for nome in nomes if (not incluir or nome in incluir) and nome not in omitir]
+    
+    def get_fields(self):
+        campos = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in permissions.SAFE_METHODS or not self._serializacao_raiz():
+            return campos
+        
+        selecionados = self.nomes_selecionados(campos, request.query_params)
+        if selecionados is None:
+            return campos
+        return {nome: campos[nome] for nome in selecionados}
+    
+    def _serializacao_raiz(self):
+        pai = self.parent
+        if isinstance(pai, serializers.ListSerializer):
+            pai = pai.parent
+        return pai is None
+    
+    @classmethod
+    def campos_queryset(cls, parametros):
+        """
+        (colunas, relações) que bastam para os campos selecionados pelos parâmetros;
+        None sem seleção ou quando algum campo exige o registro inteiro
+        """
+        campos = cls().fields
+        selecionados = cls.nomes_selecionados(campos, parametros)
+        if selecionados is None:
+            return None
+        
+        modelo = cls.Meta.model
+        colunas, relacoes = {modelo._meta.pk.name}, set()
+        for nome in selecionados:
+            campo = campos[nome]
+            if nome in cls.dependencias_campos:
+                origens = cls.dependencias_campos[nome]
+            elif isinstance(campo, serializers.SerializerMethodField) or campo.source == '*':
+                return None
+            else:
+                origens = [campo.source]
+            
+            for origem in origens:
+                if not cls._incluir_origem(modelo, origem.split('.'), colunas, relacoes):
+                    return None
+        return colunas, relacoes
+    
+    @staticmethod
+    def _incluir_origem(modelo, partes, colunas, relacoes):
+        """Acrescenta a coluna (e as relações percorridas) de uma origem 'campo' ou 'relacao.campo'"""
+        for indice, parte in enumerate(partes):
+            try:
+                campo_modelo = modelo._meta.get_field(parte)
+            except FieldDoesNotExist:
+                return False
+            if not campo_modelo.concrete or campo_modelo.many_to_many:
+                return False
+            
+            caminho = '__'.join(partes[:indice + 1])
+            colunas.add(caminho)
+            if indice < len(partes) - 1:
+                if not campo_modelo.is_relation:
+                    return False
+                relacoes.add(caminho)
+                modelo = campo_modelo.related_model
+        return True
+
+
+class FuncionarioSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo Funcionario"""
     
+    # O contrato vigente é consultado pela chave do funcionário
+    dependencias_campos = {'contrato_vigente': []}
+    
     usuario_email = serializers.EmailField(source='usuario.email', read_only=True)
     usuario_first_name = serializers.CharField(source='usuario.first_name', read_only=True)
     usuario_last_name = serializers.CharField(source='usuario.last_name', read_only=True)
@@ -58,13 +175,9 @@ class FuncionarioSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
     
     def get_contrato_vigente(self, obj):
-        """Retorna o contrato vigente do funcionário"""
-        contrato = Contrato.objects.filter(
-            funcionario=obj,
-            vigencia_inicio__lte=date.today()
-        ).order_by('-vigencia_inicio').first()
-        
-        if contrato and contrato.is_vigente():
+        """Retorna o contrato vigente do funcionário (de Contrato.prefetch_vigentes nas listagens)"""
+        contrato = Contrato.vigente_hoje(obj)
+        if contrato:
             return ContratoSerializer(contrato).data
         return None
     
@@ -75,9 +188,11 @@ class FuncionarioSerializer(serializers.ModelSerializer):
         return value
 
 
-class ContratoSerializer(serializers.ModelSerializer):
+class ContratoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo Contrato com validações trabalhistas"""
     
+    dependencias_campos = {'vigente': ['vigencia_inicio', 'vigencia_fim']}
+    
     funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
     vigente = serializers.SerializerMethodField()
     
@@ -97,23 +212,10 @@ class ContratoSerializer(serializers.ModelSerializer):
     
     def validate(self, data):
         """Validações gerais do contrato"""
-        # Valida carga horária diária (máximo 12h conforme CLT)
-        if data.get('carga_diaria_max', 0) > 720:  # 12 horas em minutos
-            raise serializers.ValidationError({
-                'carga_diaria_max': 'Carga diária não pode exceder 12 horas (720 minutos)'
-            })
-        
-        # Valida carga horária semanal (máximo 44h conforme CLT)
-        if data.get('carga_semanal_max', 0) > 2640:  # 44 horas em minutos
-            raise serializers.ValidationError({
-                'carga_semanal_max': 'Carga semanal não pode exceder 44 horas (2640 minutos)'
-            })
-        
-        # Valida cap de horas extras diárias (máximo 2h conforme CLT)
-        if data.get('extra_diaria_cap', 0) > 120:  # 2 horas em minutos
-            raise serializers.ValidationError({
-                'extra_diaria_cap': 'Horas extras diárias não podem exceder 2 horas (120 minutos)'
-            })
+        # Limites de carga, horas extras e banco de horas da empresa (CLT por padrão)
+        erros = obter_regras().validar_contrato(data)
+        if erros:
+            raise serializers.ValidationError(erros)
         
         # Valida período de vigência
         vigencia_inicio = data.get('vigencia_inicio')
@@ -125,56 +227,28 @@ class ContratoSerializer(serializers.ModelSerializer):
             })
         
         return data
-    
-    def validate_banco_horas_prazo_meses(self, value):
-        """Valida prazo do banco de horas (máximo 12 meses conforme CLT)"""
-        if value > 12:
-            raise serializers.ValidationError(
-                "Prazo do banco de horas não pode exceder 12 meses"
-            )
-        return value
 
 
-class EscalaSerializer(serializers.ModelSerializer):
+class EscalaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo Escala com validações trabalhistas"""
     
+    dependencias_campos = {'violacoes': ['codigos_violacao']}
+    
     funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
     duracao_minutos = serializers.ReadOnlyField()
-    validacoes = serializers.SerializerMethodField()
+    violacoes = serializers.ReadOnlyField()
+    
+    # Campo que recebe o erro de cada regra do turno (as demais vão para non_field_errors)
+    CAMPOS_REGRAS = {'pausa_intrajornada': 'pausa_minutos'}
     
     class Meta:
         model = Escala
         fields = [
             'id', 'funcionario', 'funcionario_nome', 'data', 'hora_inicio',
             'hora_fim', 'pausa_minutos', 'tipo_escala', 'descanso',
-            'duracao_minutos', 'validacoes', 'created_at'
+            'duracao_minutos', 'valida', 'violacoes', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at']
-    
-    def get_validacoes(self, obj):
-        """Executa validações trabalhistas para a escala"""
-        if obj.descanso:
-            return {'valido': True, 'tipo': 'descanso'}
-        
-        validador = ValidadorRegrasTrabalho()
-        
-        validacoes = {
-            'jornada_diaria': validador.validar_jornada_diaria(obj.funcionario, obj.data),
-            'pausa_intrajornada': validador.validar_pausa_intrajornada(obj),
-            'interjornada': validador.validar_interjornada(obj.funcionario, obj.data)
-        }
-        
-        # Validações específicas por tipo de escala
-        if obj.tipo_escala == '12x36':
-            validacoes['escala_12x36'] = validador.validar_escala_12x36(obj)
-        
-        # Determina se todas as validações passaram
-        todas_validas = all(v.get('valido', False) for v in validacoes.values())
-        
-        return {
-            'valido': todas_validas,
-            'detalhes': validacoes
-        }
+        read_only_fields = ['id', 'valida', 'created_at', 'updated_at']
     
     def validate(self, data):
         """Validações gerais da escala"""
@@ -196,35 +270,13 @@ class EscalaSerializer(serializers.ModelSerializer):
                 'hora_fim': 'Hora fim deve ser posterior à hora início'
             })
         
-        # Calcula duração da jornada
-        inicio_dt = datetime.combine(date.today(), hora_inicio)
-        fim_dt = datetime.combine(date.today(), hora_fim)
-        
-        # Se passou da meia-noite
-        if hora_fim < hora_inicio:
-            fim_dt += timedelta(days=1)
-        
-        duracao_minutos = int((fim_dt - inicio_dt).total_seconds() / 60)
-        
-        # Valida duração máxima (12h conforme CLT)
-        if duracao_minutos > 720:
-            raise serializers.ValidationError(
-                "Jornada não pode exceder 12 horas (720 minutos)"
-            )
-        
-        # Valida pausa mínima conforme duração
-        pausa_minutos = data.get('pausa_minutos', 0)
-        
-        if duracao_minutos >= 360:  # >= 6h
-            if pausa_minutos < 60:
-                raise serializers.ValidationError({
-                    'pausa_minutos': 'Jornada >= 6h requer pausa mínima de 60 minutos'
-                })
-        elif duracao_minutos >= 240:  # >= 4h
-            if pausa_minutos < 15:
-                raise serializers.ValidationError({
-                    'pausa_minutos': 'Jornada >= 4h requer pausa mínima de 15 minutos'
-                })
+        # Duração máxima e pausa mínima conforme as regras da empresa
+        violacoes = obter_regras().validar_turno(hora_inicio, hora_fim, data.get('pausa_minutos', 0))
+        if violacoes:
+            raise serializers.ValidationError({
+                self.CAMPOS_REGRAS.get(regra, api_settings.NON_FIELD_ERRORS_KEY): mensagem
+                for regra, mensagem in violacoes
+            })
         
         return data
     
@@ -234,7 +286,7 @@ class EscalaSerializer(serializers.ModelSerializer):
         if not funcionario:
             return value
         
-        if value == '12x36':
+        if value == '12x36' and obter_regras().ativa('escala_12x36'):
             # Verifica se o contrato permite escala 12x36
             contrato = Contrato.objects.filter(
                 funcionario_id=funcionario,
@@ -249,27 +301,133 @@ class EscalaSerializer(serializers.ModelSerializer):
         return value
 
 
-class PontoSerializer(serializers.ModelSerializer):
+class EscalaDetalheSerializer(EscalaSerializer):
+    """Escala com as validações trabalhistas recalculadas e as mensagens de cada regra"""
+    
+    validacoes = serializers.SerializerMethodField()
+    
+    class Meta(EscalaSerializer.Meta):
+        fields = EscalaSerializer.Meta.fields + ['validacoes']
+    
+    def get_validacoes(self, obj):
+        """Executa validações trabalhistas para a escala"""
+        if obj.descanso:
+            return {'valido': True, 'tipo': 'descanso'}
+        
+        validacoes = ValidadorRegrasTrabalho().validar_escala(obj)
+        
+        # Determina se todas as validações passaram
+        todas_validas = all(v.get('valido', False) for v in validacoes.values())
+        
+        return {
+            'valido': todas_validas,
+            'detalhes': validacoes
+        }
+
+
+class EscalaRecorrenteSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
+    """Serializer para escalas recorrentes (padrão aplicado sem gravar os dias)"""
+    
+    funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
+    escala_predefinida_nome = serializers.CharField(source='escala_predefinida.nome', read_only=True)
+    data_ancora = serializers.DateField(required=False)
+    
+    class Meta:
+        model = EscalaRecorrente
+        fields = [
+            'id', 'funcionario', 'funcionario_nome', 'escala_predefinida',
+            'escala_predefinida_nome', 'data_ancora', 'dias_trabalho', 'dias_ciclo',
+            'hora_inicio', 'hora_fim', 'pausa_minutos', 'tipo_escala',
+            'vigencia_inicio', 'vigencia_fim', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'dias_trabalho', 'dias_ciclo', 'created_at', 'updated_at']
+    
+    def validate(self, data):
+        """Valida o padrão e a vigência da recorrência"""
+        escala_predefinida = data.get('escala_predefinida') or getattr(self.instance, 'escala_predefinida', None)
+        ciclo = escala_predefinida.ciclo() if escala_predefinida else None
+        if not ciclo:
+            raise serializers.ValidationError({
+                'escala_predefinida': 'Padrão da escala predefinida não reconhecido'
+            })
+        data['dias_trabalho'], data['dias_ciclo'] = ciclo
+        
+        vigencia_inicio = data.get('vigencia_inicio') or getattr(self.instance, 'vigencia_inicio', None)
+        vigencia_fim = data.get('vigencia_fim', getattr(self.instance, 'vigencia_fim', None))
+        if vigencia_fim and vigencia_inicio and vigencia_fim < vigencia_inicio:
+            raise serializers.ValidationError("Vigência fim deve ser posterior à vigência início")
+        
+        # Sem âncora, o ciclo começa no início da vigência
+        if not data.get('data_ancora') and not self.instance:
+            data['data_ancora'] = vigencia_inicio
+        
+        # Duração máxima e pausa mínima conforme as regras da empresa, como nas escalas gravadas
+        regras = obter_regras()
+        violacoes = regras.validar_turno(
+            data.get('hora_inicio') or getattr(self.instance, 'hora_inicio', None),
+            data.get('hora_fim') or getattr(self.instance, 'hora_fim', None),
+            data.get('pausa_minutos', getattr(self.instance, 'pausa_minutos', 0)),
+        )
+        if violacoes:
+            raise serializers.ValidationError({
+                EscalaSerializer.CAMPOS_REGRAS.get(regra, api_settings.NON_FIELD_ERRORS_KEY): mensagem
+                for regra, mensagem in violacoes
+            })
+        
+        # Revezamento (12x36, 24x48) só com autorização no contrato vigente no início
+        tipo_escala = data.get('tipo_escala', getattr(self.instance, 'tipo_escala', None))
+        revezamento = tipo_escala == '12x36' or (ciclo[0] == 1 and ciclo[1] > 1)
+        if revezamento and regras.ativa('escala_12x36'):
+            funcionario = data.get('funcionario') or getattr(self.instance, 'funcionario', None)
+            contrato = Contrato.vigentes_em(vigencia_inicio).filter(funcionario=funcionario).first()
+            if not contrato or not contrato.permite_12x36:
+                raise serializers.ValidationError({
+                    'escala_predefinida': f'Funcionário não autorizado para escala {escala_predefinida.nome}'
+                })
+        
+        return data
+
+
+class PontoListSerializer(serializers.ListSerializer):
+    """Listas de pontos: as validações de todos são calculadas em lote"""
+    
+    def to_representation(self, data):
+        pontos = list(data.all() if isinstance(data, BaseManager) else data)
+        if 'validacoes' in self.child.fields:
+            self.child.validacoes_lote = ProcessadorPontos().validar_registros(pontos)
+        return super().to_representation(pontos)
+
+
+class PontoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo Ponto com validações automáticas"""
     
     funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
     escala_data = serializers.DateField(source='escala.data', read_only=True)
     validacoes = serializers.SerializerMethodField()
+    # Declarado para não herdar o UniqueValidator (uma query a mais): a unicidade é
+    # garantida pelo índice e as repetições são resolvidas em PontoViewSet.registrar
+    chave_idempotencia = serializers.CharField(required=False, allow_null=True, max_length=64)
     
     class Meta:
         model = Ponto
         fields = [
             'id', 'funcionario', 'funcionario_nome', 'escala', 'escala_data',
             'timestamp', 'tipo_registro', 'localizacao_lat', 'localizacao_lng',
-            'validado', 'observacoes', 'validacoes', 'created_at'
+            'validado', 'observacoes', 'validacoes', 'chave_idempotencia', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'escala', 'validado', 'created_at']
+        read_only_fields = ['id', 'escala', 'validado', 'created_at', 'updated_at']
+        list_serializer_class = PontoListSerializer
     
     def get_validacoes(self, obj):
         """Retorna validações do registro de ponto"""
+        lote = getattr(self, 'validacoes_lote', None)
+        if lote is not None and obj.pk in lote:
+            return lote[obj.pk]
         processador = ProcessadorPontos()
+        # Pontos de dias gerados por escala recorrente não têm escala gravada
+        escala = obj.escala or CalendarioEscalas().escala_do_dia(obj.funcionario, obj.timestamp.date())
         return processador._validar_registro_ponto(
-            obj.funcionario, obj.tipo_registro, obj.timestamp, obj.escala
+            obj.funcionario, obj.tipo_registro, obj.timestamp, escala
         )
     
     def create(self, validated_data):
@@ -278,14 +436,6 @@ class PontoSerializer(serializers.ModelSerializer):
         timestamp = validated_data['timestamp']
         tipo_registro = validated_data['tipo_registro']
         
-        # Busca escala do dia
-        escala = Escala.objects.filter(
-            funcionario=funcionario,
-            data=timestamp.date()
-        ).first()
-        
-        validated_data['escala'] = escala
-        
         # Usa o processador para criar com validações
         processador = ProcessadorPontos()
         localizacao = None
@@ -298,13 +448,14 @@ class PontoSerializer(serializers.ModelSerializer):
             tipo_registro=tipo_registro,
             timestamp=timestamp,
             localizacao=localizacao,
-            observacoes=validated_data.get('observacoes', '')
+            observacoes=validated_data.get('observacoes', ''),
+            chave_idempotencia=validated_data.get('chave_idempotencia')
         )
         
         if not resultado['sucesso']:
             raise serializers.ValidationError(resultado.get('erro', 'Erro ao registrar ponto'))
         
-        return Ponto.objects.get(id=resultado['ponto_id'])
+        return Ponto.objects.select_related('funcionario', 'escala').get(id=resultado['ponto_id'])
     
     def validate_timestamp(self, value):
         """Valida timestamp do ponto"""
@@ -321,9 +472,21 @@ class PontoSerializer(serializers.ModelSerializer):
         return value
 
 
-class BancoHorasSerializer(serializers.ModelSerializer):
+class PontoGravadoSerializer(PontoSerializer):
+    """
+    Ponto como gravado, sem as validações calculadas na leitura (consultadas no
+    detalhe): resposta do registro e sincronização incremental
+    """
+    
+    class Meta(PontoSerializer.Meta):
+        fields = [campo for campo in PontoSerializer.Meta.fields if campo != 'validacoes']
+
+
+class BancoHorasSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo BancoHoras"""
     
+    dependencias_campos = {'vencido': ['data_vencimento']}
+    
     funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
     saldo_minutos = serializers.ReadOnlyField()
     vencido = serializers.SerializerMethodField()
@@ -334,9 +497,9 @@ class BancoHorasSerializer(serializers.ModelSerializer):
             'id', 'funcionario', 'funcionario_nome', 'data_referencia',
             'credito_minutos', 'debito_minutos', 'saldo_minutos',
             'data_vencimento', 'compensado', 'vencido', 'observacoes',
-            'created_at'
+            'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'saldo_minutos', 'data_vencimento', 'created_at']
+        read_only_fields = ['id', 'saldo_minutos', 'data_vencimento', 'created_at', 'updated_at']
     
     def get_vencido(self, obj):
         """Verifica se o registro está vencido"""
@@ -382,31 +545,47 @@ class CompensacaoHorasSerializer(serializers.Serializer):
         return resultado
 
 
-class ConfiguracaoSistemaSerializer(serializers.ModelSerializer):
+class ConfiguracaoSistemaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para configurações do sistema"""
     
     class Meta:
         model = ConfiguracaoSistema
-        fields = ['id', 'chave', 'valor', 'descricao', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'chave', 'valor', 'descricao', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
     
     def validate_chave(self, value):
         """Valida se a chave de configuração é válida"""
         chaves_validas = [
             'periodo_noturno_inicio', 'periodo_noturno_fim',
-            'interjornada_minima_minutos', 'hora_noturna_urbana_minutos',
-            'tolerancia_ponto_minutos', 'dias_limite_edicao_ponto'
+            'hora_noturna_urbana_minutos', 'dias_limite_edicao_ponto',
+            *PARAMETROS
         ]
         
         if value not in chaves_validas:
             raise serializers.ValidationError(f"Chave inválida. Válidas: {chaves_validas}")
         
         return value
+    
+    def validate(self, data):
+        """Valida o valor dos parâmetros das regras trabalhistas"""
+        chave = data.get('chave', getattr(self.instance, 'chave', None))
+        valor = data.get('valor', getattr(self.instance, 'valor', ''))
+        if chave in PARAMETROS and valor:
+            try:
+                ler_parametro(chave, valor)
+            except ValueError as erro:
+                raise serializers.ValidationError({'valor': str(erro)})
+        return data
 
 
-class EscalaPredefinidaSerializer(serializers.ModelSerializer):
+class EscalaPredefinidaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para escalas predefinidas"""
     
+    dependencias_campos = {
+        'legal': ['horas_trabalho', 'horas_descanso'],
+        'observacoes_legais': ['nome'],
+    }
+    
     legal = serializers.SerializerMethodField()
     observacoes_legais = serializers.SerializerMethodField()
     
@@ -439,7 +618,7 @@ class EscalaPredefinidaSerializer(serializers.ModelSerializer):
         return observacoes.get(obj.nome, 'Verificar conformidade com CLT')
 
 
-class FolgaSerializer(serializers.ModelSerializer):
+class FolgaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     """Serializer para o modelo Folga (compatibilidade)"""
     
     funcionario_nome = serializers.CharField(source='funcionario.nome', read_only=True)
@@ -494,4 +673,152 @@ class ValidacaoEscalaSerializer(serializers.Serializer):
         if data['data_fim'] < data['data_inicio']:
             raise serializers.ValidationError("Data fim deve ser posterior à data início")
         
-        return data
\ No newline at end of file
+        return data
+
+class FaixaDemandaSerializer(serializers.Serializer):
+    """Faixa de horário com a quantidade de funcionários necessária"""
+    
+    hora_inicio = serializers.TimeField()
+    hora_fim = serializers.TimeField()
+    quantidade = serializers.IntegerField(min_value=1)
+    data = serializers.DateField(required=False)
+    dias_semana = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6),
+        required=False,
+        help_text='0 = segunda ... 6 = domingo'
+    )
+
+
+class TurnoOtimizacaoSerializer(serializers.Serializer):
+    """Turno candidato para o otimizador de escalas"""
+    
+    hora_inicio = serializers.TimeField()
+    hora_fim = serializers.TimeField()
+    tipo_escala = serializers.ChoiceField(choices=Escala.TIPO_ESCALA_CHOICES, default='normal')
+
+
+class OtimizacaoEscalaSerializer(serializers.Serializer):
+    """Serializer para geração automática de escalas a partir da demanda"""
+    
+    data_inicio = serializers.DateField()
+    data_fim = serializers.DateField()
+    demanda = FaixaDemandaSerializer(many=True, allow_empty=False)
+    funcionarios = serializers.PrimaryKeyRelatedField(
+        queryset=Funcionario.objects.filter(ativo=True), many=True, required=False
+    )
+    turnos = TurnoOtimizacaoSerializer(many=True, required=False)
+    preview = serializers.BooleanField(default=True)
+    
+    def validate(self, data):
+        """Valida período da otimização"""
+        if data['data_fim'] < data['data_inicio']:
+            raise serializers.ValidationError("Data fim deve ser posterior à data início")
+        
+        # Limita período máximo a 2 meses
+        if (data['data_fim'] - data['data_inicio']).days > 62:
+            raise serializers.ValidationError("Período máximo de 62 dias")
+        
+        return data
+
+
+class MapaCoberturaSerializer(serializers.Serializer):
+    """Parâmetros do mapa de cobertura (lotação por faixa de horário)"""
+    
+    data_inicio = serializers.DateField()
+    data_fim = serializers.DateField()
+    intervalo = serializers.ChoiceField(choices=[15, 30, 60], default=60)
+    funcionario = serializers.ListField(child=serializers.IntegerField(), required=False)
+    cargo = serializers.CharField(required=False)
+    tipo_escala = serializers.ChoiceField(choices=Escala.TIPO_ESCALA_CHOICES, required=False)
+    
+    def validate(self, data):
+        """Valida período do mapa"""
+        if data['data_fim'] < data['data_inicio']:
+            raise serializers.ValidationError("Data fim deve ser posterior à data início")
+        
+        # Limita período máximo a 3 meses
+        if (data['data_fim'] - data['data_inicio']).days > 92:
+            raise serializers.ValidationError("Período máximo de 92 dias")
+        
+        return data
+
+
+class HorasPrevistasSerializer(serializers.Serializer):
+    """Parâmetros do relatório de horas previstas nas escalas"""
+    
+    data_inicio = serializers.DateField()
+    data_fim = serializers.DateField()
+    agrupamento = serializers.ChoiceField(choices=['semana', 'mes'], default='semana')
+    funcionario = serializers.ListField(child=serializers.IntegerField(), required=False)
+    cargo = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        """Valida período do relatório"""
+        if data['data_fim'] < data['data_inicio']:
+            raise serializers.ValidationError("Data fim deve ser posterior à data início")
+        
+        # Limita período máximo a 1 ano
+        if (data['data_fim'] - data['data_inicio']).days > 366:
+            raise serializers.ValidationError("Período máximo de 1 ano")
+        
+        return data
+
+
+class EscalaPropostaSerializer(serializers.Serializer):
+    """Escala proposta na simulação (não é gravada)"""
+    
+    funcionario = serializers.IntegerField()
+    data = serializers.DateField()
+    hora_inicio = serializers.TimeField(required=False, allow_null=True)
+    hora_fim = serializers.TimeField(required=False, allow_null=True)
+    pausa_minutos = serializers.IntegerField(min_value=0, default=60)
+    tipo_escala = serializers.ChoiceField(choices=Escala.TIPO_ESCALA_CHOICES, default='normal')
+    descanso = serializers.BooleanField(default=False)
+    remover = serializers.BooleanField(default=False)
+    
+    def validate(self, data):
+        """Dias de trabalho precisam de horário"""
+        if not data['descanso'] and not data['remover'] and not (data.get('hora_inicio') and data.get('hora_fim')):
+            raise serializers.ValidationError(
+                "Hora início e fim são obrigatórias para escalas de trabalho"
+            )
+        return data
+
+
+class SimulacaoEscalaSerializer(serializers.Serializer):
+    """Lote de escalas propostas para a simulação"""
+    
+    escalas = EscalaPropostaSerializer(many=True, allow_empty=False, max_length=2000)
+    
+    def validate_escalas(self, value):
+        """Valida funcionários (uma query para o lote) e o período das propostas"""
+        ids = {proposta['funcionario'] for proposta in value}
+        existentes = set(Funcionario.objects.filter(id__in=ids).values_list('id', flat=True))
+        if ids - existentes:
+            raise serializers.ValidationError(
+                f"Funcionários não encontrados: {sorted(ids - existentes)}"
+            )
+        
+        datas = [proposta['data'] for proposta in value]
+        # Limita período máximo a 2 meses
+        if (max(datas) - min(datas)).days > 62:
+            raise serializers.ValidationError("Período máximo de 62 dias")
+        
+        return value
+
+
+class SincronizacaoSerializer(serializers.Serializer):
+    """Parâmetros da sincronização incremental"""
+    
+    token = serializers.CharField(required=False, allow_blank=True)
+    # Sem validar existência: a sincronização sem alterações deve custar uma única query
+    funcionario = serializers.IntegerField(required=False, min_value=1)
+    
+    def validate_token(self, value):
+        """Token devolvido pela sincronização anterior"""
+        if value:
+            try:
+                SincronizacaoIncremental.ler_token(value)
+            except ValueError as erro:
+                raise serializers.ValidationError(str(erro))
+        return value or None
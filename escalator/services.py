@@ -3,204 +3,536 @@ Serviços de negócio para o sistema de gerenciamento de escalas.
 Implementa todas as regras trabalhistas brasileiras conforme CLT.
 """
 
-from datetime import datetime, timedelta, time, date
+from datetime import datetime, timedelta, time, date, timezone as dt_timezone
 from typing import List, Dict, Tuple, Optional
-from django.db.models import Q, Sum
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum, Count, Min, Max, Value
+from django.db.models.functions import TruncMonth, TruncWeek
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 
 from .models import (
-    Funcionario, Escala, Ponto, BancoHoras, Contrato, 
-    ConfiguracaoSistema, EscalaPredefinida
+    Funcionario, Escala, Folga, Ponto, BancoHoras, Contrato, 
+    ConfiguracaoSistema, EscalaPredefinida, EscalaRecorrente, RegistroExcluido, contar_minutos_noturnos
 )
+from .regras import JANELA_DIAS, DiaEscala, LinhaEscalas, obter_regras
+
+
+class CalendarioEscalas:
+    """
+    Escalas dos funcionários com as recorrentes expandidas em memória.
+    Para cada funcionário e dia vale a Escala gravada (exceção) e, na falta
+    dela, o dia gerado pela escala recorrente vigente mais recente. Os dias
+    gerados não são gravados (pk None) até serem editados.
+    """
+    
+    AGRUPAMENTOS = {'semana': TruncWeek, 'mes': TruncMonth}
+    # Campos das escalas lidos pelas regras trabalhistas (DiaEscala)
+    CAMPOS_REGRAS = ('hora_inicio', 'hora_fim', 'pausa_minutos', 'tipo_escala', 'descanso')
+    
+    def escalas(self, data_inicio: date, data_fim: date, funcionarios=None,
+                colunas=None, relacoes=('funcionario',), tipo_escala: str = None,
+                ordenar: bool = True) -> List[Escala]:
+        """
+        Escalas do período ordenadas por funcionário e data (funcionarios: ids ou queryset de ids).
+        colunas/relacoes limitam o only()/select_related das gravadas aos campos que serão lidos.
+        tipo_escala filtra as gravadas no banco; ordenar=False dispensa a ordenação.
+        Se valida for lida (colunas None ou com 'valida'), os dias gerados são
+        classificados nas regras em memória, com as escalas do período como vizinhas.
+        """
+        gravadas = Escala.objects.filter(data__range=[data_inicio, data_fim])
+        if funcionarios is not None:
+            gravadas = gravadas.filter(funcionario_id__in=funcionarios)
+        
+        escalas = self._geradas(data_inicio, data_fim, funcionarios)
+        if tipo_escala:
+            if escalas:
+                # Gravadas de outro tipo ainda sobrepõem os dias gerados
+                for chave in gravadas.exclude(tipo_escala=tipo_escala).values_list('funcionario_id', 'data'):
+                    escalas.pop(chave, None)
+                escalas = {chave: escala for chave, escala in escalas.items() if escala.tipo_escala == tipo_escala}
+            gravadas = gravadas.filter(tipo_escala=tipo_escala)
+        
+        classificar = bool(escalas) and (colunas is None or 'valida' in colunas)
+        if relacoes:
+            gravadas = gravadas.select_related(*relacoes)
+        if colunas is not None:
+            if classificar:
+                colunas = {*colunas, *self.CAMPOS_REGRAS}
+            gravadas = gravadas.only('funcionario', 'data', *colunas)
+        
+        # As gravadas sobrepõem os dias gerados
+        for escala in gravadas:
+            escalas[(escala.funcionario_id, escala.data)] = escala
+        
+        if classificar:
+            self._classificar_geradas(escalas.values())
+        
+        if not ordenar:
+            return list(escalas.values())
+        return [escalas[chave] for chave in sorted(escalas)]
+    
+    def totais(self, data_inicio: date, data_fim: date, funcionarios=None,
+               agrupamento: str = None) -> List[Dict]:
+        """
+        Minutos previstos por funcionário (e por semana ou mês, se informado).
+        As escalas gravadas são somadas no banco; só os dias gerados pelas
+        recorrências, sem escala gravada, são somados em memória.
+        """
+        gravadas = Escala.objects.filter(data__range=[data_inicio, data_fim])
+        if funcionarios is not None:
+            gravadas = gravadas.filter(funcionario_id__in=funcionarios)
+        
+        campos = ['funcionario_id']
+        consulta = gravadas.filter(descanso=False)
+        if agrupamento:
+            consulta = consulta.annotate(periodo=self.AGRUPAMENTOS[agrupamento]('data'))
+            campos.append('periodo')
+        
+        totais = {}
+        for linha in consulta.values(*campos).annotate(
+            duracao=Sum('duracao_minutos'),
+            noturnos=Sum('minutos_noturnos'),
+            dias=Count('id')
+        ).order_by():
+            totais[(linha['funcionario_id'], linha.get('periodo'))] = [
+                linha['duracao'] or 0, linha['noturnos'] or 0, linha['dias']
+            ]
+        
+        geradas = self._geradas(data_inicio, data_fim, funcionarios)
+        if geradas:
+            gravados = set(gravadas.values_list('funcionario_id', 'data'))
+            for chave, escala in geradas.items():
+                if escala.descanso or chave in gravados:
+                    continue
+                total = totais.setdefault(
+                    (escala.funcionario_id, self._periodo(escala.data, agrupamento)), [0, 0, 0]
+                )
+                total[0] += escala.duracao_minutos
+                total[1] += escala.minutos_noturnos
+                total[2] += 1
+        
+        return [
+            {
+                'funcionario': funcionario_id,
+                'periodo': periodo,
+                'duracao_minutos': duracao,
+                'minutos_noturnos': noturnos,
+                'dias_trabalho': dias,
+            }
+            for (funcionario_id, periodo), (duracao, noturnos, dias) in sorted(
+                totais.items(), key=lambda item: (item[0][0], item[0][1] or data_inicio)
+            )
+        ]
+    
+    def escala_do_dia(self, funcionario: Funcionario, data: date) -> Optional[Escala]:
+        """Escala do funcionário na data (gravada ou gerada pela recorrência)"""
+        escala = Escala.objects.filter(funcionario=funcionario, data=data).first()
+        if escala:
+            return escala
+        
+        recorrente = self._recorrentes(data, data).filter(
+            funcionario=funcionario
+        ).order_by('-vigencia_inicio', '-id').first()
+        if not recorrente:
+            return None
+        
+        if isinstance(funcionario, Funcionario):
+            recorrente.funcionario = funcionario
+        return recorrente.gerar_escala(data)
+    
+    def _geradas(self, data_inicio: date, data_fim: date, funcionarios=None) -> Dict:
+        """Dias gerados pelas recorrências, por (funcionário, data); a mais recente prevalece"""
+        recorrentes = self._recorrentes(data_inicio, data_fim).select_related('funcionario')
+        if funcionarios is not None:
+            recorrentes = recorrentes.filter(funcionario_id__in=funcionarios)
+        recorrentes = list(recorrentes.order_by('vigencia_inicio', 'id'))
+        if not recorrentes:
+            return {}
+        
+        periodo_noturno = ConfiguracaoSistema.get_periodo_noturno()
+        escalas = {}
+        for recorrente in recorrentes:
+            for escala in recorrente.expandir(data_inicio, data_fim, periodo_noturno):
+                escalas[(escala.funcionario_id, escala.data)] = escala
+        return escalas
+    
+    def _classificar_geradas(self, escalas) -> None:
+        """Situação nas regras dos dias gerados (uma query para os contratos)"""
+        funcionarios = {escala.funcionario_id for escala in escalas if escala.pk is None}
+        escalas = [escala for escala in escalas if escala.funcionario_id in funcionarios]
+        contratos = Contrato.objects.filter(funcionario_id__in=funcionarios)
+        ValidacaoEscalas().classificar(escalas, list(contratos))
+    
+    def _periodo(self, data: date, agrupamento: str) -> Optional[date]:
+        """Início da semana ou do mês da data, como TruncWeek/TruncMonth"""
+        if agrupamento == 'semana':
+            return data - timedelta(days=data.weekday())
+        if agrupamento == 'mes':
+            return data.replace(day=1)
+        return None
+    
+    def _recorrentes(self, data_inicio: date, data_fim: date):
+        """Recorrências com vigência no período"""
+        return EscalaRecorrente.objects.filter(
+            vigencia_inicio__lte=data_fim
+        ).filter(
+            Q(vigencia_fim__isnull=True) | Q(vigencia_fim__gte=data_inicio)
+        )
 
 
 class ValidadorRegrasTrabalho:
     """
     Validador das regras trabalhistas brasileiras conforme CLT.
-    Implementa todas as validações obrigatórias do sistema.
+    Cada validação carrega os dias envolvidos e aplica a regra compilada
+    da empresa (escalator.regras), com os limites de ConfiguracaoSistema.
     """
     
     def __init__(self):
-        """Inicializa o validador com configurações do sistema"""
-        try:
-            self.periodo_noturno_inicio, self.periodo_noturno_fim = ConfiguracaoSistema.get_periodo_noturno()
-            self.interjornada_minima = ConfiguracaoSistema.get_interjornada_minima()
-        except Exception:
-            # Se não conseguir obter as configurações, usa valores padrão
-            self.periodo_noturno_inicio, self.periodo_noturno_fim = time(22, 0), time(5, 0)
-            self.interjornada_minima = 660
+        """Inicializa o validador com as regras compiladas da empresa"""
+        self.regras = obter_regras()
+        self.interjornada_minima = self.regras.interjornada_minima
+        self.calendario = CalendarioEscalas()
+    
+    def validar_escala(self, escala: Escala) -> Dict:
+        """Valida todas as regras do dia da escala, com uma única carga do dia anterior ao seguinte"""
+        linha = self._linha(escala.funcionario_id, escala.data - timedelta(days=1), escala.data + timedelta(days=1))
+        linha.dias[1] = dia = DiaEscala.da_escala(escala)
+        
+        validacoes = {
+            'jornada_diaria': self._resultado(
+                self.regras.verificar('contrato', linha, 1) or self.regras.verificar('jornada_diaria', linha, 1),
+                jornada_minutos=dia.duracao
+            ),
+            'pausa_intrajornada': self._resultado(
+                self.regras.verificar('pausa_intrajornada', linha, 1),
+                pausa_necessaria=self.regras.pausa_minima(dia.duracao + dia.pausa_minutos)
+            ),
+            'interjornada': self._resultado(
+                self.regras.verificar('interjornada', linha, 1), intervalo_minutos=linha.intervalo(1)
+            ),
+        }
+        if escala.tipo_escala == '12x36':
+            validacoes['escala_12x36'] = self._validar_12x36(linha, 1)
+        return validacoes
+    
+    def validar_periodo(self, funcionario: Funcionario, data_inicio: date, data_fim: date) -> Dict:
+        """
+        Valida as escalas do período (jornada diária, pausa, interjornada e DSR de
+        cada 7 dias a partir do início) com uma única carga de escalas e contratos,
+        que inclui os dias vizinhos usados pelas regras
+        """
+        maximo = self.regras.parametros['max_dias_consecutivos']
+        inicio = data_inicio - timedelta(days=maximo + 1)
+        fim = data_fim + timedelta(days=6 + maximo)
+        escalas = self.calendario.escalas(
+            inicio, fim, [funcionario.id],
+            colunas={*CalendarioEscalas.CAMPOS_REGRAS, 'duracao_minutos'}, relacoes=()
+        )
+        contratos = list(Contrato.objects.filter(funcionario_id=funcionario.id, vigencia_inicio__lte=fim))
+        linha = LinhaEscalas.montar(
+            inicio, fim, {escala.data: DiaEscala.da_escala(escala) for escala in escalas}, contratos
+        )
+        
+        escalas_validas = []
+        escalas_invalidas = []
+        violacoes = {
+            'jornada_diaria': 0,
+            'jornada_semanal': 0,
+            'pausa_intrajornada': 0,
+            'interjornada': 0,
+            'dsr': 0
+        }
+        
+        for escala in escalas:
+            if not data_inicio <= escala.data <= data_fim:
+                continue
+            if escala.descanso:
+                escalas_validas.append({
+                    'data': escala.data,
+                    'tipo': 'descanso'
+                })
+                continue
+            
+            indice = linha.indice(escala.data)
+            erros = []
+            erro_jornada = (
+                'Contrato não encontrado' if linha.contrato(indice) is None
+                else self.regras.verificar('jornada_diaria', linha, indice)
+            )
+            if erro_jornada:
+                erros.append(erro_jornada)
+                violacoes['jornada_diaria'] += 1
+            
+            val_pausa = self.validar_pausa_intrajornada(escala)
+            if not val_pausa['valido']:
+                erros.append(val_pausa['erro'])
+                violacoes['pausa_intrajornada'] += 1
+            
+            erro_interjornada = self.regras.verificar('interjornada', linha, indice)
+            if erro_interjornada:
+                erros.append(erro_interjornada)
+                violacoes['interjornada'] += 1
+            
+            if erros:
+                escalas_invalidas.append({
+                    'data': escala.data,
+                    'erros': erros
+                })
+            else:
+                escalas_validas.append({
+                    'data': escala.data,
+                    'duracao_minutos': escala.duracao_minutos
+                })
+        
+        # Valida DSR semanal
+        data_atual = data_inicio
+        while data_atual <= data_fim:
+            semana = range(linha.indice(data_atual), linha.indice(data_atual) + 7)
+            if any(self.regras.verificar('dsr', linha, indice) for indice in semana):
+                violacoes['dsr'] += 1
+            data_atual += timedelta(days=7)
+        
+        return {
+            'escalas_validas': escalas_validas,
+            'escalas_invalidas': escalas_invalidas,
+            'resumo_violacoes': violacoes,
+        }
     
     def validar_jornada_diaria(self, funcionario: Funcionario, data: date) -> Dict:
-        """Valida se a jornada diária está dentro dos limites legais"""
+        """Valida se a jornada diária está dentro do limite do contrato"""
         contrato = self._get_contrato_vigente(funcionario, data)
         if not contrato:
             return {'valido': False, 'erro': 'Contrato não encontrado'}
         
-        escala = Escala.objects.filter(funcionario=funcionario, data=data).first()
+        escala = self.calendario.escala_do_dia(funcionario, data)
         if not escala or escala.descanso:
             return {'valido': True, 'jornada_minutos': 0}
         
-        jornada_minutos = escala.duracao_minutos
-        
-        # Verifica limite diário
-        if jornada_minutos > contrato.carga_diaria_max:
-            return {
-                'valido': False,
-                'erro': f'Jornada de {jornada_minutos}min excede limite diário de {contrato.carga_diaria_max}min',
-                'jornada_minutos': jornada_minutos
-            }
-        
-        return {'valido': True, 'jornada_minutos': jornada_minutos}
+        dia = DiaEscala.da_escala(escala)
+        linha = LinhaEscalas(data, [dia], [contrato])
+        return self._resultado(self.regras.verificar('jornada_diaria', linha, 0), jornada_minutos=dia.duracao)
     
     def validar_jornada_semanal(self, funcionario: Funcionario, data_inicio: date) -> Dict:
-        """Valida se a jornada semanal está dentro dos limites legais"""
+        """Valida a jornada da semana (segunda a domingo) que contém a data"""
         contrato = self._get_contrato_vigente(funcionario, data_inicio)
         if not contrato:
             return {'valido': False, 'erro': 'Contrato não encontrado'}
         
-        data_fim = data_inicio + timedelta(days=6)
-        escalas = Escala.objects.filter(
-            funcionario=funcionario,
-            data__range=[data_inicio, data_fim],
-            descanso=False
-        )
+        segunda = data_inicio - timedelta(days=data_inicio.weekday())
+        linha = self._linha(funcionario.id, segunda, segunda + timedelta(days=6))
+        total_minutos = sum(dia.duracao for dia in linha.dias if dia is not None and dia.trabalho)
         
-        total_minutos = sum(escala.duracao_minutos for escala in escalas)
-        
-        if total_minutos > contrato.carga_semanal_max:
-            return {
-                'valido': False,
-                'erro': f'Jornada semanal de {total_minutos}min excede limite de {contrato.carga_semanal_max}min',
-                'total_minutos': total_minutos
-            }
-        
-        return {'valido': True, 'total_minutos': total_minutos}
+        return self._resultado(self.regras.verificar('jornada_semanal', linha, 0), total_minutos=total_minutos)
     
     def validar_pausa_intrajornada(self, escala: Escala) -> Dict:
-        """Valida se a pausa intrajornada está adequada"""
+        """Valida se a pausa intrajornada está adequada à duração do turno"""
         if escala.descanso:
             return {'valido': True, 'pausa_necessaria': 0}
         
-        jornada_minutos = escala.duracao_minutos
-        
-        # Jornada >= 6h: pausa de 60min
-        if jornada_minutos >= 360:
-            pausa_necessaria = 60
-        # Jornada entre 4-6h: pausa de 15min
-        elif jornada_minutos >= 240:
-            pausa_necessaria = 15
-        else:
-            pausa_necessaria = 0
-        
-        if escala.pausa_minutos < pausa_necessaria:
-            return {
-                'valido': False,
-                'erro': f'Pausa de {escala.pausa_minutos}min insuficiente. Necessário: {pausa_necessaria}min',
-                'pausa_necessaria': pausa_necessaria
-            }
-        
-        return {'valido': True, 'pausa_necessaria': pausa_necessaria}
+        dia = DiaEscala.da_escala(escala)
+        linha = LinhaEscalas(escala.data, [dia], [None])
+        return self._resultado(
+            self.regras.verificar('pausa_intrajornada', linha, 0),
+            pausa_necessaria=self.regras.pausa_minima(dia.duracao + dia.pausa_minutos)
+        )
     
     def validar_interjornada(self, funcionario: Funcionario, data: date) -> Dict:
-        """Valida o intervalo mínimo entre jornadas (660 minutos)"""
-        escala_atual = Escala.objects.filter(funcionario=funcionario, data=data).first()
+        """Valida o intervalo mínimo entre o fim da jornada anterior e o início da do dia"""
+        escala_atual = self.calendario.escala_do_dia(funcionario, data)
         if not escala_atual or escala_atual.descanso:
             return {'valido': True}
         
-        # Busca escala do dia anterior
         data_anterior = data - timedelta(days=1)
-        escala_anterior = Escala.objects.filter(
-            funcionario=funcionario, 
-            data=data_anterior,
-            descanso=False
-        ).first()
-        
-        if not escala_anterior:
+        escala_anterior = self.calendario.escala_do_dia(funcionario, data_anterior)
+        if not escala_anterior or escala_anterior.descanso:
             return {'valido': True}
         
-        # Calcula intervalo entre fim da jornada anterior e início da atual
-        fim_anterior = datetime.combine(data_anterior, escala_anterior.hora_fim)
-        inicio_atual = datetime.combine(data, escala_atual.hora_inicio)
-        
-        # Se passou da meia-noite
-        if escala_anterior.hora_fim < escala_atual.hora_inicio:
-            intervalo = inicio_atual - fim_anterior
-        else:
-            intervalo = (inicio_atual + timedelta(days=1)) - fim_anterior
-        
-        intervalo_minutos = int(intervalo.total_seconds() / 60)
-        
-        if intervalo_minutos < self.interjornada_minima:
-            return {
-                'valido': False,
-                'erro': f'Interjornada de {intervalo_minutos}min menor que mínimo de {self.interjornada_minima}min',
-                'intervalo_minutos': intervalo_minutos
-            }
-        
-        return {'valido': True, 'intervalo_minutos': intervalo_minutos}
+        # DiaEscala trata turnos que passam da meia-noite
+        linha = LinhaEscalas(
+            data_anterior, [DiaEscala.da_escala(escala_anterior), DiaEscala.da_escala(escala_atual)], [None, None]
+        )
+        return self._resultado(self.regras.verificar('interjornada', linha, 1), intervalo_minutos=linha.intervalo(1))
     
     def validar_dsr(self, funcionario: Funcionario, data_inicio: date) -> Dict:
-        """Valida se há DSR (Descanso Semanal Remunerado) a cada 7 dias"""
-        data_fim = data_inicio + timedelta(days=6)
-        
-        # Conta dias de descanso na semana
-        dias_descanso = Escala.objects.filter(
-            funcionario=funcionario,
-            data__range=[data_inicio, data_fim],
-            descanso=True
-        ).count()
-        
-        if dias_descanso == 0:
-            return {
-                'valido': False,
-                'erro': 'Nenhum DSR encontrado na semana',
-                'dias_descanso': dias_descanso
-            }
+        """Valida o DSR nos 7 dias a partir da data (dias de trabalho seguidos além do máximo)"""
+        maximo = self.regras.parametros['max_dias_consecutivos']
+        linha = self._linha(
+            funcionario.id, data_inicio - timedelta(days=maximo), data_inicio + timedelta(days=6 + maximo)
+        )
+        semana = range(maximo, maximo + 7)
+        dias_descanso = sum(1 for indice in semana if not linha.trabalha(indice))
         
-        return {'valido': True, 'dias_descanso': dias_descanso}
+        erro = next(filter(None, (self.regras.verificar('dsr', linha, indice) for indice in semana)), None)
+        return self._resultado(erro, dias_descanso=dias_descanso)
     
     def validar_escala_12x36(self, escala: Escala) -> Dict:
         """Valida regras específicas da escala 12x36"""
         if escala.tipo_escala != '12x36':
             return {'valido': True}
         
-        contrato = self._get_contrato_vigente(escala.funcionario, escala.data)
-        if not contrato or not contrato.permite_12x36:
-            return {
-                'valido': False,
-                'erro': 'Contrato não permite escala 12x36'
-            }
-        
-        # Verifica se tem folga no dia seguinte
-        data_seguinte = escala.data + timedelta(days=1)
-        folga_seguinte = Escala.objects.filter(
-            funcionario=escala.funcionario,
-            data=data_seguinte,
-            descanso=True
-        ).exists()
-        
-        if not folga_seguinte:
-            return {
-                'valido': False,
-                'erro': 'Escala 12x36 deve ter folga embutida no dia seguinte'
-            }
-        
-        # Valida interjornada (36h mínimo)
-        validacao_interjornada = self.validar_interjornada(escala.funcionario, escala.data)
-        if not validacao_interjornada['valido']:
-            return validacao_interjornada
-        
+        linha = self._linha(escala.funcionario_id, escala.data - timedelta(days=1), escala.data + timedelta(days=1))
+        linha.dias[1] = DiaEscala.da_escala(escala)
+        return self._validar_12x36(linha, 1)
+    
+    def _validar_12x36(self, linha, indice: int) -> Dict:
+        """Autorização no contrato, folga no dia seguinte e interjornada"""
+        for nome in ('escala_12x36', 'folga_12x36', 'interjornada'):
+            erro = self.regras.verificar(nome, linha, indice)
+            if erro:
+                return {'valido': False, 'erro': erro}
         return {'valido': True}
     
+    def _resultado(self, erro: Optional[str], **valores) -> Dict:
+        if erro:
+            return {'valido': False, 'erro': erro, **valores}
+        return {'valido': True, **valores}
+    
+    def _linha(self, funcionario_id: int, data_inicio: date, data_fim: date) -> LinhaEscalas:
+        """Escalas (gravadas ou geradas) e contratos do funcionário no período, em arrays por dia"""
+        dias = {
+            escala.data: DiaEscala.da_escala(escala)
+            for escala in self.calendario.escalas(data_inicio, data_fim, [funcionario_id])
+        }
+        contratos = list(Contrato.objects.filter(funcionario_id=funcionario_id, vigencia_inicio__lte=data_fim))
+        return LinhaEscalas.montar(data_inicio, data_fim, dias, contratos)
+    
     def _get_contrato_vigente(self, funcionario: Funcionario, data: date) -> Optional[Contrato]:
         """Obtém o contrato vigente para o funcionário na data especificada"""
-        return Contrato.objects.filter(
-            funcionario=funcionario,
-            vigencia_inicio__lte=data
-        ).filter(
-            Q(vigencia_fim__isnull=True) | Q(vigencia_fim__gte=data)
-        ).order_by('-vigencia_inicio').first()
+        return Contrato.vigentes_em(data).filter(funcionario=funcionario).first()
+
+
+class ValidacaoEscalas:
+    """
+    Situação de cada Escala gravada nas regras trabalhistas (campos valida e
+    codigos_violacao), para listas e calendários filtrarem pela coluna sem
+    validar linha a linha.
+    
+    Uma alteração só muda a situação dos dias cujas regras dependem do dia
+    alterado: o anterior e o seguinte (interjornada, folga do 12x36), a semana
+    de segunda a domingo (carga semanal) e a sequência sem DSR (até o máximo
+    de dias consecutivos para cada lado). revalidar_alteracao recalcula só essa
+    janela; as regras são avaliadas com contexto extra em volta dela.
+    """
+    
+    FUNCIONARIOS_POR_LOTE = 100
+    LOTE_GRAVACAO = 2000
+    
+    def __init__(self, regras=None):
+        self.regras = regras or obter_regras()
+        self.calendario = CalendarioEscalas()
+        self.alcance = max(1, self.regras.parametros['max_dias_consecutivos'])
+        self.contexto = max(JANELA_DIAS, self.alcance)
+    
+    def janela(self, data_inicio: date, data_fim: date) -> Tuple[date, date]:
+        """Dias cuja situação pode mudar com uma alteração entre as datas"""
+        inicio = min(data_inicio - timedelta(days=data_inicio.weekday()), data_inicio - timedelta(days=self.alcance))
+        fim = max(data_fim + timedelta(days=6 - data_fim.weekday()), data_fim + timedelta(days=self.alcance))
+        return inicio, fim
+    
+    def revalidar_alteracao(self, funcionario_id: int, data_inicio: date, data_fim: date = None) -> Dict:
+        """Revalida as escalas afetadas pela alteração do funcionário entre as datas"""
+        inicio, fim = self.janela(data_inicio, data_fim or data_inicio)
+        return self.revalidar([funcionario_id], inicio, fim)
+    
+    def revalidar(self, funcionarios=None, data_inicio: date = None, data_fim: date = None) -> Dict:
+        """
+        Recalcula e grava a situação das escalas gravadas no período (sem datas:
+        todo o histórico), só atualizando as que mudaram.
+        Retorna {id da escala: (valida, codigos_violacao)} das avaliadas.
+        """
+        escalas = Escala.objects.all()
+        if funcionarios is not None:
+            escalas = escalas.filter(funcionario_id__in=funcionarios)
+        if data_inicio:
+            escalas = escalas.filter(data__gte=data_inicio)
+        if data_fim:
+            escalas = escalas.filter(data__lte=data_fim)
+        
+        if data_inicio is None or data_fim is None:
+            limites = escalas.aggregate(inicio=Min('data'), fim=Max('data'))
+            if limites['inicio'] is None:
+                return {}
+            data_inicio, data_fim = data_inicio or limites['inicio'], data_fim or limites['fim']
+        if funcionarios is None:
+            funcionarios = list(escalas.order_by('funcionario_id').values_list('funcionario_id', flat=True).distinct())
+        funcionarios = list(funcionarios)
+        
+        situacoes = {}
+        for posicao in range(0, len(funcionarios), self.FUNCIONARIOS_POR_LOTE):
+            situacoes.update(self._revalidar_lote(
+                funcionarios[posicao:posicao + self.FUNCIONARIOS_POR_LOTE], data_inicio, data_fim
+            ))
+        return situacoes
+    
+    def classificar(self, escalas: List[Escala], contratos: List[Contrato]):
+        """
+        Preenche a situação de escalas ainda não gravadas (caminhos com bulk_create
+        e dias gerados pelas recorrências), com todas as escalas e contratos dos
+        funcionários em memória. As gravadas entram só como vizinhas: mantêm a
+        situação gravada.
+        """
+        por_funcionario = {}
+        for escala in escalas:
+            por_funcionario.setdefault(escala.funcionario_id, []).append(escala)
+        contratos_funcionario = {}
+        for contrato in contratos:
+            contratos_funcionario.setdefault(contrato.funcionario_id, []).append(contrato)
+        
+        for funcionario_id, escalas_funcionario in por_funcionario.items():
+            datas = [escala.data for escala in escalas_funcionario]
+            linha = LinhaEscalas.montar(
+                min(datas), max(datas),
+                {escala.data: DiaEscala.da_escala(escala) for escala in escalas_funcionario},
+                contratos_funcionario.get(funcionario_id, [])
+            )
+            for escala in escalas_funcionario:
+                if escala.pk is None:
+                    escala.valida, escala.codigos_violacao = self._situacao(linha, escala.data)
+    
+    def _revalidar_lote(self, funcionarios: List[int], data_inicio: date, data_fim: date) -> Dict:
+        inicio = data_inicio - timedelta(days=self.contexto)
+        fim = data_fim + timedelta(days=self.contexto)
+        
+        dias = {funcionario_id: {} for funcionario_id in funcionarios}
+        gravadas = {funcionario_id: [] for funcionario_id in funcionarios}
+        for escala in self.calendario.escalas(inicio, fim, funcionarios):
+            dias[escala.funcionario_id][escala.data] = DiaEscala.da_escala(escala)
+            if escala.pk and data_inicio <= escala.data <= data_fim:
+                gravadas[escala.funcionario_id].append(escala)
+        
+        contratos = {funcionario_id: [] for funcionario_id in funcionarios}
+        for contrato in Contrato.objects.filter(funcionario_id__in=funcionarios, vigencia_inicio__lte=fim):
+            contratos[contrato.funcionario_id].append(contrato)
+        
+        situacoes = {}
+        alteradas = []
+        for funcionario_id in funcionarios:
+            if not gravadas[funcionario_id]:
+                continue
+            linha = LinhaEscalas.montar(inicio, fim, dias[funcionario_id], contratos[funcionario_id])
+            for escala in gravadas[funcionario_id]:
+                situacao = self._situacao(linha, escala.data)
+                situacoes[escala.pk] = situacao
+                if (escala.valida, escala.codigos_violacao) != situacao:
+                    escala.valida, escala.codigos_violacao = situacao
+                    alteradas.append(escala)
+        
+        if alteradas:
+            # bulk_update não preenche o auto_now (sincronização incremental)
+            agora = timezone.now()
+            for escala in alteradas:
+                escala.updated_at = agora
+            Escala.objects.bulk_update(
+                alteradas, ['valida', 'codigos_violacao', 'updated_at'], batch_size=self.LOTE_GRAVACAO
+            )
+            Funcionario.incrementar_versao({escala.funcionario_id for escala in alteradas})
+        return situacoes
+    
+    def _situacao(self, linha: LinhaEscalas, data: date) -> Tuple[bool, str]:
+        codigos = self.regras.violacoes_do_dia(linha, linha.indice(data))
+        return not codigos, ','.join(codigos)
 
 
 class CalculadoraJornada:
@@ -209,6 +541,9 @@ class CalculadoraJornada:
     Implementa cálculos conforme legislação trabalhista brasileira.
     """
     
+    # Tempo após o fim previsto da escala em que a saída ainda fecha a jornada (horas extras)
+    TOLERANCIA_SAIDA = timedelta(hours=4)
+    
     def __init__(self):
         try:
             self.periodo_noturno_inicio, self.periodo_noturno_fim = ConfiguracaoSistema.get_periodo_noturno()
@@ -219,13 +554,13 @@ class CalculadoraJornada:
             self.hora_noturna_minutos = 52.5
     
     def calcular_jornada_diaria(self, funcionario: Funcionario, data: date) -> Dict:
-        """Calcula a jornada diária completa com todos os adicionais"""
-        pontos = Ponto.objects.filter(
-            funcionario=funcionario,
-            timestamp__date=data
-        ).order_by('timestamp')
+        """
+        Calcula a jornada do dia com todos os adicionais. A jornada é a iniciada
+        na data: um turno noturno inclui a saída registrada no dia seguinte.
+        """
+        pontos = self.jornadas_periodo(funcionario, data, data).get(data)
         
-        if not pontos.exists():
+        if not pontos:
             return {
                 'jornada_normal': 0,
                 'horas_extras': 0,
@@ -234,44 +569,99 @@ class CalculadoraJornada:
                 'pausas': 0
             }
         
-        # Agrupa pontos por tipo
-        entradas = pontos.filter(tipo_registro='entrada')
-        saidas = pontos.filter(tipo_registro='saida')
-        pausas_inicio = pontos.filter(tipo_registro='pausa_inicio')
-        pausas_fim = pontos.filter(tipo_registro='pausa_fim')
+        contrato = self._get_contrato_vigente(funcionario, data)
+        return self.calcular_jornada_pontos(pontos, contrato)
+    
+    def jornadas_periodo(self, funcionario: Funcionario, data_inicio: date, data_fim: date,
+                         escalas: List[Escala] = None) -> Dict[date, List[Ponto]]:
+        """
+        Pontos do funcionário agrupados pela data da jornada (ver separar_jornadas).
+        escalas: as do funcionário da véspera de data_inicio até data_fim, se já carregadas.
+        """
+        if escalas is None:
+            escalas = CalendarioEscalas().escalas(
+                data_inicio - timedelta(days=1), data_fim, [funcionario.pk],
+                colunas={'descanso', 'fim_previsto'}, relacoes=()
+            )
+        inicio = timezone.make_aware(datetime.combine(data_inicio - timedelta(days=1), time.min))
+        fim = timezone.make_aware(datetime.combine(data_fim + timedelta(days=2), time.min))
+        pontos = Ponto.objects.filter(
+            funcionario=funcionario,
+            timestamp__gte=inicio,
+            timestamp__lt=fim
+        ).order_by('timestamp')
         
+        jornadas = self.separar_jornadas(pontos, self.limites_jornada(escalas))
+        return {dia: lista for dia, lista in jornadas.items() if data_inicio <= dia <= data_fim}
+    
+    def limites_jornada(self, escalas: List[Escala]) -> Dict:
+        """Término previsto de cada escala de trabalho, por (funcionário, data)"""
+        return {
+            (escala.funcionario_id, escala.data): escala.fim_previsto
+            for escala in escalas
+            if not escala.descanso and escala.fim_previsto
+        }
+    
+    def separar_jornadas(self, pontos, limites: Dict = None) -> Dict[date, List[Ponto]]:
+        """
+        Agrupa os pontos de um funcionário (em ordem de horário) pela data da
+        jornada a que pertencem. A entrada abre a jornada na sua data local e os
+        registros seguintes entram nela até a saída, mesmo depois da meia-noite.
+        A jornada aberta vale até o fim do dia ou, se a escala do dia (limites, por
+        funcionário e data) termina depois, até o fim previsto mais TOLERANCIA_SAIDA;
+        registros posteriores sem nova entrada ficam na própria data.
+        """
+        limites = limites or {}
+        jornadas = {}
+        aberta = None
+        for ponto in pontos:
+            momento = timezone.localtime(ponto.timestamp)
+            if aberta and momento > aberta[1]:
+                aberta = None
+            
+            if ponto.tipo_registro == 'entrada':
+                dia = momento.date()
+                limite = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+                fim_previsto = limites.get((ponto.funcionario_id, dia))
+                if fim_previsto:
+                    limite = max(limite, fim_previsto + self.TOLERANCIA_SAIDA)
+                aberta = (dia, limite)
+            
+            jornadas.setdefault(aberta[0] if aberta else momento.date(), []).append(ponto)
+            if ponto.tipo_registro == 'saida':
+                aberta = None
+        return jornadas
+    
+    def calcular_jornada_pontos(self, pontos: List[Ponto], contrato: Optional[Contrato]) -> Dict:
+        """
+        Calcula a jornada a partir dos pontos já carregados (em ordem de horário).
+        Cada entrada forma par com a saída seguinte e cada início de pausa com o
+        retorno seguinte. Usado pelo cálculo individual e pelo fechamento diário em lote.
+        """
         total_trabalhado = 0
         total_pausas = 0
         minutos_noturnos = 0
         
-        # Calcula períodos trabalhados
-        for i, entrada in enumerate(entradas):
-            try:
-                saida = saidas[i]
-                periodo_minutos = int((saida.timestamp - entrada.timestamp).total_seconds() / 60)
-                total_trabalhado += periodo_minutos
-                
+        # Calcula períodos trabalhados e pausas (registro sem par é ignorado)
+        entrada = pausa_inicio = None
+        for ponto in pontos:
+            if ponto.tipo_registro == 'entrada':
+                entrada = ponto
+            elif ponto.tipo_registro == 'saida' and entrada:
+                total_trabalhado += int((ponto.timestamp - entrada.timestamp).total_seconds() / 60)
                 # Calcula minutos noturnos neste período
-                minutos_noturnos += self._calcular_minutos_noturnos(entrada.timestamp, saida.timestamp)
-                
-            except IndexError:
-                # Entrada sem saída correspondente
-                continue
-        
-        # Calcula pausas
-        for i, pausa_inicio in enumerate(pausas_inicio):
-            try:
-                pausa_fim = pausas_fim[i]
-                pausa_minutos = int((pausa_fim.timestamp - pausa_inicio.timestamp).total_seconds() / 60)
-                total_pausas += pausa_minutos
-            except IndexError:
-                continue
+                minutos_noturnos += self._calcular_minutos_noturnos(entrada.timestamp, ponto.timestamp)
+                entrada = None
+            elif ponto.tipo_registro == 'pausa_inicio':
+                pausa_inicio = ponto
+            elif ponto.tipo_registro == 'pausa_fim' and pausa_inicio:
+                total_pausas += int((ponto.timestamp - pausa_inicio.timestamp).total_seconds() / 60)
+                pausa_inicio = None
         
         # Subtrai pausas do tempo trabalhado
         total_trabalhado -= total_pausas
         
         # Calcula horas extras
-        contrato = self._get_contrato_vigente(funcionario, data)
         jornada_normal = min(total_trabalhado, contrato.carga_diaria_max if contrato else 480)
         horas_extras = max(0, total_trabalhado - jornada_normal)
         
@@ -295,9 +685,25 @@ class CalculadoraJornada:
         if not contrato:
             return {'credito': 0, 'debito': 0, 'saldo': 0}
         
-        jornada_prevista = contrato.carga_diaria_max
-        jornada_realizada = jornada['total_trabalhado']
-        
+        escala = CalendarioEscalas().escala_do_dia(funcionario, data)
+        return self.calcular_credito_debito(
+            jornada['total_trabalhado'], contrato, self.jornada_prevista(escala, contrato)
+        )
+    
+    def jornada_prevista(self, escala: Optional[Escala], contrato: Contrato) -> int:
+        """Minutos previstos no dia: duração da escala (0 no descanso) ou, sem escala, a carga do contrato"""
+        if escala is None:
+            return contrato.carga_diaria_max
+        return 0 if escala.descanso else escala.duracao_minutos
+    
+    def calcular_credito_debito(self, jornada_realizada: int, contrato: Contrato,
+                                jornada_prevista: Optional[int] = None) -> Dict:
+        """
+        Converte a jornada realizada em crédito ou débito conforme o contrato.
+        A jornada prevista padrão é a carga diária máxima do contrato.
+        """
+        if jornada_prevista is None:
+            jornada_prevista = contrato.carga_diaria_max
         diferenca = jornada_realizada - jornada_prevista
         
         if diferenca > 0:
@@ -316,44 +722,25 @@ class CalculadoraJornada:
         }
     
     def _calcular_minutos_noturnos(self, inicio: datetime, fim: datetime) -> int:
-        """Calcula quantos minutos foram trabalhados no período noturno"""
-        minutos_noturnos = 0
-        
-        # Converte para time objects para comparação
-        inicio_time = inicio.time()
-        fim_time = fim.time()
+        """
+        Calcula quantos minutos foram trabalhados no período noturno.
         
-        # Caso 1: Período totalmente diurno
-        if (inicio_time >= self.periodo_noturno_fim and 
-            fim_time <= self.periodo_noturno_inicio):
-            return 0
+        Horários com fuso são convertidos para o horário local antes.
+        """
+        if timezone.is_aware(inicio):
+            inicio = timezone.make_naive(inicio)
+        if timezone.is_aware(fim):
+            fim = timezone.make_naive(fim)
         
-        # Caso 2: Período cruza a meia-noite
+        # Período cruza a meia-noite
         if fim < inicio:
             fim += timedelta(days=1)
         
-        # Calcula intersecção com período noturno
-        periodo_atual = inicio
-        while periodo_atual < fim:
-            hora_atual = periodo_atual.time()
-            
-            # Verifica se está no período noturno
-            if (hora_atual >= self.periodo_noturno_inicio or 
-                hora_atual < self.periodo_noturno_fim):
-                minutos_noturnos += 1
-            
-            periodo_atual += timedelta(minutes=1)
-        
-        return minutos_noturnos
+        return contar_minutos_noturnos(inicio, fim, self.periodo_noturno_inicio, self.periodo_noturno_fim)
     
     def _get_contrato_vigente(self, funcionario: Funcionario, data: date) -> Optional[Contrato]:
         """Obtém o contrato vigente para o funcionário na data especificada"""
-        return Contrato.objects.filter(
-            funcionario=funcionario,
-            vigencia_inicio__lte=data
-        ).filter(
-            Q(vigencia_fim__isnull=True) | Q(vigencia_fim__gte=data)
-        ).order_by('-vigencia_inicio').first()
+        return Contrato.vigentes_em(data).filter(funcionario=funcionario).first()
 
 
 class GerenciadorBancoHoras:
@@ -385,55 +772,77 @@ class GerenciadorBancoHoras:
     
     def obter_saldo_atual(self, funcionario: Funcionario) -> Dict:
         """Obtém o saldo atual do banco de horas"""
-        registros = BancoHoras.objects.filter(
-            funcionario=funcionario,
+        return self.obter_saldos([funcionario.pk])[funcionario.pk]
+    
+    def obter_saldos(self, funcionarios) -> Dict[int, Dict]:
+        """Saldo atual de cada funcionário (lista de ids), com uma query agrupada"""
+        # Registros próximos ao vencimento (30 dias)
+        vencendo = Q(data_vencimento__lte=date.today() + timedelta(days=30), data_vencimento__gte=date.today())
+        totais = BancoHoras.objects.filter(
+            funcionario_id__in=funcionarios,
             compensado=False
-        )
-        
-        total_credito = registros.aggregate(Sum('credito_minutos'))['credito_minutos__sum'] or 0
-        total_debito = registros.aggregate(Sum('debito_minutos'))['debito_minutos__sum'] or 0
-        saldo_atual = total_credito - total_debito
-        
-        # Verifica registros próximos ao vencimento (30 dias)
-        data_limite = date.today() + timedelta(days=30)
-        vencendo = registros.filter(
-            data_vencimento__lte=data_limite,
-            data_vencimento__gte=date.today()
-        )
+        ).values('funcionario_id').annotate(
+            credito=Sum('credito_minutos'),
+            debito=Sum('debito_minutos'),
+            vencendo=Count('id', filter=vencendo),
+            minutos_vencendo=Sum('saldo_minutos', filter=vencendo),
+        ).order_by()
+        
+        saldos = {}
+        for linha in totais:
+            total_credito = linha['credito'] or 0
+            total_debito = linha['debito'] or 0
+            saldos[linha['funcionario_id']] = {
+                'saldo_atual': total_credito - total_debito,
+                'total_credito': total_credito,
+                'total_debito': total_debito,
+                'registros_vencendo': linha['vencendo'],
+                'minutos_vencendo': linha['minutos_vencendo'] or 0
+            }
         
-        return {
-            'saldo_atual': saldo_atual,
-            'total_credito': total_credito,
-            'total_debito': total_debito,
-            'registros_vencendo': vencendo.count(),
-            'minutos_vencendo': vencendo.aggregate(Sum('saldo_minutos'))['saldo_minutos__sum'] or 0
-        }
+        # Funcionários sem registros em aberto
+        for funcionario_id in funcionarios:
+            saldos.setdefault(funcionario_id, {
+                'saldo_atual': 0, 'total_credito': 0, 'total_debito': 0,
+                'registros_vencendo': 0, 'minutos_vencendo': 0
+            })
+        return saldos
     
     def processar_vencimentos(self, data_referencia: date = None) -> List[Dict]:
         """Processa registros vencidos do banco de horas"""
         if data_referencia is None:
             data_referencia = date.today()
         
-        registros_vencidos = BancoHoras.objects.filter(
+        registros_vencidos = list(BancoHoras.objects.filter(
             data_vencimento__lt=data_referencia,
             compensado=False,
             saldo_minutos__gt=0  # Apenas créditos não compensados
-        )
+        ).select_related('funcionario'))
         
         resultados = []
+        agora = timezone.now()
         for registro in registros_vencidos:
             # Marca como compensado (será pago como hora extra)
             registro.compensado = True
             registro.observacoes += f"\nVencido em {data_referencia} - Convertido para hora extra"
-            registro.save()
+            # bulk_update não preenche o auto_now (sincronização incremental)
+            registro.updated_at = agora
             
             resultados.append({
-                'funcionario': registro.funcionario,
+                'funcionario': registro.funcionario_id,
+                'funcionario_nome': registro.funcionario.nome,
                 'data_referencia': registro.data_referencia,
                 'minutos_vencidos': registro.saldo_minutos,
                 'valor_hora_extra': self._calcular_valor_hora_extra(registro)
             })
         
+        if registros_vencidos:
+            with transaction.atomic():
+                BancoHoras.objects.bulk_update(
+                    registros_vencidos, ['compensado', 'observacoes', 'updated_at'], batch_size=1000
+                )
+                Funcionario.incrementar_versao({registro.funcionario_id for registro in registros_vencidos})
+        
         return resultados
     
     def compensar_horas(self, funcionario: Funcionario, minutos_compensar: int, 
@@ -468,6 +877,345 @@ class GerenciadorBancoHoras:
         return registro.saldo_minutos
 
 
+class FechamentoDiario:
+    """
+    Fechamento do dia para todos os funcionários ativos da empresa.
+    Carrega contratos, escalas, folgas e pontos do dia com uma query cada,
+    separa os pontos por jornada (turnos noturnos terminam no dia seguinte),
+    calcula a jornada em memória e grava o banco de horas em lote (upsert).
+    Pode ser executado novamente para o mesmo dia sem duplicar registros.
+    """
+    
+    TAMANHO_LOTE = 1000
+    
+    def __init__(self):
+        self.calculadora = CalculadoraJornada()
+    
+    def fechar_dia(self, data: date) -> Dict:
+        """Fecha o dia: gera créditos/débitos (inclusive faltas) e sinaliza marcações incompletas"""
+        funcionarios = list(Funcionario.objects.filter(ativo=True).values_list('id', flat=True))
+        contratos = self._carregar_contratos(data)
+        pontos = self._carregar_pontos(data)
+        
+        # Escalas da véspera delimitam os turnos que terminam no dia; as do dia definem a jornada prevista
+        escalas = CalendarioEscalas().escalas(
+            data - timedelta(days=1), data,
+            colunas={'descanso', 'duracao_minutos', 'fim_previsto'}, relacoes=()
+        )
+        limites = self.calculadora.limites_jornada(escalas)
+        escalas_dia = {escala.funcionario_id: escala for escala in escalas if escala.data == data}
+        folgas = set(Folga.objects.filter(data=data).values_list('funcionario_id', flat=True))
+        
+        # Registros já compensados não são recalculados
+        compensados = set(BancoHoras.objects.filter(
+            data_referencia=data, compensado=True
+        ).values_list('funcionario_id', flat=True))
+        
+        resultado = {
+            'data': data,
+            'funcionarios': len(funcionarios),
+            'registros': 0,
+            'faltas': 0,
+            'marcacoes_incompletas': 0,
+            'sem_contrato': 0,
+            'compensados': 0,
+        }
+        
+        registros = []
+        for funcionario_id in funcionarios:
+            pontos_dia = self.calculadora.separar_jornadas(
+                pontos.get(funcionario_id, []), limites
+            ).get(data, [])
+            escala = escalas_dia.get(funcionario_id)
+            escalado = escala is not None and not escala.descanso and funcionario_id not in folgas
+            if not pontos_dia and not escalado:
+                continue
+            
+            contrato = contratos.get(funcionario_id)
+            if not contrato:
+                resultado['sem_contrato'] += 1
+                continue
+            if funcionario_id in compensados:
+                resultado['compensados'] += 1
+                continue
+            
+            # Na folga todo o tempo trabalhado é crédito
+            jornada_prevista = 0 if funcionario_id in folgas else self.calculadora.jornada_prevista(escala, contrato)
+            if pontos_dia:
+                jornada = self.calculadora.calcular_jornada_pontos(pontos_dia, contrato)
+                calculo = self.calculadora.calcular_credito_debito(
+                    jornada['total_trabalhado'], contrato, jornada_prevista
+                )
+                observacoes = self._verificar_marcacoes(pontos_dia)
+                if observacoes:
+                    resultado['marcacoes_incompletas'] += 1
+            else:
+                # Dia de escala sem nenhum registro de ponto: falta
+                calculo = self.calculadora.calcular_credito_debito(0, contrato, jornada_prevista)
+                observacoes = ['Falta: nenhum registro de ponto em dia de escala']
+                resultado['faltas'] += 1
+            
+            registros.append(BancoHoras(
+                funcionario_id=funcionario_id,
+                data_referencia=data,
+                credito_minutos=calculo['credito'],
+                debito_minutos=calculo['debito'],
+                # bulk_create não chama save(): saldo e vencimento são calculados aqui
+                saldo_minutos=calculo['saldo'],
+                data_vencimento=data + relativedelta(months=contrato.banco_horas_prazo_meses),
+                observacoes='\n'.join(observacoes),
+            ))
+        
+        with transaction.atomic():
+            BancoHoras.objects.bulk_create(
+                registros,
+                batch_size=self.TAMANHO_LOTE,
+                update_conflicts=True,
+                unique_fields=['funcionario', 'data_referencia'],
+                update_fields=[
+                    'credito_minutos', 'debito_minutos', 'saldo_minutos',
+                    'data_vencimento', 'observacoes', 'updated_at',
+                ],
+            )
+            Funcionario.incrementar_versao({registro.funcionario_id for registro in registros})
+        
+        resultado['registros'] = len(registros)
+        return resultado
+    
+    def _carregar_contratos(self, data: date) -> Dict[int, Contrato]:
+        """Contrato vigente na data por funcionário (o de início mais recente)"""
+        contratos = Contrato.vigentes_em(data).filter(
+            funcionario__ativo=True
+        ).order_by('funcionario_id', 'vigencia_inicio')
+        return {contrato.funcionario_id: contrato for contrato in contratos}
+    
+    def _carregar_pontos(self, data: date) -> Dict[int, List[Ponto]]:
+        """
+        Pontos da véspera ao dia seguinte (horário local) agrupados por funcionário,
+        em ordem de horário: cobrem as jornadas que atravessam a meia-noite.
+        """
+        inicio = timezone.make_aware(datetime.combine(data - timedelta(days=1), time.min))
+        fim = timezone.make_aware(datetime.combine(data + timedelta(days=2), time.min))
+        
+        pontos = {}
+        consulta = Ponto.objects.filter(
+            funcionario__ativo=True,
+            timestamp__gte=inicio,
+            timestamp__lt=fim
+        ).only('funcionario_id', 'timestamp', 'tipo_registro').order_by('funcionario_id', 'timestamp')
+        for ponto in consulta.iterator(chunk_size=self.TAMANHO_LOTE):
+            pontos.setdefault(ponto.funcionario_id, []).append(ponto)
+        return pontos
+    
+    def _verificar_marcacoes(self, pontos: List[Ponto]) -> List[str]:
+        """Aponta marcações sem par (entrada sem saída, pausa sem retorno)"""
+        tipos = [ponto.tipo_registro for ponto in pontos]
+        alertas = []
+        
+        entradas, saidas = tipos.count('entrada'), tipos.count('saida')
+        if entradas > saidas:
+            alertas.append(f'Marcação incompleta: {entradas - saidas} entrada(s) sem saída')
+        elif saidas > entradas:
+            alertas.append(f'Marcação incompleta: {saidas - entradas} saída(s) sem entrada')
+        
+        pausas_inicio, pausas_fim = tipos.count('pausa_inicio'), tipos.count('pausa_fim')
+        if pausas_inicio != pausas_fim:
+            alertas.append('Marcação incompleta: pausa sem início ou retorno')
+        
+        return alertas
+
+
+class SincronizacaoIncremental:
+    """
+    Sincronização incremental (delta) do app móvel.
+    Alterações vêm do updated_at de cada coleção e exclusões da tabela
+    RegistroExcluido (gravada por triggers). O token guarda o instante da
+    consulta e o último registro de exclusão entregue; sem alterações, a
+    sincronização custa uma única query sobre os índices.
+    Registros gravados até SINCRONIZACAO_MARGEM_SEGUNDOS antes do token são
+    reenviados, cobrindo transações ainda abertas no instante da consulta
+    (o cliente aplica por id, então a repetição não tem efeito).
+    """
+    
+    # Coleção -> (model, relações usadas pelos serializers)
+    COLECOES = {
+        'escalas': (Escala, ['funcionario']),
+        'escalas_recorrentes': (EscalaRecorrente, ['funcionario', 'escala_predefinida']),
+        'pontos': (Ponto, ['funcionario', 'escala']),
+        'banco_horas': (BancoHoras, ['funcionario']),
+        'configuracoes': (ConfiguracaoSistema, []),
+    }
+    EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    
+    def __init__(self, colecoes=None):
+        self.colecoes = [nome for nome in self.COLECOES if colecoes is None or nome in colecoes]
+        self.margem = timedelta(seconds=getattr(settings, 'SINCRONIZACAO_MARGEM_SEGUNDOS', 60))
+        self.retencao = timedelta(days=getattr(settings, 'SINCRONIZACAO_RETENCAO_DIAS', 90))
+    
+    @classmethod
+    def gerar_token(cls, instante: datetime, ultimo_excluido: int) -> str:
+        return f'{(instante - cls.EPOCA) // timedelta(microseconds=1)}-{ultimo_excluido}'
+    
+    @classmethod
+    def ler_token(cls, token: str) -> Tuple[datetime, int]:
+        """(instante, último registro de exclusão entregue) do token; ValueError se inválido"""
+        try:
+            microssegundos, ultimo_excluido = (int(parte) for parte in token.split('-'))
+        except ValueError:
+            raise ValueError('Token de sincronização inválido')
+        return cls.EPOCA + timedelta(microseconds=microssegundos), ultimo_excluido
+    
+    def sincronizar(self, token: str = None, funcionario_id: int = None) -> Dict:
+        """
+        Registros alterados e ids excluídos desde o token, por coleção.
+        Sem token, ou com token mais antigo que a retenção das exclusões, faz a
+        carga completa (completa=True: o cliente substitui os dados locais).
+        """
+        agora = timezone.now()
+        desde, ultimo_excluido = self.ler_token(token) if token else (None, 0)
+        completa = desde is None or desde < agora - self.retencao
+        if completa:
+            desde, ultimo_excluido = None, 0
+        else:
+            desde -= self.margem
+        
+        # Uma query: maior id alterado de cada coleção e do registro de exclusões (NULL: nada mudou)
+        excluidos = self._excluidos(ultimo_excluido, funcionario_id)
+        consultas = [
+            self._alterados(nome, desde, funcionario_id).values(colecao=Value(nome)).annotate(ultimo=Max('pk')).order_by()
+            for nome in self.colecoes
+        ]
+        consultas.append(excluidos.values(colecao=Value('excluidos')).annotate(ultimo=Max('id')).order_by())
+        alteradas = {
+            linha['colecao']: linha['ultimo']
+            for linha in consultas[0].union(*consultas[1:], all=True)
+            if linha['ultimo'] is not None
+        }
+        
+        resultado = {
+            'completa': completa,
+            'alterados': {nome: [] for nome in self.colecoes},
+            'excluidos': {nome: [] for nome in self.colecoes},
+        }
+        for nome in self.colecoes:
+            if nome in alteradas:
+                relacoes = self.COLECOES[nome][1]
+                resultado['alterados'][nome] = list(
+                    self._alterados(nome, desde, funcionario_id).select_related(*relacoes).order_by('pk')
+                )
+        
+        # Exclusões gravadas depois da primeira query ficam para a próxima sincronização
+        ultimo_excluido = alteradas.get('excluidos', ultimo_excluido)
+        if 'excluidos' in alteradas and not completa:
+            colecoes = {self.COLECOES[nome][0]._meta.db_table: nome for nome in self.colecoes}
+            for tabela, objeto_id in excluidos.filter(id__lte=ultimo_excluido).values_list('tabela', 'objeto_id'):
+                resultado['excluidos'][colecoes[tabela]].append(objeto_id)
+        
+        resultado['token'] = self.gerar_token(agora, ultimo_excluido)
+        return resultado
+    
+    def purgar_excluidos(self) -> int:
+        """Remove registros de exclusão além da retenção (tokens dessa idade já exigem carga completa)"""
+        limite = timezone.now() - self.retencao - self.margem
+        removidos, _ = RegistroExcluido.objects.filter(excluido_em__lt=limite).delete()
+        return removidos
+    
+    def _alterados(self, nome: str, desde: Optional[datetime], funcionario_id: Optional[int]):
+        modelo = self.COLECOES[nome][0]
+        queryset = modelo.objects.all()
+        if desde is not None:
+            queryset = queryset.filter(updated_at__gt=desde)
+        if funcionario_id is not None and RegistroExcluido.TABELAS[modelo._meta.db_table]:
+            queryset = queryset.filter(funcionario_id=funcionario_id)
+        return queryset
+    
+    def _excluidos(self, ultimo_excluido: int, funcionario_id: Optional[int]):
+        tabelas = [self.COLECOES[nome][0]._meta.db_table for nome in self.colecoes]
+        queryset = RegistroExcluido.objects.filter(id__gt=ultimo_excluido, tabela__in=tabelas)
+        if funcionario_id is not None:
+            queryset = queryset.filter(Q(funcionario_id=funcionario_id) | Q(funcionario_id__isnull=True))
+        return queryset
+
+
+class MapaCobertura:
+    """
+    Quantidade de pessoas escaladas por faixa de horário em cada dia.
+    Usa um vetor de diferenças: cada escala soma 1 na faixa em que começa e
+    subtrai 1 na faixa em que termina (inclusive no dia seguinte, quando passa
+    da meia-noite); a soma acumulada dá a lotação de todas as faixas de uma vez.
+    """
+    
+    def calcular(self, data_inicio: date, data_fim: date, intervalo_minutos: int = 60,
+                 funcionarios: Optional[List[int]] = None, cargo: str = None,
+                 tipo_escala: str = None) -> Dict:
+        """Retorna a matriz dias × faixas com a lotação de cada faixa"""
+        faixas_dia = 1440 // intervalo_minutos
+        total_dias = (data_fim - data_inicio).days + 1
+        total_faixas = total_dias * faixas_dia
+        diferencas = [0] * (total_faixas + 1)
+        
+        filtro_funcionarios = None
+        if funcionarios or cargo:
+            filtro_funcionarios = Funcionario.objects.all()
+            if funcionarios:
+                filtro_funcionarios = filtro_funcionarios.filter(id__in=funcionarios)
+            if cargo:
+                filtro_funcionarios = filtro_funcionarios.filter(cargo=cargo)
+            filtro_funcionarios = filtro_funcionarios.values('id')
+        
+        # O dia anterior entra por causa das escalas que terminam depois da meia-noite
+        escalas = CalendarioEscalas().escalas(
+            data_inicio - timedelta(days=1), data_fim, filtro_funcionarios,
+            colunas={'hora_inicio', 'hora_fim', 'descanso', 'tipo_escala'}, relacoes=(),
+            tipo_escala=tipo_escala, ordenar=False
+        )
+        
+        total_escalas = 0
+        for escala in escalas:
+            if escala.descanso or not escala.hora_inicio or not escala.hora_fim:
+                continue
+            
+            data, hora_inicio, hora_fim = escala.data, escala.hora_inicio, escala.hora_fim
+            inicio = hora_inicio.hour * 60 + hora_inicio.minute
+            fim = hora_fim.hour * 60 + hora_fim.minute
+            if fim <= inicio:
+                fim += 1440
+            
+            # Faixas parcialmente ocupadas contam a pessoa
+            base = (data - data_inicio).days * faixas_dia
+            primeira = max(0, base + inicio // intervalo_minutos)
+            ultima = min(total_faixas, base - (-fim // intervalo_minutos))
+            if primeira >= ultima:
+                continue
+            
+            diferencas[primeira] += 1
+            diferencas[ultima] -= 1
+            total_escalas += 1
+        
+        matriz = []
+        acumulado = 0
+        for dia in range(total_dias):
+            linha = []
+            for faixa in range(dia * faixas_dia, (dia + 1) * faixas_dia):
+                acumulado += diferencas[faixa]
+                linha.append(acumulado)
+            matriz.append(linha)
+        
+        return {
+            'data_inicio': data_inicio,
+            'data_fim': data_fim,
+            'intervalo_minutos': intervalo_minutos,
+            'faixas': [
+                f'{(faixa * intervalo_minutos) // 60:02d}:{(faixa * intervalo_minutos) % 60:02d}'
+                for faixa in range(faixas_dia)
+            ],
+            'dias': [data_inicio + timedelta(days=dia) for dia in range(total_dias)],
+            'matriz': matriz,
+            'maximo': max((max(linha) for linha in matriz), default=0),
+            'total_escalas': total_escalas,
+        }
+
+
 class ProcessadorPontos:
     """
     Processador de registros de ponto com validações automáticas.
@@ -476,14 +1224,11 @@ class ProcessadorPontos:
     
     def registrar_ponto(self, funcionario: Funcionario, tipo_registro: str, 
                        timestamp: datetime, localizacao: Tuple[float, float] = None,
-                       observacoes: str = '') -> Dict:
+                       observacoes: str = '', chave_idempotencia: str = None) -> Dict:
         """Registra um ponto com validações automáticas"""
         
-        # Busca escala do dia
-        escala = Escala.objects.filter(
-            funcionario=funcionario,
-            data=timestamp.date()
-        ).first()
+        # Busca escala do dia (os dias gerados por recorrência não são gravados para o ponto)
+        escala = CalendarioEscalas().escala_do_dia(funcionario, timestamp.date())
         
         # Validações básicas
         validacoes = self._validar_registro_ponto(funcionario, tipo_registro, timestamp, escala)
@@ -494,16 +1239,31 @@ class ProcessadorPontos:
             }
         
         # Cria o registro de ponto
-        ponto = Ponto.objects.create(
-            funcionario=funcionario,
-            escala=escala,
-            timestamp=timestamp,
-            tipo_registro=tipo_registro,
-            localizacao_lat=localizacao[0] if localizacao else None,
-            localizacao_lng=localizacao[1] if localizacao else None,
-            observacoes=observacoes,
-            validado=validacoes.get('auto_validado', False)
-        )
+        try:
+            with transaction.atomic():
+                ponto = Ponto.objects.create(
+                    funcionario=funcionario,
+                    escala=escala if escala and escala.pk else None,
+                    timestamp=timestamp,
+                    tipo_registro=tipo_registro,
+                    localizacao_lat=localizacao[0] if localizacao else None,
+                    localizacao_lng=localizacao[1] if localizacao else None,
+                    observacoes=observacoes,
+                    validado=validacoes.get('auto_validado', False),
+                    chave_idempotencia=chave_idempotencia
+                )
+        except IntegrityError:
+            if not chave_idempotencia:
+                raise
+            # Repetição concorrente com a mesma chave: vale o ponto gravado primeiro
+            ponto = Ponto.objects.get(chave_idempotencia=chave_idempotencia)
+            return {
+                'sucesso': True,
+                'ponto_id': ponto.id,
+                'validado': ponto.validado,
+                'alertas': [],
+                'repetido': True
+            }
         
         # Atualiza banco de horas se for final do dia
         if tipo_registro == 'saida':
@@ -533,9 +1293,57 @@ class ProcessadorPontos:
             'total_registros': pontos.count()
         }
     
+    def validar_registros(self, pontos: List[Ponto]) -> Dict[int, Dict]:
+        """
+        Validações de pontos gravados (listagens), por id: as escalas do período e o
+        último registro de cada funcionário por dia são carregados uma vez, em vez
+        das consultas de _validar_registro_ponto para cada ponto
+        """
+        if not pontos:
+            return {}
+        funcionarios = {ponto.funcionario_id for ponto in pontos}
+        datas = [ponto.timestamp.date() for ponto in pontos]
+        inicio, fim = min(datas), max(datas)
+        
+        escalas = {
+            (escala.funcionario_id, escala.data): escala
+            for escala in CalendarioEscalas().escalas(
+                inicio, fim, funcionarios,
+                colunas={'hora_inicio', 'hora_fim', 'descanso'}, relacoes=(), ordenar=False
+            )
+        }
+        # Último tipo registrado por (funcionário, dia), como na consulta de _validar_registro_ponto
+        ultimos = {}
+        registros = Ponto.objects.filter(
+            funcionario_id__in=funcionarios, timestamp__date__range=[inicio, fim]
+        ).order_by('timestamp').values_list('funcionario_id', 'timestamp', 'tipo_registro')
+        for funcionario_id, timestamp, tipo_registro in registros:
+            ultimos[(funcionario_id, timezone.localtime(timestamp).date())] = tipo_registro
+        
+        validacoes = {}
+        for ponto, data in zip(pontos, datas):
+            chave = (ponto.funcionario_id, data)
+            # Pontos de dias gerados por escala recorrente não têm escala gravada
+            escala = ponto.escala if ponto.escala_id else escalas.get(chave)
+            validacoes[ponto.pk] = self._avaliar_registro_ponto(
+                ponto.tipo_registro, ponto.timestamp, escala, ultimos.get(chave)
+            )
+        return validacoes
+    
     def _validar_registro_ponto(self, funcionario: Funcionario, tipo_registro: str,
                                timestamp: datetime, escala: Escala = None) -> Dict:
         """Valida um registro de ponto antes de salvá-lo"""
+        ultimo_ponto = Ponto.objects.filter(
+            funcionario=funcionario,
+            timestamp__date=timestamp.date()
+        ).order_by('-timestamp').first()
+        return self._avaliar_registro_ponto(
+            tipo_registro, timestamp, escala, ultimo_ponto.tipo_registro if ultimo_ponto else None
+        )
+    
+    def _avaliar_registro_ponto(self, tipo_registro: str, timestamp: datetime,
+                                escala: Optional[Escala], ultimo_tipo: Optional[str]) -> Dict:
+        """Validações de um registro diante da escala do dia e do último tipo registrado no dia"""
         alertas = []
         auto_validado = True
         
@@ -550,30 +1358,26 @@ class ProcessadorPontos:
         # Verifica horário em relação à escala
         if escala and not escala.descanso:
             hora_registro = timestamp.time()
+            tolerancia = obter_regras().tolerancia_ponto
             
             if tipo_registro == 'entrada':
                 if escala.hora_inicio:
                     diferenca = self._calcular_diferenca_minutos(hora_registro, escala.hora_inicio)
-                    if abs(diferenca) > 15:  # Tolerância de 15 minutos
+                    if abs(diferenca) > tolerancia:
                         alertas.append(f'Entrada com {abs(diferenca)}min de diferença do programado')
             
             elif tipo_registro == 'saida':
                 if escala.hora_fim:
                     diferenca = self._calcular_diferenca_minutos(hora_registro, escala.hora_fim)
-                    if abs(diferenca) > 15:
+                    if abs(diferenca) > tolerancia:
                         alertas.append(f'Saída com {abs(diferenca)}min de diferença do programado')
         
         # Verifica sequência lógica de registros
-        ultimo_ponto = Ponto.objects.filter(
-            funcionario=funcionario,
-            timestamp__date=timestamp.date()
-        ).order_by('-timestamp').first()
-        
-        if ultimo_ponto:
-            if not self._validar_sequencia_pontos(ultimo_ponto.tipo_registro, tipo_registro):
+        if ultimo_tipo:
+            if not self._validar_sequencia_pontos(ultimo_tipo, tipo_registro):
                 return {
                     'valido': False,
-                    'erro': f'Sequência inválida: {ultimo_ponto.tipo_registro} → {tipo_registro}'
+                    'erro': f'Sequência inválida: {ultimo_tipo} → {tipo_registro}'
                 }
         
         return {
@@ -625,44 +1429,68 @@ class ConsultorEscalasBrasil:
         return escalas
     
     def aplicar_escala_predefinida(self, funcionario: Funcionario, escala_id: int,
-                                  data_inicio: date, data_fim: date) -> Dict:
-        """Aplica uma escala predefinida para um período"""
+                                  data_inicio: date, data_fim: date = None,
+                                  hora_inicio: time = None, hora_fim: time = None,
+                                  pausa_minutos: int = 60) -> Dict:
+        """
+        Aplica uma escala predefinida a partir de data_inicio (até data_fim, se informada).
+        Grava apenas a recorrência; os dias são gerados na leitura.
+        """
         try:
             escala_predefinida = EscalaPredefinida.objects.get(id=escala_id)
         except EscalaPredefinida.DoesNotExist:
             return {'sucesso': False, 'erro': 'Escala predefinida não encontrada'}
         
-        # Verifica se funcionário pode usar esta escala
-        contrato = Contrato.objects.filter(
-            funcionario=funcionario,
-            vigencia_inicio__lte=data_inicio
-        ).order_by('-vigencia_inicio').first()
+        ciclo = escala_predefinida.ciclo()
+        if not ciclo:
+            return {'sucesso': False, 'erro': f'Padrão da escala {escala_predefinida.nome} não reconhecido'}
+        dias_trabalho, dias_ciclo = ciclo
         
-        if escala_predefinida.nome == '12x36' and (not contrato or not contrato.permite_12x36):
-            return {'sucesso': False, 'erro': 'Funcionário não autorizado para escala 12x36'}
+        # Um dia de trabalho por ciclo: escala de revezamento (12x36, 24x48)
+        revezamento = dias_trabalho == 1 and dias_ciclo > 1
         
-        # Gera escalas para o período
-        escalas_criadas = []
-        data_atual = data_inicio
+        hora_inicio = hora_inicio or (time(7, 0) if revezamento else time(8, 0))
+        hora_fim = hora_fim or (time(19, 0) if revezamento else time(17, 0))
         
-        while data_atual <= data_fim:
-            # Lógica específica por tipo de escala
-            if escala_predefinida.nome == '12x36':
-                escalas_criadas.extend(self._gerar_escala_12x36(funcionario, data_atual, data_fim))
-                break
-            elif escala_predefinida.nome == '6x1':
-                escalas_criadas.extend(self._gerar_escala_6x1(funcionario, data_atual, data_fim))
-                break
-            elif escala_predefinida.nome == '5x2':
-                escalas_criadas.extend(self._gerar_escala_5x2(funcionario, data_atual, data_fim))
-                break
+        # Duração máxima e pausa mínima conforme as regras da empresa
+        regras = obter_regras()
+        violacoes = regras.validar_turno(hora_inicio, hora_fim, pausa_minutos)
+        if violacoes:
+            return {'sucesso': False, 'erro': '; '.join(mensagem for _, mensagem in violacoes)}
+        
+        # Verifica se funcionário pode usar esta escala
+        if revezamento and regras.ativa('escala_12x36'):
+            contrato = Contrato.objects.filter(
+                funcionario=funcionario,
+                vigencia_inicio__lte=data_inicio
+            ).order_by('-vigencia_inicio').first()
             
-            data_atual += timedelta(days=1)
+            if not contrato or not contrato.permite_12x36:
+                return {'sucesso': False, 'erro': f'Funcionário não autorizado para escala {escala_predefinida.nome}'}
+        
+        # O 5x2 segue a semana: o ciclo começa na segunda-feira
+        data_ancora = data_inicio
+        if (dias_trabalho, dias_ciclo) == (5, 7):
+            data_ancora = data_inicio - timedelta(days=data_inicio.weekday())
+        
+        recorrente = EscalaRecorrente.objects.create(
+            funcionario=funcionario,
+            escala_predefinida=escala_predefinida,
+            data_ancora=data_ancora,
+            dias_trabalho=dias_trabalho,
+            dias_ciclo=dias_ciclo,
+            hora_inicio=hora_inicio,
+            hora_fim=hora_fim,
+            pausa_minutos=pausa_minutos,
+            tipo_escala='12x36' if revezamento else 'normal',
+            vigencia_inicio=data_inicio,
+            vigencia_fim=data_fim
+        )
         
         return {
             'sucesso': True,
-            'escalas_criadas': len(escalas_criadas),
-            'periodo': f'{data_inicio} a {data_fim}'
+            'escala_recorrente': recorrente.id,
+            'periodo': f'{data_inicio} a {data_fim}' if data_fim else f'a partir de {data_inicio}'
         }
     
     def _verificar_legalidade_escala(self, escala: EscalaPredefinida) -> bool:
@@ -683,112 +1511,3 @@ class ConsultorEscalasBrasil:
             '4x2': 'Escala industrial. Requer pausas adequadas para jornadas longas.'
         }
         return observacoes.get(escala.nome, '')
-    
-    def _gerar_escala_12x36(self, funcionario: Funcionario, data_inicio: date, data_fim: date) -> List[Escala]:
-        """Gera escalas no padrão 12x36"""
-        escalas = []
-        data_atual = data_inicio
-        trabalha = True  # Começa trabalhando
-        
-        while data_atual <= data_fim:
-            if trabalha:
-                # Dia de trabalho (12h)
-                escala = Escala.objects.create(
-                    funcionario=funcionario,
-                    data=data_atual,
-                    hora_inicio=time(7, 0),  # 07:00
-                    hora_fim=time(19, 0),    # 19:00
-                    pausa_minutos=60,
-                    tipo_escala='12x36',
-                    descanso=False
-                )
-                escalas.append(escala)
-                
-                # Próximo dia é folga
-                data_folga = data_atual + timedelta(days=1)
-                if data_folga <= data_fim:
-                    folga = Escala.objects.create(
-                        funcionario=funcionario,
-                        data=data_folga,
-                        descanso=True,
-                        tipo_escala='12x36'
-                    )
-                    escalas.append(folga)
-                
-                data_atual += timedelta(days=2)  # Pula para depois da folga
-            else:
-                data_atual += timedelta(days=1)
-            
-            trabalha = not trabalha
-        
-        return escalas
-    
-    def _gerar_escala_6x1(self, funcionario: Funcionario, data_inicio: date, data_fim: date) -> List[Escala]:
-        """Gera escalas no padrão 6x1"""
-        escalas = []
-        data_atual = data_inicio
-        dias_trabalhados = 0
-        
-        while data_atual <= data_fim:
-            if dias_trabalhados < 6:
-                # Dia de trabalho
-                escala = Escala.objects.create(
-                    funcionario=funcionario,
-                    data=data_atual,
-                    hora_inicio=time(8, 0),   # 08:00
-                    hora_fim=time(17, 0),     # 17:00
-                    pausa_minutos=60,
-                    tipo_escala='normal',
-                    descanso=False
-                )
-                escalas.append(escala)
-                dias_trabalhados += 1
-            else:
-                # Dia de descanso (DSR)
-                folga = Escala.objects.create(
-                    funcionario=funcionario,
-                    data=data_atual,
-                    descanso=True,
-                    tipo_escala='normal'
-                )
-                escalas.append(folga)
-                dias_trabalhados = 0  # Reinicia o ciclo
-            
-            data_atual += timedelta(days=1)
-        
-        return escalas
-    
-    def _gerar_escala_5x2(self, funcionario: Funcionario, data_inicio: date, data_fim: date) -> List[Escala]:
-        """Gera escalas no padrão 5x2 (segunda a sexta)"""
-        escalas = []
-        data_atual = data_inicio
-        
-        while data_atual <= data_fim:
-            # 0 = segunda, 6 = domingo
-            dia_semana = data_atual.weekday()
-            
-            if dia_semana < 5:  # Segunda a sexta (0-4)
-                # Dia de trabalho
-                escala = Escala.objects.create(
-                    funcionario=funcionario,
-                    data=data_atual,
-                    hora_inicio=time(8, 0),   # 08:00
-                    hora_fim=time(17, 0),     # 17:00
-                    pausa_minutos=60,
-                    tipo_escala='normal',
-                    descanso=False
-                )
-                escalas.append(escala)
-            else:
-                # Fim de semana - descanso
-                folga = Escala.objects.create(
-                    funcionario=funcionario,
-                    data=data_atual,
-                    descanso=True,
-                    tipo_escala='normal'
-                )
-                escalas.append(folga)
-            
-            data_atual += timedelta(days=1)
-        
-        return escalas
\ No newline at end of file
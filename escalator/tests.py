@@ -1,3 +1,1091 @@
-from django.test import TestCase
+"""
+Testes de orçamento de queries das APIs REST.
 
-# Create your tests here.
+Cada endpoint do router é chamado com uma empresa pequena e depois com a
+mesma empresa ampliada (mais funcionários e mais dias). A quantidade de
+queries precisa ser a mesma nos dois cenários e não pode passar do
+orçamento declarado; se falhar, a mensagem mostra as queries repetidas
+(formato normalizado), que normalmente apontam o N+1.
+
+As regras trabalhistas compiladas são testadas à parte, sobre linhas de
+escala montadas em memória.
+"""
+
+import re
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.apps import apps as django_apps
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.authentication import EmpresaJWTAuthentication, invalidar_usuario_cache
+from core.licencas import invalidar_direitos_empresa
+from core.models import Empresa, Licenca
+from core.routers import get_db_for_request, get_empresa_database, set_db_for_request
+from core.views import metricas
+from usuarios.models import Usuario
+from .models import (
+    Funcionario, Escala, Ponto, BancoHoras, Contrato,
+    ConfiguracaoSistema, EscalaPredefinida, EscalaRecorrente, Folga, RegistroExcluido,
+    MIGRACAO_SITUACAO, revalidar_escalas_apos_migrate
+)
+from .regras import PARAMETROS, DiaEscala, LinhaEscalas, RegrasTrabalhistas
+from .services import CalculadoraJornada, FechamentoDiario, SincronizacaoIncremental, ValidacaoEscalas
+
+# Cenários (funcionários, dias) comparados em cada teste
+CENARIO_PEQUENO = (2, 3)
+CENARIO_GRANDE = (5, 7)
+
+
+def normalizar_sql(sql):
+    """Reduz uma query ao seu formato, sem valores literais"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class OrcamentoQueriesTestCase(TestCase):
+    """Garante que as APIs executam um número fixo de queries, independente do volume"""
+
+    databases = {'default', 'master'}
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(
+            username='gestor', email='gestor@exemplo.com', password='senha-teste',
+            first_name='Gestor', last_name='Teste'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+        self.hoje = timezone.localdate()
+        self.funcionarios = []
+        self.dias = 0
+        ConfiguracaoSistema.objects.create(chave='interjornada_minima_minutos', valor='660')
+
+    # Massa de dados
+
+    def semear(self, total_funcionarios, total_dias):
+        """Amplia a empresa até ter total_funcionarios com total_dias de escalas, pontos e banco de horas"""
+        for indice in range(len(self.funcionarios), total_funcionarios):
+            # O primeiro funcionário é o próprio usuário autenticado (endpoint /me)
+            usuario = self.usuario if indice == 0 else Usuario.objects.create_user(
+                username=f'func{indice}', email=f'func{indice}@exemplo.com', password='senha-teste',
+                first_name='Func', last_name=str(indice)
+            )
+            funcionario = Funcionario.objects.create(
+                usuario=usuario, nome=f'Funcionário {indice}', matricula=f'M{indice:04d}', cargo='Operador'
+            )
+            Contrato.objects.create(
+                funcionario=funcionario,
+                vigencia_inicio=self.hoje - timedelta(days=400),
+                permite_12x36=True
+            )
+            self.funcionarios.append(funcionario)
+            self._semear_dias(funcionario, 0, self.dias)
+
+        for funcionario in self.funcionarios:
+            self._semear_dias(funcionario, self.dias, total_dias)
+
+        self.dias = max(self.dias, total_dias)
+
+    def _semear_dias(self, funcionario, dia_inicial, dia_final):
+        escalas, pontos, bancos, folgas = [], [], [], []
+        for deslocamento in range(dia_inicial, dia_final):
+            data = self.hoje - timedelta(days=deslocamento + 1)
+            descanso = data.weekday() == 6
+            escalas.append(Escala(
+                funcionario=funcionario, data=data, descanso=descanso,
+                hora_inicio=None if descanso else time(8, 0),
+                hora_fim=None if descanso else time(17, 0),
+            ))
+            if descanso:
+                folgas.append(Folga(funcionario=funcionario, data=data, motivo='DSR'))
+                continue
+
+            for hora, tipo in ((8, 'entrada'), (12, 'pausa_inicio'), (13, 'pausa_fim'), (17, 'saida')):
+                pontos.append(Ponto(
+                    funcionario=funcionario, tipo_registro=tipo, validado=True,
+                    timestamp=timezone.make_aware(datetime.combine(data, time(hora, 5))),
+                ))
+            bancos.append(BancoHoras(
+                funcionario=funcionario, data_referencia=data, credito_minutos=10, saldo_minutos=10,
+                data_vencimento=self.hoje + timedelta(days=10),
+            ))
+
+        escalas = Escala.objects.bulk_create(escalas)
+        por_data = {escala.data: escala for escala in escalas}
+        for ponto in pontos:
+            ponto.escala = por_data.get(timezone.localtime(ponto.timestamp).date())
+        Ponto.objects.bulk_create(pontos)
+        BancoHoras.objects.bulk_create(bancos)
+        Folga.objects.bulk_create(folgas)
+
+    # Medição
+
+    def _executar(self, metodo, url, dados):
+        with CaptureQueriesContext(connections['default']) as contexto:
+            if metodo == 'get':
+                resposta = self.client.get(url, dados)
+            else:
+                resposta = self.client.post(url, dados, format='json')
+        self.assertLess(resposta.status_code, 400, f'{metodo.upper()} {url}: {resposta.status_code} {resposta.content[:300]}')
+        return [normalizar_sql(query['sql']) for query in contexto.captured_queries]
+
+    def assertOrcamento(self, orcamento, metodo, requisicao, preparar=None):
+        """
+        Executa a requisição nos dois cenários e compara a contagem de queries.
+        `requisicao` recebe o teste e retorna (url, dados), para usar ids da massa atual;
+        `preparar`, se informado, completa a massa de cada cenário antes da requisição.
+        """
+        self.semear(*CENARIO_PEQUENO)
+        if preparar:
+            preparar(self)
+        url, dados = requisicao(self)
+        pequeno = self._executar(metodo, url, dados)
+
+        self.semear(*CENARIO_GRANDE)
+        if preparar:
+            preparar(self)
+        url, dados = requisicao(self)
+        grande = self._executar(metodo, url, dados)
+
+        if len(pequeno) == len(grande) and len(grande) <= orcamento:
+            return
+
+        contagem_pequeno = Counter(pequeno)
+        repetidas = [
+            f'  {total}x (antes {contagem_pequeno.get(sql, 0)}x): {sql}'
+            for sql, total in Counter(grande).most_common() if total > 1
+        ]
+        self.fail(
+            f'{metodo.upper()} {url}: {len(pequeno)} queries com {CENARIO_PEQUENO} '
+            f'e {len(grande)} com {CENARIO_GRANDE} (funcionários, dias); orçamento {orcamento}.\n'
+            'Queries repetidas:\n' + ('\n'.join(repetidas) or '  nenhuma')
+        )
+
+    def _recorrencia(self, funcionario, inicio, nome='5x2', **horario):
+        """Aplica a escala predefinida ao funcionário a partir de inicio, sem gravar os dias"""
+        horario = {'hora_inicio': time(8, 0), 'hora_fim': time(17, 0), 'pausa_minutos': 60, **horario}
+        return EscalaRecorrente.objects.create(
+            funcionario=funcionario, escala_predefinida=EscalaPredefinida.objects.get(nome=nome),
+            data_ancora=inicio, vigencia_inicio=inicio, **horario
+        )
+
+    def _recorrencias(self):
+        """Uma escala recorrente para cada funcionário que ainda não tem"""
+        com_recorrencia = set(EscalaRecorrente.objects.values_list('funcionario_id', flat=True))
+        for funcionario in self.funcionarios:
+            if funcionario.id not in com_recorrencia:
+                self._recorrencia(funcionario, self.hoje)
+
+    def _periodo(self):
+        return {
+            'funcionario': self.funcionarios[0].id,
+            'data_inicio': str(self.hoje - timedelta(days=self.dias)),
+            'data_fim': str(self.hoje - timedelta(days=1)),
+        }
+
+    # Funcionários
+
+    def test_funcionarios_lista(self):
+        self.assertOrcamento(3, 'get', lambda t: ('/api/funcionarios/', {}))
+
+    def test_funcionarios_busca(self):
+        self.assertOrcamento(3, 'get', lambda t: ('/api/funcionarios/', {'search': 'funcionario'}))
+
+    def test_busca_indexada(self):
+        """O índice ignora acentos e acompanha as gravações (triggers)"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[1]
+        funcionario.nome = 'João da Conceição'
+        funcionario.save()
+        ponto = Ponto.objects.filter(funcionario=self.funcionarios[0]).first()
+        ponto.observacoes = 'Esqueceu o crachá'
+        ponto.save()
+
+        resposta = self.client.get('/api/funcionarios/', {'search': 'joao conceicao'})
+        self.assertEqual([item['id'] for item in resposta.json()['results']], [funcionario.id])
+        resposta = self.client.get('/api/pontos/', {'search': 'cracha', 'omit': 'validacoes'})
+        self.assertEqual([item['id'] for item in resposta.json()['results']], [ponto.id])
+        resposta = self.client.get('/api/escalas/', {'search': 'conceição'})
+        self.assertEqual({item['funcionario'] for item in resposta.json()['results']}, {funcionario.id})
+
+        funcionario.delete()
+        resposta = self.client.get('/api/funcionarios/', {'search': 'conceicao'})
+        self.assertEqual(resposta.json()['count'], 0)
+
+    def test_funcionarios_detalhe(self):
+        self.assertOrcamento(3, 'get', lambda t: (f'/api/funcionarios/{t.funcionarios[0].id}/', {}))
+
+    def test_funcionarios_me(self):
+        self.assertOrcamento(4, 'get', lambda t: ('/api/funcionarios/me/', {}))
+
+    def test_funcionarios_escalas_mes(self):
+        self.assertOrcamento(4, 'get', lambda t: (
+            f'/api/funcionarios/{t.funcionarios[0].id}/escalas_mes/',
+            {'ano': t.hoje.year, 'mes': t.hoje.month}
+        ))
+
+    def test_funcionarios_saldo_banco_horas(self):
+        self.assertOrcamento(5, 'get', lambda t: (f'/api/funcionarios/{t.funcionarios[0].id}/saldo_banco_horas/', {}))
+
+    def test_funcionarios_escalas_mes_condicional(self):
+        """Com If-None-Match atual, só a versão dos dados é consultada; gravações invalidam o ETag"""
+        self.semear(*CENARIO_PEQUENO)
+        url = f'/api/funcionarios/{self.funcionarios[0].id}/escalas_mes/'
+        etag = self.client.get(url)['ETag']
+
+        with CaptureQueriesContext(connections['default']) as contexto:
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], etag)
+        self.assertEqual(len(contexto.captured_queries), 1)
+
+        Ponto.objects.create(funcionario=self.funcionarios[0], tipo_registro='entrada', timestamp=timezone.now())
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_funcionarios_versao_dados_instancia_defasada(self):
+        """Gravar o cadastro com a versão lida antes de outro incremento não a faz voltar"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = Funcionario.objects.get(pk=self.funcionarios[0].pk)
+        versao = funcionario.versao_dados
+        Ponto.objects.create(funcionario=funcionario, tipo_registro='entrada', timestamp=timezone.now())
+
+        funcionario.cargo = 'Supervisor'
+        funcionario.save()
+        funcionario.refresh_from_db()
+        self.assertEqual(funcionario.cargo, 'Supervisor')
+        # +1 do ponto e +1 do próprio cadastro
+        self.assertEqual(funcionario.versao_dados, versao + 2)
+
+    def test_funcionarios_compensar_horas(self):
+        self.assertOrcamento(8, 'post', lambda t: (
+            f'/api/funcionarios/{t.funcionarios[0].id}/compensar_horas/',
+            {'minutos_compensar': 5, 'data_compensacao': str(t.hoje + timedelta(days=t.dias))}
+        ))
+
+    # Contratos
+
+    def test_contratos_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/contratos/', {}))
+
+    def test_contratos_detalhe(self):
+        self.assertOrcamento(1, 'get', lambda t: (f'/api/contratos/{Contrato.objects.first().id}/', {}))
+
+    def test_contratos_vigentes(self):
+        self.assertOrcamento(1, 'get', lambda t: ('/api/contratos/vigentes/', {}))
+
+    def test_contratos_validar_conformidade(self):
+        self.assertOrcamento(1, 'get', lambda t: (f'/api/contratos/{Contrato.objects.first().id}/validar_conformidade/', {}))
+
+    def test_contratos_validar_conformidade_limites_empresa(self):
+        """A conformidade segue os limites configurados na empresa"""
+        self.semear(*CENARIO_PEQUENO)
+        contrato = Contrato.objects.first()
+        url = f'/api/contratos/{contrato.id}/validar_conformidade/'
+        self.assertTrue(self.client.get(url).json()['conforme'])
+
+        ConfiguracaoSistema.objects.create(chave='jornada_maxima_minutos', valor=str(contrato.carga_diaria_max - 60))
+        resposta = self.client.get(url).json()
+        self.assertFalse(resposta['conforme'])
+        self.assertFalse(resposta['validacoes']['carga_diaria_valida'])
+        self.assertTrue(resposta['validacoes']['carga_semanal_valida'])
+        self.assertEqual(list(resposta['violacoes']), ['carga_diaria_max'])
+
+    # Escalas
+
+    def test_escalas_periodo_dias_gerados(self):
+        """Dias gerados pela recorrência (não gravados) aparecem no calendário e no mês do funcionário"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[0]
+        inicio = self.hoje + timedelta(days=40)
+        self._recorrencia(funcionario, inicio)
+        
+        fim = inicio + timedelta(days=13)
+        resposta = self.client.get('/api/escalas/periodo/', {
+            'funcionario': funcionario.id, 'data_inicio': str(inicio), 'data_fim': str(fim)
+        })
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        escalas = resposta.json()['escalas']
+        self.assertEqual(len(escalas), 14)
+        self.assertEqual(sum(1 for escala in escalas if escala['descanso']), 4)
+        self.assertTrue(all(escala['id'] is None and escala['updated_at'] for escala in escalas))
+        
+        resposta = self.client.get(
+            f'/api/funcionarios/{funcionario.id}/escalas_mes/', {'ano': inicio.year, 'mes': inicio.month}
+        )
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        datas = {escala['data'] for escala in resposta.json()['escalas']}
+        self.assertIn(str(inicio), datas)
+
+    def test_escalas_recorrentes_validacao(self):
+        """Recorrências seguem as regras de turno e a autorização de 12x36, como as escalas gravadas"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[1]
+        Contrato.objects.filter(funcionario=funcionario).update(permite_12x36=False)
+        predefinidas = dict(EscalaPredefinida.objects.values_list('nome', 'id'))
+        dados = {
+            'funcionario': funcionario.id, 'escala_predefinida': predefinidas['5x2'],
+            'vigencia_inicio': str(self.hoje), 'hora_inicio': '07:00', 'hora_fim': '21:00', 'pausa_minutos': 60,
+        }
+
+        resposta = self.client.post('/api/escalas-recorrentes/', dados, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.client.post('/api/escalas-recorrentes/', {
+            **dados, 'escala_predefinida': predefinidas['12x36'], 'hora_fim': '19:00'
+        }, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('escala_predefinida', resposta.json())
+        resposta = self.client.post('/api/escalas-recorrentes/', {**dados, 'hora_fim': '17:00'}, format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.content[:300])
+
+        aplicar = {
+            'funcionario': funcionario.id, 'escala_predefinida': predefinidas['6x1'],
+            'data_inicio': str(self.hoje), 'hora_inicio': '07:00', 'hora_fim': '21:00',
+        }
+        resposta = self.client.post('/api/escalas/aplicar_escala_predefinida/', aplicar, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(EscalaRecorrente.objects.filter(funcionario=funcionario).count(), 1)
+
+    def test_escalas_periodo_dias_gerados_validados(self):
+        """Os dias gerados são classificados nas regras em memória, sem queries por dia"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[1]
+        Contrato.objects.filter(funcionario=funcionario).update(permite_12x36=False)
+        inicio = self.hoje + timedelta(days=40)
+        self._recorrencia(funcionario, inicio, nome='12x36', hora_inicio=time(7, 0), hora_fim=time(19, 0))
+
+        consultas = []
+        for dias in (6, 13):
+            parametros = {
+                'funcionario': funcionario.id, 'data_inicio': str(inicio),
+                'data_fim': str(inicio + timedelta(days=dias)), 'valida': 'false',
+            }
+            with CaptureQueriesContext(connections['default']) as contexto:
+                resposta = self.client.get('/api/escalas/periodo/', parametros)
+            consultas.append(len(contexto.captured_queries))
+            escalas = resposta.json()['escalas']
+            self.assertEqual(len(escalas), dias // 2 + 1)
+            self.assertTrue(all(not escala['descanso'] and escala['violacoes'] for escala in escalas))
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_escalas_lista(self):
+        self.assertOrcamento(4, 'get', lambda t: ('/api/escalas/', {}))
+
+    def test_escalas_detalhe(self):
+        self.assertOrcamento(8, 'get', lambda t: (f'/api/escalas/{Escala.objects.filter(descanso=False).first().id}/', {}))
+
+    def test_escalas_periodo(self):
+        self.assertOrcamento(4, 'get', lambda t: ('/api/escalas/periodo/', t._periodo()))
+
+    def test_escalas_periodo_campos(self):
+        """?fields= poda a resposta e a consulta das escalas gravadas: sem o nome, sem o join do funcionário"""
+        self.semear(*CENARIO_PEQUENO)
+        campos = ['funcionario', 'data', 'hora_inicio', 'hora_fim']
+        with CaptureQueriesContext(connections['default']) as contexto:
+            resposta = self.client.get('/api/escalas/periodo/', {**self._periodo(), 'fields': ','.join(campos)})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(list(resposta.json()['escalas'][0]), campos)
+        gravadas = [query['sql'] for query in contexto.captured_queries if 'FROM "escala" ' in query['sql']]
+        self.assertEqual(len(gravadas), 1)
+        self.assertNotIn('"funcionario"."nome"', gravadas[0])
+
+    def test_escalas_simular(self):
+        self.assertOrcamento(4, 'post', lambda t: ('/api/escalas/simular/', {'escalas': [
+            {'funcionario': funcionario.id, 'data': str(t.hoje - timedelta(days=2)),
+             'hora_inicio': '06:00', 'hora_fim': '18:00'}
+            for funcionario in t.funcionarios
+        ]}))
+
+    def test_escalas_simular_sem_gravar(self):
+        """A simulação sobrepõe as propostas à escala gravada e não grava nada"""
+        self.semear(*CENARIO_PEQUENO)
+        escala = Escala.objects.filter(descanso=False).order_by('data').last()
+        anterior = escala.data - timedelta(days=1)
+        total = Escala.objects.count()
+        propostas = [
+            # Turno noturno na véspera: termina às 06:00 do dia da escala gravada (08:00)
+            {'funcionario': escala.funcionario_id, 'data': str(anterior),
+             'hora_inicio': '22:00', 'hora_fim': '06:00'},
+        ]
+
+        with CaptureQueriesContext(connections['default']) as contexto:
+            resposta = self.client.post('/api/escalas/simular/', {'escalas': propostas}, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        escritas = [query['sql'] for query in contexto.captured_queries
+                    if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(escritas, [])
+        self.assertEqual(Escala.objects.count(), total)
+        self.assertFalse(Escala.objects.get(pk=escala.pk).descanso)
+        self.assertFalse(Escala.objects.filter(funcionario_id=escala.funcionario_id, data=anterior,
+                                               hora_inicio=time(22, 0)).exists())
+
+        violacoes = resposta.json()['violacoes']
+        self.assertIn(
+            {'funcionario': escala.funcionario_id, 'data': str(escala.data), 'regra': 'interjornada',
+             'mensagem': 'Interjornada de 120min menor que mínimo de 660min'},
+            violacoes
+        )
+
+    def test_escalas_simular_dsr_configurado(self):
+        """Com mais de 7 dias consecutivos permitidos, a simulação apura o DSR como a escala gravada"""
+        ConfiguracaoSistema.objects.create(chave='max_dias_consecutivos', valor='10')
+        self.semear(1, 0)
+        funcionario = self.funcionarios[0]
+        dia = self.hoje + timedelta(days=30)
+        for deslocamento in range(10, 0, -1):
+            Escala.objects.create(funcionario=funcionario, data=dia - timedelta(days=deslocamento),
+                                  hora_inicio=time(8, 0), hora_fim=time(12, 0))
+
+        resposta = self.client.post('/api/escalas/simular/', {'escalas': [
+            {'funcionario': funcionario.id, 'data': str(dia), 'hora_inicio': '08:00', 'hora_fim': '12:00'}
+        ]}, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        simuladas = {violacao['regra'] for violacao in resposta.json()['violacoes']}
+        self.assertIn('dsr', simuladas)
+
+        gravada = Escala.objects.create(funcionario=funcionario, data=dia, hora_inicio=time(8, 0), hora_fim=time(12, 0))
+        gravada.refresh_from_db()
+        self.assertEqual(set(gravada.violacoes), simuladas)
+
+    def test_escalas_aplicar_escala_predefinida(self):
+        # A massa semeada em lote já entra classificada: a revalidação não regrava nenhuma escala
+        self.assertOrcamento(8, 'post', lambda t: ('/api/escalas/aplicar_escala_predefinida/', {
+            'funcionario': t.funcionarios[-1].id,
+            'escala_predefinida': EscalaPredefinida.objects.get(nome='6x1').id,
+            'data_inicio': str(t.hoje + timedelta(days=30)),
+        }), preparar=lambda t: ValidacaoEscalas().revalidar())
+
+    def test_escalas_otimizar(self):
+        self.assertOrcamento(15, 'post', lambda t: ('/api/escalas/otimizar/', {
+            'data_inicio': str(t.hoje + timedelta(days=10 * t.dias)),
+            'data_fim': str(t.hoje + timedelta(days=10 * t.dias + 6)),
+            'demanda': [{'hora_inicio': '08:00', 'hora_fim': '17:00', 'quantidade': 2}],
+            'preview': False,
+        }))
+
+    def test_escalas_otimizar_regras_configuradas(self):
+        """As escalas geradas respeitam o limite de dias sem DSR configurado, com os dias antes e depois do período"""
+        ConfiguracaoSistema.objects.create(chave='max_dias_consecutivos', valor='10')
+        self.semear(2, 0)
+        antes, depois = self.funcionarios
+        inicio = self.hoje + timedelta(days=30)
+        fim = inicio + timedelta(days=6)
+        for deslocamento in range(1, 11):
+            Escala.objects.create(funcionario=antes, data=inicio - timedelta(days=deslocamento),
+                                  hora_inicio=time(8, 0), hora_fim=time(12, 0))
+            Escala.objects.create(funcionario=depois, data=fim + timedelta(days=deslocamento),
+                                  hora_inicio=time(8, 0), hora_fim=time(12, 0))
+
+        resposta = self.client.post('/api/escalas/otimizar/', {
+            'data_inicio': str(inicio), 'data_fim': str(fim),
+            'funcionarios': [antes.id, depois.id],
+            'turnos': [{'hora_inicio': '08:00', 'hora_fim': '12:00'}],
+            'demanda': [{'hora_inicio': '08:00', 'hora_fim': '12:00', 'quantidade': 2}],
+            'preview': False,
+        }, format='json')
+        self.assertEqual(resposta.status_code, 201, resposta.content[:300])
+
+        geradas = {
+            (escala.funcionario_id, escala.data): escala
+            for escala in Escala.objects.filter(data__range=[inicio, fim])
+        }
+        self.assertEqual(len(geradas), 14)
+        # O 11º dia seguido seria o primeiro (ou o último) do período: fica de DSR
+        self.assertTrue(geradas[(antes.id, inicio)].descanso)
+        self.assertTrue(geradas[(depois.id, fim)].descanso)
+        self.assertEqual(sum(not escala.descanso for escala in geradas.values()), 12)
+        self.assertEqual(list(Escala.objects.filter(valida=False).values_list('data', 'codigos_violacao')), [])
+
+    def test_escalas_situacao_calculada_apos_migracao(self):
+        """Aplicar a migração da situação revalida as escalas existentes, gravadas como válidas"""
+        self.semear(1, 0)
+        Escala.objects.bulk_create([Escala(  # 14 horas: acima da jornada máxima
+            funcionario=self.funcionarios[0], data=self.hoje + timedelta(days=3),
+            hora_inicio=time(6, 0), hora_fim=time(20, 0),
+        )])
+        escala = Escala.objects.get()
+        self.assertTrue(escala.valida)
+
+        grafo = MigrationLoader(connections['default']).graph
+        escalator = django_apps.get_app_config('escalator')
+        anterior = grafo.nodes[('escalator', '0009_escala_previstos')]
+        revalidar_escalas_apos_migrate(escalator, 'default', plan=[(anterior, False)])
+        escala.refresh_from_db()
+        self.assertTrue(escala.valida)
+
+        situacao = grafo.nodes[MIGRACAO_SITUACAO]
+        revalidar_escalas_apos_migrate(escalator, 'default', plan=[(anterior, False), (situacao, False)])
+        escala.refresh_from_db()
+        self.assertFalse(escala.valida)
+        self.assertIn('duracao_maxima', escala.violacoes)
+
+    def test_escalas_recorrentes_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/escalas-recorrentes/', {}), preparar=lambda t: t._recorrencias())
+
+    def test_escalas_validar_periodo(self):
+        self.assertOrcamento(8, 'post', lambda t: ('/api/escalas/validar_periodo/', t._periodo()))
+
+    # Pontos
+
+    def test_pontos_lista(self):
+        self.assertOrcamento(5, 'get', lambda t: ('/api/pontos/', {}))
+
+    def test_pontos_lista_validacoes_do_detalhe(self):
+        """As validações calculadas em lote na lista são as mesmas do detalhe de cada ponto"""
+        self.semear(*CENARIO_PEQUENO)
+        ponto = Ponto.objects.order_by('-timestamp').first()
+        ponto.escala = None  # dia sem escala gravada: vale a do calendário
+        ponto.save()
+        Ponto.objects.create(
+            funcionario=self.funcionarios[1], tipo_registro='entrada',
+            timestamp=timezone.make_aware(datetime.combine(self.hoje - timedelta(days=1), time(17, 30))),
+        )
+
+        lista = self.client.get('/api/pontos/', {'page_size': 100}).json()['results']
+        self.assertTrue(any(not item['validacoes']['valido'] for item in lista))
+        for item in lista:
+            detalhe = self.client.get(f'/api/pontos/{item["id"]}/').json()
+            self.assertEqual(item['validacoes'], detalhe['validacoes'], item['id'])
+
+    def test_pontos_lista_sem_validacoes(self):
+        self.assertOrcamento(4, 'get', lambda t: ('/api/pontos/', {'omit': 'validacoes'}))
+
+    def test_pontos_detalhe(self):
+        self.assertOrcamento(2, 'get', lambda t: (f'/api/pontos/{Ponto.objects.first().id}/', {}))
+
+    def test_pontos_dia(self):
+        self.assertOrcamento(24, 'get', lambda t: (
+            '/api/pontos/dia/',
+            {'funcionario': t.funcionarios[0].id, 'data': str(t.hoje - timedelta(days=2))}
+        ))
+
+    def test_pontos_registrar_repeticao(self):
+        """Repetição com a mesma chave devolve o ponto original com uma query, sem gravar outro"""
+        self.semear(*CENARIO_PEQUENO)
+        dados = {
+            'funcionario': self.funcionarios[0].id, 'tipo_registro': 'entrada',
+            'timestamp': timezone.now().isoformat(), 'chave_idempotencia': 'app-0001',
+        }
+        original = self.client.post('/api/pontos/registrar/', dados, format='json')
+        self.assertEqual(original.status_code, 201, original.content[:300])
+        total = Ponto.objects.count()
+
+        with CaptureQueriesContext(connections['default']) as contexto:
+            repeticao = self.client.post('/api/pontos/registrar/', dados, format='json')
+        self.assertEqual(repeticao.status_code, 201)
+        self.assertEqual(repeticao.json(), original.json())
+        self.assertEqual(len(contexto.captured_queries), 1)
+        self.assertEqual(Ponto.objects.count(), total)
+
+        conflito = self.client.post('/api/pontos/registrar/', {**dados, 'tipo_registro': 'saida'}, format='json')
+        self.assertEqual(conflito.status_code, 409)
+
+    def test_pontos_periodo(self):
+        self.assertOrcamento(5, 'get', lambda t: ('/api/pontos/periodo/', t._periodo()))
+
+    # Banco de horas
+
+    def test_banco_horas_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/banco-horas/', {}))
+
+    def test_banco_horas_detalhe(self):
+        self.assertOrcamento(1, 'get', lambda t: (f'/api/banco-horas/{BancoHoras.objects.first().id}/', {}))
+
+    def test_banco_horas_saldos(self):
+        self.assertOrcamento(4, 'get', lambda t: ('/api/banco-horas/saldos/', {}))
+
+    def test_banco_horas_vencimentos(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/banco-horas/vencimentos/', {}))
+
+    def test_banco_horas_processar_vencimentos(self):
+        self.assertOrcamento(5, 'post', lambda t: (
+            '/api/banco-horas/processar_vencimentos/', {'data_referencia': str(t.hoje + timedelta(days=30))}
+        ))
+
+    def test_fechamento_turno_noturno(self):
+        """A saída após a meia-noite fecha a jornada iniciada na véspera, sem débito"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[0]
+        inicio = self.hoje + timedelta(days=30)
+        pontos = []
+        for deslocamento in range(3):
+            data = inicio + timedelta(days=deslocamento)
+            Escala.objects.create(funcionario=funcionario, data=data, hora_inicio=time(19, 0), hora_fim=time(7, 0))
+            for momento, tipo in (
+                (datetime.combine(data, time(19, 0)), 'entrada'),
+                (datetime.combine(data + timedelta(days=1), time(1, 0)), 'pausa_inicio'),
+                (datetime.combine(data + timedelta(days=1), time(2, 0)), 'pausa_fim'),
+                (datetime.combine(data + timedelta(days=1), time(7, 30)), 'saida'),
+            ):
+                pontos.append(Ponto(funcionario=funcionario, tipo_registro=tipo, timestamp=timezone.make_aware(momento)))
+        Ponto.objects.bulk_create(pontos)
+
+        data = inicio + timedelta(days=1)
+        resultado = FechamentoDiario().fechar_dia(data)
+        self.assertEqual((resultado['faltas'], resultado['marcacoes_incompletas']), (0, 0))
+        banco = BancoHoras.objects.get(funcionario=funcionario, data_referencia=data)
+        # 19:00 às 07:30 com 1h de pausa: 30 minutos além dos 660 previstos
+        self.assertEqual((banco.credito_minutos, banco.debito_minutos, banco.observacoes), (30, 0, ''))
+
+        jornada = CalculadoraJornada().calcular_jornada_diaria(funcionario, data)
+        self.assertEqual(jornada['total_trabalhado'], 690)
+        self.assertEqual(jornada['minutos_noturnos'], 420)
+
+    def test_fechamento_falta(self):
+        """A falta em dia de escala debita a duração prevista da escala"""
+        self.semear(*CENARIO_PEQUENO)
+        funcionario = self.funcionarios[0]
+        data = self.hoje + timedelta(days=30)
+        escala = Escala.objects.create(funcionario=funcionario, data=data, hora_inicio=time(7, 0), hora_fim=time(19, 0))
+        Folga.objects.create(funcionario=self.funcionarios[1], data=data, motivo='Folga')
+
+        resultado = FechamentoDiario().fechar_dia(data)
+        self.assertEqual(resultado['faltas'], 1)
+        banco = BancoHoras.objects.get(funcionario=funcionario, data_referencia=data)
+        self.assertEqual((banco.credito_minutos, banco.debito_minutos), (0, escala.duracao_minutos))
+        self.assertEqual(escala.duracao_minutos, 660)
+        self.assertFalse(BancoHoras.objects.filter(funcionario=self.funcionarios[1], data_referencia=data).exists())
+
+    # Configurações e escalas predefinidas
+
+    def test_configuracoes_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/configuracoes/', {}))
+
+    def test_configuracoes_periodo_noturno(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/configuracoes/periodo_noturno/', {}))
+
+    def test_configuracoes_interjornada(self):
+        self.assertOrcamento(1, 'get', lambda t: ('/api/configuracoes/interjornada/', {}))
+
+    def test_escalas_predefinidas_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/escalas-predefinidas/', {}))
+
+    def test_escalas_predefinidas_disponiveis(self):
+        self.assertOrcamento(1, 'get', lambda t: ('/api/escalas-predefinidas/disponiveis/', {}))
+
+    # Sincronização
+
+    def test_sync_carga_completa(self):
+        self.assertOrcamento(6, 'get', lambda t: ('/api/sync/', {}), preparar=lambda t: t._recorrencias())
+
+    def _sincronizar(self, token=None, **parametros):
+        resposta = self.client.get('/api/sync/', {**parametros, **({'token': token} if token else {})})
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        return resposta.json()
+
+    @override_settings(SINCRONIZACAO_MARGEM_SEGUNDOS=0)
+    def test_sync_delta_vazio(self):
+        """Sem alterações desde o token, a sincronização custa uma única query"""
+        self.semear(*CENARIO_GRANDE)
+        token = self._sincronizar()['token']
+
+        with CaptureQueriesContext(connections['default']) as contexto, \
+                CaptureQueriesContext(connections['master']) as contexto_master:
+            delta = self._sincronizar(token)
+        self.assertEqual(len(contexto.captured_queries) + len(contexto_master.captured_queries), 1)
+        self.assertFalse(delta['completa'])
+        for nome in SincronizacaoIncremental.COLECOES:
+            self.assertEqual(delta[nome], [], nome)
+            self.assertEqual(delta['excluidos'][nome], [], nome)
+
+    @override_settings(SINCRONIZACAO_MARGEM_SEGUNDOS=0)
+    def test_sync_delta_alteracao_e_exclusao(self):
+        """O delta traz só o registro alterado e as exclusões, inclusive as em cascata"""
+        self.semear(*CENARIO_PEQUENO)
+        token = self._sincronizar()['token']
+
+        ponto = Ponto.objects.filter(escala__isnull=False).first()
+        ponto.observacoes = 'Ajustado'
+        ponto.save()
+        # Os pontos da escala excluída saem em cascata (sem signals): os triggers registram todos
+        escala = Escala.objects.exclude(pk=ponto.escala_id).filter(descanso=False).first()
+        pontos_escala = set(escala.ponto_set.values_list('id', flat=True))
+        self.assertTrue(pontos_escala)
+        escala_id = escala.id
+        escala.delete()
+
+        delta = self._sincronizar(token)
+        self.assertFalse(delta['completa'])
+        self.assertEqual([item['id'] for item in delta['pontos']], [ponto.id])
+        self.assertEqual(delta['pontos'][0]['observacoes'], 'Ajustado')
+        self.assertEqual(delta['excluidos']['escalas'], [escala_id])
+        self.assertEqual(set(delta['excluidos']['pontos']), pontos_escala)
+
+        # O token do delta não repete o que já foi entregue
+        seguinte = self._sincronizar(delta['token'])
+        self.assertEqual(seguinte['pontos'], [])
+        self.assertEqual(seguinte['excluidos']['escalas'], [])
+
+    @override_settings(SINCRONIZACAO_MARGEM_SEGUNDOS=0)
+    def test_sync_exclusao_funcionario(self):
+        """Excluir o funcionário registra em cascata todos os seus registros, entregues só a ele"""
+        self.semear(*CENARIO_PEQUENO)
+        self._recorrencias()
+        excluido, outro = self.funcionarios[1].id, self.funcionarios[0].id
+        token = self._sincronizar()['token']
+
+        esperados = {
+            'escalas': set(Escala.objects.filter(funcionario_id=excluido).values_list('id', flat=True)),
+            'escalas_recorrentes': set(EscalaRecorrente.objects.filter(funcionario_id=excluido).values_list('id', flat=True)),
+            'pontos': set(Ponto.objects.filter(funcionario_id=excluido).values_list('id', flat=True)),
+            'banco_horas': set(BancoHoras.objects.filter(funcionario_id=excluido).values_list('id', flat=True)),
+        }
+        Funcionario.objects.get(pk=excluido).delete()
+
+        delta = self._sincronizar(token, funcionario=excluido)
+        for nome, ids in esperados.items():
+            self.assertTrue(ids, nome)
+            self.assertEqual(set(delta['excluidos'][nome]), ids, nome)
+
+        delta_outro = self._sincronizar(token, funcionario=outro)
+        for nome in esperados:
+            self.assertEqual(delta_outro['excluidos'][nome], [], nome)
+
+    def test_sync_token(self):
+        """O token guarda o instante e a última exclusão entregue; token inválido é recusado"""
+        instante = timezone.now()
+        token = SincronizacaoIncremental.gerar_token(instante, 42)
+        self.assertEqual(SincronizacaoIncremental.ler_token(token), (instante, 42))
+        with self.assertRaises(ValueError):
+            SincronizacaoIncremental.ler_token('abc')
+
+        resposta = self.client.get('/api/sync/', {'token': 'abc'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('token', resposta.json())
+
+    @override_settings(SINCRONIZACAO_RETENCAO_DIAS=30)
+    def test_sync_token_expirado(self):
+        """Token mais antigo que a retenção das exclusões exige a carga completa"""
+        self.semear(*CENARIO_PEQUENO)
+        antigo = SincronizacaoIncremental.gerar_token(timezone.now() - timedelta(days=31), 0)
+
+        delta = self._sincronizar(antigo)
+        self.assertTrue(delta['completa'])
+        self.assertEqual(len(delta['pontos']), Ponto.objects.count())
+        self.assertEqual(len(delta['escalas']), Escala.objects.count())
+
+        # As exclusões dessa idade podem ser purgadas: nenhum token válido ainda as pede
+        Escala.objects.filter(pk=Escala.objects.first().pk).delete()
+        RegistroExcluido.objects.update(excluido_em=timezone.now() - timedelta(days=31))
+        self.assertGreater(SincronizacaoIncremental().purgar_excluidos(), 0)
+        self.assertFalse(RegistroExcluido.objects.exists())
+
+    # Folgas
+
+    def test_folgas_lista(self):
+        self.assertOrcamento(2, 'get', lambda t: ('/api/folgas/', {}))
+
+    # Relatórios
+
+    def test_relatorios_jornada_funcionario(self):
+        self.assertOrcamento(8, 'post', lambda t: ('/api/relatorios/jornada_funcionario/', t._periodo()))
+
+    def test_relatorios_cobertura(self):
+        self.assertOrcamento(3, 'get', lambda t: ('/api/relatorios/cobertura/', {
+            'data_inicio': str(t.hoje - timedelta(days=t.dias)), 'data_fim': str(t.hoje - timedelta(days=1)),
+            'intervalo': 30, 'tipo_escala': 'normal',
+        }))
+
+    def test_relatorios_cobertura_tipo_escala(self):
+        """O filtro de tipo vale para dias gerados e gravados; a gravada sobrepõe o dia gerado"""
+        self.semear(*CENARIO_PEQUENO)
+        inicio = self.hoje + timedelta(days=7 - self.hoje.weekday())  # segunda-feira
+        self._recorrencia(self.funcionarios[0], inicio)
+        Escala.objects.create(
+            funcionario=self.funcionarios[0], data=inicio + timedelta(days=1), tipo_escala='extra',
+            hora_inicio=time(8, 0), hora_fim=time(12, 0),
+        )
+        periodo = {'data_inicio': str(inicio), 'data_fim': str(inicio + timedelta(days=6))}
+
+        normal = self.client.get('/api/relatorios/cobertura/', {**periodo, 'tipo_escala': 'normal'}).json()
+        self.assertEqual(normal['total_escalas'], 4)
+        self.assertEqual([linha[9] for linha in normal['matriz']], [1, 0, 1, 1, 1, 0, 0])
+        extra = self.client.get('/api/relatorios/cobertura/', {**periodo, 'tipo_escala': 'extra'}).json()
+        self.assertEqual(extra['total_escalas'], 1)
+        self.assertEqual([linha[9] for linha in extra['matriz']], [0, 1, 0, 0, 0, 0, 0])
+
+    def test_relatorios_horas_previstas(self):
+        self.assertOrcamento(5, 'get', lambda t: ('/api/relatorios/horas_previstas/', {
+            'data_inicio': str(t.hoje - timedelta(days=t.dias)), 'data_fim': str(t.hoje + timedelta(days=14)),
+        }), preparar=lambda t: t._recorrencias())
+
+    def test_relatorios_dashboard(self):
+        self.assertOrcamento(6, 'get', lambda t: ('/api/relatorios/dashboard/', {}))
+
+
+class RegrasTrabalhistasTestCase(SimpleTestCase):
+    """Regras compiladas avaliadas sobre linhas montadas em memória (sem banco)"""
+
+    SEGUNDA = date(2026, 3, 2)
+
+    def _linha(self, dias, **contrato):
+        """Linha a partir de SEGUNDA: cada dia é (início, fim[, pausa[, tipo]]) ou None para folga"""
+        contrato = Contrato(vigencia_inicio=self.SEGUNDA, **contrato)
+        escalas = []
+        for indice, dia in enumerate(dias):
+            data = self.SEGUNDA + timedelta(days=indice)
+            if dia is None:
+                escalas.append(DiaEscala(data, None, None, descanso=True))
+                continue
+            inicio, fim, pausa, tipo = dia + (60, 'normal')[len(dia) - 2:]
+            escalas.append(DiaEscala(data, time(*inicio), time(*fim), pausa, tipo))
+        return LinhaEscalas(self.SEGUNDA, escalas, [contrato] * len(escalas))
+
+    def _violacoes(self, regras, linha):
+        return [(nome, indice) for nome, indice, _ in regras.avaliar(linha, range(len(linha.dias)))]
+
+    def test_interjornada_apos_meia_noite(self):
+        regras = RegrasTrabalhistas({})
+        # 22:00-06:00 termina no dia seguinte: só 8 horas até as 14:00
+        curta = self._linha([((22, 0), (6, 0)), ((14, 0), (22, 0))])
+        self.assertEqual(curta.dias[0].duracao, 420)
+        self.assertEqual(curta.intervalo(1), 480)
+        self.assertEqual(regras.verificar('interjornada', curta, 1),
+                         'Interjornada de 480min menor que mínimo de 660min')
+        self.assertIsNone(regras.verificar('interjornada', curta, 0))
+
+        suficiente = self._linha([((22, 0), (6, 0)), ((17, 0), (23, 0))])
+        self.assertNotIn('interjornada', dict(self._violacoes(regras, suficiente)))
+
+    def test_dsr_dias_consecutivos(self):
+        regras = RegrasTrabalhistas({})
+        turno = ((8, 0), (12, 0))
+        sete = self._linha([turno] * 7 + [None])
+        # A sequência é apurada uma vez, no primeiro dia dela
+        self.assertEqual([violacao for violacao in self._violacoes(regras, sete) if violacao[0] == 'dsr'],
+                         [('dsr', 0)])
+        self.assertEqual(regras.verificar('dsr', sete, 6),
+                         '7 dias consecutivos de trabalho sem DSR (máximo 6)')
+        self.assertIsNone(regras.verificar('dsr', sete, 7))
+
+        seis = self._linha([turno] * 6 + [None, turno])
+        self.assertNotIn('dsr', dict(self._violacoes(regras, seis)))
+        self.assertIsNone(RegrasTrabalhistas({'max_dias_consecutivos': '7'}).verificar('dsr', sete, 0))
+
+    def test_jornada_semanal(self):
+        regras = RegrasTrabalhistas({})
+        turno = ((8, 0), (17, 0))  # 8 horas com a pausa de 60min
+        seis = self._linha([turno] * 6 + [None])
+        self.assertEqual(regras.verificar('jornada_semanal', seis, 3),
+                         'Jornada semanal de 2880min excede limite de 2640min')
+        # A violação é atribuída à segunda-feira da semana
+        self.assertIn(('jornada_semanal', 0), self._violacoes(regras, seis))
+
+        cinco = self._linha([turno] * 5 + [None, None])
+        self.assertIsNone(regras.verificar('jornada_semanal', cinco, 0))
+        limite_maior = self._linha([turno] * 6 + [None], carga_semanal_max=2880)
+        self.assertIsNone(regras.verificar('jornada_semanal', limite_maior, 0))
+
+    def test_folga_12x36(self):
+        regras = RegrasTrabalhistas({})
+        plantao = ((7, 0), (19, 0), 60, '12x36')
+        seguido = self._linha([plantao, ((8, 0), (12, 0))], carga_diaria_max=720, permite_12x36=True)
+        self.assertEqual(regras.verificar('folga_12x36', seguido, 0),
+                         'Escala 12x36 deve ter folga embutida no dia seguinte')
+        # Alterar o dia seguinte também reavalia o plantão da véspera
+        self.assertIn(('folga_12x36', 0), [(nome, indice) for nome, indice, _ in regras.avaliar(seguido, [1])])
+
+        com_folga = self._linha([plantao, None, plantao], carga_diaria_max=720, permite_12x36=True)
+        self.assertEqual(self._violacoes(regras, com_folga), [])
+
+        sem_permissao = self._linha([plantao, None], carga_diaria_max=720)
+        self.assertEqual(self._violacoes(regras, sem_permissao), [('escala_12x36', 0)])
+
+    def test_pausas_intrajornada_configuradas(self):
+        padrao = RegrasTrabalhistas({})
+        self.assertEqual(padrao.validar_turno(time(8, 0), time(17, 0), 30),
+                         [('pausa_intrajornada', 'Pausa de 30min insuficiente. Necessário: 60min')])
+
+        regras = RegrasTrabalhistas({'pausas_intrajornada': '480:30, 300:10'})
+        self.assertEqual(regras.pausa_minima(540), 30)
+        self.assertEqual(regras.pausa_minima(300), 10)
+        self.assertEqual(regras.pausa_minima(299), 0)
+        self.assertEqual(regras.validar_turno(time(8, 0), time(17, 0), 30), [])
+        self.assertEqual(regras.validar_turno(time(8, 0), time(13, 0), 0),
+                         [('pausa_intrajornada', 'Pausa de 0min insuficiente. Necessário: 10min')])
+
+        # Configuração inválida: vale o padrão da CLT
+        with self.assertLogs('escalator.regras', 'WARNING'):
+            invalida = RegrasTrabalhistas({'pausas_intrajornada': '480-30'})
+        self.assertEqual(invalida.valores['pausas_intrajornada'], PARAMETROS['pausas_intrajornada'][1])
+        self.assertEqual(invalida.pausa_minima(540), 60)
+
+    def test_regras_desativadas(self):
+        linha = self._linha([((22, 0), (6, 0), 0)] + [((8, 0), (12, 0))] * 7)
+        ativas = RegrasTrabalhistas({})
+        self.assertEqual({nome for nome, _ in self._violacoes(ativas, linha)},
+                         {'interjornada', 'dsr', 'pausa_intrajornada'})
+
+        regras = RegrasTrabalhistas({'regras_desativadas': 'interjornada, dsr,pausa_intrajornada'})
+        self.assertFalse(regras.ativa('dsr'))
+        self.assertEqual(self._violacoes(regras, linha), [])
+        self.assertIsNone(regras.verificar('interjornada', linha, 1))
+        self.assertEqual(regras.interjornada_minima, 0)
+        self.assertIsNone(regras.max_dias_consecutivos)
+        self.assertEqual(regras.pausa_minima(600), 0)
+
+        # Nome desconhecido invalida a configuração inteira: nenhuma regra é desativada
+        with self.assertLogs('escalator.regras', 'WARNING'):
+            desconhecida = RegrasTrabalhistas({'regras_desativadas': 'dsr,hora_almoco'})
+        self.assertTrue(desconhecida.ativa('dsr'))
+
+
+class EmpresaLicencaTestCase(TestCase):
+    """Licença da empresa e autenticação JWT com o claim da empresa (empresa e licença no master)"""
+
+    databases = {'default', 'master'}
+
+    def setUp(self):
+        self.empresa = Empresa.objects.create(
+            nome='Empresa Teste', razao_social='Empresa Teste Ltda', cnpj='12.345.678/0001-90',
+            email='contato@empresa.com', status_provisionamento=Empresa.PROVISIONAMENTO_PRONTO,
+        )
+        self.licenca = Licenca.objects.create(
+            empresa=self.empresa, data_inicio=timezone.localdate(), permite_ponto_eletronico=False
+        )
+        self.usuario = Usuario.objects.create_user(
+            username='colaborador', email='colaborador@empresa.com', password='senha-teste',
+            first_name='Colaborador', last_name='Teste', empresa_id=self.empresa.id
+        )
+        self.client = APIClient()
+
+        # Caches por processo: outros testes podem ter usado os mesmos ids
+        for invalidar, chave in ((invalidar_direitos_empresa, self.empresa.id), (invalidar_usuario_cache, self.usuario.pk)):
+            invalidar(chave)
+            self.addCleanup(invalidar, chave)
+        # A autenticação JWT direciona a thread para o banco da empresa
+        alias = get_empresa_database(self.empresa.id)
+        self.addCleanup(connections.databases.pop, alias, None)
+
+    # Licença
+
+    def test_licenca_bloqueia_recurso(self):
+        self.client.force_authenticate(self.usuario)
+        resposta = self.client.get('/api/pontos/')
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(resposta.json()['detail'], 'A licença da empresa não permite acesso a este recurso.')
+        # Recursos fora da licença seguem liberados
+        self.assertEqual(self.client.get('/api/escalas/').status_code, 200)
+
+    def test_licenca_alterada_libera_recurso(self):
+        self.client.force_authenticate(self.usuario)
+        self.assertEqual(self.client.get('/api/pontos/').status_code, 403)
+
+        # Gravar a licença invalida os direitos em cache
+        self.licenca.permite_ponto_eletronico = True
+        self.licenca.save()
+        self.assertEqual(self.client.get('/api/pontos/').status_code, 200)
+
+        self.licenca.status = 'suspensa'
+        self.licenca.save()
+        self.assertEqual(self.client.get('/api/pontos/').status_code, 403)
+
+    def test_licenca_cache_quente_sem_master(self):
+        self.client.force_authenticate(self.usuario)
+        self.client.get('/api/pontos/')
+
+        with CaptureQueriesContext(connections['master']) as master:
+            resposta = self.client.get('/api/pontos/')
+        self.assertEqual(resposta.status_code, 403)
+        self.assertEqual(len(master.captured_queries), 0)
+
+    # Autenticação JWT
+
+    def _token(self, empresa_id):
+        token = AccessToken.for_user(self.usuario)
+        token['empresa_id'] = empresa_id
+        return token
+
+    def _autenticar(self, token):
+        """Autentica como o DRF e devolve (usuário, banco da requisição), restaurando o roteamento"""
+        requisicao = RequestFactory().get('/api/escalas/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        try:
+            usuario, _ = EmpresaJWTAuthentication().authenticate(requisicao)
+            return usuario, get_db_for_request()
+        finally:
+            set_db_for_request(None)
+
+    def test_jwt_token_com_empresa(self):
+        resposta = self.client.post('/api/token/', {'username': 'colaborador', 'password': 'senha-teste'}, format='json')
+        self.assertEqual(resposta.status_code, 200, resposta.content[:300])
+        self.assertEqual(AccessToken(resposta.json()['access'])['empresa_id'], self.empresa.id)
+
+        usuario, banco = self._autenticar(resposta.json()['access'])
+        self.assertEqual(usuario.pk, self.usuario.pk)
+        self.assertEqual(banco, get_empresa_database(self.empresa.id))
+
+    def test_jwt_empresa_divergente(self):
+        token = self._token(self.empresa.id + 1)
+        resposta = self.client.get('/api/escalas/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(resposta.status_code, 401)
+        self.assertEqual(resposta.json()['code'], 'empresa_invalida')
+
+    def test_jwt_empresa_inativa_ou_em_provisionamento(self):
+        token = self._token(self.empresa.id)
+
+        for alteracao in ({'ativa': False}, {'status_provisionamento': Empresa.PROVISIONAMENTO_EM_ANDAMENTO}):
+            with self.subTest(**alteracao):
+                for campo, valor in alteracao.items():
+                    setattr(self.empresa, campo, valor)
+                self.empresa.save()
+                resposta = self.client.get('/api/escalas/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                self.assertEqual(resposta.status_code, 401)
+                self.assertEqual(resposta.json()['code'], 'empresa_inativa')
+
+                self.empresa.ativa, self.empresa.status_provisionamento = True, Empresa.PROVISIONAMENTO_PRONTO
+                self.empresa.save()
+
+    def test_jwt_cache_quente_sem_queries(self):
+        token = self._token(self.empresa.id)
+        self._autenticar(token)
+
+        with CaptureQueriesContext(connections['default']) as default, CaptureQueriesContext(connections['master']) as master:
+            usuario, _ = self._autenticar(token)
+        self.assertEqual(usuario.pk, self.usuario.pk)
+        self.assertEqual(len(default.captured_queries) + len(master.captured_queries), 0)
+
+    def test_jwt_usuario_salvo_invalida_cache(self):
+        token = self._token(self.empresa.id)
+        self._autenticar(token)
+
+        self.usuario.first_name = 'Renomeado'
+        self.usuario.save()
+        usuario, _ = self._autenticar(token)
+        self.assertEqual(usuario.first_name, 'Renomeado')
+
+        self.usuario.is_active = False
+        self.usuario.save()
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+
+
+@override_settings(METRICAS_HABILITADAS=True, METRICAS_TOKEN='segredo', METRICAS_IPS_PERMITIDOS=['10.0.0.5'])
+class MetricasTestCase(SimpleTestCase):
+    """Acesso ao /metrics restrito ao token ou aos IPs configurados"""
+
+    def _status(self, **meta):
+        return metricas(RequestFactory().get('/metrics', **meta)).status_code
+
+    def test_metricas_restritas(self):
+        self.assertEqual(self._status(REMOTE_ADDR='203.0.113.9'), 403)
+        self.assertEqual(self._status(REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer outro'), 403)
+        self.assertEqual(self._status(REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer segredo'), 200)
+        self.assertEqual(self._status(REMOTE_ADDR='10.0.0.5'), 200)
+
+    @override_settings(METRICAS_TOKEN='')
+    def test_metricas_sem_token(self):
+        # Sem token configurado, só os IPs permitidos
+        self.assertEqual(self._status(REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer '), 403)
+        self.assertEqual(self._status(REMOTE_ADDR='10.0.0.5'), 200)
@@ -3,46 +3,164 @@ ViewSets Django REST Framework para o sistema de gerenciamento de escalas.
 Implementa todas as APIs REST conforme especificação técnica.
 """
 
+import hashlib
+import re
+from functools import wraps
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, Sum
+from django.forms.models import model_to_dict
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from datetime import date, datetime, timedelta
 from typing import Dict, List
 
+from core.licencas import licenca_permite
+from core.permissions import LicencaPermiteRecurso
+from core.routers import get_db_for_request
+
 from .models import (
     Funcionario, Escala, Ponto, BancoHoras, Contrato, 
-    ConfiguracaoSistema, EscalaPredefinida, Folga
+    ConfiguracaoSistema, EscalaPredefinida, EscalaRecorrente, Folga
 )
 from .serializers import (
-    FuncionarioSerializer, EscalaSerializer, PontoSerializer,
+    FuncionarioSerializer, EscalaSerializer, EscalaDetalheSerializer, PontoSerializer,
     BancoHorasSerializer, ContratoSerializer, ConfiguracaoSistemaSerializer,
     EscalaPredefinidaSerializer, FolgaSerializer, SaldoBancoHorasSerializer,
-    CompensacaoHorasSerializer, RelatorioJornadaSerializer, ValidacaoEscalaSerializer
+    CompensacaoHorasSerializer, RelatorioJornadaSerializer, ValidacaoEscalaSerializer,
+    OtimizacaoEscalaSerializer, MapaCoberturaSerializer, EscalaRecorrenteSerializer,
+    HorasPrevistasSerializer, SimulacaoEscalaSerializer, PontoGravadoSerializer,
+    SincronizacaoSerializer
 )
 from .services import (
     ValidadorRegrasTrabalho, CalculadoraJornada, 
-    GerenciadorBancoHoras, ProcessadorPontos, ConsultorEscalasBrasil
+    GerenciadorBancoHoras, ProcessadorPontos, ConsultorEscalasBrasil, MapaCobertura,
+    CalendarioEscalas, ValidacaoEscalas, SincronizacaoIncremental
 )
+from .busca import BuscaIndexadaFilter
+from .otimizador import OtimizadorEscalas
+from .regras import PARAMETROS, REGRAS, SimuladorEscalas, contrato_vigente, obter_regras
+
+
+# Busca pelo nome do funcionário no índice FTS5 (BuscaIndexadaFilter)
+BUSCA_NOME_FUNCIONARIO = {'funcionario__nome': ('funcionario_id', 'funcionario_busca', 'nome')}
+
+
+def etag_funcionario(request, funcionario_id):
+    """
+    ETag de uma consulta por funcionário: empresa, versão dos dados, URL com os
+    parâmetros e data atual (consultas relativas a hoje, como o mês corrente).
+    Custa uma query; None se o funcionário não existir.
+    """
+    try:
+        versao = Funcionario.objects.filter(pk=funcionario_id).values_list('versao_dados', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if versao is None:
+        return None
+    chave = f'{get_db_for_request()}:{funcionario_id}:{versao}:{request.get_full_path()}:{timezone.localdate()}'
+    return quote_etag(hashlib.md5(chave.encode(), usedforsecurity=False).hexdigest())
 
 
-class FuncionarioViewSet(viewsets.ModelViewSet):
+def condicional_por_funcionario(parametro='pk'):
+    """
+    Decorator de actions GET: responde 304 quando o If-None-Match corresponde à
+    versão atual dos dados do funcionário, antes de qualquer outra consulta.
+    O funcionário vem do kwarg da URL ou do parâmetro de query `parametro`.
+    """
+    def decorator(metodo):
+        @wraps(metodo)
+        def wrapper(self, request, *args, **kwargs):
+            funcionario_id = kwargs.get(parametro) or request.query_params.get(parametro)
+            etag = etag_funcionario(request, funcionario_id) if funcionario_id else None
+            if etag is None:
+                return metodo(self, request, *args, **kwargs)
+            
+            response = get_conditional_response(request, etag=etag) or metodo(self, request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                # Dados por usuário: o cliente guarda e sempre revalida
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def campos_calendario(campos):
+    """Argumentos de CalendarioEscalas.escalas para as colunas e relações de campos_queryset"""
+    if campos is None:
+        return {}
+    colunas, relacoes = campos
+    return {'colunas': colunas, 'relacoes': relacoes}
+
+
+class CamposEsparsosViewSetMixin:
+    """
+    Leituras com ?fields= / ?omit=: além de podar a resposta (CamposEsparsosMixin
+    do serializer), a listagem e o detalhe carregam só as colunas e relações
+    dos campos emitidos
+    """
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = self.limitar_campos(queryset)
+        return queryset
+    
+    def campos_consulta(self):
+        """(colunas, relações) dos campos pedidos ou None (registro inteiro)"""
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'campos_queryset'):
+            return None
+        return serializer_class.campos_queryset(self.request.query_params)
+    
+    def limitar_campos(self, queryset):
+        """Aplica only()/select_related dos campos pedidos ao queryset"""
+        campos = self.campos_consulta()
+        if campos is None:
+            return queryset
+        
+        colunas, relacoes = campos
+        queryset = queryset.select_related(None)
+        if relacoes:
+            queryset = queryset.select_related(*relacoes)
+        return queryset.only(*colunas)
+
+
+class FuncionarioViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento de funcionários.
     Fornece operações CRUD e consultas específicas.
     """
-    queryset = Funcionario.objects.all()
+    queryset = Funcionario.objects.select_related('usuario')
     serializer_class = FuncionarioSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
     filterset_fields = ['ativo', 'cargo']
-    search_fields = ['nome', 'usuario__email', 'cargo']
+    search_fields = ['nome', 'matricula', 'cargo', 'usuario__email']
+    busca_indexada = {
+        'nome': ('pk', 'funcionario_busca', 'nome'),
+        'matricula': ('pk', 'funcionario_busca', 'matricula'),
+        'cargo': ('pk', 'funcionario_busca', 'cargo'),
+        'usuario__email': ('pk', 'funcionario_busca', 'email'),
+    }
     ordering_fields = ['nome', 'created_at']
     ordering = ['nome']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Contrato vigente de todos os funcionários da página em uma query (se pedido na resposta)
+        if self.action in ('list', 'retrieve') and FuncionarioSerializer.nomes_selecionados(
+            ['contrato_vigente'], self.request.query_params
+        ) != []:
+            queryset = queryset.prefetch_related(Contrato.prefetch_vigentes())
+        return queryset
+    
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Retorna o funcionário associado ao usuário autenticado"""
@@ -57,6 +175,7 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
             )
     
     @action(detail=True, methods=['get'])
+    @condicional_por_funcionario()
     def escalas_mes(self, request, pk=None):
         """Retorna escalas do funcionário para o mês atual ou especificado"""
         funcionario = self.get_object()
@@ -72,21 +191,22 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
         else:
             ultimo_dia = date(ano, mes + 1, 1) - timedelta(days=1)
         
-        escalas = Escala.objects.filter(
-            funcionario=funcionario,
-            data__range=[primeiro_dia, ultimo_dia]
-        ).order_by('data')
+        escalas = CalendarioEscalas().escalas(
+            primeiro_dia, ultimo_dia, [funcionario.id],
+            **campos_calendario(EscalaSerializer.campos_queryset(request.query_params))
+        )
         
-        serializer = EscalaSerializer(escalas, many=True)
+        serializer = EscalaSerializer(escalas, many=True, context=self.get_serializer_context())
         
         return Response({
             'funcionario': funcionario.nome,
             'periodo': f'{primeiro_dia} a {ultimo_dia}',
-            'total_escalas': escalas.count(),
+            'total_escalas': len(escalas),
             'escalas': serializer.data
         })
     
     @action(detail=True, methods=['get'])
+    @condicional_por_funcionario()
     def saldo_banco_horas(self, request, pk=None):
         """Retorna saldo atual do banco de horas do funcionário"""
         funcionario = self.get_object()
@@ -116,25 +236,33 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ContratoViewSet(viewsets.ModelViewSet):
+class ContratoViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento de contratos de trabalho.
     Implementa validações trabalhistas brasileiras.
     """
-    queryset = Contrato.objects.all()
+    queryset = Contrato.objects.select_related('funcionario')
     serializer_class = ContratoSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
     filterset_fields = ['funcionario', 'permite_12x36']
     search_fields = ['funcionario__nome']
+    busca_indexada = BUSCA_NOME_FUNCIONARIO
     ordering_fields = ['vigencia_inicio', 'created_at']
     ordering = ['-vigencia_inicio']
     
+    def perform_destroy(self, instance):
+        """Sem o contrato, as escalas do funcionário são revalidadas (a gravação é tratada por signal)"""
+        funcionario_id = instance.funcionario_id
+        super().perform_destroy(instance)
+        ValidacaoEscalas().revalidar([funcionario_id])
+        Funcionario.incrementar_versao([funcionario_id])
+    
     @action(detail=False, methods=['get'])
     def vigentes(self, request):
         """Retorna apenas contratos vigentes"""
         hoje = date.today()
-        contratos_vigentes = self.queryset.filter(
+        contratos_vigentes = self.limitar_campos(self.queryset).filter(
             vigencia_inicio__lte=hoje
         ).filter(
             Q(vigencia_fim__isnull=True) | Q(vigencia_fim__gte=hoje)
@@ -143,18 +271,23 @@ class ContratoViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(contratos_vigentes, many=True)
         return Response(serializer.data)
     
+    # Campo do contrato -> indicador da conformidade
+    VALIDACOES_CONFORMIDADE = {
+        'carga_diaria_max': 'carga_diaria_valida',
+        'carga_semanal_max': 'carga_semanal_valida',
+        'extra_diaria_cap': 'extra_diaria_valida',
+        'banco_horas_prazo_meses': 'banco_horas_valido',
+    }
+    
     @action(detail=True, methods=['get'])
     def validar_conformidade(self, request, pk=None):
         """Valida conformidade do contrato com a legislação trabalhista"""
         contrato = self.get_object()
         
-        validacoes = {
-            'carga_diaria_valida': contrato.carga_diaria_max <= 720,  # 12h
-            'carga_semanal_valida': contrato.carga_semanal_max <= 2640,  # 44h
-            'extra_diaria_valida': contrato.extra_diaria_cap <= 120,  # 2h
-            'banco_horas_valido': contrato.banco_horas_prazo_meses <= 12,
-            'vigencia_valida': contrato.is_vigente()
-        }
+        # Limites configurados na empresa (os mesmos da gravação do contrato)
+        violacoes = obter_regras().validar_contrato(model_to_dict(contrato))
+        validacoes = {nome: campo not in violacoes for campo, nome in self.VALIDACOES_CONFORMIDADE.items()}
+        validacoes['vigencia_valida'] = contrato.is_vigente()
         
         todas_validas = all(validacoes.values())
         
@@ -162,27 +295,50 @@ class ContratoViewSet(viewsets.ModelViewSet):
             'contrato_id': contrato.id,
             'funcionario': contrato.funcionario.nome,
             'conforme': todas_validas,
-            'validacoes': validacoes
+            'validacoes': validacoes,
+            'violacoes': violacoes
         })
 
 
-class EscalaViewSet(viewsets.ModelViewSet):
+class EscalaViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento de escalas de trabalho.
     Implementa validações das regras trabalhistas brasileiras.
     """
-    queryset = Escala.objects.all()
+    queryset = Escala.objects.select_related('funcionario')
     serializer_class = EscalaSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['funcionario', 'data', 'tipo_escala', 'descanso']
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
+    filterset_fields = ['funcionario', 'data', 'tipo_escala', 'descanso', 'valida']
     search_fields = ['funcionario__nome']
+    busca_indexada = BUSCA_NOME_FUNCIONARIO
     ordering_fields = ['data', 'hora_inicio', 'created_at']
     ordering = ['-data']
     
+    def get_serializer_class(self):
+        # Listas usam a situação gravada (valida); o detalhe recalcula as regras com as mensagens
+        if self.action == 'retrieve':
+            return EscalaDetalheSerializer
+        return super().get_serializer_class()
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        violacao = self.request.query_params.get('violacao')
+        if violacao:
+            # Escalas que violam a regra informada (códigos separados por vírgula)
+            queryset = queryset.filter(codigos_violacao__regex=rf'(^|,){re.escape(violacao)}(,|$)')
+        return queryset
+    
+    def perform_destroy(self, instance):
+        """Revalida os dias vizinhos da escala excluída (a gravação é tratada por signal)"""
+        funcionario_id, data = instance.funcionario_id, instance.data
+        super().perform_destroy(instance)
+        ValidacaoEscalas().revalidar_alteracao(funcionario_id, data)
+        Funcionario.incrementar_versao([funcionario_id])
+    
     @action(detail=False, methods=['get'])
     def periodo(self, request):
-        """Retorna escalas de um período específico"""
+        """Retorna escalas de um período específico, incluindo os dias das escalas recorrentes"""
         data_inicio = request.query_params.get('data_inicio')
         data_fim = request.query_params.get('data_fim')
         funcionario_id = request.query_params.get('funcionario')
@@ -193,18 +349,33 @@ class EscalaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        queryset = self.queryset.filter(
-            data__range=[data_inicio, data_fim]
+        try:
+            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
+        except ValueError:
+            return Response(
+                {'erro': 'Formato de data inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Filtro pela situação nas regras (a dos dias gerados pela recorrência é calculada na leitura)
+        valida = request.query_params.get('valida')
+        campos = self.campos_consulta()
+        if campos and valida:
+            campos[0].add('valida')
+        escalas = CalendarioEscalas().escalas(
+            data_inicio, data_fim, [funcionario_id] if funcionario_id else None,
+            **campos_calendario(campos)
         )
         
-        if funcionario_id:
-            queryset = queryset.filter(funcionario_id=funcionario_id)
+        if valida in ('true', 'false'):
+            escalas = [escala for escala in escalas if escala.valida == (valida == 'true')]
         
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(escalas, many=True)
         
         return Response({
             'periodo': f'{data_inicio} a {data_fim}',
-            'total_escalas': queryset.count(),
+            'total_escalas': len(escalas),
             'escalas': serializer.data
         })
     
@@ -219,126 +390,156 @@ class EscalaViewSet(viewsets.ModelViewSet):
         data_inicio = serializer.validated_data['data_inicio']
         data_fim = serializer.validated_data['data_fim']
         
-        validador = ValidadorRegrasTrabalho()
-        escalas = Escala.objects.filter(
-            funcionario=funcionario,
-            data__range=[data_inicio, data_fim]
-        ).order_by('data')
-        
-        escalas_validas = []
-        escalas_invalidas = []
-        violacoes = {
-            'jornada_diaria': 0,
-            'jornada_semanal': 0,
-            'pausa_intrajornada': 0,
-            'interjornada': 0,
-            'dsr': 0
-        }
-        
-        for escala in escalas:
-            if escala.descanso:
-                escalas_validas.append({
-                    'data': escala.data,
-                    'tipo': 'descanso'
-                })
-                continue
-            
-            # Validações individuais
-            val_jornada = validador.validar_jornada_diaria(funcionario, escala.data)
-            val_pausa = validador.validar_pausa_intrajornada(escala)
-            val_interjornada = validador.validar_interjornada(funcionario, escala.data)
-            
-            erros = []
-            if not val_jornada['valido']:
-                erros.append(val_jornada['erro'])
-                violacoes['jornada_diaria'] += 1
-            
-            if not val_pausa['valido']:
-                erros.append(val_pausa['erro'])
-                violacoes['pausa_intrajornada'] += 1
-            
-            if not val_interjornada['valido']:
-                erros.append(val_interjornada['erro'])
-                violacoes['interjornada'] += 1
-            
-            if erros:
-                escalas_invalidas.append({
-                    'data': escala.data,
-                    'erros': erros
-                })
-            else:
-                escalas_validas.append({
-                    'data': escala.data,
-                    'duracao_minutos': escala.duracao_minutos
-                })
-        
-        # Valida DSR semanal
-        data_atual = data_inicio
-        while data_atual <= data_fim:
-            val_dsr = validador.validar_dsr(funcionario, data_atual)
-            if not val_dsr['valido']:
-                violacoes['dsr'] += 1
-            data_atual += timedelta(days=7)
+        # Uma carga de escalas e contratos para todo o período
+        resultado = ValidadorRegrasTrabalho().validar_periodo(funcionario, data_inicio, data_fim)
         
         return Response({
             'funcionario': funcionario.nome,
             'periodo': f'{data_inicio} a {data_fim}',
-            'escalas_validas': escalas_validas,
-            'escalas_invalidas': escalas_invalidas,
-            'resumo_violacoes': violacoes,
-            'total_violacoes': sum(violacoes.values())
+            **resultado,
+            'total_violacoes': sum(resultado['resumo_violacoes'].values())
         })
     
     @action(detail=False, methods=['post'])
     def aplicar_escala_predefinida(self, request):
-        """Aplica uma escala predefinida para um funcionário em um período"""
+        """
+        Aplica uma escala predefinida a um funcionário como escala recorrente.
+        data_fim é opcional (sem fim, vale até outra escala ser aplicada);
+        hora_inicio, hora_fim e pausa_minutos substituem o horário padrão.
+        """
         funcionario_id = request.data.get('funcionario')
         escala_predefinida_id = request.data.get('escala_predefinida')
         data_inicio = request.data.get('data_inicio')
         data_fim = request.data.get('data_fim')
+        hora_inicio = request.data.get('hora_inicio')
+        hora_fim = request.data.get('hora_fim')
         
-        if not all([funcionario_id, escala_predefinida_id, data_inicio, data_fim]):
+        if not all([funcionario_id, escala_predefinida_id, data_inicio]):
             return Response(
-                {'erro': 'Todos os parâmetros são obrigatórios'},
+                {'erro': 'Parâmetros funcionario, escala_predefinida e data_inicio são obrigatórios'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         try:
             funcionario = Funcionario.objects.get(id=funcionario_id)
             data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
+            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date() if data_fim else None
+            hora_inicio = datetime.strptime(hora_inicio, '%H:%M').time() if hora_inicio else None
+            hora_fim = datetime.strptime(hora_fim, '%H:%M').time() if hora_fim else None
+            pausa_minutos = int(request.data.get('pausa_minutos', 60))
         except (Funcionario.DoesNotExist, ValueError) as e:
             return Response(
                 {'erro': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if data_fim and data_fim < data_inicio:
+            return Response(
+                {'erro': 'Data fim deve ser posterior à data início'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         consultor = ConsultorEscalasBrasil()
         resultado = consultor.aplicar_escala_predefinida(
-            funcionario, escala_predefinida_id, data_inicio, data_fim
+            funcionario, escala_predefinida_id, data_inicio, data_fim,
+            hora_inicio=hora_inicio, hora_fim=hora_fim, pausa_minutos=pausa_minutos
         )
         
         if resultado['sucesso']:
             return Response(resultado, status=status.HTTP_201_CREATED)
         else:
             return Response(resultado, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def simular(self, request):
+        """
+        Valida um lote de escalas propostas sobre a escala atual, sem gravar nada.
+        Retorna as violações das regras trabalhistas nos dias afetados.
+        """
+        serializer = SimulacaoEscalaSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        resultado = SimuladorEscalas().simular(serializer.validated_data['escalas'])
+        return Response(resultado)
+    
+    @action(detail=False, methods=['post'])
+    def otimizar(self, request):
+        """
+        Gera escalas para a equipe a partir da demanda de cobertura por dia/hora.
+        Com preview (padrão) apenas retorna a proposta; com preview=false grava as escalas.
+        """
+        serializer = OtimizacaoEscalaSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        dados = serializer.validated_data
+        otimizador = OtimizadorEscalas(
+            data_inicio=dados['data_inicio'],
+            data_fim=dados['data_fim'],
+            demanda=dados['demanda'],
+            funcionarios=[funcionario.id for funcionario in dados.get('funcionarios', [])],
+            turnos=dados.get('turnos'),
+        )
+        resultado = otimizador.otimizar()
+        
+        if dados['preview']:
+            return Response({'preview': True, **resultado})
+        
+        criadas = otimizador.aplicar(resultado)
+        resultado.pop('escalas')
+        return Response({'preview': False, 'escalas_criadas': criadas, **resultado}, status=status.HTTP_201_CREATED)
+
+
+class EscalaRecorrenteViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
+    """
+    ViewSet para escalas recorrentes.
+    Alterar a recorrência muda todos os dias gerados por ela; os dias
+    editados individualmente são escalas gravadas e não são afetados.
+    """
+    queryset = EscalaRecorrente.objects.select_related('funcionario', 'escala_predefinida')
+    serializer_class = EscalaRecorrenteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['funcionario', 'escala_predefinida', 'tipo_escala']
+    ordering_fields = ['vigencia_inicio', 'created_at']
+    ordering = ['-vigencia_inicio']
+    
+    def perform_destroy(self, instance):
+        """Sem a recorrência, as escalas gravadas do funcionário são revalidadas"""
+        funcionario_id = instance.funcionario_id
+        super().perform_destroy(instance)
+        ValidacaoEscalas().revalidar([funcionario_id])
+        Funcionario.incrementar_versao([funcionario_id])
 
 
-class PontoViewSet(viewsets.ModelViewSet):
+class PontoViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento de registros de ponto.
     Implementa validações automáticas e integração com escalas.
     """
-    queryset = Ponto.objects.all()
+    queryset = Ponto.objects.select_related('funcionario', 'escala')
     serializer_class = PontoSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    permission_classes = [permissions.IsAuthenticated, LicencaPermiteRecurso]
+    recurso_licenca = 'ponto_eletronico'
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
     filterset_fields = ['funcionario', 'tipo_registro', 'validado']
     search_fields = ['funcionario__nome', 'observacoes']
+    busca_indexada = {
+        **BUSCA_NOME_FUNCIONARIO,
+        'observacoes': ('pk', 'ponto_busca', 'observacoes'),
+    }
     ordering_fields = ['timestamp', 'created_at']
     ordering = ['-timestamp']
     
+    def perform_destroy(self, instance):
+        """Exclusão não dispara signal de gravação: invalida os ETags do funcionário"""
+        funcionario_id = instance.funcionario_id
+        super().perform_destroy(instance)
+        Funcionario.incrementar_versao([funcionario_id])
+    
     @action(detail=False, methods=['get'])
+    @condicional_por_funcionario('funcionario')
     def dia(self, request):
         """Retorna pontos de um funcionário em uma data específica"""
         funcionario_id = request.query_params.get('funcionario')
@@ -374,17 +575,37 @@ class PontoViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def registrar(self, request):
-        """Registra um novo ponto com validações automáticas"""
+        """
+        Registra um novo ponto com validações automáticas.
+        Com chave_idempotencia já gravada (repetição do app), devolve o ponto
+        original com uma consulta pelo índice, sem revalidar nem gravar de novo.
+        """
+        chave = request.data.get('chave_idempotencia')
+        if chave:
+            ponto = Ponto.objects.select_related('funcionario', 'escala').filter(chave_idempotencia=chave).first()
+            if ponto:
+                return self._resposta_repeticao(request, ponto)
+        
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             ponto = serializer.save()
             return Response(
-                PontoSerializer(ponto).data,
+                PontoGravadoSerializer(ponto).data,
                 status=status.HTTP_201_CREATED
             )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def _resposta_repeticao(self, request, ponto):
+        """Mesma resposta do registro original; chave reaproveitada em outra marcação é conflito"""
+        if (str(ponto.funcionario_id) != str(request.data.get('funcionario'))
+                or ponto.tipo_registro != request.data.get('tipo_registro')):
+            return Response(
+                {'chave_idempotencia': ['Chave já utilizada em outro registro de ponto']},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(PontoGravadoSerializer(ponto).data, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
     def periodo(self, request):
         """Retorna pontos de um período específico"""
@@ -398,7 +619,7 @@ class PontoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        queryset = self.queryset.filter(
+        queryset = self.limitar_campos(self.queryset).filter(
             funcionario_id=funcionario_id,
             timestamp__date__range=[data_inicio, data_fim]
         )
@@ -412,33 +633,42 @@ class PontoViewSet(viewsets.ModelViewSet):
         })
 
 
-class BancoHorasViewSet(viewsets.ModelViewSet):
+class BancoHorasViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento do banco de horas.
     Implementa controle de vencimentos e compensações.
     """
-    queryset = BancoHoras.objects.all()
+    queryset = BancoHoras.objects.select_related('funcionario')
     serializer_class = BancoHorasSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    permission_classes = [permissions.IsAuthenticated, LicencaPermiteRecurso]
+    recurso_licenca = 'banco_horas'
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
     filterset_fields = ['funcionario', 'compensado']
     search_fields = ['funcionario__nome', 'observacoes']
+    busca_indexada = BUSCA_NOME_FUNCIONARIO
     ordering_fields = ['data_referencia', 'data_vencimento', 'created_at']
     ordering = ['-data_referencia']
     
+    def perform_destroy(self, instance):
+        """Exclusão não dispara signal de gravação: invalida os ETags do funcionário"""
+        funcionario_id = instance.funcionario_id
+        super().perform_destroy(instance)
+        Funcionario.incrementar_versao([funcionario_id])
+    
     @action(detail=False, methods=['get'])
     def saldos(self, request):
         """Retorna saldos de banco de horas de todos os funcionários"""
-        funcionarios = Funcionario.objects.filter(ativo=True)
+        funcionarios = list(Funcionario.objects.filter(ativo=True).values_list('id', 'nome'))
         gerenciador = GerenciadorBancoHoras()
+        # Uma query agrupada para todos os funcionários
+        saldos_funcionarios = gerenciador.obter_saldos([funcionario_id for funcionario_id, _ in funcionarios])
         
         saldos = []
-        for funcionario in funcionarios:
-            saldo = gerenciador.obter_saldo_atual(funcionario)
+        for funcionario_id, nome in funcionarios:
             saldos.append({
-                'funcionario_id': funcionario.id,
-                'funcionario_nome': funcionario.nome,
-                **saldo
+                'funcionario_id': funcionario_id,
+                'funcionario_nome': nome,
+                **saldos_funcionarios[funcionario_id]
             })
         
         return Response({
@@ -452,7 +682,7 @@ class BancoHorasViewSet(viewsets.ModelViewSet):
         dias_antecedencia = int(request.query_params.get('dias', 30))
         data_limite = date.today() + timedelta(days=dias_antecedencia)
         
-        registros_vencendo = self.queryset.filter(
+        registros_vencendo = self.limitar_campos(self.queryset).filter(
             data_vencimento__lte=data_limite,
             data_vencimento__gte=date.today(),
             compensado=False,
@@ -484,7 +714,7 @@ class BancoHorasViewSet(viewsets.ModelViewSet):
         })
 
 
-class ConfiguracaoSistemaViewSet(viewsets.ModelViewSet):
+class ConfiguracaoSistemaViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para configurações do sistema.
     Permite ajustar parâmetros das regras trabalhistas.
@@ -514,16 +744,34 @@ class ConfiguracaoSistemaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def interjornada(self, request):
         """Retorna configuração da interjornada mínima"""
-        interjornada = ConfiguracaoSistema.get_interjornada_minima()
+        interjornada = obter_regras().parametros['interjornada_minima_minutos']
         
         return Response({
             'interjornada_minima_minutos': interjornada,
             'interjornada_minima_horas': interjornada / 60,
             'descricao': 'Interjornada mínima conforme CLT (11 horas)'
         })
+    
+    @action(detail=False, methods=['get'])
+    def regras(self, request):
+        """Parâmetros das regras trabalhistas em vigor na empresa e as regras aplicadas"""
+        regras = obter_regras()
+        
+        return Response({
+            'parametros': [
+                {
+                    'chave': chave,
+                    'valor': regras.valores[chave],
+                    'padrao': padrao,
+                    'descricao': descricao,
+                }
+                for chave, (_, padrao, descricao) in PARAMETROS.items()
+            ],
+            'regras': [{'nome': nome, 'ativa': regras.ativa(nome)} for nome in REGRAS],
+        })
 
 
-class EscalaPredefinidaViewSet(viewsets.ModelViewSet):
+class EscalaPredefinidaViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para escalas predefinidas disponíveis no Brasil.
     Fornece modelos de escalas conforme legislação brasileira.
@@ -548,17 +796,18 @@ class EscalaPredefinidaViewSet(viewsets.ModelViewSet):
         })
 
 
-class FolgaViewSet(viewsets.ModelViewSet):
+class FolgaViewSet(CamposEsparsosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciamento de folgas (compatibilidade).
     Mantém compatibilidade com sistema anterior.
     """
-    queryset = Folga.objects.all()
+    queryset = Folga.objects.select_related('funcionario')
     serializer_class = FolgaSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BuscaIndexadaFilter, OrderingFilter]
     filterset_fields = ['funcionario', 'data']
     search_fields = ['funcionario__nome', 'motivo']
+    busca_indexada = BUSCA_NOME_FUNCIONARIO
     ordering_fields = ['data', 'created_at']
     ordering = ['-data']
 
@@ -568,7 +817,13 @@ class RelatoriosViewSet(viewsets.ViewSet):
     ViewSet para relatórios e análises do sistema de escalas.
     Fornece dados consolidados e métricas de conformidade.
     """
-    permission_classes = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated, LicencaPermiteRecurso]
+    # O dashboard fica disponível para todas as licenças
+    recurso_licenca = {
+        'jornada_funcionario': 'relatorios_avancados',
+        'cobertura': 'relatorios_avancados',
+        'horas_previstas': 'relatorios_avancados',
+    }
     
     @action(detail=False, methods=['post'])
     def jornada_funcionario(self, request):
@@ -582,6 +837,14 @@ class RelatoriosViewSet(viewsets.ViewSet):
         data_fim = serializer.validated_data['data_fim']
         
         calculadora = CalculadoraJornada()
+        # A véspera entra para a jornada noturna iniciada nela não ser atribuída ao primeiro dia
+        carregadas = CalendarioEscalas().escalas(
+            data_inicio - timedelta(days=1), data_fim, [funcionario.id],
+            colunas={'descanso', 'fim_previsto'}, relacoes=()
+        )
+        escalas = {escala.data: escala for escala in carregadas}
+        jornadas = calculadora.jornadas_periodo(funcionario, data_inicio, data_fim, carregadas)
+        contratos = list(Contrato.objects.filter(funcionario=funcionario))
         
         # Coleta dados do período
         data_atual = data_inicio
@@ -595,17 +858,16 @@ class RelatoriosViewSet(viewsets.ViewSet):
         while data_atual <= data_fim:
             total_dias += 1
             
-            escala = Escala.objects.filter(
-                funcionario=funcionario,
-                data=data_atual
-            ).first()
+            escala = escalas.get(data_atual)
             
             if escala:
                 if escala.descanso:
                     dias_descanso += 1
                 else:
                     dias_trabalhados += 1
-                    jornada = calculadora.calcular_jornada_diaria(funcionario, data_atual)
+                    jornada = calculadora.calcular_jornada_pontos(
+                        jornadas.get(data_atual, []), contrato_vigente(contratos, data_atual)
+                    )
                     total_horas_normais += jornada['jornada_normal']
                     total_horas_extras += jornada['horas_extras']
                     total_adicional_noturno += jornada['adicional_noturno']
@@ -627,6 +889,67 @@ class RelatoriosViewSet(viewsets.ViewSet):
         response_serializer = RelatorioJornadaSerializer(resultado)
         return Response(response_serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def cobertura(self, request):
+        """
+        Mapa de cobertura: pessoas escaladas por faixa de horário (15, 30 ou 60
+        minutos) em cada dia do período. Filtros: funcionario (repetível), cargo
+        e tipo_escala. A matriz tem uma linha por dia e uma coluna por faixa.
+        """
+        serializer = MapaCoberturaSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        dados = serializer.validated_data
+        resultado = MapaCobertura().calcular(
+            data_inicio=dados['data_inicio'],
+            data_fim=dados['data_fim'],
+            intervalo_minutos=dados['intervalo'],
+            funcionarios=dados.get('funcionario'),
+            cargo=dados.get('cargo'),
+            tipo_escala=dados.get('tipo_escala'),
+        )
+        return Response(resultado)
+    
+    @action(detail=False, methods=['get'])
+    def horas_previstas(self, request):
+        """
+        Horas previstas nas escalas por funcionário e por semana ou mês, com o
+        total da equipe em cada período. Filtros: funcionario (repetível) e cargo.
+        """
+        serializer = HorasPrevistasSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        dados = serializer.validated_data
+        funcionarios = Funcionario.objects.all()
+        if dados.get('funcionario'):
+            funcionarios = funcionarios.filter(id__in=dados['funcionario'])
+        if dados.get('cargo'):
+            funcionarios = funcionarios.filter(cargo=dados['cargo'])
+        
+        totais = CalendarioEscalas().totais(
+            dados['data_inicio'], dados['data_fim'],
+            funcionarios.values('id'), agrupamento=dados['agrupamento']
+        )
+        
+        equipe = {}
+        for total in totais:
+            periodo = equipe.setdefault(total['periodo'], {
+                'periodo': total['periodo'], 'duracao_minutos': 0, 'minutos_noturnos': 0, 'dias_trabalho': 0
+            })
+            for campo in ('duracao_minutos', 'minutos_noturnos', 'dias_trabalho'):
+                periodo[campo] += total[campo]
+        
+        return Response({
+            'data_inicio': dados['data_inicio'],
+            'data_fim': dados['data_fim'],
+            'agrupamento': dados['agrupamento'],
+            'funcionarios': totais,
+            'equipe': [equipe[periodo] for periodo in sorted(equipe)],
+            'total_minutos': sum(total['duracao_minutos'] for total in totais),
+        })
+    
     @action(detail=False, methods=['get'])
     def dashboard(self, request):
         """Retorna dados para dashboard do sistema"""
@@ -636,9 +959,9 @@ class RelatoriosViewSet(viewsets.ViewSet):
         funcionarios_ativos = Funcionario.objects.filter(ativo=True).count()
         
         # Escalas de hoje
-        escalas_hoje = Escala.objects.filter(data=hoje)
-        trabalhando_hoje = escalas_hoje.filter(descanso=False).count()
-        descansando_hoje = escalas_hoje.filter(descanso=True).count()
+        escalas_hoje = CalendarioEscalas().escalas(hoje, hoje)
+        trabalhando_hoje = sum(1 for escala in escalas_hoje if not escala.descanso)
+        descansando_hoje = len(escalas_hoje) - trabalhando_hoje
         
         # Pontos de hoje
         pontos_hoje = Ponto.objects.filter(timestamp__date=hoje).count()
@@ -664,3 +987,48 @@ class RelatoriosViewSet(viewsets.ViewSet):
             'pontos_pendentes': pontos_pendentes,
             'registros_vencendo': registros_vencendo
         })
+
+
+class SincronizacaoViewSet(viewsets.ViewSet):
+    """
+    Sincronização incremental do app móvel (GET /api/sync/?token=&funcionario=).
+    Devolve escalas, recorrências, pontos, banco de horas e configurações
+    alterados ou excluídos desde o token, com o token da próxima chamada.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # Coleções que dependem da licença da empresa (omitidas se ela não permitir)
+    recursos_colecoes = {'pontos': 'ponto_eletronico', 'banco_horas': 'banco_horas'}
+    serializers_colecoes = {
+        'escalas': EscalaSerializer,
+        'escalas_recorrentes': EscalaRecorrenteSerializer,
+        'pontos': PontoGravadoSerializer,
+        'banco_horas': BancoHorasSerializer,
+        'configuracoes': ConfiguracaoSistemaSerializer,
+    }
+    
+    def list(self, request):
+        """Alterações e exclusões desde o token (sem token: carga completa)"""
+        serializer = SincronizacaoSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        sincronizacao = SincronizacaoIncremental(self._colecoes_permitidas(request))
+        resultado = sincronizacao.sincronizar(
+            serializer.validated_data.get('token'),
+            serializer.validated_data.get('funcionario'),
+        )
+        
+        resposta = {'token': resultado['token'], 'completa': resultado['completa']}
+        for nome, registros in resultado['alterados'].items():
+            resposta[nome] = self.serializers_colecoes[nome](registros, many=True).data
+        resposta['excluidos'] = resultado['excluidos']
+        return Response(resposta)
+    
+    def _colecoes_permitidas(self, request):
+        """Coleções liberadas pela licença (usuários sem empresa recebem todas)"""
+        empresa_id = getattr(request.user, 'empresa_id', None)
+        return [
+            nome for nome in self.serializers_colecoes
+            if not empresa_id or nome not in self.recursos_colecoes
+            or licenca_permite(empresa_id, self.recursos_colecoes[nome])
+        ]